@@ -588,6 +588,16 @@ program
         inboxFiles.forEach(f => console.log(chalk.yellow(`   • ${f}`)));
       }
 
+      // Извлечени от Python в manifest режим (python.output.mode: "manifest")
+      const extracted = await requests.readManifest();
+      if (extracted.length > 0) {
+        console.log(chalk.cyan(`\n🗂️  Извлечени: ${extracted.length} записа (manifest), последните:`));
+        for (const entry of extracted.slice(-10).reverse()) {
+          console.log(chalk.white(`   • ${entry.source} — ${entry.subject}`));
+          console.log(chalk.gray(`      ${entry.from} | ${entry.date}`));
+        }
+      }
+
     } else if (action === 'check') {
       // Провери inbox
       const inboxFiles = await requests.checkInbox();
@@ -9,6 +9,7 @@ import * as fs from 'fs-extra';
 import * as path from 'path';
 import chalk from 'chalk';
 import { exec } from 'child_process';
+import * as readline from 'readline';
 import { promisify } from 'util';
 
 const execAsync = promisify(exec);
@@ -25,6 +26,16 @@ export interface RequestSummary {
   file: string;
 }
 
+export interface ManifestEntry {
+  source: string;
+  from: string;
+  subject: string;
+  date: string;
+  attachments: string[];
+  segment: string;
+  offset: number;
+}
+
 export class RequestsManager {
   private projectDir: string;
   private requestsDir: string;
@@ -82,6 +93,31 @@ export class RequestsManager {
       'python/process_inbox.py',
       'python/office_extractor.py',
       'python/pdf_extractor.py',
+      'python/doc_reader.py',
+      'python/odf_reader.py',
+      'python/rtf_reader.py',
+      'python/text_decoding.py',
+      'python/xml_reader.py',
+      'python/vtt_reader.py',
+      'python/output_writer.py',
+      'python/processed_index.py',
+      'python/manifest.py',
+      'python/search_index.py',
+      'python/email_threads.py',
+      'python/body_reducer.py',
+      'python/triage.py',
+      'python/scheduler.py',
+      'python/metrics.py',
+      'python/profiling.py',
+      'python/logging_setup.py',
+      'python/records.py',
+      'python/journal.py',
+      'python/claims.py',
+      'python/worker_pool.py',
+      'python/requests_config.py',
+      'python/run_summary.py',
+      'python/corpus.py',
+      'python/benchmark.py',
       'python/requirements.txt',
     ];
 
@@ -135,7 +171,7 @@ export class RequestsManager {
         if (['.txt', '.md'].includes(ext)) {
           // TXT и MD винаги работят — четем директно
           processed.push(file);
-        } else if (pythonAvailable && ['.eml', '.msg', '.docx', '.xlsx', '.pdf', '.rtf', '.doc', '.xls', '.odt'].includes(ext)) {
+        } else if (pythonAvailable && ['.eml', '.msg', '.docx', '.xlsx', '.pdf', '.rtf', '.doc', '.xls', '.odt', '.ods', '.vtt', '.srt'].includes(ext)) {
           // Python форматите
           await this.runPythonProcessor(filePath);
           processed.push(file);
@@ -289,6 +325,55 @@ export class RequestsManager {
     return entries.filter(e => e.endsWith('.md') && e.startsWith('CR-'));
   }
 
+  /**
+   * Чете python/processed/manifest/manifest-NNNNN.jsonl последователно
+   * (компактният изходен режим на Python инструментите — пишат до себе си,
+   * manifest.py PROCESSED_DIR) — без тялото на записите.
+   */
+  async readManifest(filter?: (entry: ManifestEntry) => boolean): Promise<ManifestEntry[]> {
+    const manifestDir = path.join(this.requestsDir, 'python', 'processed', 'manifest');
+    if (!await fs.pathExists(manifestDir)) {
+      return [];
+    }
+    const segments = (await fs.readdir(manifestDir))
+      .filter(e => /^manifest-\d{5,}\.jsonl$/.test(e))
+      .sort();
+
+    const result: ManifestEntry[] = [];
+    for (const segment of segments) {
+      let offset = 0;
+      const lines = readline.createInterface({
+        input: fs.createReadStream(path.join(manifestDir, segment)),
+        crlfDelay: Infinity,
+      });
+      for await (const line of lines) {
+        const lineOffset = offset;
+        offset += Buffer.byteLength(line, 'utf-8') + 1;
+        if (!line.trim()) {
+          continue;
+        }
+        try {
+          const record = JSON.parse(line);
+          const entry: ManifestEntry = {
+            source: record.source_file || '',
+            from: record.from || '',
+            subject: record.subject || '',
+            date: record.date_parsed || record.date || '',
+            attachments: record.attachment_names || [],
+            segment,
+            offset: lineOffset,
+          };
+          if (!filter || filter(entry)) {
+            result.push(entry);
+          }
+        } catch {
+          // Недописан ред (записът още тече) — пропуска се
+        }
+      }
+    }
+    return result;
+  }
+
   async getArchivedFiles(): Promise<string[]> {
     const archiveDir = path.join(this.requestsDir, 'archive');
     if (!await fs.pathExists(archiveDir)) {
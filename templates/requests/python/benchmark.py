@@ -0,0 +1,368 @@
+"""
+ClientRequests Extractor Benchmark
+==================================
+Измерва скоростта на извличане по формати върху синтетичен корпус
+(corpus.py) или върху реални файлове.
+
+Използване:
+    python benchmark.py doc                       # Синтетичен .doc корпус
+    python benchmark.py doc --files a.doc b.doc   # Конкретни файлове
+    python benchmark.py doc --count 100 --repeat 5
+    python benchmark.py odt                       # Вграден ODF четец
+    python benchmark.py odt-pandoc                # Същият корпус през pandoc (сравнение)
+    python benchmark.py rtf --count 5             # Многомегабайтови RTF с картинки
+    python benchmark.py teams --count 5           # Многочасови Teams транскрипти
+    python benchmark.py vtt --count 5             # Многочасови VTT транскрипти
+    python benchmark.py txt --count 6             # Големи cp1251/UTF-8 логове
+    python benchmark.py txt-legacy --count 6      # Старото четене с 4 опита (сравнение)
+    python benchmark.py xml --count 3             # Големи XML експорти
+    python benchmark.py eml --count 50            # Писма: кодировки, HTML, вложени прикачени
+    python benchmark.py docx xlsx pdf pdf-scanned # Няколко формата наведнъж
+    python benchmark.py xlsx --rows 100000        # Големи таблици
+    python benchmark.py all --save-baseline       # Записва базовата линия
+    python benchmark.py all                       # Сравнява с нея; изход 1 при регресия
+    python benchmark.py eml --threshold 10        # По-строг праг (%)
+
+За всеки файл се взима най-бързото от --repeat пускания; p50/p95/p99/max
+са по файлове. Паметта е пикът на Python алокациите (tracemalloc) при
+едно допълнително пускане на файл, и пиковият RSS на процеса за формата.
+
+Регресия спрямо базовата линия (python.benchmark.baseline, по формат —
+само при същите --count/--seed/--repeat/--rows): p50/p95/памет нагоре или
+MB/s надолу с повече от thresholdPct процента. Промени под MIN_DELTA_MS /
+MIN_DELTA_MB се смятат за шум. Формат без нужната библиотека (python-docx,
+openpyxl, PyMuPDF, pypandoc) се пропуска.
+
+Настройки (секция python.benchmark на config.json):
+    "benchmark": {"baseline": "benchmark_baseline.json", "thresholdPct": 20}
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import corpus
+from doc_reader import read_doc_text
+from office_extractor import OfficeTextExtractor, TeamsTranscriptParser
+from odf_reader import read_odf_text
+from output_writer import atomic_write_json
+from requests_config import load_config
+from rtf_reader import read_rtf_text
+from run_summary import percentile
+from text_decoding import read_text
+from worker_pool import peak_rss_mb, reset_peak_rss
+from xml_reader import read_xml_text
+
+
+BASE_DIR = Path(__file__).parent
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+DEFAULT_THRESHOLD_PCT = 20.0
+# По-малки абсолютни промени не са регресия (шум при бързи файлове)
+MIN_DELTA_MS = 1.0
+MIN_DELTA_MB = 1.0
+
+
+@dataclass
+class BenchmarkSettings:
+    """Базова линия и праг за регресия (секция python.benchmark на config.json)."""
+    baseline: Path = BASE_DIR / DEFAULT_BASELINE
+    threshold_pct: float = DEFAULT_THRESHOLD_PCT
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'BenchmarkSettings':
+        benchmark = config.get('python', {}).get('benchmark', {})
+        baseline = Path(benchmark.get('baseline') or DEFAULT_BASELINE)
+        return cls(
+            baseline=baseline if baseline.is_absolute() else BASE_DIR / baseline,
+            threshold_pct=float(benchmark.get('thresholdPct', DEFAULT_THRESHOLD_PCT)),
+        )
+
+
+def extract_with_pandoc(file_path: Path) -> str:
+    """Старият път за ODT — pandoc процес за всеки файл (за сравнение)."""
+    import pypandoc
+    return pypandoc.convert_file(str(file_path), 'plain')
+
+
+def extract_txt_legacy(file_path: Path) -> str:
+    """Старият път за TXT — до четири read_text() с различни кодировки (за сравнение)."""
+    for encoding in ['utf-8', 'cp1251', 'iso-8859-1', 'windows-1252']:
+        try:
+            return file_path.read_text(encoding=encoding)
+        except UnicodeDecodeError:
+            continue
+    return ''
+
+
+def extract_teams(file_path: Path) -> str:
+    """Поточно парсване на Teams транскрипт + Markdown в едно минаване."""
+    _, text = TeamsTranscriptParser.parse_to_markdown(
+        OfficeTextExtractor.iter_docx_paragraphs(file_path)
+    )
+    return text
+
+
+def extract_vtt(file_path: Path) -> str:
+    """Поточно четене на VTT + сливане на репликите + Markdown."""
+    _, text = TeamsTranscriptParser.parse_subtitles(file_path)
+    return text
+
+
+def extract_eml(file_path: Path) -> str:
+    """Пътят на inbox/ за .eml: тяло (с редукция на цитати) + текстът на прикачените."""
+    from process_inbox import EmailExtractor, extract_with_attachment_text
+    record = extract_with_attachment_text(EmailExtractor.extract, file_path)
+    return '\n'.join([record.get('body_clean', '')] + list(record.get('attachment_text', {}).values()))
+
+
+def extract_xlsx_readonly(file_path: Path) -> str:
+    """Поточното (low-memory) четене на XLSX."""
+    return OfficeTextExtractor.extract_from_xlsx(file_path, read_only=True)
+
+
+def extract_pdf_text(file_path: Path) -> str:
+    """pdf_extractor без запис на текст/metadata; сканираните минават към изображения."""
+    from pdf_extractor import extract_pdf
+    with tempfile.TemporaryDirectory() as tmp:
+        result = extract_pdf(file_path, tmp, save_text=False, save_metadata=False)
+    return result.full_text or ''
+
+
+# Формат -> (генератор на корпус, функция за извличане)
+BENCHMARKS: Dict[str, Tuple[Callable, Callable]] = {
+    'doc': (corpus.generate_doc_corpus, read_doc_text),
+    'docx': (corpus.generate_docx_corpus, OfficeTextExtractor.extract_from_docx),
+    'docx-streaming': (corpus.generate_docx_corpus, OfficeTextExtractor.extract_from_docx_streaming),
+    'eml': (corpus.generate_eml_corpus, extract_eml),
+    'odt': (corpus.generate_odt_corpus, read_odf_text),
+    'ods': (corpus.generate_ods_corpus, read_odf_text),
+    'odt-pandoc': (corpus.generate_odt_corpus, extract_with_pandoc),
+    'pdf': (corpus.generate_pdf_corpus, extract_pdf_text),
+    'pdf-scanned': (corpus.generate_scanned_pdf_corpus, extract_pdf_text),
+    'rtf': (corpus.generate_rtf_corpus, read_rtf_text),
+    'teams': (corpus.generate_teams_corpus, extract_teams),
+    'txt': (corpus.generate_txt_corpus, read_text),
+    'vtt': (corpus.generate_vtt_corpus, extract_vtt),
+    'txt-legacy': (corpus.generate_txt_corpus, extract_txt_legacy),
+    'xlsx': (corpus.generate_xlsx_corpus, OfficeTextExtractor.extract_from_xlsx),
+    'xlsx-readonly': (corpus.generate_xlsx_corpus, extract_xlsx_readonly),
+    'xml': (corpus.generate_xml_corpus, read_xml_text),
+}
+
+# Формат -> модул, без който не може да се измери
+REQUIRES = {
+    'docx': 'docx', 'odt-pandoc': 'pypandoc', 'pdf': 'fitz', 'pdf-scanned': 'fitz',
+    'xlsx': 'openpyxl', 'xlsx-readonly': 'openpyxl',
+}
+# Без текстов слой — 0 символа е очакван резултат
+IMAGE_ONLY = {'pdf-scanned'}
+
+# Метрика -> посока (+1: по-голямо е по-лошо, -1: по-малко е по-лошо), праг на шума
+GATED_METRICS = {
+    'p50_ms': (1, MIN_DELTA_MS),
+    'p95_ms': (1, MIN_DELTA_MS),
+    'peak_alloc_mb': (1, MIN_DELTA_MB),
+    'mb_per_s': (-1, 0.0),
+}
+
+
+def run_benchmark(extract: Callable, files: List[Path], repeat: int = 3) -> Dict:
+    """Пуска extract върху всеки файл repeat пъти (+1 под tracemalloc) и връща статистика."""
+    timings = []
+    total_bytes = 0
+    total_chars = 0
+    peak_alloc = 0
+    rss_reset = reset_peak_rss()
+
+    for path in files:
+        size = path.stat().st_size
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            text = extract(path)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+        total_bytes += size
+        total_chars += len(text or '')
+
+        # Отделно пускане: tracemalloc забавя извличането и не трябва да влиза във времената
+        tracemalloc.start()
+        try:
+            extract(path)
+            peak_alloc = max(peak_alloc, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    total_time = sum(timings)
+    timings.sort()
+    return {
+        'files': len(files),
+        'total_mb': total_bytes / (1024 * 1024),
+        'total_chars': total_chars,
+        'mean_ms': statistics.mean(timings) * 1000 if timings else 0,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'max_ms': timings[-1] * 1000 if timings else 0,
+        'docs_per_s': len(files) / total_time if total_time else 0,
+        'mb_per_s': total_bytes / (1024 * 1024) / total_time if total_time else 0,
+        'peak_alloc_mb': peak_alloc / (1024 * 1024),
+        # Без нулиране (не-Linux) пикът е за целия процес, не само за формата
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_reset': rss_reset,
+    }
+
+
+def print_report(name: str, stats: Dict):
+    """Показва резултата от бенчмарка."""
+    rss = stats.get('peak_rss_mb')
+    rss_text = f"{rss:.1f} MB RSS" if rss is not None else "RSS неизвестен"
+    if rss is not None and not stats.get('rss_reset'):
+        rss_text += " (за целия процес)"
+    print(f"\n{'='*60}")
+    print(f"  Формат:   {name}")
+    print(f"  Файлове:  {stats['files']} ({stats['total_mb']:.2f} MB, {stats['total_chars']} символа)")
+    print(f"  Средно:   {stats['mean_ms']:.2f} ms/файл")
+    print(f"  p50/p95:  {stats['p50_ms']:.2f} / {stats['p95_ms']:.2f} ms")
+    print(f"  p99/max:  {stats['p99_ms']:.2f} / {stats['max_ms']:.2f} ms")
+    print(f"  Скорост:  {stats['docs_per_s']:.1f} док/s, {stats['mb_per_s']:.2f} MB/s")
+    print(f"  Памет:    {stats['peak_alloc_mb']:.1f} MB алокации (пик на файл), {rss_text}")
+    print(f"{'='*60}\n")
+
+
+# ================== BASELINE ==================
+
+def load_baseline(path: Path) -> Dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Базовата линия не се чете: {path}: {e}")
+        return {}
+
+
+def save_baseline(path: Path, results: Dict[str, Dict], params: Dict) -> None:
+    """Записва (обновява) базовата линия за измерените формати; другите остават."""
+    baseline = load_baseline(path)
+    formats = baseline.get('formats', {})
+    for name, stats in results.items():
+        formats[name] = {'params': params, 'stats': {k: v for k, v in stats.items() if k != 'rss_reset'}}
+    atomic_write_json(path, {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'formats': dict(sorted(formats.items())),
+    })
+    print(f"Базова линия записана: {path} ({', '.join(sorted(results))})")
+
+
+def compare_to_baseline(stats: Dict, entry: Dict, threshold_pct: float) -> List[str]:
+    """Регресиите спрямо записа на формата в базовата линия (празен списък — няма)."""
+    regressions = []
+    for metric, (direction, min_delta) in GATED_METRICS.items():
+        old = entry['stats'].get(metric)
+        new = stats.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        if change * direction > threshold_pct and abs(new - old) > min_delta:
+            regressions.append(f"{metric}: {old:.2f} -> {new:.2f} ({change:+.1f}%)")
+    return regressions
+
+
+# ================== CLI ==================
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    # Без логовете на екстракторите (process_inbox добавя и конзолен handler) — те
+    # забавят измерването; липсващ текст се отчита отделно след всеки формат
+    logging.disable(logging.ERROR)
+    settings = BenchmarkSettings.from_config(load_config())
+
+    parser = argparse.ArgumentParser(description='ClientRequests Extractor Benchmark')
+    parser.add_argument('formats', nargs='+', choices=sorted(BENCHMARKS) + ['all'],
+                        help='Формати за измерване (all — всички)')
+    parser.add_argument('--files', nargs='*', help='Реални файлове (вместо синтетичен корпус; един формат)')
+    parser.add_argument('--count', type=int, default=30, help='Брой синтетични файлове')
+    parser.add_argument('--seed', type=int, default=42, help='Seed на синтетичния корпус')
+    parser.add_argument('--rows', type=int, help='Редове на лист в XLSX корпуса')
+    parser.add_argument('--repeat', type=int, default=3, help='Повторения на файл (взима се най-бързото)')
+    parser.add_argument('--baseline', type=str, default=str(settings.baseline), help='JSON с базовата линия')
+    parser.add_argument('--save-baseline', action='store_true', help='Запиши резултата като базова линия')
+    parser.add_argument('--threshold', type=float, default=settings.threshold_pct,
+                        help='Праг за регресия в проценти')
+    args = parser.parse_args()
+
+    names = sorted(BENCHMARKS) if 'all' in args.formats else list(dict.fromkeys(args.formats))
+    if args.files and len(names) != 1:
+        parser.error('--files изисква точно един формат')
+
+    params = {'count': args.count, 'seed': args.seed, 'repeat': args.repeat, 'rows': args.rows}
+    results = {}
+    for name in names:
+        module = REQUIRES.get(name)
+        if module and importlib.util.find_spec(module) is None:
+            print(f"{name}: пропуснат — модулът {module} не е инсталиран")
+            continue
+        generate, extract = BENCHMARKS[name]
+
+        if args.files:
+            stats = run_benchmark(extract, [Path(f) for f in args.files], args.repeat)
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                if name.startswith('xlsx') and args.rows:
+                    files = generate(Path(tmp), args.count, args.seed, rows=args.rows)
+                else:
+                    files = generate(Path(tmp), args.count, args.seed)
+                stats = run_benchmark(extract, files, args.repeat)
+
+        print_report(name, stats)
+        if stats['total_chars'] == 0 and name not in IMAGE_ONLY:
+            print(f"ВНИМАНИЕ: {name} не извлече текст — липсваща зависимост или грешка в екстрактора")
+        results[name] = stats
+
+    # Реални файлове не се сравняват с (и не стават) базова линия на синтетичния корпус
+    if args.files or not results:
+        return
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        save_baseline(baseline_path, results, params)
+        return
+
+    formats = load_baseline(baseline_path).get('formats', {})
+    failed = []
+    for name, stats in results.items():
+        entry = formats.get(name)
+        if entry is None:
+            print(f"{name}: няма базова линия в {baseline_path}")
+            continue
+        if entry.get('params') != params:
+            print(f"{name}: базовата линия е с други параметри {entry.get('params')} — не се сравнява")
+            continue
+        regressions = compare_to_baseline(stats, entry, args.threshold)
+        if regressions:
+            failed.append(name)
+            print(f"РЕГРЕСИЯ {name} (праг {args.threshold:g}%): " + '; '.join(regressions))
+        else:
+            print(f"{name}: в рамките на {args.threshold:g}% от базовата линия")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,583 @@
+"""
+ClientRequests Body Reducer
+===========================
+Съкращаване на тялото на имейлите преди записа: цитираната история,
+подписът и повтарящият се текст (дисклеймъри, фирмени подписи, шаблони)
+не са част от заявката.
+
+Три стъпки върху body_clean (body_text остава непроменен):
+1. Цитирана история (само при отговор): редовете с '>' и всичко след
+   заглавката на отговора — на български, английски и френски:
+       On … wrote: / На … написа: / Le … a écrit :
+       -----Original Message----- / Оригинално съобщение / Message d'origine
+       From: … Sent: … / От: … Изпратено: … / De : … Envoyé : …
+   След "Forwarded message" / "Препратено съобщение" / "Message transféré"
+   нищо не се реже — препратеното писмо е съдържанието.
+2. Подпис: от разделителя "-- " или от сбогуването ("Поздрави,",
+   "Best regards,", "Cordialement,", "Sent from my iPhone"…) в края на
+   писмото, ако след него има само няколко кратки реда (име, длъжност,
+   телефон) — изречение или P.S. отдолу значи, че не е подпис.
+3. Повтарящ се текст: SimHash (64 бита) върху 2-словни шинглове за всеки
+   абзац (малки букви; цифрите остават — заявки, които се различават само
+   по номер или сума, не са шаблон). Отпечатъците от предишните писма са в
+   processed/fingerprints.bin; близък отпечатък (до maxDistance различни
+   бита) се намира в O(1) чрез maxDistance + 1 ленти — при разлика до k бита
+   поне една лента съвпада изцяло. Отпадат само абзаците в края на писмото
+   (дисклеймъри, фирмени подписи), видени в поне minSeen предишни писма или
+   повторени в същото. Ако не остане нищо съществено (само обръщение),
+   писмото остава цяло.
+
+За всяко писмо record['reduction'] пази байтовете преди/след и по стъпки;
+InboxProcessor отчита сумите в края на пакета, а --report — за целия архив.
+
+Настройки (секция python.reduction на config.json):
+    "reduction": {"enabled": true, "stripQuotes": true, "stripSignatures": true,
+                  "boilerplate": true, "minSeen": 2, "maxDistance": 3, "minParagraphChars": 40}
+
+Използване:
+    python body_reducer.py --report                  # спестени байтове за processed/
+    python body_reducer.py --file mail.txt --reply   # какво остава (без запис в отпечатъците)
+    python body_reducer.py --stats                   # отпечатъци и повтарящи се абзаци
+    python body_reducer.py --check                   # проверка върху примерни писма
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sys
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+BASE_DIR = Path(__file__).parent
+PROCESSED_DIR = BASE_DIR / "processed"
+FINGERPRINTS_FILE = PROCESSED_DIR / "fingerprints.bin"
+
+FINGERPRINT_BITS = 64
+FINGERPRINT_BYTES = FINGERPRINT_BITS // 8
+SHINGLE_WORDS = 2
+# Подписът се търси само в последните редове на писмото
+SIGNATURE_MAX_LINES = 12
+# Подпис: до толкова реда след сбогуването, всеки кратък
+SIGNATURE_BLOCK_LINES = 6
+SIGNATURE_LINE_CHARS = 60
+SIGNATURE_LINE_WORDS = 6
+
+
+@dataclass
+class ReductionSettings:
+    """Съкращаване на телата (секция python.reduction на config.json)."""
+    enabled: bool = True
+    strip_quotes: bool = True
+    strip_signatures: bool = True
+    boilerplate: bool = True
+    min_seen: int = 2
+    max_distance: int = 3
+    min_paragraph_chars: int = 40
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'ReductionSettings':
+        reduction = config.get('python', {}).get('reduction', {})
+        settings = cls(
+            enabled=bool(reduction.get('enabled', cls.enabled)),
+            strip_quotes=bool(reduction.get('stripQuotes', cls.strip_quotes)),
+            strip_signatures=bool(reduction.get('stripSignatures', cls.strip_signatures)),
+            boilerplate=bool(reduction.get('boilerplate', cls.boilerplate)),
+            min_seen=max(1, int(reduction.get('minSeen', cls.min_seen))),
+            max_distance=int(reduction.get('maxDistance', cls.max_distance)),
+            min_paragraph_chars=int(reduction.get('minParagraphChars', cls.min_paragraph_chars)),
+        )
+        if not 0 <= settings.max_distance <= 7:
+            logger.warning("python.reduction.maxDistance %s извън 0..7 — използва се 3", settings.max_distance)
+            settings.max_distance = 3
+        return settings
+
+
+# ================== QUOTED HISTORY ==================
+
+# Ред (или два съседни реда — Gmail пренася дългия ред), който въвежда цитата
+ATTRIBUTION_RES = [
+    re.compile(r'^On\b.{5,300}\bwrote\s*:$', re.IGNORECASE),
+    re.compile(r'^На\b.{5,300}\b(написа|е написал|е написала)\s*:$', re.IGNORECASE),
+    re.compile(r'^Le\b.{5,300}\ba écrit\s*:$', re.IGNORECASE),
+    re.compile(r'^-{2,}\s*(Original Message|Оригинално съобщение|Първоначално съобщение|'
+               r'Message d.origine)\s*-{2,}$', re.IGNORECASE),
+]
+# Outlook: "From: …" и до 4 реда по-долу "Sent: …" / "Date: …"
+HEADER_FROM_RE = re.compile(r'^\*?(From|От|De)\s*:\s*\S', re.IGNORECASE)
+HEADER_DATE_RE = re.compile(r'^\*?(Sent|Date|Изпратено|Дата|Envoyé)\s*:\s*\S', re.IGNORECASE)
+HEADER_SEPARATOR_RE = re.compile(r'^_{10,}$')
+FORWARD_RE = re.compile(r'^-{2,}\s*(Forwarded message|Препратено съобщение|Препратено писмо|'
+                        r'Message transféré)\s*-{2,}', re.IGNORECASE)
+
+REPLY_SUBJECT_RE = re.compile(r'^\s*(re|aw|отг|отн|rép|réf)\s*(\[\d+\])?\s*:', re.IGNORECASE)
+FORWARD_SUBJECT_RE = re.compile(r'^\s*(fw|fwd|пр|tr)\s*(\[\d+\])?\s*:', re.IGNORECASE)
+
+
+def is_reply(record: Dict) -> bool:
+    """Писмото е отговор (а не препратено): In-Reply-To/References или Re:/Отг: в темата."""
+    subject = record.get('subject') or ''
+    if FORWARD_SUBJECT_RE.match(subject):
+        return False
+    return bool(record.get('in_reply_to') or record.get('references') or REPLY_SUBJECT_RE.match(subject))
+
+
+def _quote_start(lines: List[str], index: int) -> bool:
+    """Започва ли цитираната история на реда index."""
+    line = lines[index].strip()
+    following = lines[index + 1].strip() if index + 1 < len(lines) else ''
+    for pattern in ATTRIBUTION_RES:
+        if pattern.match(line) or (following and pattern.match(f"{line} {following}")):
+            return True
+    if HEADER_FROM_RE.match(line):
+        return any(HEADER_DATE_RE.match(lines[j].strip()) for j in range(index + 1, min(index + 5, len(lines))))
+    return False
+
+
+def strip_quoted(text: str) -> Tuple[str, int]:
+    """Текстът без цитираната история; връща (текст, премахнати байтове)."""
+    lines = (text or '').splitlines()
+    kept = []
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if FORWARD_RE.match(stripped):
+            kept += lines[index:]
+            break
+        if _quote_start(lines, index):
+            # Разделителят "____" на Outlook над заглавката също е част от цитата
+            while kept and (not kept[-1].strip() or HEADER_SEPARATOR_RE.match(kept[-1].strip())):
+                kept.pop()
+            break
+        if stripped.startswith('>'):
+            continue
+        kept.append(line)
+    result = '\n'.join(kept).strip()
+    return result, _removed_bytes(text, result)
+
+
+# ================== SIGNATURES ==================
+
+SIGN_OFF_RE = re.compile(
+    r'^(с уважение|с поздрав|поздрави|поздрав|благодаря|хубав ден|всичко хубаво|'
+    r'best regards|kind regards|warm regards|regards|best|many thanks|thanks|thank you|cheers|'
+    r'sincerely|yours sincerely|cordialement|bien cordialement|bien à vous|salutations|'
+    r'sincères salutations|meilleures salutations|merci)\s*[,.!]*$', re.IGNORECASE)
+MOBILE_SIGNATURE_RE = re.compile(r'^(Sent from my|Get Outlook for|Изпратено от|Envoyé de mon|Envoyé depuis)\b',
+                                 re.IGNORECASE)
+POSTSCRIPT_RE = re.compile(r'^(P\.?\s?P\.?\s?)?P\.?\s?S\b', re.IGNORECASE)
+SENTENCE_END_RE = re.compile(r'[.!?]$')
+
+
+def _signature_line(line: str) -> bool:
+    """Ред от подпис: кратък (име, длъжност, фирма, телефон), не изречение и не P.S."""
+    words = line.split()
+    if len(line) > SIGNATURE_LINE_CHARS or len(words) > SIGNATURE_LINE_WORDS or POSTSCRIPT_RE.match(line):
+        return False
+    return not (SENTENCE_END_RE.search(line) and len(words) >= 3)
+
+
+def _name_line(line: str) -> bool:
+    """Име под сбогуването: до 4 думи с главна буква, без цифри."""
+    words = line.replace(',', ' ').split()
+    return 0 < len(words) <= 4 and not any(c.isdigit() for c in line) and all(w[0].isupper() for w in words)
+
+
+def _signature_follows(lines: List[str], index: int, named: bool) -> bool:
+    """След реда index е само подпис: до SIGNATURE_BLOCK_LINES кратки реда в един блок.
+
+    named — първият ред трябва да е име (след "Благодаря!", "Best," …: иначе
+    сбогуването е в средата на писмото и отдолу е заявката).
+    """
+    rest = [line.strip() for line in lines[index + 1:]]
+    while rest and not rest[0]:
+        rest = rest[1:]
+    while rest and not rest[-1]:
+        rest = rest[:-1]
+    if not rest:
+        return True
+    if len(rest) > SIGNATURE_BLOCK_LINES or not all(rest) or not all(_signature_line(line) for line in rest):
+        return False
+    return not named or _name_line(rest[0])
+
+
+def strip_signature(text: str) -> Tuple[str, int]:
+    """Текстът без подписа; връща (текст, премахнати байтове).
+
+    Реже се от разделителя "-- " (след почистването — "--"), от сбогуване
+    ("Поздрави,", "Best,") или от "Sent from my …" — само в последните
+    SIGNATURE_MAX_LINES непразни реда и само ако след него е подпис: до
+    SIGNATURE_BLOCK_LINES кратки реда без изречения и P.S. (след сбогуване
+    първият е име). Писмо, от което не би останало нищо, не се пипа.
+    """
+    lines = (text or '').splitlines()
+    cut = None
+    non_empty = [i for i, line in enumerate(lines) if line.strip()]
+    for index in non_empty[-SIGNATURE_MAX_LINES:]:
+        stripped = lines[index].strip()
+        if stripped == '--' or MOBILE_SIGNATURE_RE.match(stripped):
+            named = False
+        elif SIGN_OFF_RE.match(stripped):
+            named = True
+        else:
+            continue
+        if _signature_follows(lines, index, named):
+            cut = index
+            break
+    if cut is None:
+        return text, 0
+    result = '\n'.join(lines[:cut]).strip()
+    if not result:
+        return text, 0
+    return result, _removed_bytes(text, result)
+
+
+def _removed_bytes(before: str, after: str) -> int:
+    return max(0, len((before or '').encode('utf-8')) - len(after.encode('utf-8')))
+
+
+# ================== SIMHASH ==================
+
+WORD_RE = re.compile(r'\w+')
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> List[str]:
+    """Припокриващите се поредици от size думи (малки букви)."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return [' '.join(words)] if words else []
+    return [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def simhash(text: str) -> int:
+    """64-битов SimHash върху шингловете — близки текстове дават близки отпечатъци."""
+    weights = [0] * FINGERPRINT_BITS
+    for shingle in shingles(text):
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=FINGERPRINT_BYTES).digest(),
+                               'little')
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class FingerprintStore:
+    """Отпечатъците на абзаците от предишните писма (append-only, 8 байта на запис).
+
+    Всеки запис е каноничният отпечатък на абзац от едно писмо; броят на
+    записите на канонична стойност е броят писма, в които абзацът се е
+    срещал. Близките отпечатъци се свеждат към първия видян (канонизиране
+    при четене — еднакво за всички процеси, защото редът във файла е общ).
+    """
+
+    def __init__(self, path: Path = FINGERPRINTS_FILE, max_distance: int = ReductionSettings.max_distance):
+        self.path = Path(path)
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.bands
+        self.band_mask = (1 << self.band_bits) - 1
+        # Канонична стойност -> брой писма; (лента, стойност на лентата) -> канонични стойности
+        self._counts: Dict[int, int] = {}
+        self._buckets: Dict[int, List[int]] = {}
+        self._offset = 0
+
+    def _band_keys(self, fingerprint: int) -> List[int]:
+        return [(band << self.band_bits) | ((fingerprint >> (band * self.band_bits)) & self.band_mask)
+                for band in range(self.bands)]
+
+    def match(self, fingerprint: int) -> Optional[int]:
+        """Каноничният отпечатък на разстояние до max_distance бита (или None)."""
+        if fingerprint in self._counts:
+            return fingerprint
+        for key in self._band_keys(fingerprint):
+            for candidate in self._buckets.get(key, ()):
+                if hamming(fingerprint, candidate) <= self.max_distance:
+                    return candidate
+        return None
+
+    def seen(self, fingerprint: int) -> Tuple[int, int]:
+        """(канонична стойност, в колко писма е видян абзацът)."""
+        self.refresh()
+        canonical = self.match(fingerprint)
+        if canonical is None:
+            return fingerprint, 0
+        return canonical, self._counts[canonical]
+
+    def _merge(self, fingerprint: int) -> None:
+        canonical = self.match(fingerprint)
+        if canonical is None:
+            canonical = fingerprint
+            self._counts[canonical] = 0
+            for key in self._band_keys(canonical):
+                self._buckets.setdefault(key, []).append(canonical)
+        self._counts[canonical] += 1
+
+    def refresh(self) -> None:
+        """Дочита записите след последното четене (и от други процеси)."""
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return
+        size -= size % FINGERPRINT_BYTES
+        if size <= self._offset:
+            return
+        values = array('Q')
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            values.frombytes(f.read(size - self._offset))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        self._offset = size
+        for fingerprint in values:
+            self._merge(fingerprint)
+
+    def add(self, fingerprints: Iterable[int]) -> None:
+        """Записва отпечатъците на едно писмо — един write() с O_APPEND."""
+        values = array('Q', sorted(set(fingerprints)))
+        if not values:
+            return
+        if sys.byteorder != 'little':
+            values.byteswap()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, values.tobytes())
+        finally:
+            os.close(fd)
+        self.refresh()
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._counts)
+
+    def repeated(self, min_seen: int) -> int:
+        """Брой абзаци (канонични), видени в поне min_seen писма."""
+        self.refresh()
+        return sum(1 for count in self._counts.values() if count >= min_seen)
+
+
+# ================== REDUCER ==================
+
+PARAGRAPH_SPLIT_RE = re.compile(r'\n\s*\n')
+REDUCTION_FIELDS = ('original_bytes', 'quoted_bytes', 'signature_bytes', 'boilerplate_bytes', 'kept_bytes')
+
+
+class BodyReducer:
+    """Трите стъпки върху тялото + суми за отчета на пакета."""
+
+    def __init__(self, settings: Optional[ReductionSettings] = None, store_path: Path = FINGERPRINTS_FILE):
+        self.settings = settings or ReductionSettings()
+        self.store = FingerprintStore(store_path, self.settings.max_distance)
+        self.documents = 0
+        self.totals = dict.fromkeys(REDUCTION_FIELDS, 0)
+
+    def reduce(self, text: str, reply: bool = False, update: bool = True) -> Tuple[str, Dict]:
+        """Съкратеното тяло и статистиката; update=False — без запис в отпечатъците."""
+        text = text or ''
+        stats = dict.fromkeys(REDUCTION_FIELDS, 0)
+        stats['original_bytes'] = len(text.encode('utf-8'))
+        if self.settings.enabled:
+            if reply and self.settings.strip_quotes:
+                text, stats['quoted_bytes'] = strip_quoted(text)
+            if self.settings.strip_signatures:
+                text, stats['signature_bytes'] = strip_signature(text)
+            if self.settings.boilerplate:
+                text, stats['boilerplate_bytes'] = self._drop_boilerplate(text, update)
+        stats['kept_bytes'] = len(text.encode('utf-8'))
+
+        self.documents += 1
+        for field in REDUCTION_FIELDS:
+            self.totals[field] += stats[field]
+        return text, stats
+
+    def _drop_boilerplate(self, text: str, update: bool) -> Tuple[str, int]:
+        """Познатите абзаци в края на писмото (видени в поне min_seen предишни писма
+        или повторени в същото) отпадат; първият непознат абзац спира рязането."""
+        paragraphs = PARAGRAPH_SPLIT_RE.split(text)
+        canonicals: List[Optional[int]] = []
+        observed = set()
+        known = set()
+        for paragraph in paragraphs:
+            if len(paragraph.strip()) < self.settings.min_paragraph_chars:
+                canonicals.append(None)
+                continue
+            canonical, count = self.store.seen(simhash(paragraph))
+            if canonical in observed or count >= self.settings.min_seen:
+                known.add(canonical)
+            observed.add(canonical)
+            canonicals.append(canonical)
+
+        end = len(paragraphs)
+        dropped = set()
+        for index in range(len(paragraphs) - 1, -1, -1):
+            canonical = canonicals[index]
+            if canonical is None:
+                if paragraphs[index].strip():
+                    break
+            elif canonical not in known:
+                break
+            else:
+                dropped.add(index)
+            end = index
+        kept = [p for i, p in enumerate(paragraphs) if i < end or i not in dropped]
+        # Писмо, от което остава само обръщение (или съставено само от познат текст,
+        # напр. автоматично известие), остава цяло
+        if not self._substantive(kept):
+            kept = paragraphs
+        if update:
+            self.store.add(observed)
+        result = '\n\n'.join(kept).strip()
+        return result, _removed_bytes(text, result)
+
+    def _substantive(self, paragraphs: List[str]) -> bool:
+        """Има ли нещо освен обръщение: дълъг абзац или поне два непразни."""
+        non_empty = [p.strip() for p in paragraphs if p.strip()]
+        return len(non_empty) > 1 or any(len(p) >= self.settings.min_paragraph_chars for p in non_empty)
+
+    def report_lines(self) -> List[str]:
+        return reduction_report(self.documents, self.totals)
+
+
+def reduction_report(documents: int, totals: Dict) -> List[str]:
+    """Редовете на отчета за спестените байтове."""
+    if not documents or not totals['original_bytes']:
+        return []
+    saved = totals['original_bytes'] - totals['kept_bytes']
+    return [
+        f"Съкращаване: {documents} писма, {totals['original_bytes'] / 1024:.1f} KB -> "
+        f"{totals['kept_bytes'] / 1024:.1f} KB (спестени {saved / 1024:.1f} KB, "
+        f"{saved / totals['original_bytes']:.0%})",
+        f"  цитати {totals['quoted_bytes'] / 1024:.1f} KB, подписи {totals['signature_bytes'] / 1024:.1f} KB, "
+        f"повтарящ се текст {totals['boilerplate_bytes'] / 1024:.1f} KB",
+    ]
+
+
+# ================== CHECK ==================
+
+# (име, тяло, трябва да остане, трябва да отпадне)
+SIGNATURE_CASES = [
+    ("сбогуване над заявката",
+     "Здравейте,\n\nБлагодаря!\nМоля изпратете фактура 4711 за март.\nИван",
+     "Моля изпратете фактура 4711 за март.", None),
+    ("'--' като разделител в лог",
+     "Hi,\n\nThe nightly job failed:\n--\nERROR 42 at step 3\n--\nPlease fix ASAP.\n\nThanks,\nJohn",
+     "Please fix ASAP.", "John"),
+    ("подпис след сбогуване",
+     "Моля за оферта за 20 палета.\n\nПоздрави,\nИван Петров\nУправител\nтел. 0888 123 456",
+     "Моля за оферта за 20 палета.", "0888"),
+    ("подпис след '--'",
+     "Please send the invoice.\n\n--\nIvan Petrov\nACME Ltd\n+359 2 123 4567",
+     "Please send the invoice.", "ACME"),
+    ("P.S. след сбогуването",
+     "Моля за офертата.\n\nБлагодаря!\n\nP.S. И за поръчка 4712, моля.",
+     "P.S. И за поръчка 4712", None),
+    ("мобилен подпис",
+     "Потвърждавам доставката.\n\nSent from my iPhone",
+     "Потвърждавам доставката.", "iPhone"),
+]
+
+
+def run_check() -> bool:
+    """Проверява подписите, повтарящия се текст и индекса за търсене върху примерни писма."""
+    import tempfile
+    from search_index import search_body
+
+    failures = 0
+
+    def report(name: str, ok: bool, detail: str = '') -> None:
+        nonlocal failures
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {name}" + (f": {detail}" if detail and not ok else ''))
+
+    for name, body, kept, dropped in SIGNATURE_CASES:
+        result, _ = strip_signature(body)
+        report(name, kept in result and (dropped is None or dropped not in result), repr(result))
+
+    disclaimer = ("Това съобщение е поверително и е предназначено само за адресата. "
+                  "Ако сте го получили по грешка, моля изтрийте го.")
+    with tempfile.TemporaryDirectory(prefix='body_reducer_') as tmp:
+        reducer = BodyReducer(store_path=Path(tmp) / FINGERPRINTS_FILE.name)
+        results = []
+        for order, amount in ((4711, 1200), (4712, 1350), (4713, 980), (4714, 1200)):
+            body = (f"Здравейте,\n\nМоля, издайте фактура по поръчка {order} на стойност {amount} лв. "
+                    f"с ДДС, с падеж до края на месеца.\n\n{disclaimer}\n\nПоздрави,\nИван Петров")
+            results.append((order, reducer.reduce(body)[0]))
+        report("заявки, различни само по номер", all(str(order) in text for order, text in results),
+               repr(results[-1][1]))
+        report("повтарящ се дисклеймър", disclaimer not in results[-1][1], repr(results[-1][1]))
+
+        body_text = "Здравейте,\n\nМоля за оферта.\n\nПоздрави,\nИван Петров\nтел. 0888 123 456"
+        body_clean, reduction = reducer.reduce(body_text)
+        record = {'body_text': body_text, 'body_clean': body_clean, 'reduction': reduction}
+        report("индексът търси и в съкратеното", '0888' in search_body(record) and '0888' not in body_clean,
+               repr(search_body(record)))
+
+    print(f"{'Всички проверки минаха' if not failures else f'Неуспешни проверки: {failures}'}")
+    return not failures
+
+
+# ================== CLI ==================
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='ClientRequests Body Reducer')
+    parser.add_argument('--dir', type=str, default=str(PROCESSED_DIR), help='processed/ папка')
+    parser.add_argument('--report', action='store_true', help='Спестените байтове за всички записи в processed/')
+    parser.add_argument('--file', type=str, help='Текстов файл — покажи съкратеното тяло (без запис)')
+    parser.add_argument('--reply', action='store_true', help='С --file: текстът е отговор (реже цитатите)')
+    parser.add_argument('--stats', action='store_true', help='Брой отпечатъци и повтарящи се абзаци')
+    parser.add_argument('--check', action='store_true',
+                        help='Проверка върху примерни писма (подписи, повтарящ се текст, индекс)')
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if run_check() else 1)
+
+    from requests_config import load_config
+    settings = ReductionSettings.from_config(load_config())
+    output_dir = Path(args.dir)
+    store_path = output_dir / FINGERPRINTS_FILE.name
+
+    if args.report:
+        from processed_index import ArtifactIndex
+        documents = 0
+        totals = dict.fromkeys(REDUCTION_FIELDS, 0)
+        for _, record in ArtifactIndex(output_dir).records():
+            reduction = record.get('reduction')
+            if not reduction:
+                continue
+            documents += 1
+            for field in REDUCTION_FIELDS:
+                totals[field] += reduction.get(field, 0)
+        lines = reduction_report(documents, totals)
+        print('\n'.join(lines) if lines else "Няма съкратени записи в processed/")
+    elif args.file:
+        text = Path(args.file).read_text(encoding='utf-8')
+        reduced, stats = BodyReducer(settings, store_path).reduce(text, reply=args.reply, update=False)
+        print(reduced)
+        print(f"\n{stats['original_bytes']} -> {stats['kept_bytes']} байта (цитати {stats['quoted_bytes']}, "
+              f"подпис {stats['signature_bytes']}, повтарящ се текст {stats['boilerplate_bytes']})")
+    elif args.stats:
+        store = FingerprintStore(store_path, settings.max_distance)
+        print(f"Отпечатъци: {len(store)}, видени в поне {settings.min_seen} писма: "
+              f"{store.repeated(settings.min_seen)}")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
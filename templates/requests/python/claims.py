@@ -0,0 +1,422 @@
+"""
+ClientRequests Inbox Claims
+===========================
+Атомарно "взимане" на файлове от обща inbox/ — за няколко машини или
+контейнера, които източват една и съща папка.
+
+Протокол:
+- всеки възел (node) има папка inbox/.claims/<node_id>/ и в нея .lease,
+  чийто mtime се обновява от фонова нишка (heartbeat) на lease/3 секунди
+- claim = os.rename(inbox/X, inbox/.claims/<node_id>/X): rename в рамките
+  на една файлова система е атомарен — само един възел успява, останалите
+  получават FileNotFoundError и продължават със следващия файл
+- обработката (извличане, изходи, архивиране) е върху взетия път
+- възел, чийто .lease не е обновяван повече от lease секунди, се смята за
+  мъртъв: друг възел преименува папката му на .stale-<мъртъв>@<спасяващ>
+  (отново атомарно — само един спасява) и връща файловете ѝ в inbox/;
+  всеки възел източва само своите .stale-* папки, а изоставена (спасяващият
+  е спрял) се поема наново по същото правило за .lease
+- връщането в inbox/ не презаписва: ако междувременно е пристигнал файл
+  със същото име, върнатият получава ново име (<stem>_N<разширение>)
+- възел със същия node_id след рестарт продължава собствените си файлове
+
+Журналът (journal.py) на възела е в папката му, за да не се споделя
+между процеси.
+
+Използване:
+    from claims import InboxClaims
+    with InboxClaims(INBOX_DIR) as claims:
+        claimed = claims.claim(path)      # None — друг възел го е взел
+
+    python claims.py --demo --nodes 4 --files 400 --work-ms 20
+    python claims.py --demo --nodes 4 --kill-one    # + възстановяване на мъртъв възел
+    python claims.py --inbox --nodes 2 --files 40   # истински process_inbox.py --claim
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+BASE_DIR = Path(__file__).parent
+
+CLAIMS_DIRNAME = '.claims'
+LEASE_FILENAME = '.lease'
+STALE_PREFIX = '.stale-'
+DEFAULT_LEASE_SECONDS = 60.0
+
+
+def default_node_id() -> str:
+    """Уникален за процеса идентификатор: <host>-<pid>."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def move_no_clobber(src: Path, dest: Path) -> bool:
+    """rename, който не презаписва: False ако dest вече съществува.
+
+    os.link отказва атомарно при съществуващ dest; без hard link-ове
+    (FAT, някои мрежови дялове) — проверка и rename (под Windows rename
+    и без това не презаписва).
+    """
+    try:
+        os.link(src, dest)
+    except FileExistsError:
+        if not os.path.samefile(src, dest):
+            return False
+        # Прекъснат предишен опит: връзката вече е в inbox/
+    except FileNotFoundError:
+        raise
+    except OSError:
+        if dest.exists():
+            return False
+        os.rename(src, dest)
+        return True
+    os.unlink(src)
+    return True
+
+
+class InboxClaims:
+    """Lease-базирано разпределяне на inbox/ между няколко възела."""
+
+    def __init__(self, inbox_dir: Path, node_id: Optional[str] = None,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.inbox_dir = Path(inbox_dir)
+        self.node_id = node_id or default_node_id()
+        self.lease_seconds = lease_seconds
+        self.claims_dir = self.inbox_dir / CLAIMS_DIRNAME
+        self.node_dir = self.claims_dir / self.node_id
+        self.lease_file = self.node_dir / LEASE_FILENAME
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    # ---------- lease ----------
+
+    def start(self) -> 'InboxClaims':
+        """Създава папката на възела и пуска heartbeat нишката."""
+        self.node_dir.mkdir(parents=True, exist_ok=True)
+        self.lease_file.touch()
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, name='claims-heartbeat', daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def _beat(self) -> None:
+        interval = max(self.lease_seconds / 3, 0.1)
+        while not self._stop.wait(interval):
+            try:
+                os.utime(self.lease_file)
+            except OSError as e:
+                logger.error("Heartbeat на %s не успя: %s", self.node_id, e)
+
+    def stop(self) -> None:
+        """Спира heartbeat-а; празната папка на възела се премахва."""
+        self._stop.set()
+        if self._heartbeat:
+            self._heartbeat.join()
+            self._heartbeat = None
+        if not self.claimed():
+            shutil.rmtree(self.node_dir, ignore_errors=True)
+
+    def __enter__(self) -> 'InboxClaims':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # ---------- claims ----------
+
+    def claim(self, file_path: Path) -> Optional[Path]:
+        """Взима файла за този възел; None ако друг възел вече го е взел."""
+        dest = self.node_dir / file_path.name
+        if dest.exists():
+            logger.warning("%s вече е взет от %s — пропуснат", file_path.name, self.node_id)
+            return None
+        try:
+            os.rename(file_path, dest)
+        except FileNotFoundError:
+            return None
+        return dest
+
+    def release(self, claimed_path: Path) -> Optional[Path]:
+        """Връща необработен файл в inbox/ (напр. след грешка при извличането)."""
+        if not claimed_path.exists():
+            return None
+        return self._return_to_inbox(claimed_path)
+
+    def _return_to_inbox(self, file_path: Path) -> Optional[Path]:
+        """Мести файла в inbox/; зает име (нов файл със същото име) -> <stem>_N."""
+        dest = self.inbox_dir / file_path.name
+        attempt = 0
+        while True:
+            try:
+                if move_no_clobber(file_path, dest):
+                    break
+            except FileNotFoundError:
+                # Файлът вече е преместен (напр. папката е поета от друг възел)
+                return None
+            except OSError as e:
+                logger.error("%s не може да се върне в inbox/: %s", file_path.name, e)
+                return None
+            attempt += 1
+            dest = self.inbox_dir / f"{file_path.stem}_{attempt}{file_path.suffix}"
+        if attempt:
+            logger.warning("В inbox/ вече има %s — върнат като %s", file_path.name, dest.name)
+        return dest
+
+    def claimed(self) -> List[Path]:
+        """Файловете, които този възел вече държи (напр. след рестарт със същия node_id)."""
+        if not self.node_dir.exists():
+            return []
+        return sorted(p for p in self.node_dir.iterdir() if p.is_file() and not p.name.startswith('.'))
+
+    def held_elsewhere(self) -> int:
+        """Колко файла държат другите възли (живи или още невъзстановени)."""
+        if not self.claims_dir.exists():
+            return 0
+        held = 0
+        for node_dir in self.claims_dir.iterdir():
+            if node_dir == self.node_dir or not node_dir.is_dir():
+                continue
+            try:
+                held += sum(1 for p in node_dir.iterdir() if not p.name.startswith('.'))
+            except FileNotFoundError:
+                # Папката тъкмо е премахната/преименувана
+                continue
+        return held
+
+    def _lease_age(self, node_dir: Path, now: float) -> Optional[float]:
+        """Секунди от последния heartbeat на папката; None — папката вече я няма."""
+        try:
+            return now - (node_dir / LEASE_FILENAME).stat().st_mtime
+        except FileNotFoundError:
+            pass
+        try:
+            # Възелът още създава папката си
+            return now - node_dir.stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _take_over(self, node_dir: Path) -> Optional[Path]:
+        """Преименува папката на мъртъв възел (или изоставено спасяване) на .stale-<име>@<този възел>.
+
+        .lease се обновява преди rename-а (rename не сменя mtime-а): така
+        другите възли виждат спасяването като живо и не го поемат.
+        """
+        name = node_dir.name
+        if name.startswith(STALE_PREFIX):
+            name = name[len(STALE_PREFIX):].rpartition('@')[0]
+        stale_dir = self.claims_dir / f"{STALE_PREFIX}{name}@{self.node_id}"
+        try:
+            (node_dir / LEASE_FILENAME).touch()
+            os.rename(node_dir, stale_dir)
+        except OSError:
+            # Друг възел е бил по-бърз
+            return None
+        return stale_dir
+
+    def _drain(self, stale_dir: Path) -> int:
+        """Връща файловете от собствена .stale-* папка в inbox/ и я изтрива."""
+        try:
+            files = [p for p in stale_dir.iterdir() if not p.name.startswith('.')]
+        except FileNotFoundError:
+            return 0
+        recovered = sum(1 for file_path in files if self._return_to_inbox(file_path) is not None)
+        shutil.rmtree(stale_dir, ignore_errors=True)
+        return recovered
+
+    def recover_stale(self) -> int:
+        """Връща в inbox/ файловете на възлите с изтекъл lease. Връща броя им."""
+        if not self.claims_dir.exists():
+            return 0
+        now = time.time()
+        recovered = 0
+        for node_dir in self.claims_dir.iterdir():
+            if node_dir == self.node_dir or not node_dir.is_dir():
+                continue
+            if node_dir.name.startswith(STALE_PREFIX) and node_dir.name.rpartition('@')[2] == self.node_id:
+                # Собствено спасяване, прекъснато от рестарт със същия node_id
+                recovered += self._drain(node_dir)
+                continue
+            age = self._lease_age(node_dir, now)
+            if age is None or age < self.lease_seconds:
+                continue
+            stale_dir = self._take_over(node_dir)
+            if stale_dir is None:
+                continue
+            logger.warning("Възел %s не отговаря (%.0f s) — файловете му се връщат", node_dir.name, age)
+            recovered += self._drain(stale_dir)
+        return recovered
+
+
+# ================== DEMO ==================
+
+def _demo_node(inbox_dir: str, results_path: str, node_id: str, lease: float,
+               work_ms: float, die_after: int) -> None:
+    """Един възел: взима файлове, докато inbox/ не се изпразни."""
+    inbox = Path(inbox_dir)
+    done_dir = inbox.parent / 'processed'
+    handled = 0
+    claims = InboxClaims(inbox, node_id, lease).start()
+    with open(results_path, 'a', encoding='utf-8') as results:
+        while True:
+            claims.recover_stale()
+            files = claims.claimed() + sorted(p for p in inbox.iterdir() if p.is_file())
+            if not files:
+                if not claims.held_elsewhere():
+                    break
+                # Файлове на мъртъв възел се връщат след изтичане на lease-а му
+                time.sleep(lease / 4)
+                continue
+            for file_path in files:
+                claimed = file_path if file_path.parent == claims.node_dir else claims.claim(file_path)
+                if claimed is None:
+                    continue
+                if die_after and handled >= die_after:
+                    # Симулиран срив: файлът остава взет, lease-ът спира да се обновява
+                    os._exit(1)
+                claimed.read_bytes()
+                time.sleep(work_ms / 1000)
+                os.rename(claimed, done_dir / claimed.name)
+                results.write(f"{claimed.name}\t{node_id}\n")
+                results.flush()
+                handled += 1
+    claims.stop()
+
+
+def run_demo(nodes: int, files: int, work_ms: float, kill_one: bool, lease: float) -> bool:
+    """Пуска `nodes` процеса върху временна inbox/ и проверява "точно веднъж"."""
+    import multiprocessing
+
+    with tempfile.TemporaryDirectory(prefix='claims_demo_') as tmp:
+        inbox = Path(tmp) / 'inbox'
+        (Path(tmp) / 'processed').mkdir()
+        inbox.mkdir()
+        for i in range(files):
+            (inbox / f"request_{i:05d}.txt").write_text(f"Заявка {i}\n" * 20, encoding='utf-8')
+        results_path = Path(tmp) / 'results.tsv'
+        results_path.touch()
+
+        start = time.perf_counter()
+        processes = []
+        for n in range(nodes):
+            die_after = files // (nodes * 4) if kill_one and n == 0 else 0
+            process = multiprocessing.Process(
+                target=_demo_node,
+                args=(str(inbox), str(results_path), f"node{n}", lease, work_ms, die_after),
+            )
+            process.start()
+            processes.append(process)
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        lines = results_path.read_text(encoding='utf-8').splitlines()
+        names = [line.split('\t')[0] for line in lines]
+        per_node = {}
+        for line in lines:
+            node = line.split('\t')[1]
+            per_node[node] = per_node.get(node, 0) + 1
+        duplicates = len(names) - len(set(names))
+        missing = files - len(set(names))
+
+    print(f"Възли: {nodes:>2} | файлове: {files} | {elapsed:.2f} s | {files / elapsed:.1f} файла/s | "
+          f"дублирани: {duplicates} | липсващи: {missing} | по възли: {dict(sorted(per_node.items()))}")
+    return duplicates == 0 and missing == 0
+
+
+def run_inbox_check(nodes: int, files: int) -> bool:
+    """Пуска `nodes` истински `process_inbox.py --claim` върху една inbox/ и проверява "точно веднъж".
+
+    Скриптовете и config.json се копират във временна папка (BASE_DIR на
+    копието е отделен — истинските inbox/ и processed/ не се пипат), а
+    inbox/ се пълни със синтетични .eml писма (corpus.py).
+    """
+    import subprocess
+    from corpus import generate_eml_corpus
+
+    with tempfile.TemporaryDirectory(prefix='claims_inbox_') as tmp:
+        script_dir = Path(tmp) / 'python'
+        script_dir.mkdir()
+        for script in BASE_DIR.glob('*.py'):
+            shutil.copy2(script, script_dir)
+        config = BASE_DIR.parent / 'config.json'
+        if config.exists():
+            shutil.copy2(config, Path(tmp))
+        names = {p.name for p in generate_eml_corpus(script_dir / 'inbox', count=files)}
+
+        start = time.perf_counter()
+        processes = [
+            subprocess.Popen([sys.executable, str(script_dir / 'process_inbox.py'), '--claim',
+                              '--node-id', f"node{n}"],
+                             cwd=str(script_dir), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             encoding='utf-8', errors='replace')
+            for n in range(nodes)
+        ]
+        per_node = {}
+        failed = 0
+        for n, process in enumerate(processes):
+            output, _ = process.communicate()
+            failed += process.returncode != 0
+            # "Общо обработени: N файла" от run_cli
+            counts = [line.split(':')[1].split()[0] for line in output.splitlines()
+                      if line.startswith('Общо обработени:')]
+            per_node[f"node{n}"] = int(counts[0]) if counts else 0
+        elapsed = time.perf_counter() - start
+
+        # Архивираният оригинал е при артефактите си: extracted/<месец>/<hh>/<папка>/<име>
+        archived = [p.name for p in (script_dir / 'processed' / 'extracted').glob('*/*/*/*')
+                    if p.name in names]
+        left = [p for p in (script_dir / 'inbox').rglob('*')
+                if p.is_file() and not p.name.startswith('.')]
+        duplicates = len(archived) - len(set(archived))
+        missing = len(names - set(archived))
+
+    print(f"process_inbox.py --claim x {nodes} | файлове: {files} | {elapsed:.2f} s | "
+          f"дублирани: {duplicates} | липсващи: {missing} | останали в inbox/: {len(left)} | "
+          f"неуспешни процеси: {failed} | по възли: {per_node}")
+    return duplicates == 0 and missing == 0 and not left and not failed
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='ClientRequests Inbox Claims')
+    parser.add_argument('--demo', action='store_true',
+                        help='Многопроцесна демонстрация върху временна папка')
+    parser.add_argument('--nodes', type=int, default=4, help='Максимален брой възли (1, 2, 4 ... N)')
+    parser.add_argument('--files', type=int, default=400, help='Брой файлове')
+    parser.add_argument('--work-ms', type=float, default=20,
+                        help='Симулирано време за обработка на файл (ms)')
+    parser.add_argument('--kill-one', action='store_true',
+                        help='Възел 0 "умира" с взет файл — останалите го възстановяват')
+    parser.add_argument('--lease', type=float, default=2.0, help='Lease в секунди (демо)')
+    parser.add_argument('--inbox', action='store_true',
+                        help='Истински process_inbox.py --claim процеси (--nodes) върху обща inbox/')
+    args = parser.parse_args()
+
+    if args.inbox:
+        sys.exit(0 if run_inbox_check(args.nodes, args.files) else 1)
+    if not args.demo:
+        parser.print_help()
+        return
+
+    ok = True
+    counts = sorted({1, *(n for n in (2, 4, 8) if n < args.nodes), args.nodes})
+    for nodes in counts:
+        ok &= run_demo(nodes, args.files, args.work_ms, args.kill_one and nodes > 1, args.lease)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
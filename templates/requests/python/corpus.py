@@ -0,0 +1,956 @@
+"""
+ClientRequests Synthetic Corpus
+===============================
+Генерира синтетични примерни файлове за бенчмаркове и ръчна проверка
+на извличането — изцяло офлайн, без Word/LibreOffice и без външни пакети.
+
+Поддържани формати:
+- .eml (utf-8/windows-1251/koi8-r/iso-8859-1, QP/base64/8bit, HTML версия,
+  цитирана история, офис и текстови прикачени и препратено писмо
+  (message/rfc822) със собствени прикачени)
+- .doc (Word 97: OLE контейнер + piece table, 8-битови и Unicode парчета)
+- .odt, .ods (OpenDocument: параграфи, списъци, таблици, листове)
+- .docx (обикновени документи и Teams транскрипти с часове реплики)
+- .xlsx (листове с shared strings и числа, размер по избор — --rows)
+- .pdf (текстови страници с Helvetica и "сканирани" — само изображение)
+- .vtt, .srt (транскрипти с <v Говорещ> / "Говорещ: текст" cue-та)
+- .txt (големи логове в cp1251, UTF-8 и UTF-8 с BOM)
+- .xml (EDI-подобни експорти с namespace, атрибути и смесено съдържание)
+- .rtf (cp1251 \\'xx, \\uN, вградени \\pict картинки от няколко MB)
+
+Използване:
+    python corpus.py --out ./corpus                # Генерира примерен корпус
+    python corpus.py --out ./corpus --count 50     # 50 файла от всеки вид
+    python corpus.py --out ./corpus --rows 100000  # по-големи XLSX листове
+"""
+
+import argparse
+import io
+import random
+import struct
+import zipfile
+import zlib
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import format_datetime
+from pathlib import Path
+from typing import List, Tuple
+from xml.sax.saxutils import escape
+
+# Речник за генериране на текст (кирилица + латиница)
+WORDS_BG = ['заявка', 'клиент', 'фактура', 'доставка', 'срок', 'плащане', 'договор',
+            'проблем', 'решение', 'система', 'отчет', 'склад', 'поръчка', 'цена']
+WORDS_EN = ['request', 'invoice', 'delivery', 'deadline', 'payment', 'contract',
+            'issue', 'report', 'order', 'price', 'customer', 'status']
+WORDS_FR = ['demande', 'facture', 'livraison', 'échéance', 'règlement', 'contrat',
+            'problème', 'rapport', 'commande', 'prix', 'client', 'état']
+
+
+def random_paragraph(rng: random.Random, words: List[str], min_words: int = 8,
+                     max_words: int = 40) -> str:
+    """Генерира параграф от случайни думи."""
+    count = rng.randint(min_words, max_words)
+    text = ' '.join(rng.choice(words) for _ in range(count))
+    return text[0].upper() + text[1:] + '.'
+
+
+# ================== OLE / WORD 97 WRITER ==================
+
+SECTOR = 512
+ENDOFCHAIN = 0xFFFFFFFE
+FREESECT = 0xFFFFFFFF
+FATSECT = 0xFFFFFFFD
+MINI_CUTOFF = 4096
+
+TEXT_OFFSET = 0x800          # Къде в WordDocument започва текстът
+FIB_RG_FC_LCB_COUNT = 0x5D   # Брой fc/lcb двойки в Word 97 FIB
+LID_BULGARIAN = 0x0402
+# Обратното на COMPRESSED_CHAR_MAP в doc_reader.py (cp1252 без 0x80, 0x8E, 0x9E)
+COMPRESSED_BYTES = {bytes([b]).decode('cp1252'): b
+                    for b in (*range(0x82, 0x8D), *range(0x91, 0x9D), 0x9F)}
+
+
+def _pad(data: bytes, size: int) -> bytes:
+    return data + b'\0' * (size - len(data))
+
+
+def _dir_entry(name: str, entry_type: int, start: int, size: int,
+               right: int = FREESECT, child: int = FREESECT) -> bytes:
+    encoded = (name + '\0').encode('utf-16-le')
+    entry = _pad(encoded, 64)
+    entry += struct.pack('<HBB', len(encoded), entry_type, 1)
+    entry += struct.pack('<III', FREESECT, right, child)
+    entry += b'\0' * 16 + b'\0' * 4 + b'\0' * 16
+    entry += struct.pack('<IQ', start, size)
+    return entry
+
+
+def build_compound_file(streams: List[Tuple[str, bytes]]) -> bytes:
+    """Сглобява OLE Compound File (v3) с дадените потоци.
+
+    Потоците се допълват до MINI_CUTOFF, за да не е нужен MiniFAT.
+    """
+    streams = [(name, _pad(data, max(len(data), MINI_CUTOFF))) for name, data in streams]
+
+    fat: List[int] = []
+    starts = []
+    body = b''
+    for _, data in streams:
+        count = -(-len(data) // SECTOR)
+        start = len(fat)
+        starts.append(start)
+        fat.extend(range(start + 1, start + count))
+        fat.append(ENDOFCHAIN)
+        body += _pad(data, count * SECTOR)
+
+    dir_sector = len(fat)
+    fat.append(ENDOFCHAIN)
+
+    # Брой FAT сектори: всеки покрива 128 сектора, включително себе си
+    num_fat = 1
+    while len(fat) + num_fat > num_fat * (SECTOR // 4):
+        num_fat += 1
+    fat_start = len(fat)
+    fat.extend([FATSECT] * num_fat)
+    fat.extend([FREESECT] * (num_fat * (SECTOR // 4) - len(fat)))
+
+    entries = _dir_entry('Root Entry', 5, ENDOFCHAIN, 0, child=1)
+    for i, ((name, data), start) in enumerate(zip(streams, starts), 1):
+        right = i + 1 if i < len(streams) else FREESECT
+        entries += _dir_entry(name, 2, start, len(data), right=right)
+    if len(entries) > SECTOR:
+        raise ValueError("Твърде много потоци за един сектор директория")
+    directory = _pad(entries, SECTOR)
+
+    difat = list(range(fat_start, fat_start + num_fat))
+    if len(difat) > 109:
+        raise ValueError("Твърде голям файл за DIFAT в хедъра")
+    difat += [FREESECT] * (109 - len(difat))
+
+    header = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\0' * 16
+    header += struct.pack('<HHHHH', 0x003E, 3, 0xFFFE, 9, 6) + b'\0' * 6
+    header += struct.pack('<IIIIIIIII', 0, num_fat, dir_sector, 0, MINI_CUTOFF,
+                          ENDOFCHAIN, 0, ENDOFCHAIN, 0)
+    header += struct.pack('<109I', *difat)
+
+    return header + body + directory + struct.pack(f'<{len(fat)}I', *fat)
+
+
+def _compress_word_text(text: str) -> bytes:
+    """Текст -> 8-битово парче като Word: U+00XX и cp1252 0x80-0x9F; иначе ValueError."""
+    out = bytearray()
+    for ch in text:
+        code = ord(ch)
+        if code < 0x100 and not 0x80 <= code <= 0x9F:
+            out.append(code)
+        elif ch in COMPRESSED_BYTES:
+            out.append(COMPRESSED_BYTES[ch])
+        else:
+            raise ValueError(f"Символът {ch!r} не се побира в 8-битово парче")
+    return bytes(out)
+
+
+def build_doc(pieces: List[Tuple[str, bool]], lid: int = LID_BULGARIAN) -> bytes:
+    """Създава минимален Word 97 .doc с piece table.
+
+    Args:
+        pieces: [(текст, unicode), ...] — unicode=False означава 8-битово
+            (compressed) парче; както в Word, само за текст без кирилица
+        lid: Език на документа (не влияе на 8-битовите парчета)
+    """
+    text_data = b''
+    plc_cps = [0]
+    plc_pcds = b''
+    for text, unicode in pieces:
+        offset = TEXT_OFFSET + len(text_data)
+        if unicode:
+            text_data += text.encode('utf-16-le')
+            fc = offset
+        else:
+            text_data += _compress_word_text(text)
+            fc = (offset * 2) | 0x40000000
+        plc_cps.append(plc_cps[-1] + len(text))
+        plc_pcds += struct.pack('<HIH', 0, fc, 0)
+
+    plc = struct.pack(f'<{len(plc_cps)}I', *plc_cps) + plc_pcds
+    clx = b'\x02' + struct.pack('<I', len(plc)) + plc
+    table = clx
+
+    csw, cslw = 14, 22
+    fib = struct.pack('<HHHHHH', 0xA5EC, 0x00C1, 0, lid, 0, 0x0200 | 0x0004)
+    fib = _pad(fib, 32)
+    fib += struct.pack('<H', csw) + b'\0' * (csw * 2)
+    rg_lw = [0] * cslw
+    rg_lw[0] = TEXT_OFFSET + len(text_data)  # cbMac
+    rg_lw[3] = plc_cps[-1]                   # ccpText
+    fib += struct.pack('<H', cslw) + struct.pack(f'<{cslw}i', *rg_lw)
+    rg_fc_lcb = [0] * (FIB_RG_FC_LCB_COUNT * 2)
+    rg_fc_lcb[33 * 2] = 0
+    rg_fc_lcb[33 * 2 + 1] = len(clx)
+    fib += struct.pack('<H', FIB_RG_FC_LCB_COUNT) + struct.pack(f'<{len(rg_fc_lcb)}I', *rg_fc_lcb)
+
+    word = _pad(fib, TEXT_OFFSET) + text_data
+    return build_compound_file([('WordDocument', word), ('1Table', table)])
+
+
+def generate_doc_corpus(out_dir: Path, count: int = 10, seed: int = 42) -> List[Path]:
+    """Генерира .doc файлове: 8-битови, Unicode и смесени парчета, с полета и таблици.
+
+    Парчетата са като в Word: кирилицата е винаги в Unicode парчета, а
+    8-битовите носят латиница с типографски кавички и тирета (0x91-0x97).
+    """
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+
+    for i in range(count):
+        kind = ('ansi', 'unicode', 'mixed')[i % 3]
+        pieces = []
+        for j in range(rng.randint(5, 200)):
+            latin = kind == 'ansi' or (kind == 'mixed' and j % 2 == 0)
+            para = random_paragraph(rng, WORDS_EN if latin else WORDS_BG + WORDS_EN)
+            if latin:
+                para = f"\u201c{para[:-1]}\u201d \u2013 \u2018{rng.choice(WORDS_EN)}\u2019\u2026"
+            text = para + '\r'
+            if j % 7 == 3:
+                # Поле с код и показан резултат + ред от таблица
+                text = '\x13 PAGE \x14' + str(j) + '\x15 ' + text
+                text += ('Cell 1\x07Cell 2' if latin else 'Клетка 1\x07Клетка 2') + '\x07\x07'
+            pieces.append((text, not latin))
+
+        path = out_dir / f"sample_{i + 1:03d}_{kind}.doc"
+        path.write_bytes(build_doc(pieces))
+        paths.append(path)
+
+    return paths
+
+
+# ================== OPENDOCUMENT WRITER ==================
+
+ODF_CONTENT_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<office:document-content'
+    ' xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"'
+    ' xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0"'
+    ' xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0"'
+    ' office:version="1.2"><office:body>'
+)
+ODF_CONTENT_FOOTER = '</office:body></office:document-content>'
+
+ODF_MIMETYPES = {
+    '.odt': 'application/vnd.oasis.opendocument.text',
+    '.ods': 'application/vnd.oasis.opendocument.spreadsheet',
+}
+
+
+def build_odf(path: Path, body_xml: str) -> None:
+    """Записва минимален ODF пакет (mimetype, manifest, content.xml)."""
+    mimetype = ODF_MIMETYPES[path.suffix.lower()]
+    manifest = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0">'
+        f'<manifest:file-entry manifest:full-path="/" manifest:media-type="{mimetype}"/>'
+        '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+        '</manifest:manifest>'
+    )
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('mimetype', mimetype, compress_type=zipfile.ZIP_STORED)
+        zf.writestr('META-INF/manifest.xml', manifest, compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr('content.xml', ODF_CONTENT_HEADER + body_xml + ODF_CONTENT_FOOTER,
+                    compress_type=zipfile.ZIP_DEFLATED)
+
+
+def generate_odt_corpus(out_dir: Path, count: int = 10, seed: int = 42) -> List[Path]:
+    """Генерира .odt файлове с параграфи, заглавия, списъци и таблици."""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    words = WORDS_BG + WORDS_EN
+    paths = []
+
+    for i in range(count):
+        parts = ['<office:text>']
+        for section in range(rng.randint(2, 40)):
+            parts.append(f'<text:h text:outline-level="1">Раздел {section + 1}</text:h>')
+            for _ in range(rng.randint(1, 8)):
+                para = escape(random_paragraph(rng, words))
+                parts.append(f'<text:p>{para}<text:s text:c="2"/><text:span>край</text:span></text:p>')
+            parts.append('<text:list>')
+            for _ in range(rng.randint(1, 5)):
+                parts.append(f'<text:list-item><text:p>{escape(random_paragraph(rng, words, 2, 6))}'
+                             '</text:p></text:list-item>')
+            parts.append('</text:list>')
+            if section % 3 == 0:
+                parts.append('<table:table table:name="T">')
+                for _ in range(rng.randint(2, 10)):
+                    parts.append('<table:table-row>')
+                    for _ in range(4):
+                        parts.append(f'<table:table-cell><text:p>{rng.choice(words)}</text:p>'
+                                     '</table:table-cell>')
+                    parts.append('</table:table-row>')
+                parts.append('</table:table>')
+        parts.append('</office:text>')
+
+        path = out_dir / f"sample_{i + 1:03d}.odt"
+        build_odf(path, ''.join(parts))
+        paths.append(path)
+
+    return paths
+
+
+def generate_ods_corpus(out_dir: Path, count: int = 10, seed: int = 42,
+                        rows: int = 500, cols: int = 8) -> List[Path]:
+    """Генерира .ods таблици с няколко листа и повторени празни клетки."""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    words = WORDS_BG + WORDS_EN
+    paths = []
+
+    for i in range(count):
+        parts = ['<office:spreadsheet>']
+        for sheet in range(rng.randint(1, 3)):
+            parts.append(f'<table:table table:name="Лист{sheet + 1}">')
+            for _ in range(rng.randint(rows // 2, rows)):
+                parts.append('<table:table-row>')
+                for col in range(cols):
+                    value = rng.choice(words) if col % 2 else str(rng.randint(1, 99999))
+                    parts.append(f'<table:table-cell><text:p>{value}</text:p></table:table-cell>')
+                parts.append('<table:table-cell table:number-columns-repeated="1016"/>')
+                parts.append('</table:table-row>')
+            parts.append('<table:table-row table:number-rows-repeated="1048000">'
+                         '<table:table-cell table:number-columns-repeated="1024"/>'
+                         '</table:table-row>')
+            parts.append('</table:table>')
+        parts.append('</office:spreadsheet>')
+
+        path = out_dir / f"sample_{i + 1:03d}.ods"
+        build_odf(path, ''.join(parts))
+        paths.append(path)
+
+    return paths
+
+
+# ================== DOCX / TEAMS TRANSCRIPTS ==================
+
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/'
+    'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+    'relationships/officeDocument" Target="word/document.xml"/>'
+    '</Relationships>'
+)
+W_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+TEAMS_SPEAKERS = ['Ivan Petrov', 'Maria Georgieva', 'Jean Dupont', 'Anna Smith', 'Георги Иванов']
+
+
+def _docx_paragraph(lines: List[str]) -> str:
+    """Параграф с редове, разделени с <w:br/> (както в Teams транскриптите)."""
+    runs = '<w:r><w:br/></w:r>'.join(
+        f'<w:r><w:t xml:space="preserve">{escape(line)}</w:t></w:r>' for line in lines
+    )
+    return f'<w:p>{runs}</w:p>'
+
+
+def build_docx(path: Path, paragraphs: List[List[str]]) -> None:
+    """Записва минимален DOCX (content types, rels, document.xml)."""
+    body = ''.join(_docx_paragraph(lines) for lines in paragraphs)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<w:document xmlns:w="{W_NAMESPACE}"><w:body>{body}</w:body></w:document>'
+    )
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', DOCX_CONTENT_TYPES)
+        zf.writestr('_rels/.rels', DOCX_RELS)
+        zf.writestr('word/document.xml', document)
+
+
+def generate_docx_corpus(out_dir: Path, count: int = 10, seed: int = 42,
+                         paragraphs: int = 400) -> List[Path]:
+    """Генерира обикновени DOCX документи (заглавия и параграфи, не транскрипти)."""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    words = WORDS_BG + WORDS_EN
+    paths = []
+
+    for i in range(count):
+        content = []
+        for j in range(rng.randint(paragraphs // 2, paragraphs)):
+            if j % 20 == 0:
+                content.append([f"Раздел {j // 20 + 1}. {random_paragraph(rng, words, 2, 5)}"])
+            else:
+                content.append([random_paragraph(rng, words)])
+
+        path = out_dir / f"sample_{i + 1:03d}.docx"
+        build_docx(path, content)
+        paths.append(path)
+
+    return paths
+
+
+def _format_stamp(seconds: int) -> str:
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
+def generate_teams_corpus(out_dir: Path, count: int = 10, seed: int = 42,
+                          hours: float = 2) -> List[Path]:
+    """Генерира Teams транскрипти (DOCX) с продължителност ~hours часа."""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    words = WORDS_BG + WORDS_EN
+    paths = []
+
+    for i in range(count):
+        total = int(hours * 3600)
+        paragraphs = [
+            [f"Client Meeting-202602{i % 28 + 1:02d}_120000-Recording"],
+            [f"{i % 28 + 1} février 2026, 12:00PM"],
+            [f"{total // 60}min {total % 60}sec"],
+            [f"{TEAMS_SPEAKERS[0]} a commencé la transcription"],
+        ]
+        seconds = 0
+        while seconds < total:
+            speaker = rng.choice(TEAMS_SPEAKERS)
+            text = [random_paragraph(rng, words, 3, 30) for _ in range(rng.randint(1, 3))]
+            paragraphs.append([f"{speaker}   {_format_stamp(seconds)}"] + text)
+            seconds += rng.randint(3, 40)
+
+        path = out_dir / f"sample_{i + 1:03d}_teams.docx"
+        build_docx(path, paragraphs)
+        paths.append(path)
+
+    return paths
+
+
+def _cue_stamp(seconds: float, separator: str) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, secs = divmod(rest, 60)
+    millis = int(round((seconds - int(seconds)) * 1000))
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def generate_vtt_corpus(out_dir: Path, count: int = 10, seed: int = 42,
+                        hours: float = 2, srt: bool = False) -> List[Path]:
+    """Генерира VTT (или SRT) транскрипти; един говорещ често има няколко поредни cue-та."""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    words = WORDS_BG + WORDS_EN
+    separator = ',' if srt else '.'
+    paths = []
+
+    for i in range(count):
+        total = hours * 3600
+        lines = [] if srt else ['WEBVTT', '', 'NOTE генериран от corpus.py', '']
+        seconds = 0.0
+        cue = 0
+        while seconds < total:
+            speaker = rng.choice(TEAMS_SPEAKERS)
+            for _ in range(rng.randint(1, 4)):
+                cue += 1
+                end = seconds + rng.uniform(1.5, 6)
+                text = random_paragraph(rng, words, 3, 14)
+                lines.append(str(cue) if srt else f"{cue:08x}-{rng.randint(0, 9)}")
+                lines.append(f"{_cue_stamp(seconds, separator)} --> {_cue_stamp(end, separator)}")
+                lines.append(f"{speaker}: {text}" if srt else f"<v {speaker}>{text}</v>")
+                lines.append('')
+                seconds = end + rng.uniform(0, 1)
+
+        path = out_dir / f"sample_{i + 1:03d}_transcript.{'srt' if srt else 'vtt'}"
+        path.write_text('\n'.join(lines), encoding='utf-8')
+        paths.append(path)
+
+    return paths
+
+
+# ================== TEXT LOGS ==================
+
+def generate_txt_corpus(out_dir: Path, count: int = 10, seed: int = 42,
+                        size_mb: float = 8) -> List[Path]:
+    """Генерира големи текстови логове (~size_mb MB): cp1251, UTF-8, UTF-8 с BOM."""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    words = WORDS_BG + WORDS_EN
+    # Блок от редове, който се повтаря до желания размер
+    block = '\n'.join(
+        f"2026-02-{rng.randint(1, 28):02d} 12:{rng.randint(0, 59):02d}:00 INFO "
+        f"{random_paragraph(rng, words, 4, 16)}"
+        for _ in range(500)
+    ) + '\n'
+    paths = []
+
+    for i in range(count):
+        kind = ('cp1251', 'utf-8', 'utf-8-sig')[i % 3]
+        data = block.encode(kind)
+        repeat = max(1, int(size_mb * 1024 * 1024 / len(data)))
+        path = out_dir / f"sample_{i + 1:03d}_{kind}.txt"
+        with open(path, 'wb') as f:
+            if kind == 'utf-8-sig':
+                f.write(data)
+                data = block.encode('utf-8')
+                repeat -= 1
+            for _ in range(repeat):
+                f.write(data)
+        paths.append(path)
+
+    return paths
+
+
+# ================== XML EXPORTS ==================
+
+def generate_xml_corpus(out_dir: Path, count: int = 10, seed: int = 42,
+                        size_mb: float = 8) -> List[Path]:
+    """Генерира EDI-подобни XML експорти (~size_mb MB), записвани поточно."""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    words = WORDS_BG + WORDS_EN
+    paths = []
+
+    for i in range(count):
+        path = out_dir / f"sample_{i + 1:03d}.xml"
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<Export xmlns="urn:example:edi" version="2">\n')
+            n = 0
+            while f.tell() < size_mb * 1024 * 1024:
+                n += 1
+                f.write(
+                    f'  <Invoice id="{n}">\n'
+                    f'    <Header><Number>{rng.randint(1000, 99999)}</Number>'
+                    f'<Date>2026-02-{rng.randint(1, 28):02d}</Date></Header>\n'
+                    f'    <Party role="buyer"><Name>{escape(random_paragraph(rng, words, 2, 4))}</Name></Party>\n'
+                    f'    <Note>Забележка: <b>{rng.choice(words)}</b> и {rng.choice(words)}</Note>\n'
+                    f'    <Lines>\n'
+                )
+                for _ in range(rng.randint(1, 6)):
+                    f.write(f'      <Line><Description>{escape(random_paragraph(rng, words, 3, 10))}'
+                            f'</Description><Amount>{rng.uniform(1, 9999):.2f}</Amount></Line>\n')
+                f.write('    </Lines>\n  </Invoice>\n')
+            f.write('</Export>\n')
+        paths.append(path)
+
+    return paths
+
+
+# ================== RTF WRITER ==================
+
+RTF_HEADER = (
+    r'{\rtf1\ansi\ansicpg1251\deff0'
+    r'{\fonttbl{\f0\fnil\fcharset204 Times New Roman;}{\f1\fswiss\fcharset0 Arial;}}'
+    r'{\colortbl;\red0\green0\blue0;}'
+    r'{\stylesheet{\s0 Normal;}}'
+    r'{\*\generator corpus.py;}'
+    '\n'
+)
+
+
+def _rtf_escape(text: str, unicode: bool) -> str:
+    """Кодира текст като RTF: \\'xx (cp1251) или \\uN? за не-ASCII."""
+    out = []
+    for ch in text:
+        if ch in '\\{}':
+            out.append('\\' + ch)
+        elif ord(ch) < 128:
+            out.append(ch)
+        elif unicode:
+            code = ord(ch)
+            out.append(f'\\u{code - 65536 if code > 32767 else code}?')
+        else:
+            out.append(''.join(f"\\'{b:02x}" for b in ch.encode('cp1251', errors='replace')))
+    return ''.join(out)
+
+
+def generate_rtf_corpus(out_dir: Path, count: int = 10, seed: int = 42,
+                        image_kb: int = 2048) -> List[Path]:
+    """Генерира .rtf файлове с кирилица и вградени \\pict hex блокове (~image_kb KB всеки)."""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    words = WORDS_BG + WORDS_EN
+    paths = []
+
+    for i in range(count):
+        parts = [RTF_HEADER]
+        for j in range(rng.randint(20, 200)):
+            para = random_paragraph(rng, words)
+            parts.append(r'\pard\plain\f0 ' + _rtf_escape(para, unicode=j % 2 == 1) + '\\par\n')
+            if j % 50 == 10:
+                blob = rng.randbytes(image_kb * 512).hex()
+                lines = '\n'.join(blob[k:k + 128] for k in range(0, len(blob), 128))
+                parts.append(r'{\*\shppict{\pict\pngblip\picw100\pich100 ' + lines + '}}\n')
+        parts.append('}')
+
+        path = out_dir / f"sample_{i + 1:03d}.rtf"
+        path.write_text(''.join(parts), encoding='ascii')
+        paths.append(path)
+
+    return paths
+
+
+# ================== EML MESSAGES ==================
+
+# (charset, Content-Transfer-Encoding, речник) — iso-8859-1 няма кирилица
+EML_CHARSETS = [
+    ('utf-8', 'quoted-printable', WORDS_BG + WORDS_EN),
+    ('windows-1251', 'base64', WORDS_BG),
+    ('koi8-r', '8bit', WORDS_BG),
+    ('iso-8859-1', 'quoted-printable', WORDS_FR),
+    ('utf-8', '8bit', WORDS_FR + WORDS_BG),
+]
+DOCX_MIME = ('application', 'vnd.openxmlformats-officedocument.wordprocessingml.document')
+
+
+def _docx_bytes(rng: random.Random, words: List[str], paragraphs: int = 20) -> bytes:
+    buffer = io.BytesIO()
+    build_docx(buffer, [[random_paragraph(rng, words)] for _ in range(paragraphs)])
+    return buffer.getvalue()
+
+
+def _eml_body(rng: random.Random, words: List[str], reply: bool) -> str:
+    """Тяло с обръщение, параграфи, подпис и (при отговор) цитирана история."""
+    cyrillic = 'заявка' in words
+    lines = ['Здравейте,' if cyrillic else 'Bonjour,', '']
+    for _ in range(rng.randint(2, 12)):
+        lines += [random_paragraph(rng, words, 10, 60), '']
+    # Подписът е в кодировката на писмото — без кирилско име в iso-8859-1
+    signers = TEAMS_SPEAKERS if cyrillic else [name for name in TEAMS_SPEAKERS if name.isascii()]
+    lines += ['Поздрави,' if cyrillic else 'Cordialement,', rng.choice(signers)]
+    if reply:
+        lines += ['', 'On Mon, 2 Feb 2026 at 10:00, Client <client@example.bg> wrote:']
+        lines += [f"> {random_paragraph(rng, words, 5, 20)}" for _ in range(rng.randint(3, 30))]
+    return '\n'.join(lines) + '\n'
+
+
+def generate_eml_corpus(out_dir: Path, count: int = 10, seed: int = 42) -> List[Path]:
+    """Генерира .eml писма с различни кодировки и вложени прикачени файлове.
+
+    Всяко писмо е в една от EML_CHARSETS; част от тях имат HTML версия,
+    цитирана история (отговор), DOCX и cp1251 TXT прикачени и препратено
+    писмо (message/rfc822) със собствен DOCX.
+    """
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    start = datetime(2026, 2, 2, 9, 0, tzinfo=timezone(timedelta(hours=2)))
+    paths = []
+
+    for i in range(count):
+        charset, cte, words = EML_CHARSETS[i % len(EML_CHARSETS)]
+        reply = i % 3 == 1
+        msg = EmailMessage()
+        msg['From'] = f"{rng.choice(TEAMS_SPEAKERS)} <client{i % 7}@example.bg>"
+        msg['To'] = 'requests@example.bg'
+        if i % 4 == 0:
+            msg['Cc'] = 'Георги Иванов <georgi@example.bg>'
+        msg['Subject'] = ('RE: ' if reply else '') + random_paragraph(rng, words, 3, 8).rstrip('.')
+        msg['Date'] = format_datetime(start + timedelta(minutes=17 * i))
+        msg['Message-ID'] = f"<corpus-{seed}-{i + 1}@example.bg>"
+        if reply:
+            msg['In-Reply-To'] = f"<corpus-{seed}-{i}@example.bg>"
+            msg['References'] = msg['In-Reply-To']
+
+        body = _eml_body(rng, words, reply)
+        msg.set_content(body, charset=charset, cte=cte)
+        if i % 2 == 0:
+            html = ''.join(f"<p>{escape(line)}</p>" if line else '<br>' for line in body.splitlines())
+            msg.add_alternative(f"<html><body>{html}</body></html>", subtype='html', charset=charset, cte=cte)
+
+        if i % 3 == 0:
+            msg.add_attachment(_docx_bytes(rng, words), maintype=DOCX_MIME[0], subtype=DOCX_MIME[1],
+                               filename=f"Отчет {i + 1}.docx")
+        if i % 4 == 1:
+            log = '\n'.join(random_paragraph(rng, WORDS_BG, 4, 16) for _ in range(200))
+            msg.add_attachment(log.encode('cp1251'), maintype='text', subtype='plain',
+                               filename='log_cp1251.txt')
+        if i % 5 == 2:
+            inner = EmailMessage()
+            inner['From'] = 'Supplier <supplier@example.com>'
+            inner['Subject'] = random_paragraph(rng, WORDS_EN, 3, 6).rstrip('.')
+            inner['Date'] = format_datetime(start - timedelta(days=1))
+            inner.set_content(_eml_body(rng, WORDS_EN, False))
+            inner.add_attachment(_docx_bytes(rng, WORDS_EN, 10), maintype=DOCX_MIME[0],
+                                 subtype=DOCX_MIME[1], filename='specification.docx')
+            msg.add_attachment(inner)
+
+        path = out_dir / f"sample_{i + 1:03d}_{charset}.eml"
+        path.write_bytes(bytes(msg))
+        paths.append(path)
+
+    return paths
+
+
+# ================== XLSX WRITER ==================
+
+XLSX_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+XLSX_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+XLSX_PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+XLSX_MAIN = 'application/vnd.openxmlformats-officedocument.spreadsheetml'
+XLSX_STYLES = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><styleSheet xmlns="{XLSX_NS}">'
+    '<fonts count="1"><font/></fonts><fills count="1"><fill/></fills>'
+    '<borders count="1"><border/></borders><cellStyleXfs count="1"><xf/></cellStyleXfs>'
+    '<cellXfs count="1"><xf/></cellXfs></styleSheet>'
+)
+
+
+def _column_letter(index: int) -> str:
+    """0 -> A, 25 -> Z, 26 -> AA."""
+    letters = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+
+def build_xlsx(path: Path, sheets: List[Tuple[str, int]], cols: int, strings: List[str],
+               rng: random.Random) -> None:
+    """Записва XLSX с листове (име, брой редове); редовете се пишат поточно.
+
+    Нечетните колони са shared strings (индекс в strings), четните — числа.
+    """
+    columns = [_column_letter(c) for c in range(cols)]
+    overrides = ''.join(
+        f'<Override PartName="/xl/worksheets/sheet{n}.xml" ContentType="{XLSX_MAIN}.worksheet+xml"/>'
+        for n in range(1, len(sheets) + 1)
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        f'<Override PartName="/xl/workbook.xml" ContentType="{XLSX_MAIN}.sheet.main+xml"/>'
+        f'<Override PartName="/xl/sharedStrings.xml" ContentType="{XLSX_MAIN}.sharedStrings+xml"/>'
+        f'<Override PartName="/xl/styles.xml" ContentType="{XLSX_MAIN}.styles+xml"/>'
+        f'{overrides}</Types>'
+    )
+    package_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Relationships xmlns="{XLSX_PACKAGE_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{XLSX_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    )
+    workbook = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<workbook xmlns="{XLSX_NS}" xmlns:r="{XLSX_REL_NS}"><sheets>'
+        + ''.join(f'<sheet name="{escape(name)}" sheetId="{n}" r:id="rId{n}"/>'
+                  for n, (name, _) in enumerate(sheets, 1))
+        + '</sheets></workbook>'
+    )
+    n_sheets = len(sheets)
+    workbook_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Relationships xmlns="{XLSX_PACKAGE_REL_NS}">'
+        + ''.join(f'<Relationship Id="rId{n}" Type="{XLSX_REL_NS}/worksheet" Target="worksheets/sheet{n}.xml"/>'
+                  for n in range(1, n_sheets + 1))
+        + f'<Relationship Id="rId{n_sheets + 1}" Type="{XLSX_REL_NS}/sharedStrings" Target="sharedStrings.xml"/>'
+        + f'<Relationship Id="rId{n_sheets + 2}" Type="{XLSX_REL_NS}/styles" Target="styles.xml"/>'
+        + '</Relationships>'
+    )
+    shared = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<sst xmlns="{XLSX_NS}" count="{len(strings)}" uniqueCount="{len(strings)}">'
+        + ''.join(f'<si><t>{escape(text)}</t></si>' for text in strings)
+        + '</sst>'
+    )
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', content_types)
+        zf.writestr('_rels/.rels', package_rels)
+        zf.writestr('xl/workbook.xml', workbook)
+        zf.writestr('xl/_rels/workbook.xml.rels', workbook_rels)
+        zf.writestr('xl/sharedStrings.xml', shared)
+        zf.writestr('xl/styles.xml', XLSX_STYLES)
+        for n, (_, rows) in enumerate(sheets, 1):
+            with zf.open(f'xl/worksheets/sheet{n}.xml', 'w', force_zip64=True) as sheet:
+                sheet.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                            f'<worksheet xmlns="{XLSX_NS}"><sheetData>'.encode('utf-8'))
+                for row in range(1, rows + 1):
+                    cells = [f'<c r="{col}{row}" t="s"><v>{rng.randrange(len(strings))}</v></c>' if c % 2
+                             else f'<c r="{col}{row}"><v>{rng.randint(1, 999999) / 100}</v></c>'
+                             for c, col in enumerate(columns)]
+                    sheet.write(f'<row r="{row}">{"".join(cells)}</row>'.encode('utf-8'))
+                sheet.write(b'</sheetData></worksheet>')
+
+
+def generate_xlsx_corpus(out_dir: Path, count: int = 10, seed: int = 42,
+                         rows: int = 5000, cols: int = 10) -> List[Path]:
+    """Генерира .xlsx файлове с 1-3 листа по ~rows реда x cols колони."""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    words = WORDS_BG + WORDS_EN
+    strings = [random_paragraph(rng, words, 1, 5) for _ in range(500)]
+    paths = []
+
+    for i in range(count):
+        sheets = [(f"Лист{n + 1}", rng.randint(rows // 2, rows)) for n in range(rng.randint(1, 3))]
+        path = out_dir / f"sample_{i + 1:03d}.xlsx"
+        build_xlsx(path, sheets, cols, strings, rng)
+        paths.append(path)
+
+    return paths
+
+
+# ================== PDF WRITER ==================
+
+PDF_PAGE_SIZE = (595, 842)  # A4 в точки
+PDF_LINE_HEIGHT = 14
+# "Сканирана" страница: сиво изображение ~100 DPI
+SCAN_SIZE = (827, 1169)
+
+
+def _pdf_string(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def build_pdf(path: Path, pages: List[Tuple[bytes, bytes]]) -> None:
+    """Записва PDF 1.4: всяка страница е (content stream, сиво изображение или b'').
+
+    Изображенията са 8-битови DeviceGray със SCAN_SIZE и FlateDecode.
+    """
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    def stream(header: str, data: bytes) -> bytes:
+        return f"<< {header} /Length {len(data)} >>\nstream\n".encode('ascii') + data + b"\nendstream"
+
+    catalog = add(b'')
+    pages_id = add(b'')
+    font = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    kids = []
+    for content, image in pages:
+        resources = f'/Font << /F1 {font} 0 R >>'
+        if image:
+            width, height = SCAN_SIZE
+            image_id = add(stream(f'/Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                                  '/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode', image))
+            resources += f' /XObject << /Im1 {image_id} 0 R >>'
+        content_id = add(stream('', content))
+        kids.append(add(f'<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 {PDF_PAGE_SIZE[0]} '
+                        f'{PDF_PAGE_SIZE[1]}] /Resources << {resources} >> /Contents {content_id} 0 R >>'
+                        .encode('ascii')))
+    objects[catalog - 1] = f'<< /Type /Catalog /Pages {pages_id} 0 R >>'.encode('ascii')
+    objects[pages_id - 1] = (f'<< /Type /Pages /Kids [{" ".join(f"{k} 0 R" for k in kids)}] '
+                             f'/Count {len(kids)} >>').encode('ascii')
+
+    out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n'.encode('ascii') + body + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('ascii')
+    out += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode('ascii')
+    out += (f'trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\n'
+            f'startxref\n{xref}\n%%EOF\n').encode('ascii')
+    path.write_bytes(bytes(out))
+
+
+def _text_page(rng: random.Random, words: List[str]) -> bytes:
+    lines = [f'BT /F1 10 Tf {PDF_LINE_HEIGHT} TL 50 {PDF_PAGE_SIZE[1] - 60} Td']
+    for _ in range((PDF_PAGE_SIZE[1] - 120) // PDF_LINE_HEIGHT):
+        text = random_paragraph(rng, words, 8, 14)
+        lines.append(f'({_pdf_string(text)}) Tj T*')
+    lines.append('ET')
+    return '\n'.join(lines).encode('cp1252')
+
+
+def _scanned_page(rng: random.Random) -> Tuple[bytes, bytes]:
+    """Страница само с изображение: бял фон и тъмни "редове" с шум — без текстов слой."""
+    width, height = SCAN_SIZE
+    blank = bytes([250]) * width
+    rows = []
+    for y in range(height):
+        if 80 < y < height - 80 and y % 24 < 9:
+            start = rng.randint(60, 120)
+            end = rng.randint(width // 2, width - 60)
+            row = bytearray(blank)
+            for x in range(start, end, rng.randint(3, 6)):
+                row[x:x + 2] = bytes([rng.randint(10, 90)]) * 2
+            rows.append(bytes(row))
+        else:
+            rows.append(blank)
+    image = zlib.compress(b''.join(rows), 6)
+    content = f'q {PDF_PAGE_SIZE[0]} 0 0 {PDF_PAGE_SIZE[1]} 0 0 cm /Im1 Do Q'.encode('ascii')
+    return content, image
+
+
+def generate_pdf_corpus(out_dir: Path, count: int = 10, seed: int = 42,
+                        pages: int = 10, scanned: bool = False) -> List[Path]:
+    """Генерира текстови PDF-и (Helvetica, WinAnsi) или "сканирани" (само изображения).
+
+    Сканираните нямат текстов слой — pdf_extractor минава към изображения.
+    """
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    words = WORDS_EN + WORDS_FR
+    paths = []
+
+    for i in range(count):
+        page_count = rng.randint(max(1, pages // 2), pages)
+        if scanned:
+            content = [_scanned_page(rng) for _ in range(page_count)]
+        else:
+            content = [(_text_page(rng, words), b'') for _ in range(page_count)]
+        path = out_dir / f"sample_{i + 1:03d}{'_scanned' if scanned else ''}.pdf"
+        build_pdf(path, content)
+        paths.append(path)
+
+    return paths
+
+
+def generate_scanned_pdf_corpus(out_dir: Path, count: int = 10, seed: int = 42,
+                                pages: int = 3) -> List[Path]:
+    return generate_pdf_corpus(out_dir, count, seed, pages=pages, scanned=True)
+
+
+# Формат -> генератор (out_dir, count, seed) -> [пътища]
+GENERATORS = {
+    'doc': generate_doc_corpus,
+    'docx': generate_docx_corpus,
+    'eml': generate_eml_corpus,
+    'odt': generate_odt_corpus,
+    'ods': generate_ods_corpus,
+    'pdf': generate_pdf_corpus,
+    'pdf-scanned': generate_scanned_pdf_corpus,
+    'rtf': generate_rtf_corpus,
+    'teams': generate_teams_corpus,
+    'txt': generate_txt_corpus,
+    'vtt': generate_vtt_corpus,
+    'xlsx': generate_xlsx_corpus,
+    'xml': generate_xml_corpus,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ClientRequests Synthetic Corpus Generator')
+    parser.add_argument('--out', type=str, default='corpus', help='Изходна папка')
+    parser.add_argument('--count', type=int, default=10, help='Брой файлове от всеки вид')
+    parser.add_argument('--seed', type=int, default=42, help='Seed за възпроизводимост')
+    parser.add_argument('--rows', type=int, help='Редове на лист в XLSX (по подразбиране 5000)')
+    parser.add_argument('--only', nargs='*', choices=sorted(GENERATORS), help='Само тези видове')
+    args = parser.parse_args()
+
+    out_dir = Path(args.out)
+    for name, generate in GENERATORS.items():
+        if args.only and name not in args.only:
+            continue
+        if name == 'xlsx' and args.rows:
+            paths = generate(out_dir / name, args.count, args.seed, rows=args.rows)
+        else:
+            paths = generate(out_dir / name, args.count, args.seed)
+        print(f"Генерирани {len(paths)} {name} файла в {out_dir / name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+"""
+ClientRequests DOC Reader
+=========================
+Чист Python четец за стари Word документи (.doc, Word 97-2003).
+
+Не изисква Word, win32com или външни процеси — чете директно:
+- OLE Compound File (CFB) контейнера: FAT/DIFAT, MiniFAT, директория
+- FIB (File Information Block) от потока WordDocument
+- CLX / piece table от потока 0Table или 1Table
+
+Всяко парче (piece) от текста е или 8-битово (compressed), или UTF-16LE.
+8-битовите парчета са винаги cp1252 (по MS-DOC: байтът е U+00XX, освен
+0x80-0x9F с таблицата на спецификацията) независимо от езика на
+документа — Word пише кирилицата в UTF-16 парчета.
+
+Използване:
+    from doc_reader import read_doc_text
+    text = read_doc_text(Path("X.doc"))
+
+    python doc_reader.py X.doc           # Отпечатва извлечения текст
+"""
+
+import logging
+import re
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# ================== OLE COMPOUND FILE ==================
+
+CFB_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+FREESECT = 0xFFFFFFFF
+ENDOFCHAIN = 0xFFFFFFFE
+FATSECT = 0xFFFFFFFD
+DIFSECT = 0xFFFFFFFC
+
+NOSTREAM = 0xFFFFFFFF
+
+STGTY_STORAGE = 1
+STGTY_STREAM = 2
+STGTY_ROOT = 5
+
+
+class CompoundFile:
+    """Минимален четец на OLE Compound File (само четене на потоци)."""
+
+    def __init__(self, data: bytes):
+        if len(data) < 512 or data[:8] != CFB_SIGNATURE:
+            raise ValueError("Не е OLE Compound File (липсва CFB сигнатура)")
+
+        self.data = memoryview(data)
+        (sector_shift, mini_shift) = struct.unpack_from('<HH', data, 0x1E)
+        (num_fat, first_dir, _, self.mini_cutoff, first_minifat, num_minifat,
+         first_difat, num_difat) = struct.unpack_from('<IIIIIIII', data, 0x2C)
+
+        self.sector_size = 1 << sector_shift
+        self.mini_sector_size = 1 << mini_shift
+
+        self.fat = self._read_fat(num_fat, first_difat, num_difat)
+        self.entries = self._read_directory(first_dir)
+
+        root = self.entries.get('Root Entry') or next(
+            (e for e in self.entries.values() if e[0] == STGTY_ROOT), None)
+        if root is None:
+            raise ValueError("Липсва Root Entry в OLE директорията")
+
+        self.mini_stream = self._read_chain(root[1], root[2]) if root[2] else b''
+        self.minifat = self._unpack_ids(
+            self._read_chain(first_minifat, num_minifat * self.sector_size)
+        ) if num_minifat else []
+
+    def _sector(self, sid: int) -> memoryview:
+        offset = (sid + 1) * self.sector_size
+        if offset + self.sector_size > len(self.data):
+            raise ValueError(f"Сектор {sid} е извън файла")
+        return self.data[offset:offset + self.sector_size]
+
+    @staticmethod
+    def _unpack_ids(raw) -> List[int]:
+        return list(struct.unpack(f'<{len(raw) // 4}I', raw))
+
+    def _read_fat(self, num_fat: int, first_difat: int, num_difat: int) -> List[int]:
+        """Сглобява FAT таблицата от DIFAT масива в хедъра и DIFAT секторите."""
+        fat_sectors = self._unpack_ids(self.data[0x4C:0x200])
+
+        sid = first_difat
+        per_sector = self.sector_size // 4 - 1
+        for _ in range(num_difat):
+            if sid in (ENDOFCHAIN, FREESECT):
+                break
+            ids = self._unpack_ids(self._sector(sid))
+            fat_sectors.extend(ids[:per_sector])
+            sid = ids[per_sector]
+
+        fat: List[int] = []
+        for sid in fat_sectors[:num_fat]:
+            if sid == FREESECT:
+                break
+            fat.extend(self._unpack_ids(self._sector(sid)))
+        return fat
+
+    def _chain(self, start: int, table: List[int]) -> List[int]:
+        chain = []
+        sid = start
+        limit = len(table)
+        while sid not in (ENDOFCHAIN, FREESECT) and sid < limit:
+            chain.append(sid)
+            if len(chain) > limit:
+                raise ValueError("Зациклена верига от сектори в OLE файла")
+            sid = table[sid]
+        return chain
+
+    def _read_chain(self, start: int, size: int) -> bytes:
+        chunks = [self._sector(sid) for sid in self._chain(start, self.fat)]
+        return b''.join(chunks)[:size]
+
+    def _read_mini_chain(self, start: int, size: int) -> bytes:
+        step = self.mini_sector_size
+        chunks = [self.mini_stream[sid * step:(sid + 1) * step]
+                  for sid in self._chain(start, self.minifat)]
+        return b''.join(chunks)[:size]
+
+    def _read_directory(self, first_dir: int) -> Dict[str, Tuple[int, int, int]]:
+        """Връща {име: (тип, начален сектор, размер)} за всички записи."""
+        raw = self._read_chain(first_dir, len(self.data))
+        entries = {}
+        # Всички записи по номер (за дървото — paths()): име, тип, ляв, десен, дете, сектор, размер
+        self.nodes: List[Tuple[str, int, int, int, int, int, int]] = []
+        for offset in range(0, len(raw) - 127, 128):
+            name_len = struct.unpack_from('<H', raw, offset + 64)[0]
+            entry_type = raw[offset + 66]
+            left, right, child = struct.unpack_from('<III', raw, offset + 68)
+            start, size = struct.unpack_from('<IQ', raw, offset + 116)
+            if self.sector_size == 512:
+                size &= 0xFFFFFFFF  # v3: горните 32 бита може да са боклук
+            valid = 2 <= name_len <= 64
+            name = raw[offset:offset + name_len - 2].decode('utf-16-le', errors='replace') if valid else ''
+            self.nodes.append((name, entry_type, left, right, child, start, size))
+            if entry_type not in (STGTY_STREAM, STGTY_ROOT) or not valid:
+                continue
+            entries.setdefault(name, (entry_type, start, size))
+        return entries
+
+    def paths(self) -> Dict[str, Tuple[int, int, int]]:
+        """Всички потоци и хранилища с пълен път ('хранилище/поток') -> (тип, сектор, размер).
+
+        entries е плосък речник по име — при .msg едни и същи имена има в
+        корена и във всяко прикачено; тук йерархията се пази.
+        """
+        result = {}
+        if not self.nodes:
+            return result
+        stack = [(self.nodes[0][4], '')]
+        seen = set()
+        while stack:
+            sid, prefix = stack.pop()
+            if sid == NOSTREAM or sid >= len(self.nodes) or sid in seen:
+                continue
+            seen.add(sid)
+            name, entry_type, left, right, child, start, size = self.nodes[sid]
+            stack += [(left, prefix), (right, prefix)]
+            if entry_type not in (STGTY_STORAGE, STGTY_STREAM) or not name:
+                continue
+            result[prefix + name] = (entry_type, start, size)
+            if entry_type == STGTY_STORAGE:
+                stack.append((child, f"{prefix}{name}/"))
+        return result
+
+    def has_stream(self, name: str) -> bool:
+        return name in self.entries
+
+    def open_stream(self, name: str) -> bytes:
+        """Връща съдържанието на поток по име."""
+        entry = self.entries.get(name)
+        if entry is None:
+            raise KeyError(f"Потокът {name} липсва в OLE файла")
+        return self.read_entry(entry)
+
+    def read_entry(self, entry: Tuple[int, int, int]) -> bytes:
+        """Съдържанието на запис (тип, сектор, размер) — от entries или paths()."""
+        entry_type, start, size = entry
+        if entry_type != STGTY_ROOT and size < self.mini_cutoff:
+            return self._read_mini_chain(start, size)
+        return self._read_chain(start, size)
+
+
+# ================== WORD 97 PIECE TABLE ==================
+
+WORD_IDENT = 0xA5EC
+
+FIB_FLAG_WHICH_TABLE = 0x0200
+FIB_FLAG_ENCRYPTED = 0x0100
+
+PIECE_COMPRESSED = 0x40000000
+
+# Индекс на fcClx в FibRgFcLcb97 (двойки fc/lcb)
+FC_CLX_INDEX = 33
+
+# 8-битови (compressed) парчета: байтовете 0x80-0x9F, които не са U+00XX
+# (MS-DOC 2.4.1) — останалите байтове са U+0000-U+00FF както са
+COMPRESSED_CHAR_MAP = {
+    0x82: '\u201a', 0x83: '\u0192', 0x84: '\u201e', 0x85: '\u2026',
+    0x86: '\u2020', 0x87: '\u2021', 0x88: '\u02c6', 0x89: '\u2030',
+    0x8A: '\u0160', 0x8B: '\u2039', 0x8C: '\u0152', 0x91: '\u2018',
+    0x92: '\u2019', 0x93: '\u201c', 0x94: '\u201d', 0x95: '\u2022',
+    0x96: '\u2013', 0x97: '\u2014', 0x98: '\u02dc', 0x99: '\u2122',
+    0x9A: '\u0161', 0x9B: '\u203a', 0x9C: '\u0153', 0x9F: '\u0178',
+}
+COMPRESSED_TRANSLATION = str.maketrans({chr(b): ch for b, ch in COMPRESSED_CHAR_MAP.items()})
+
+# Специални символи от потока на Word -> текст
+WORD_CHAR_MAP = {
+    '\r': '\n',      # край на параграф
+    '\x07': '\t',    # край на клетка / ред в таблица
+    '\x0b': '\n',    # ръчен нов ред
+    '\x0c': '\n',    # нова страница / секция
+    '\x0e': '\n',    # нова колона
+    '\x1e': '-',     # неразделимо тире
+    '\x1f': '',      # условно тире
+    '\xa0': ' ',     # неразделим интервал
+}
+
+# Маркери, които нямат текстово представяне (картинки, бележки и т.н.)
+WORD_DROP_CHARS = {'\x01', '\x02', '\x03', '\x04', '\x05', '\x08'}
+
+FIELD_BEGIN = '\x13'
+FIELD_SEPARATOR = '\x14'
+FIELD_END = '\x15'
+FIELD_MARKS = re.compile('([\x13\x14\x15])')
+
+WORD_TRANSLATION = str.maketrans(
+    {**WORD_CHAR_MAP, **{ch: None for ch in WORD_DROP_CHARS}}
+)
+
+
+def decode_compressed(data: bytes) -> str:
+    """Декодира 8-битово (compressed) парче по MS-DOC — без значение от LID."""
+    return data.decode('latin-1').translate(COMPRESSED_TRANSLATION)
+
+
+def _parse_fib(word: bytes) -> Dict:
+    """Чете нужните полета от FIB."""
+    if len(word) < 34:
+        raise ValueError("Потокът WordDocument е твърде къс")
+
+    ident, nfib, _, lid, _, flags = struct.unpack_from('<HHHHHH', word, 0)
+    if ident != WORD_IDENT:
+        raise ValueError(f"Невалиден FIB идентификатор: 0x{ident:04X}")
+
+    offset = 32
+    csw = struct.unpack_from('<H', word, offset)[0]
+    offset += 2 + csw * 2
+    cslw = struct.unpack_from('<H', word, offset)[0]
+    rg_lw = offset + 2
+    offset = rg_lw + cslw * 4
+    cb_rg_fc_lcb = struct.unpack_from('<H', word, offset)[0]
+    rg_fc_lcb = offset + 2
+
+    if cslw < 4 or cb_rg_fc_lcb <= FC_CLX_INDEX:
+        raise ValueError(f"Неподдържана версия на Word (nFib=0x{nfib:04X})")
+
+    ccp_text = struct.unpack_from('<i', word, rg_lw + 3 * 4)[0]
+    fc_clx, lcb_clx = struct.unpack_from('<II', word, rg_fc_lcb + FC_CLX_INDEX * 8)
+
+    return {
+        'nfib': nfib,
+        'lid': lid,
+        'encrypted': bool(flags & FIB_FLAG_ENCRYPTED),
+        'table_stream': '1Table' if flags & FIB_FLAG_WHICH_TABLE else '0Table',
+        'ccp_text': ccp_text,
+        'fc_clx': fc_clx,
+        'lcb_clx': lcb_clx,
+    }
+
+
+def _parse_piece_table(table: bytes, fc_clx: int, lcb_clx: int) -> List[Tuple[int, int, int, bool]]:
+    """Парсва CLX и връща [(cp_start, cp_end, fc, compressed), ...]."""
+    clx = table[fc_clx:fc_clx + lcb_clx]
+    pos = 0
+
+    # Пропускаме Prc записите (форматиране) до Pcdt
+    while pos < len(clx) and clx[pos] == 0x01:
+        cb_grpprl = struct.unpack_from('<h', clx, pos + 1)[0]
+        pos += 3 + cb_grpprl
+
+    if pos >= len(clx) or clx[pos] != 0x02:
+        raise ValueError("Липсва piece table (Pcdt) в CLX")
+
+    lcb = struct.unpack_from('<I', clx, pos + 1)[0]
+    plc = clx[pos + 5:pos + 5 + lcb]
+    count = (len(plc) - 4) // 12
+    if count <= 0:
+        return []
+
+    cps = struct.unpack_from(f'<{count + 1}I', plc, 0)
+    pieces = []
+    for i in range(count):
+        fc = struct.unpack_from('<I', plc, (count + 1) * 4 + i * 8 + 2)[0]
+        compressed = bool(fc & PIECE_COMPRESSED)
+        fc &= ~PIECE_COMPRESSED
+        if compressed:
+            fc //= 2
+        pieces.append((cps[i], cps[i + 1], fc, compressed))
+    return pieces
+
+
+def _strip_fields(text: str) -> str:
+    """Премахва кодовете на полетата, запазва показания им резултат.
+
+    Поле: \\x13 код \\x14 резултат \\x15 (може да са вложени).
+    """
+    if FIELD_BEGIN not in text:
+        return text
+
+    out = []
+    # Стек: True = в кода на полето (скрито), False = в резултата
+    stack: List[bool] = []
+    for chunk in FIELD_MARKS.split(text):
+        if chunk == FIELD_BEGIN:
+            stack.append(True)
+        elif chunk == FIELD_SEPARATOR:
+            if stack:
+                stack[-1] = False
+        elif chunk == FIELD_END:
+            if stack:
+                stack.pop()
+        elif chunk and not any(stack):
+            out.append(chunk)
+    return ''.join(out)
+
+
+def _normalize_word_text(text: str) -> str:
+    """Превръща специалните символи на Word в обикновен текст."""
+    return _strip_fields(text).translate(WORD_TRANSLATION)
+
+
+def read_doc_text(file_path: Path, main_text_only: bool = True) -> str:
+    """Извлича текста от .doc файл (Word 97-2003).
+
+    Args:
+        file_path: Път до .doc файла
+        main_text_only: Само основният текст (без бележки под линия,
+            колонтитули и коментари) — както Document.Content.Text в Word
+
+    Raises:
+        ValueError: Ако файлът не е валиден/поддържан Word документ
+    """
+    ole = CompoundFile(Path(file_path).read_bytes())
+    if not ole.has_stream('WordDocument'):
+        raise ValueError("Липсва поток WordDocument — не е Word документ")
+
+    word = ole.open_stream('WordDocument')
+    fib = _parse_fib(word)
+    if fib['encrypted']:
+        raise ValueError("Документът е защитен с парола")
+    if not fib['lcb_clx']:
+        raise ValueError("Липсва CLX (документ преди Word 97?)")
+
+    table = ole.open_stream(fib['table_stream'])
+    pieces = _parse_piece_table(table, fib['fc_clx'], fib['lcb_clx'])
+
+    limit = fib['ccp_text'] if main_text_only and fib['ccp_text'] > 0 else None
+    logger.debug("DOC %s: nFib=0x%04X, lid=0x%04X, парчета=%d",
+                 file_path, fib['nfib'], fib['lid'], len(pieces))
+
+    parts = []
+    for cp_start, cp_end, fc, compressed in pieces:
+        if limit is not None:
+            if cp_start >= limit:
+                break
+            cp_end = min(cp_end, limit)
+        length = cp_end - cp_start
+        if length <= 0:
+            continue
+        if compressed:
+            parts.append(decode_compressed(word[fc:fc + length]))
+        else:
+            parts.append(word[fc:fc + length * 2].decode('utf-16-le', errors='replace'))
+
+    return _normalize_word_text(''.join(parts))
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    if len(sys.argv) < 2:
+        print("Използване: python doc_reader.py <файл.doc>")
+        sys.exit(1)
+    print(read_doc_text(Path(sys.argv[1])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""
+ClientRequests Email Threads
+============================
+Индекс на разговорите по Message-ID / In-Reply-To / References.
+
+Клиентски разговор с 30 отговора не е 30 несвързани извличания: всяко
+писмо се закача към разговора си, а файлът на разговора съдържа само
+новото съдържание на всяко писмо (без цитираната история).
+
+    processed/threads/index.jsonl           - message_id -> thread_id (append-only)
+    processed/threads/<tt>/<thread_id>.md   - разговорът, писмо по писмо
+
+Закачане (O(1) — речник в паметта, дочитан от index.jsonl по offset):
+- първият известен идентификатор от In-Reply-To и References (от
+  последния към първия) дава разговора
+- иначе — Outlook Thread-Index (първите 22 байта са на разговора)
+- иначе — ако самото писмо вече е цитирано от пристигнал по-рано отговор
+- иначе започва нов разговор: thread_id е хеш от корена (References[0])
+Всички идентификатори от References се записват към разговора, така че
+писмата се закачат правилно и когато пристигат в обратен ред.
+
+Използване:
+    python email_threads.py --list                   # разговори: писма, последна дата, тема
+    python email_threads.py --show "X.eml"           # разговорът на писмото
+    python email_threads.py --show 3f2a9c0d1b7e4a55  # по thread_id
+    python email_threads.py --rebuild                # наново от processed/index.jsonl
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from body_reducer import is_reply, strip_quoted
+
+logger = logging.getLogger(__name__)
+
+
+BASE_DIR = Path(__file__).parent
+PROCESSED_DIR = BASE_DIR / "processed"
+
+THREADS_DIRNAME = 'threads'
+INDEX_FILENAME = 'index.jsonl'
+
+MESSAGE_ID_RE = re.compile(r'<[^<>\s]+>')
+SUBJECT_PREFIX_RE = re.compile(r'^\s*((re|fw|fwd|отг|отн|пр|tr|réf|rép)\s*(\[\d+\])?\s*:\s*)+',
+                               re.IGNORECASE)
+
+
+# ================== HEADERS ==================
+
+def parse_message_ids(value) -> List[str]:
+    """Message-ID-тата от заглавка (<...>), по ред, без повторения."""
+    ids = []
+    for mid in MESSAGE_ID_RE.findall(str(value or '')):
+        if mid not in ids:
+            ids.append(mid)
+    return ids
+
+
+def threading_headers(get) -> Dict:
+    """Полетата за разговорите от заглавките (get — msg.get или dict.get)."""
+    message_ids = parse_message_ids(get('Message-ID'))
+    in_reply_to = parse_message_ids(get('In-Reply-To'))
+    return {
+        'message_id': message_ids[0] if message_ids else '',
+        'in_reply_to': in_reply_to[0] if in_reply_to else '',
+        'references': parse_message_ids(get('References')),
+        'thread_index': outlook_thread_key(get('Thread-Index')),
+    }
+
+
+def outlook_thread_key(value) -> str:
+    """Outlook Thread-Index: първите 22 байта са общи за целия разговор."""
+    try:
+        raw = base64.b64decode(str(value or '').strip(), validate=True)
+    except ValueError:
+        return ''
+    return raw[:22].hex() if len(raw) >= 22 else ''
+
+
+def normalize_subject(subject: str) -> str:
+    """Темата без Re:/Fwd:/Отг: и т.н. — за заглавието на разговора."""
+    return SUBJECT_PREFIX_RE.sub('', str(subject or '')).strip()
+
+
+def new_content(body: str) -> str:
+    """Само новото в писмото: без цитираните (>) редове и историята след заглавка на отговор."""
+    return strip_quoted(body)[0]
+
+
+# ================== INDEX ==================
+
+class ThreadIndex:
+    """Разговорите в processed/threads/: индекс в паметта + по един .md файл на разговор."""
+
+    def __init__(self, output_dir: Path = PROCESSED_DIR):
+        self.output_dir = Path(output_dir)
+        self.directory = self.output_dir / THREADS_DIRNAME
+        self.path = self.directory / INDEX_FILENAME
+        self._reset()
+
+    def _reset(self) -> None:
+        # Идентификатор (Message-ID или "ti:<Thread-Index>") -> thread_id
+        self._threads: Dict[str, str] = {}
+        # Вече добавените писма (за повторно пускане) и писмата на всеки разговор
+        self._messages: Dict[str, Dict] = {}
+        self._by_thread: Dict[str, List[Dict]] = {}
+        self._offset = 0
+
+    def _merge(self, entry: Dict) -> None:
+        thread_id = entry['thread_id']
+        for key in [entry['key']] + entry.get('refs', []):
+            self._threads.setdefault(key, thread_id)
+        self._messages[entry['key']] = entry
+        self._by_thread.setdefault(thread_id, []).append(entry)
+
+    def refresh(self) -> None:
+        """Дочита редовете, добавени след последното четене (и от други процеси)."""
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return
+        if size <= self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break
+                self._offset += len(raw)
+                try:
+                    self._merge(json.loads(raw))
+                except (json.JSONDecodeError, KeyError):
+                    logger.warning("Повреден ред в threads/%s — пропуснат", INDEX_FILENAME)
+
+    @staticmethod
+    def _keys(record: Dict) -> List[str]:
+        """Идентификаторите за търсене на разговора — от най-близкия родител нагоре."""
+        keys = []
+        if record.get('in_reply_to'):
+            keys.append(record['in_reply_to'])
+        keys += reversed(record.get('references') or [])
+        if record.get('thread_index'):
+            keys.append(f"ti:{record['thread_index']}")
+        return keys
+
+    @staticmethod
+    def _message_key(record: Dict, location: str = '') -> str:
+        return record.get('message_id') or f"source:{location or record.get('source_file', '')}"
+
+    def resolve(self, record: Dict) -> str:
+        """thread_id за писмото (без запис) — O(1) по броя на заглавките."""
+        self.refresh()
+        for key in self._keys(record) + [self._message_key(record)]:
+            thread_id = self._threads.get(key)
+            if thread_id:
+                return thread_id
+        references = record.get('references') or []
+        root = (references[0] if references else record.get('in_reply_to')
+                or self._message_key(record))
+        return hashlib.sha1(root.encode('utf-8')).hexdigest()[:16]
+
+    def thread_path(self, thread_id: str) -> Path:
+        return self.directory / thread_id[:2] / f"{thread_id}.md"
+
+    def add(self, record: Dict, location: str) -> Optional[str]:
+        """Закача писмото към разговора му и добавя новото съдържание във файла на разговора.
+
+        Връща thread_id; None ако писмото вече е добавено (напр. след рестарт).
+        """
+        self.refresh()
+        key = self._message_key(record, location)
+        if key in self._messages:
+            return None
+        thread_id = record.get('thread_id') or self.resolve(record)
+
+        thread_path = self.thread_path(thread_id)
+        thread_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # Заглавието — само от първото писмо (O_EXCL: един създател между процесите)
+            fd = os.open(thread_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            title = normalize_subject(record.get('subject', '')) or thread_id
+            os.write(fd, f"# {title}\n\nРазговор: {thread_id}\n".encode('utf-8'))
+            os.close(fd)
+        except FileExistsError:
+            pass
+        self._append(thread_path, self._message_block(record, location))
+
+        entry = {
+            'key': key,
+            'thread_id': thread_id,
+            'refs': self._keys(record),
+            'source': record.get('source_file', ''),
+            'location': location,
+            'date': record.get('date_parsed') or record.get('date', ''),
+            'from': record.get('from', ''),
+            'subject': record.get('subject', ''),
+            'at': datetime.now().isoformat(timespec='seconds'),
+        }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._append(self.path, json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+        return thread_id
+
+    @staticmethod
+    def _append(path: Path, text: str) -> None:
+        """Един write() с O_APPEND — безопасно между процеси."""
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, text.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _message_block(record: Dict, location: str) -> str:
+        body = record.get('body_clean') or record.get('body_text', '')
+        if is_reply(record):
+            # Само при отговор — препратеното писмо (Fwd) е съдържанието
+            body = new_content(body)
+        attachments = record.get('attachment_names') or [a['filename'] for a in record.get('attachments', [])]
+        lines = [
+            '',
+            f"## {record.get('date_parsed') or record.get('date', '')} — {record.get('from', '')}",
+            '',
+            f"Тема: {record.get('subject', '')}",
+            f"Източник: processed/{location}/{record.get('source_file', '')}",
+        ]
+        if attachments:
+            lines.append(f"Прикачени: {', '.join(attachments)}")
+        lines += ['', body or '(без ново съдържание)', '']
+        return '\n'.join(lines)
+
+    def thread_of(self, name_or_id: str) -> Optional[str]:
+        """thread_id по thread_id, Message-ID или име на входния файл."""
+        self.refresh()
+        if name_or_id in self._by_thread:
+            return name_or_id
+        if name_or_id in self._threads:
+            return self._threads[name_or_id]
+        for entry in self._messages.values():
+            if entry['source'] == name_or_id:
+                return entry['thread_id']
+        return None
+
+    def threads(self) -> Dict[str, List[Dict]]:
+        self.refresh()
+        return self._by_thread
+
+    def rebuild(self) -> int:
+        """Строи разговорите наново от записите в processed/ (по дата)."""
+        from processed_index import ArtifactIndex
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._reset()
+        records = []
+        for entry, record in ArtifactIndex(self.output_dir).records():
+            if record.get('format') in ('eml', 'msg'):
+                records.append((record.get('date_parsed') or '', entry['dir'], record))
+        records.sort(key=lambda item: item[0])
+        for _, location, record in records:
+            record.pop('thread_id', None)
+            self.add(record, location)
+        return len(records)
+
+
+# ================== CLI ==================
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='ClientRequests Email Threads')
+    parser.add_argument('--dir', type=str, default=str(PROCESSED_DIR), help='processed/ папка')
+    parser.add_argument('--list', action='store_true', help='Разговорите: писма, последна дата, тема')
+    parser.add_argument('--show', type=str, help='thread_id, Message-ID или име на файл — целият разговор')
+    parser.add_argument('--rebuild', action='store_true', help='Построй разговорите наново от processed/')
+    args = parser.parse_args()
+
+    index = ThreadIndex(Path(args.dir))
+    if args.rebuild:
+        print(f"Писма: {index.rebuild()}, разговори: {len(index.threads())}")
+    elif args.list:
+        threads = sorted(index.threads().items(), key=lambda item: max(e['date'] for e in item[1]),
+                         reverse=True)
+        for thread_id, entries in threads:
+            last = max(e['date'] for e in entries)
+            print(f"{thread_id}  {len(entries):>3} писма  {last}  {normalize_subject(entries[0]['subject'])}")
+    elif args.show:
+        thread_id = index.thread_of(args.show)
+        if not thread_id:
+            print(f"Няма разговор за: {args.show}")
+            sys.exit(1)
+        print(index.thread_path(thread_id).read_text(encoding='utf-8'))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+ClientRequests Processing Journal
+=================================
+Write-ahead журнал на обработката — за възобновяване след срив.
+
+Всеки файл минава през етапи, и всеки етап се записва в журнала (JSONL,
+append-only, flush + fsync) ПРЕДИ да се премине към следващия:
+
+    started      — извличането започна; преди първия изход записът
+                   получава и папката с артефактите (artifact_dir)
+    written      — всички изходи са записани (атомарно, output_writer)
+    done         — оригиналът е архивиран; файлът е завършен
+    quarantined  — файлът е в quarantine/
+    failed       — грешка при извличането (файлът остава в inbox/)
+
+При рестарт:
+    written  -> изходите вече са на диска: само се архивира оригиналът
+    started  -> изходите може да са непълни: файлът се обработва наново
+                в същата папка (artifact_dir от записа) — имената на
+                изходите в нея са фиксирани и се презаписват атомарно
+    done     -> ако оригиналът още е тук (office_extractor не мести офис
+                файловете), не се обработва повторно
+
+Файлът се разпознава по име + размер + mtime, така че нов файл със
+същото име се обработва нормално. При отваряне журналът се уплътнява:
+остават само записите за файлове, които още съществуват непроменени.
+
+Използване:
+    from journal import ProcessingJournal, STAGE_DONE, STAGE_STARTED
+    journal = ProcessingJournal()
+    if journal.stage(path) != STAGE_DONE:
+        journal.start(path)
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from output_writer import atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+
+BASE_DIR = Path(__file__).parent
+JOURNAL_FILE = BASE_DIR / "processing_journal.jsonl"
+
+STAGE_STARTED = 'started'
+STAGE_WRITTEN = 'written'
+STAGE_DONE = 'done'
+STAGE_QUARANTINED = 'quarantined'
+STAGE_FAILED = 'failed'
+
+# Етапи, след които файлът е приключен (за повторно пускане)
+FINAL_STAGES = (STAGE_DONE, STAGE_QUARANTINED)
+
+
+def file_key(file_path: Path) -> Optional[str]:
+    """Идентичност на входния файл: "име:размер:mtime_ns"; None ако файлът липсва."""
+    try:
+        stat = file_path.stat()
+    except OSError:
+        return None
+    return f"{file_path.name}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class ProcessingJournal:
+    """Append-only JSONL журнал с последния етап на всеки файл в паметта."""
+
+    def __init__(self, path: Path = JOURNAL_FILE, compact: bool = True):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        # Ключ -> последният запис за файла
+        self._entries: Dict[str, Dict] = {}
+        self._load()
+        if compact:
+            self.compact()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Недописан последен ред от срив — пропуска се
+                    logger.warning("Повреден ред %s в %s — пропуснат", line_number, self.path.name)
+                    continue
+                self._entries[entry['key']] = entry
+
+    def compact(self) -> None:
+        """Пренаписва журнала само със записите за файлове, които още са на мястото си."""
+        kept = {key: entry for key, entry in self._entries.items()
+                if file_key(Path(entry['path'])) == key}
+        dropped = len(self._entries) - len(kept)
+        self._entries = kept
+        if dropped or self.path.exists():
+            atomic_write_text(self.path, ''.join(
+                json.dumps(entry, ensure_ascii=False) + '\n' for entry in kept.values()
+            ))
+        if dropped:
+            logger.debug("Журнал: %s приключени записа премахнати", dropped)
+
+    @staticmethod
+    def key(file_path: Path) -> Optional[str]:
+        return file_key(file_path)
+
+    def entry(self, file_path: Path, key: Optional[str] = None) -> Optional[Dict]:
+        """Последният запис за файла (по текущото му съдържание) или None."""
+        key = key or file_key(file_path)
+        return self._entries.get(key) if key else None
+
+    def stage(self, file_path: Path, key: Optional[str] = None) -> Optional[str]:
+        entry = self.entry(file_path, key)
+        return entry['stage'] if entry else None
+
+    def record(self, file_path: Path, stage: str, key: Optional[str] = None, **extra) -> None:
+        """Добавя етап за файла и го записва на диска (fsync) преди да върне.
+
+        key трябва да се подаде, ако файлът ще бъде преместен/изтрит преди
+        записа (напр. 'done' след архивиране) — иначе се изчислява от файла.
+        """
+        key = key or file_key(file_path)
+        if key is None:
+            logger.warning("Журнал: файлът липсва, етап '%s' не е записан: %s", stage, file_path)
+            return
+        entry = {
+            'key': key,
+            'path': str(file_path),
+            'stage': stage,
+            'at': datetime.now().isoformat(timespec='seconds'),
+        }
+        entry.update(extra)
+        with self._lock:
+            self._entries[key] = entry
+            self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def start(self, file_path: Path, key: Optional[str] = None) -> None:
+        """Записва 'started'; папката на прекъснат опит (artifact_dir) се пренася."""
+        entry = self.entry(file_path, key)
+        extra = {}
+        if entry and entry['stage'] == STAGE_STARTED and entry.get('artifact_dir'):
+            extra['artifact_dir'] = entry['artifact_dir']
+        self.record(file_path, STAGE_STARTED, key=key, **extra)
+
+    def unfinished(self) -> Iterator[Dict]:
+        """Записите на файлове, спрени по средата ('started' или 'written')."""
+        return (e for e in self._entries.values() if e['stage'] in (STAGE_STARTED, STAGE_WRITTEN))
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self) -> 'ProcessingJournal':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,164 @@
+"""
+ClientRequests Logging
+======================
+Единствената настройка на логовете за process_inbox.py, office_extractor.py
+и pdf_extractor.py — извиква се от main(), не при import (иначе всеки
+импортиран скрипт добавя свой конзолен handler и редовете се дублират).
+
+Root логерът има само QueueHandler: извикващата нишка слага записа в
+опашка и продължава, а форматирането (%-аргументите, времето, traceback-а)
+и писането във файла и конзолата са в нишката на QueueListener. Затова
+логовете се пишат като logger.debug("Файл %s: %d символа", name, chars) —
+при изключено ниво записът изобщо не се създава, а при включено
+низът се сглобява извън пътя на извличането.
+
+Файлът е <име>.log до скриптовете, с ротация по размер (maxMb, backups).
+Работните процеси на worker_pool пишат в същия файл през собствена опашка
+и WatchedFileHandler: те не ротират, а отварят файла наново, след като
+главният процес го е ротирал. Записите, още в опашката на убит работник,
+се губят.
+
+Настройки (секция python.logging на config.json):
+    "logging": {"level": "DEBUG", "consoleLevel": "INFO", "maxMb": 10, "backups": 5}
+
+Използване:
+    from logging_setup import setup_logging
+    setup_logging('process_inbox')    # python/process_inbox.log + конзола
+"""
+
+import atexit
+import logging
+import queue
+from dataclasses import dataclass
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
+from pathlib import Path
+from typing import List, Optional
+
+from requests_config import load_config
+
+
+BASE_DIR = Path(__file__).parent
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Слушателят на текущия процес и настройките му (за работните процеси)
+_listener: Optional[QueueListener] = None
+_settings: Optional['LoggingSettings'] = None
+
+
+@dataclass
+class LoggingSettings:
+    """Нива, файл и ротация (секция python.logging на config.json)."""
+    level: str = 'DEBUG'
+    console_level: str = 'INFO'
+    max_mb: float = 10.0
+    backups: int = 5
+    # None — само конзола
+    log_file: Optional[Path] = None
+
+    @classmethod
+    def from_config(cls, config: dict, name: Optional[str] = None) -> 'LoggingSettings':
+        settings = config.get('python', {}).get('logging', {})
+        return cls(
+            level=str(settings.get('level', cls.level)).upper(),
+            console_level=str(settings.get('consoleLevel', cls.console_level)).upper(),
+            max_mb=float(settings.get('maxMb', cls.max_mb)),
+            backups=max(0, int(settings.get('backups', cls.backups))),
+            log_file=BASE_DIR / f"{name}.log" if name else None,
+        )
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler без форматиране в извикващата нишка.
+
+    Стандартният prepare() сглобява съобщението преди опашката (за да може
+    записът да се pickle-не); опашката тук е в процеса, така че записът
+    отива както е и се форматира от нишката на слушателя.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _level(name: str) -> int:
+    level = logging.getLevelName(name)
+    return level if isinstance(level, int) else logging.INFO
+
+
+def _start(handlers: List[logging.Handler]) -> None:
+    """Заменя handler-ите на root с опашка към нов QueueListener с handlers."""
+    global _listener
+    stop_logging()
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    # Root пропуска само нивата, които някой handler ще запише
+    root.setLevel(min(handler.level for handler in handlers))
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _handlers(settings: LoggingSettings, worker: bool) -> List[logging.Handler]:
+    console = logging.StreamHandler()
+    console.setLevel(_level(settings.console_level))
+    handlers: List[logging.Handler] = [console]
+    if settings.log_file:
+        if worker:
+            file_handler = WatchedFileHandler(settings.log_file, encoding='utf-8', delay=True)
+        else:
+            file_handler = RotatingFileHandler(
+                settings.log_file, maxBytes=int(settings.max_mb * 1024 * 1024),
+                backupCount=settings.backups, encoding='utf-8', delay=True,
+            )
+        file_handler.setLevel(_level(settings.level))
+        handlers.append(file_handler)
+    return handlers
+
+
+def setup_logging(name: Optional[str] = None, settings: Optional[LoggingSettings] = None) -> LoggingSettings:
+    """Настройва логовете на процеса: <name>.log с ротация + конзола, през опашка.
+
+    Повторно извикване заменя предишната настройка; опашката се изпразва при изход.
+    """
+    global _settings
+    if settings is None:
+        settings = LoggingSettings.from_config(load_config(), name)
+    _start(_handlers(settings, worker=False))
+    if _settings is None:
+        atexit.register(stop_logging)
+    _settings = settings
+    return settings
+
+
+def active_settings() -> Optional[LoggingSettings]:
+    """Настройките от setup_logging() — worker_pool ги предава на работните процеси."""
+    return _settings
+
+
+def configure_worker(settings: Optional[LoggingSettings]) -> None:
+    """В работен процес: собствена опашка и нишка; файлът е без ротация.
+
+    При fork root наследява QueueHandler-а на главния процес, чиято опашка
+    никой не чете в работника — заменя се. None — главният процес не е
+    настройвал логове (работникът остава с наследеното).
+    """
+    global _settings
+    if settings is None:
+        return
+    _start(_handlers(settings, worker=True))
+    _settings = settings
+
+
+def stop_logging() -> None:
+    """Изчаква нишката да запише всичко от опашката и я спира."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,256 @@
+"""
+ClientRequests Manifest
+=======================
+Компактен изходен режим: вместо _extracted.json (indent=2) и _body.txt за
+всеки файл — по един JSON ред на извличане в общ rolling manifest:
+
+    processed/manifest/manifest-00001.jsonl
+    processed/manifest/manifest-00002.jsonl   # нов сегмент след segmentMb
+
+Всеки ред е метаданните на записа (схемата на output_writer). Текстовите
+полета (body_clean, body_text, body_html) са низ или, с компресия,
+{'codec': 'gzip'|'lzma', 'data': base64}; поле, равно на body_clean (при
+офис документите body_text), се пази веднъж — {'codec': 'same'}.
+Прикачените файлове и оригиналът остават в папката с артефакти
+(processed_index.py), а index.jsonl пази за всеки входен файл къде е редът
+му ({'segment', 'offset', 'length'}) — четене с един seek, без обхождане.
+
+Списъци, филтри и табла четат един последователен файл вместо хиляди малки.
+Редовете се добавят с един write() с O_APPEND, така че няколко процеса
+(--claim) могат да пишат в един сегмент.
+
+Настройки (секция python.output на config.json):
+    "output": {"mode": "manifest", "compression": "gzip", "segmentMb": 64}
+
+Използване:
+    python manifest.py --list                 # източник, дата, тема — по ред
+    python manifest.py --list --type eml      # само имейлите
+    python manifest.py --show "X.eml"         # целият запис с тялото
+    python manifest.py --stats                # редове и размер по сегменти
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import logging
+import lzma
+import os
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+BASE_DIR = Path(__file__).parent
+PROCESSED_DIR = BASE_DIR / "processed"
+
+MANIFEST_DIRNAME = 'manifest'
+SEGMENT_PATTERN = 'manifest-{:05d}.jsonl'
+SEGMENT_RE = re.compile(r'^manifest-(\d{5,})\.jsonl$')
+
+OUTPUT_MODES = ('files', 'manifest')
+CODECS = ('none', 'gzip', 'lzma')
+
+
+@dataclass
+class OutputSettings:
+    """Изходен режим (секция python.output на config.json)."""
+    mode: str = 'files'
+    compression: str = 'none'
+    segment_mb: int = 64
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'OutputSettings':
+        output = config.get('python', {}).get('output', {})
+        settings = cls(
+            mode=str(output.get('mode', cls.mode)),
+            compression=str(output.get('compression', cls.compression)),
+            segment_mb=int(output.get('segmentMb', cls.segment_mb)),
+        )
+        if settings.mode not in OUTPUT_MODES:
+            logger.warning("Непознат python.output.mode '%s' — използва се 'files'", settings.mode)
+            settings.mode = 'files'
+        if settings.compression not in CODECS:
+            logger.warning("Непозната компресия '%s' — без компресия", settings.compression)
+            settings.compression = 'none'
+        return settings
+
+
+# ================== BODY CODECS ==================
+
+# Големите текстови полета на записа; body_clean е първо — другите може да сочат към него
+BODY_FIELDS = ('body_clean', 'body_text', 'body_html')
+
+
+def encode_body(text: str, codec: str = 'none') -> Union[str, Dict]:
+    """Тялото за реда в manifest-а: низ или компресирано и base64-кодирано."""
+    if codec == 'none':
+        return text
+    data = text.encode('utf-8')
+    packed = gzip.compress(data, compresslevel=6) if codec == 'gzip' else lzma.compress(data)
+    return {'codec': codec, 'data': base64.b64encode(packed).decode('ascii')}
+
+
+def decode_body(value: Union[str, Dict, None]) -> str:
+    if value is None or isinstance(value, str):
+        return value or ''
+    packed = base64.b64decode(value['data'])
+    data = gzip.decompress(packed) if value['codec'] == 'gzip' else lzma.decompress(packed)
+    return data.decode('utf-8')
+
+
+def pack_record(metadata: Dict, codec: str = 'none') -> Dict:
+    """Редът за manifest-а: текстовите полета кодирани, дубликатите — веднъж."""
+    line = dict(metadata)
+    for field in BODY_FIELDS:
+        value = metadata.get(field)
+        if not value:
+            continue
+        if field != 'body_clean' and value == metadata.get('body_clean'):
+            line[field] = {'codec': 'same'}
+        else:
+            line[field] = encode_body(value, codec)
+    return line
+
+
+def unpack_record(line: Dict) -> Dict:
+    """Обратното на pack_record — полетата отново са низове."""
+    record = dict(line)
+    for field in BODY_FIELDS:
+        value = record.get(field)
+        if isinstance(value, dict) and value.get('codec') == 'same':
+            record[field] = record.get('body_clean', '')
+        elif value is not None:
+            record[field] = decode_body(value)
+    return record
+
+
+# ================== MANIFEST ==================
+
+class Manifest:
+    """Append-only сегменти processed/manifest/manifest-NNNNN.jsonl."""
+
+    def __init__(self, output_dir: Path = PROCESSED_DIR, segment_mb: int = OutputSettings.segment_mb):
+        self.output_dir = Path(output_dir)
+        self.directory = self.output_dir / MANIFEST_DIRNAME
+        self.segment_bytes = max(segment_mb, 1) * 1024 * 1024
+
+    def segments(self) -> List[Path]:
+        if not self.directory.exists():
+            return []
+        numbered = []
+        for path in self.directory.iterdir():
+            match = SEGMENT_RE.match(path.name)
+            if match:
+                numbered.append((int(match.group(1)), path))
+        return [p for _, p in sorted(numbered)]
+
+    def _current_segment(self) -> Path:
+        segments = self.segments()
+        if not segments:
+            return self.directory / SEGMENT_PATTERN.format(1)
+        last = segments[-1]
+        try:
+            full = last.stat().st_size >= self.segment_bytes
+        except FileNotFoundError:
+            full = False
+        if full:
+            return self.directory / SEGMENT_PATTERN.format(int(SEGMENT_RE.match(last.name).group(1)) + 1)
+        return last
+
+    def append(self, line: Dict) -> Dict:
+        """Добавя ред; връща мястото му {'segment', 'offset', 'length'}."""
+        data = (json.dumps(line, ensure_ascii=False, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+        self.directory.mkdir(parents=True, exist_ok=True)
+        segment = self._current_segment()
+        fd = os.open(segment, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            # С O_APPEND позицията след write() е краят на нашия ред
+            end = os.lseek(fd, 0, os.SEEK_CUR)
+        finally:
+            os.close(fd)
+        return {'segment': segment.name, 'offset': end - len(data), 'length': len(data)}
+
+    def read(self, ref: Dict) -> Dict:
+        """Записът на посоченото място (с декодирани текстови полета)."""
+        with open(self.directory / ref['segment'], 'rb') as f:
+            f.seek(ref['offset'])
+            return unpack_record(json.loads(f.read(ref['length'])))
+
+    def __iter__(self) -> Iterator[Dict]:
+        """Всички редове по ред на записване (текстовите полета остават кодирани)."""
+        for segment in self.segments():
+            offset = 0
+            with open(segment, 'rb') as f:
+                for raw in f:
+                    if not raw.endswith(b'\n'):
+                        break
+                    try:
+                        line = json.loads(raw)
+                    except json.JSONDecodeError:
+                        logger.warning("Повреден ред в %s @ %s — пропуснат", segment.name, offset)
+                    else:
+                        line['_ref'] = {'segment': segment.name, 'offset': offset, 'length': len(raw)}
+                        yield line
+                    offset += len(raw)
+
+
+# ================== REFS ==================
+
+def ref_to_str(ref: Dict) -> str:
+    """Мястото на реда като един низ (за списъка с изходи в журнала)."""
+    return f"{MANIFEST_DIRNAME}/{ref['segment']}#{ref['offset']}+{ref['length']}"
+
+
+def ref_from_str(value: str) -> Optional[Dict]:
+    match = re.match(rf'^{MANIFEST_DIRNAME}/(.+)#(\d+)\+(\d+)$', value)
+    if not match:
+        return None
+    return {'segment': match.group(1), 'offset': int(match.group(2)), 'length': int(match.group(3))}
+
+
+# ================== CLI ==================
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='ClientRequests Manifest')
+    parser.add_argument('--dir', type=str, default=str(PROCESSED_DIR), help='processed/ папка')
+    parser.add_argument('--list', action='store_true', help='Източник, дата и тема на всеки ред')
+    parser.add_argument('--type', type=str, help='Само файлове с това разширение (с --list)')
+    parser.add_argument('--show', type=str, help='Име на входен файл — целият запис с тялото')
+    parser.add_argument('--stats', action='store_true', help='Редове и размер по сегменти')
+    args = parser.parse_args()
+
+    manifest = Manifest(Path(args.dir))
+    if args.list:
+        suffix = f".{args.type.lower().lstrip('.')}" if args.type else None
+        for line in manifest:
+            source = line.get('source_file', '')
+            if suffix and Path(source).suffix.lower() != suffix:
+                continue
+            print(f"{source}\t{line.get('date_parsed', line.get('date', ''))}\t{line.get('subject', '')}")
+    elif args.show:
+        from processed_index import ArtifactIndex
+        entry = ArtifactIndex(Path(args.dir)).lookup(args.show)
+        if not entry or not entry.get('manifest'):
+            print(f"Няма ред в manifest-а за: {args.show}")
+            sys.exit(1)
+        print(json.dumps(manifest.read(entry['manifest']), ensure_ascii=False, indent=2, default=str))
+    elif args.stats:
+        for segment in manifest.segments():
+            with open(segment, 'rb') as f:
+                lines = sum(1 for _ in f)
+            print(f"{segment.name}: {lines} реда, {segment.stat().st_size / (1024 * 1024):.2f} MB")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""
+ClientRequests Stage Metrics
+============================
+Времена и байтове по етап и формат на обработката — къде отива времето:
+парсване, декодиране, HTML почистване, офис/PDF четецът, запис на JSON,
+на тялото и на прикачените, преместване на оригинала.
+
+Всеки етап се мери с time.perf_counter (монотонен) и се натрупва по
+(етап, формат): брой, сума и максимум на времето, байтове и хистограма
+(STAGE_BUCKETS). Етапите в работните процеси (worker_pool) се връщат с
+резултата на задачата (TaskResult.stages) и се сливат в главния процес.
+
+В края на всеки пуск (и на всеки интервал на --watch) натрупаното се
+записва атомарно като:
+- Prometheus textfile (за textfile collector-а на node_exporter) —
+  хистограма clientrequests_stage_seconds и брояч
+  clientrequests_stage_bytes_total с етикети stage и format
+- JSON обобщение — по етап и формат: брой, общо/средно/максимум, MB/s
+
+Изключено (по подразбиране) stage() връща един и същ празен обект —
+цената е една проверка на флаг, без часовник и без речници.
+
+Настройки (секция python.metrics на config.json; пътищата са спрямо python/):
+    "metrics": {
+        "enabled": false,
+        "textfile": "processed/metrics.prom",
+        "json": "processed/metrics.json"
+    }
+
+Използване:
+    from metrics import METRICS, stage
+    with stage('parse', 'eml') as timing:
+        msg = parser.parse(f)
+        timing.bytes = size
+    METRICS.merge(task.stages)          # етапите от работния процес
+    METRICS.export(MetricsSettings.from_config(load_config()))
+
+    python metrics.py                   # обобщението от последния пуск
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from requests_config import load_config
+
+logger = logging.getLogger(__name__)
+
+
+BASE_DIR = Path(__file__).parent
+DEFAULT_TEXTFILE = 'processed/metrics.prom'
+DEFAULT_JSON = 'processed/metrics.json'
+
+METRIC_PREFIX = 'clientrequests'
+# Горни граници на кофите на хистограмата (секунди); последната кофа е +Inf
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0)
+
+# Полета на натрупаната стойност за (етап, формат)
+COUNT, SECONDS, BYTES, MAX, BUCKETS = range(5)
+
+
+@dataclass
+class MetricsSettings:
+    """Включване и пътища на изходите (секция python.metrics на config.json)."""
+    enabled: bool = False
+    textfile: Optional[Path] = None
+    json_file: Optional[Path] = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'MetricsSettings':
+        metrics = config.get('python', {}).get('metrics', {})
+        return cls(
+            enabled=bool(metrics.get('enabled', False)),
+            textfile=cls._path(metrics.get('textfile', DEFAULT_TEXTFILE)),
+            json_file=cls._path(metrics.get('json', DEFAULT_JSON)),
+        )
+
+    @staticmethod
+    def _path(value: Optional[str]) -> Optional[Path]:
+        # Празен низ / null — този изход не се записва
+        if not value:
+            return None
+        path = Path(value)
+        return path if path.is_absolute() else BASE_DIR / path
+
+
+class _Stage:
+    """Един измерван етап (with блок); bytes може да се зададе вътре в блока."""
+    __slots__ = ('metrics', 'name', 'fmt', 'bytes', 'start')
+
+    def __init__(self, metrics: 'StageMetrics', name: str, fmt: str, nbytes: int):
+        self.metrics = metrics
+        self.name = name
+        self.fmt = fmt
+        self.bytes = nbytes
+        self.start = 0.0
+
+    def __enter__(self) -> '_Stage':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.metrics.observe(self.name, self.fmt, time.perf_counter() - self.start, self.bytes)
+
+
+class _NullStage:
+    """Етап при изключени метрики — нищо не мери; bytes се приема и се губи."""
+    __slots__ = ('bytes',)
+
+    def __enter__(self) -> '_NullStage':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+class StageMetrics:
+    """Натрупани времена и байтове по (етап, формат) за процеса."""
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.time()
+        # (етап, формат) -> [брой, секунди, байтове, максимум, [брой по кофи]]
+        self._stats: Dict[Tuple[str, str], List] = {}
+
+    def enable(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+
+    def reset(self) -> None:
+        self._stats = {}
+
+    # ---------- измерване ----------
+
+    def stage(self, name: str, fmt: str, nbytes: int = 0):
+        """Context manager, който мери етапа (празен при изключени метрики)."""
+        if not self.enabled:
+            return NULL_STAGE
+        return _Stage(self, name, fmt or 'unknown', nbytes)
+
+    def observe(self, name: str, fmt: str, seconds: float, nbytes: int = 0) -> None:
+        """Добавя едно вече измерено изпълнение на етапа."""
+        if not self.enabled:
+            return
+        stats = self._stats.get((name, fmt))
+        if stats is None:
+            stats = self._stats[(name, fmt)] = [0, 0.0, 0, 0.0, [0] * (len(STAGE_BUCKETS) + 1)]
+        stats[COUNT] += 1
+        stats[SECONDS] += seconds
+        stats[BYTES] += nbytes or 0
+        if seconds > stats[MAX]:
+            stats[MAX] = seconds
+        stats[BUCKETS][bisect.bisect_left(STAGE_BUCKETS, seconds)] += 1
+
+    # ---------- работни процеси ----------
+
+    def drain(self) -> Optional[Dict]:
+        """Натрупаното от последното drain() (за TaskResult.stages) — и нулиране."""
+        if not self._stats:
+            return None
+        stats, self._stats = self._stats, {}
+        return stats
+
+    def merge(self, stats: Optional[Dict]) -> None:
+        """Слива етапите от работен процес (резултата на drain())."""
+        if not stats or not self.enabled:
+            return
+        for key, other in stats.items():
+            current = self._stats.get(key)
+            if current is None:
+                self._stats[key] = [other[COUNT], other[SECONDS], other[BYTES], other[MAX],
+                                    list(other[BUCKETS])]
+                continue
+            current[COUNT] += other[COUNT]
+            current[SECONDS] += other[SECONDS]
+            current[BYTES] += other[BYTES]
+            current[MAX] = max(current[MAX], other[MAX])
+            current[BUCKETS] = [a + b for a, b in zip(current[BUCKETS], other[BUCKETS])]
+
+    # ---------- изходи ----------
+
+    def to_dict(self) -> Dict:
+        """JSON обобщението: етап -> формат -> брой, време и пропускателна способност."""
+        stages: Dict[str, Dict] = {}
+        for (name, fmt), stats in sorted(self._stats.items()):
+            count, seconds, nbytes = stats[COUNT], stats[SECONDS], stats[BYTES]
+            stages.setdefault(name, {})[fmt] = {
+                'count': count,
+                'total_s': round(seconds, 6),
+                'mean_ms': round(seconds / count * 1000, 3) if count else 0.0,
+                'max_ms': round(stats[MAX] * 1000, 3),
+                'bytes': nbytes,
+                'mb_per_s': round(nbytes / (1024 * 1024) / seconds, 2) if nbytes and seconds else None,
+            }
+        return {
+            'generated': datetime.now().isoformat(timespec='seconds'),
+            'since': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'stages': stages,
+        }
+
+    def prometheus_text(self) -> str:
+        """Натрупаното във формата на Prometheus textfile (кумулативни броячи)."""
+        seconds = f'{METRIC_PREFIX}_stage_seconds'
+        nbytes = f'{METRIC_PREFIX}_stage_bytes_total'
+        lines = [f'# HELP {seconds} Time spent in a processing stage.',
+                 f'# TYPE {seconds} histogram']
+        items = sorted(self._stats.items())
+        for (name, fmt), stats in items:
+            labels = f'stage="{_label(name)}",format="{_label(fmt)}"'
+            cumulative = 0
+            for bound, count in zip(STAGE_BUCKETS + (None,), stats[BUCKETS]):
+                cumulative += count
+                le = '+Inf' if bound is None else f'{bound:g}'
+                lines.append(f'{seconds}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{seconds}_sum{{{labels}}} {stats[SECONDS]:.6f}')
+            lines.append(f'{seconds}_count{{{labels}}} {stats[COUNT]}')
+        lines += [f'# HELP {nbytes} Bytes handled by a processing stage.',
+                  f'# TYPE {nbytes} counter']
+        for (name, fmt), stats in items:
+            lines.append(f'{nbytes}{{stage="{_label(name)}",format="{_label(fmt)}"}} {stats[BYTES]}')
+        lines += [f'# HELP {METRIC_PREFIX}_metrics_generated_seconds Unix time of this export.',
+                  f'# TYPE {METRIC_PREFIX}_metrics_generated_seconds gauge',
+                  f'{METRIC_PREFIX}_metrics_generated_seconds {time.time():.0f}']
+        return '\n'.join(lines) + '\n'
+
+    def export(self, settings: MetricsSettings) -> None:
+        """Записва textfile-а и JSON обобщението (атомарно — четецът не вижда половин файл)."""
+        if not self.enabled or not self._stats:
+            return
+        # output_writer мери своите етапи оттук — импортът е тук, не на ниво модул
+        from output_writer import atomic_write_json, atomic_write_text
+        for path, write in ((settings.textfile, lambda p: atomic_write_text(p, self.prometheus_text())),
+                            (settings.json_file, lambda p: atomic_write_json(p, self.to_dict()))):
+            if path is None:
+                continue
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                write(path)
+            except OSError as e:
+                logger.error("Метриките не са записани в %s: %s", path, e)
+
+    def report_lines(self, top: int = 10) -> List[str]:
+        """Етапите с най-много време — за лога след обработката."""
+        if not self._stats:
+            return []
+        items = sorted(self._stats.items(), key=lambda item: item[1][SECONDS], reverse=True)
+        # Етапите се припокриват (extract съдържа backend) — без обща сума
+        lines = ["Етапи по общо време:"]
+        for (name, fmt), stats in items[:top]:
+            lines.append(f"  {name:<16} {fmt:<5} {stats[COUNT]:>6} x {stats[SECONDS] / stats[COUNT] * 1000:>8.2f} ms"
+                         f" = {stats[SECONDS]:>8.2f} s, max {stats[MAX] * 1000:.1f} ms")
+        return lines
+
+
+def _label(value: str) -> str:
+    """Стойност на етикет в Prometheus формат (escape на \\, " и нов ред)."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Един регистър на процес — главният процес и всеки работник имат свой
+METRICS = StageMetrics()
+
+
+def stage(name: str, fmt: str, nbytes: int = 0):
+    """METRICS.stage() — with stage('parse', 'eml'): ..."""
+    return METRICS.stage(name, fmt, nbytes)
+
+
+# ================== CLI ==================
+
+def print_metrics(json_file: Path) -> bool:
+    """Показва JSON обобщението от последния пуск."""
+    try:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Няма обобщение на метриките ({json_file}): {e}")
+        return False
+    print(f"Метрики от {report.get('since', '')} до {report.get('generated', '')}")
+    rows = [(name, fmt, values) for name, formats in report.get('stages', {}).items()
+            for fmt, values in formats.items()]
+    rows.sort(key=lambda row: row[2]['total_s'], reverse=True)
+    for name, fmt, values in rows:
+        rate = f", {values['mb_per_s']:.2f} MB/s" if values.get('mb_per_s') else ''
+        print(f"  {name:<16} {fmt:<5} {values['count']:>6} x {values['mean_ms']:>8.2f} ms = "
+              f"{values['total_s']:>8.2f} s, max {values['max_ms']:.1f} ms{rate}")
+    return True
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description='ClientRequests Stage Metrics')
+    parser.add_argument('--json', type=str, help='JSON обобщение (по подразбиране от config.json)')
+    args = parser.parse_args()
+
+    settings = MetricsSettings.from_config(load_config())
+    json_file = Path(args.json) if args.json else settings.json_file or BASE_DIR / DEFAULT_JSON
+    if not print_metrics(json_file):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+ClientRequests ODF Reader
+=========================
+Чист Python четец за OpenDocument файлове (.odt, .ods).
+
+Чете content.xml директно от zip архива с iterparse (поточно, без да
+зарежда целия XML в паметта) — без pandoc и без външни процеси.
+
+Поддържа:
+- параграфи и заглавия (text:p, text:h)
+- списъци (text:list / text:list-item) — с отстъп по ниво
+- таблици в ODT — редове като "клетка | клетка"
+- листове в ODS — "=== Лист: Име ===" + редове, както при XLSX
+- text:s, text:tab, text:line-break; бележки и коментари се пропускат
+
+Използване:
+    from odf_reader import read_odf_text
+    text = read_odf_text(Path("X.odt"))
+
+    python odf_reader.py X.ods           # Отпечатва извлечения текст
+"""
+
+import logging
+import sys
+import zipfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+
+NS_TEXT = 'urn:oasis:names:tc:opendocument:xmlns:text:1.0'
+NS_TABLE = 'urn:oasis:names:tc:opendocument:xmlns:table:1.0'
+NS_OFFICE = 'urn:oasis:names:tc:opendocument:xmlns:office:1.0'
+
+TAG_P = f'{{{NS_TEXT}}}p'
+TAG_H = f'{{{NS_TEXT}}}h'
+TAG_LIST = f'{{{NS_TEXT}}}list'
+TAG_LIST_ITEM = f'{{{NS_TEXT}}}list-item'
+TAG_S = f'{{{NS_TEXT}}}s'
+TAG_TAB = f'{{{NS_TEXT}}}tab'
+TAG_LINE_BREAK = f'{{{NS_TEXT}}}line-break'
+TAG_NOTE = f'{{{NS_TEXT}}}note'
+TAG_ANNOTATION = f'{{{NS_OFFICE}}}annotation'
+TAG_SPREADSHEET = f'{{{NS_OFFICE}}}spreadsheet'
+
+TAG_TABLE = f'{{{NS_TABLE}}}table'
+TAG_ROW = f'{{{NS_TABLE}}}table-row'
+TAG_CELL = f'{{{NS_TABLE}}}table-cell'
+TAG_COVERED_CELL = f'{{{NS_TABLE}}}covered-table-cell'
+
+ATTR_C = f'{{{NS_TEXT}}}c'
+ATTR_TABLE_NAME = f'{{{NS_TABLE}}}name'
+ATTR_COLS_REPEATED = f'{{{NS_TABLE}}}number-columns-repeated'
+ATTR_ROWS_REPEATED = f'{{{NS_TABLE}}}number-rows-repeated'
+
+# ODS често съдържа "1024 празни колони" / "1048576 празни реда" като
+# една повторена клетка/ред — ограничаваме повторенията на непразно съдържание
+MAX_REPEAT = 100
+
+SKIPPED_TAGS = {TAG_NOTE, TAG_ANNOTATION}
+
+
+def _inline_text(elem: ET.Element, out: List[str]) -> None:
+    """Събира текста на параграф, включително вложените span/a елементи."""
+    if elem.text:
+        out.append(elem.text)
+    for child in elem:
+        tag = child.tag
+        if tag == TAG_S:
+            out.append(' ' * int(child.get(ATTR_C, '1')))
+        elif tag == TAG_TAB:
+            out.append('\t')
+        elif tag == TAG_LINE_BREAK:
+            out.append('\n')
+        elif tag not in SKIPPED_TAGS:
+            _inline_text(child, out)
+        if child.tail:
+            out.append(child.tail)
+
+
+def _repeat(elem: ET.Element, attr: str) -> int:
+    try:
+        return max(1, int(elem.get(attr, '1')))
+    except ValueError:
+        return 1
+
+
+def iter_odf_lines(file_path: Path):
+    """Генератор на редове текст от content.xml на ODT/ODS файл."""
+    with zipfile.ZipFile(file_path) as zf:
+        with zf.open('content.xml') as content:
+            is_spreadsheet = False
+            list_depth = 0
+            skip_depth = 0
+            # Буфери за текущата клетка/ред (таблици могат да са вложени)
+            cells: List[List[str]] = []
+            rows: List[List[str]] = []
+
+            for event, elem in ET.iterparse(content, events=('start', 'end')):
+                tag = elem.tag
+
+                if event == 'start':
+                    if tag in SKIPPED_TAGS:
+                        skip_depth += 1
+                    elif tag == TAG_SPREADSHEET:
+                        is_spreadsheet = True
+                    elif tag == TAG_LIST:
+                        list_depth += 1
+                    elif tag == TAG_TABLE:
+                        if is_spreadsheet:
+                            yield ''
+                            yield f"=== Лист: {elem.get(ATTR_TABLE_NAME, '')} ==="
+                            yield ''
+                    elif tag == TAG_ROW:
+                        rows.append([])
+                    elif tag in (TAG_CELL, TAG_COVERED_CELL):
+                        cells.append([])
+                    continue
+
+                # event == 'end'
+                if tag in SKIPPED_TAGS:
+                    skip_depth -= 1
+                    elem.clear()
+                elif skip_depth:
+                    continue
+                elif tag in (TAG_P, TAG_H):
+                    parts: List[str] = []
+                    _inline_text(elem, parts)
+                    text = ''.join(parts).strip()
+                    elem.clear()
+                    if not text:
+                        continue
+                    if cells:
+                        cells[-1].append(text)
+                    elif list_depth:
+                        yield f"{'  ' * (list_depth - 1)}- {text}"
+                    else:
+                        yield text
+                elif tag == TAG_LIST:
+                    list_depth -= 1
+                    elem.clear()
+                elif tag in (TAG_CELL, TAG_COVERED_CELL):
+                    cell_text = ' '.join(cells.pop())
+                    repeat = _repeat(elem, ATTR_COLS_REPEATED)
+                    elem.clear()
+                    if rows:
+                        rows[-1].extend([cell_text] * min(repeat, MAX_REPEAT))
+                elif tag == TAG_ROW:
+                    row = rows.pop()
+                    repeat = _repeat(elem, ATTR_ROWS_REPEATED)
+                    elem.clear()
+                    while row and not row[-1]:
+                        row.pop()
+                    if not row:
+                        continue
+                    line = ' | '.join(row)
+                    if cells:
+                        # Таблица вложена в клетка
+                        cells[-1].append(line)
+                    else:
+                        for _ in range(min(repeat, MAX_REPEAT)):
+                            yield line
+                elif tag == TAG_TABLE:
+                    elem.clear()
+
+
+def read_odf_text(file_path: Path) -> str:
+    """Извлича текста от ODT/ODS файл.
+
+    Raises:
+        zipfile.BadZipFile, KeyError, ET.ParseError: при повреден файл
+    """
+    return '\n'.join(iter_odf_lines(Path(file_path)))
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    if len(sys.argv) < 2:
+        print("Използване: python odf_reader.py <файл.odt|файл.ods>")
+        sys.exit(1)
+    print(read_odf_text(Path(sys.argv[1])))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,53 +5,84 @@ ClientRequests Office Document Extractor
 
 Извлича текст от различни видове офис документи:
 - .docx (Word документи, Teams транскрипти)
-- .doc (стари Word документи)
+- .doc (стари Word документи — вграден четец, без Word)
 - .xlsx, .xls (Excel)
-- .rtf, .txt, .xml (текстови)
-- .odt (OpenDocument)
+- .rtf (поточен RTF токенизатор)
+- .xml (поточно структурно извличане)
+- .txt (текстови)
+- .odt, .ods (OpenDocument — вграден четец, без pandoc)
+- .vtt, .srt (транскрипти от Teams/Zoom — като Teams DOCX транскрипт)
 - .eml (имейли с прикачени офис документи)
 
 Оригинал: Cargoflow_Office/office_processor.py (НЕ Е ПРОМЕНЯН)
 Тази версия е адаптирана за ClientRequests/ системата.
 
 Използване:
-    python office_extractor.py                  # Обработва всички файлове в inbox/
+    python office_extractor.py                  # Обработва всички файлове в inbox/ (паралелно)
+    python office_extractor.py --workers 4      # ... с 4 надзиравани процеса
+    python office_extractor.py --memory-limit-mb 1024  # ... с лимит на паметта на процес
     python office_extractor.py --file "X.docx"  # Обработва конкретен файл
     python office_extractor.py --file "X.eml"   # Извлича DOCX от EML и обработва
-
-Извежда:
-    processed/<filename>_extracted.json   - метаданни
-    processed/<filename>_body.txt         - извлечен текст
-    processed/<filename>.docx             - копие на DOCX (при EML)
+    python office_extractor.py --output-mode manifest --compress gzip  # ред в processed/manifest/
+    python office_extractor.py --metrics        # + времена по етап (processed/metrics.prom, .json)
+    python office_extractor.py --profile        # + cProfile и стекове по файл (processed/profiles/)
+    python office_extractor.py --transcript "X.docx" --minutes 40-45   # по индекса на processed/
+    python office_extractor.py --transcript processed/extracted/.../X_extracted.json --speaker "Ivan Petrov"
+
+Извежда (през output_writer — същата схема като process_inbox), в една
+папка processed/extracted/<ГГГГ-ММ>/<hh>/<stem>-<id>/ на входен файл:
+    <filename>_extracted.json   - метаданни
+    <filename>_body.txt         - извлечен текст
+    <filename>_att_<filename>   - копие на документа (при EML)
+    <filename>.eml              - самият EML
+    quarantine/<filename>       - увиснал/сринал се файл (+ .diagnostic.json)
+Пътят по име на файла: python processed_index.py --lookup "X.docx".
+
+OfficeDocumentProcessor.process_file() само връща данни; записът е в
+save_results() (CLI) или в process_inbox.py.
 """
 
 import json
 import logging
+import os
 import re
 import sys
 import argparse
+import io
+import itertools
+import tempfile
 import time
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import deque
 from datetime import datetime
 from email import policy
 from email.parser import BytesParser
 from enum import Enum
 from pathlib import Path
-from typing import Optional, Dict, List, Tuple
+from typing import Optional, Dict, Iterable, Iterator, List, Tuple
 from dataclasses import dataclass
 
-# Configure logging
-LOG_FILE = Path(__file__).parent / 'office_extractor.log'
-logging.basicConfig(
-    level=logging.DEBUG,
-    filename=str(LOG_FILE),
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
-console = logging.StreamHandler()
-console.setLevel(logging.INFO)
-console.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logging.getLogger('').addHandler(console)
+from doc_reader import read_doc_text
+from journal import (ProcessingJournal, STAGE_DONE, STAGE_FAILED, STAGE_QUARANTINED,
+                     STAGE_WRITTEN)
+from logging_setup import setup_logging
+from manifest import CODECS, OUTPUT_MODES, Manifest, OutputSettings
+from metrics import METRICS, MetricsSettings, stage
+from output_writer import (finish_original, output_list, prepare_artifact_dir, quarantine_file,
+                           quarantine_write_error, remove_stale_temp_files, write_outputs)
+from processed_index import ArtifactIndex
+from profiling import merge_profiles, new_profile_dir, profiled
+from records import ExtractionRecord, now_stamp
+from odf_reader import read_odf_text
+from rtf_reader import read_rtf_text
+from requests_config import load_config
+from run_summary import BatchSummary
+from search_index import SearchIndex
+from text_decoding import read_text
+from vtt_reader import format_duration, iter_cues, iter_speaker_turns
+from worker_pool import SupervisedPool, SupervisionSettings
+from xml_reader import XmlOptions, read_xml_text
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +90,7 @@ logger = logging.getLogger(__name__)
 BASE_DIR = Path(__file__).parent
 INBOX_DIR = BASE_DIR / "inbox"
 PROCESSED_DIR = BASE_DIR / "processed"
+QUARANTINE_DIR = BASE_DIR / "quarantine"
 
 # Ensure directories exist
 INBOX_DIR.mkdir(exist_ok=True)
@@ -77,6 +109,9 @@ class DocumentType(Enum):
     TXT = ".txt"
     XML = ".xml"
     ODT = ".odt"
+    ODS = ".ods"
+    VTT = ".vtt"
+    SRT = ".srt"
 
 
 # Optional imports - не всички са задължителни
@@ -135,6 +170,18 @@ def clean_text_aggressive(text: str) -> str:
     return text.strip()
 
 
+# WordprocessingML тагове за поточно четене на DOCX
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_P = f'{W_NS}p'
+W_T = f'{W_NS}t'
+W_TAB = f'{W_NS}tab'
+W_BR = f'{W_NS}br'
+W_CR = f'{W_NS}cr'
+W_TBL = f'{W_NS}tbl'
+W_VAL = f'{W_NS}val'
+W_PSTYLE_PATH = f'{W_NS}pPr/{W_NS}pStyle'
+
+
 # ================== TEXT EXTRACTORS ==================
 
 class OfficeTextExtractor:
@@ -142,8 +189,14 @@ class OfficeTextExtractor:
 
     Адаптирано от: Cargoflow_Office/office_processor.py::TextExtractor
     Разлика: Без PostgreSQL, без Watchdog, с EML поддръжка.
+
+    При low_memory DOCX/XLSX/XLS се четат поточно, без целия документ в паметта.
+    MemoryError не се поглъща — надзираващият пул повтаря файла в low-memory режим.
     """
 
+    def __init__(self, low_memory: bool = False):
+        self.low_memory = low_memory
+
     @staticmethod
     def extract_from_docx(file_path: Path) -> Optional[str]:
         """Извлича текст от DOCX файл."""
@@ -158,38 +211,104 @@ class OfficeTextExtractor:
                 if text:
                     paragraphs.append(text)
             return clean_text('\n'.join(paragraphs))
+        except MemoryError:
+            raise
+        except Exception as e:
+            logger.error("Грешка при извличане от DOCX %s: %s", file_path, e)
+            return None
+
+    @staticmethod
+    def extract_from_docx_streaming(file_path: Path) -> Optional[str]:
+        """Извлича текст от DOCX поточно (low-memory) — параграф по параграф, без python-docx."""
+        try:
+            return clean_text('\n'.join(p['text'] for p in OfficeTextExtractor.iter_docx_paragraphs(file_path)))
+        except MemoryError:
+            raise
         except Exception as e:
-            logger.error(f"Грешка при извличане от DOCX {file_path}: {e}")
+            logger.error("Грешка при поточно извличане от DOCX %s: %s", file_path, e)
             return None
 
+    @staticmethod
+    def iter_docx_paragraphs(file_path: Path) -> Iterator[Dict]:
+        """Поточно чете параграфите на DOCX директно от word/document.xml.
+
+        Дава същите речници като extract_from_docx_structured, но един по един
+        и без python-docx. Както document.paragraphs, пропуска параграфите в таблици.
+        """
+        with zipfile.ZipFile(file_path) as zf:
+            with zf.open('word/document.xml') as xml_file:
+                table_depth = 0
+                index = 0
+                for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+                    tag = elem.tag
+                    if tag == W_TBL:
+                        table_depth += 1 if event == 'start' else -1
+                        if event == 'end':
+                            elem.clear()
+                        continue
+                    if event != 'end' or tag != W_P:
+                        continue
+                    if table_depth:
+                        continue
+
+                    parts = []
+                    for node in elem.iter():
+                        if node.tag == W_T:
+                            parts.append(node.text or '')
+                        elif node.tag == W_TAB:
+                            parts.append('\t')
+                        elif node.tag in (W_BR, W_CR):
+                            parts.append('\n')
+                    style = elem.find(W_PSTYLE_PATH)
+                    text = ''.join(parts).strip()
+                    elem.clear()
+
+                    if text:
+                        yield {
+                            'index': index,
+                            'text': text,
+                            'style': style.get(W_VAL) if style is not None else 'Normal'
+                        }
+                    index += 1
+
     @staticmethod
     def extract_from_docx_structured(file_path: Path) -> Optional[List[Dict]]:
         """Извлича структуриран текст от DOCX (параграф по параграф).
         Полезно за Teams транскрипти, където всеки параграф е реплика.
         """
-        if not DOCX_AVAILABLE:
-            return None
         try:
-            document = DocxDocument(str(file_path))
-            paragraphs = []
-            for i, para in enumerate(document.paragraphs):
-                text = para.text.strip()
-                if text:
-                    paragraphs.append({
-                        'index': i,
-                        'text': text,
-                        'style': para.style.name if para.style else 'Normal'
-                    })
-            return paragraphs
+            return list(OfficeTextExtractor.iter_docx_paragraphs(file_path))
+        except MemoryError:
+            raise
         except Exception as e:
-            logger.error(f"Грешка при структурирано извличане от DOCX {file_path}: {e}")
+            logger.error("Грешка при структурирано извличане от DOCX %s: %s", file_path, e)
             return None
 
     @staticmethod
     def extract_from_doc(file_path: Path) -> Optional[str]:
-        """Извлича текст от DOC файл (стар Word формат)."""
+        """Извлича текст от DOC файл (стар Word формат).
+
+        Първо чете piece table директно (doc_reader, без Word) — работи и на Linux.
+        Word през win32com остава само като резерва за файлове, които
+        вграденият четец не поддържа.
+        """
+        try:
+            text = read_doc_text(file_path)
+            if text.strip():
+                return clean_text(text)
+            logger.warning("Вграденият DOC четец не върна текст: %s", file_path)
+        except MemoryError:
+            raise
+        except Exception as e:
+            logger.warning("Вграденият DOC четец не успя за %s: %s", file_path, e)
+
+        return OfficeTextExtractor._extract_from_doc_com(file_path)
+
+    @staticmethod
+    def _extract_from_doc_com(file_path: Path) -> Optional[str]:
+        """Извлича текст от DOC чрез Word (win32com) — само на Windows."""
         if not WIN32COM_AVAILABLE:
-            logger.warning(f"win32com не е наличен, DOC не може да се обработи: {file_path}")
+            logger.warning("win32com не е наличен, DOC не може да се обработи: %s", file_path)
             return None
         word = None
         try:
@@ -202,7 +321,7 @@ class OfficeTextExtractor:
             doc.Close(False)
             return clean_text_aggressive(text)
         except Exception as e:
-            logger.error(f"Грешка при извличане от DOC {file_path}: {e}")
+            logger.error("Грешка при извличане от DOC %s: %s", file_path, e)
             return None
         finally:
             if word:
@@ -216,13 +335,18 @@ class OfficeTextExtractor:
                 pass
 
     @staticmethod
-    def extract_from_xlsx(file_path: Path) -> Optional[str]:
-        """Извлича текст от XLSX файл."""
+    def extract_from_xlsx(file_path: Path, read_only: bool = False) -> Optional[str]:
+        """Извлича текст от XLSX файл.
+
+        read_only=True чете редовете поточно (low-memory) — без обектите на
+        всички клетки в паметта.
+        """
         if not OPENPYXL_AVAILABLE:
-            logger.warning(f"openpyxl не е наличен, XLSX не може да се обработи: {file_path}")
+            logger.warning("openpyxl не е наличен, XLSX не може да се обработи: %s", file_path)
             return None
+        workbook = None
         try:
-            workbook = openpyxl.load_workbook(str(file_path), data_only=True)
+            workbook = openpyxl.load_workbook(str(file_path), data_only=True, read_only=read_only)
             text = []
             for sheet in workbook.sheetnames:
                 worksheet = workbook[sheet]
@@ -232,18 +356,27 @@ class OfficeTextExtractor:
                     if row_text.strip() and row_text.strip() != '|':
                         text.append(row_text)
             return clean_text('\n'.join(text))
+        except MemoryError:
+            raise
         except Exception as e:
-            logger.error(f"Грешка при извличане от XLSX {file_path}: {e}")
+            logger.error("Грешка при извличане от XLSX %s: %s", file_path, e)
             return None
+        finally:
+            if read_only and workbook is not None:
+                # read_only държи файла отворен до close()
+                workbook.close()
 
     @staticmethod
-    def extract_from_xls(file_path: Path) -> Optional[str]:
-        """Извлича текст от XLS файл (стар Excel)."""
+    def extract_from_xls(file_path: Path, on_demand: bool = False) -> Optional[str]:
+        """Извлича текст от XLS файл (стар Excel).
+
+        on_demand=True зарежда листовете един по един (low-memory).
+        """
         if not XLRD_AVAILABLE:
-            logger.warning(f"xlrd не е наличен, XLS не може да се обработи: {file_path}")
+            logger.warning("xlrd не е наличен, XLS не може да се обработи: %s", file_path)
             return None
         try:
-            workbook = xlrd.open_workbook(str(file_path))
+            workbook = xlrd.open_workbook(str(file_path), on_demand=on_demand)
             text = []
             for sheet_index in range(workbook.nsheets):
                 sheet = workbook.sheet_by_index(sheet_index)
@@ -253,39 +386,94 @@ class OfficeTextExtractor:
                     row_text = ' | '.join(str(cell) for cell in row_values if cell)
                     if row_text.strip():
                         text.append(row_text)
+                if on_demand:
+                    workbook.unload_sheet(sheet_index)
+            if on_demand:
+                workbook.release_resources()
             return clean_text('\n'.join(text))
+        except MemoryError:
+            raise
         except Exception as e:
-            logger.error(f"Грешка при извличане от XLS {file_path}: {e}")
+            logger.error("Грешка при извличане от XLS %s: %s", file_path, e)
             return None
 
     @staticmethod
     def extract_from_txt(file_path: Path) -> Optional[str]:
-        """Извлича текст от TXT/RTF/XML файл."""
+        """Извлича текст от TXT файл.
+
+        Файлът се чете веднъж; кодировката се определя от извадка (text_decoding).
+        """
         try:
-            # Пробваме различни кодировки
-            for encoding in ['utf-8', 'cp1251', 'iso-8859-1', 'windows-1252']:
-                try:
-                    text = file_path.read_text(encoding=encoding)
-                    return clean_text(text)
-                except UnicodeDecodeError:
-                    continue
-            logger.warning(f"Не може да се декодира {file_path}")
+            return clean_text(read_text(file_path))
+        except MemoryError:
+            raise
+        except Exception as e:
+            logger.error("Грешка при четене на текстов файл %s: %s", file_path, e)
             return None
+
+    @staticmethod
+    def extract_from_xml(file_path: Path) -> Optional[str]:
+        """Извлича текстовите възли от XML поточно ("път: текст"), с постоянна памет.
+
+        Разрешените елементи и лимитите се четат от config.json (python.xml).
+        Невалиден XML: извлеченото дотук + останалото като текст, пак до лимита.
+        """
+        try:
+            options = XmlOptions.from_config(load_config())
+            return clean_text(read_xml_text(file_path, options, raw_fallback=True))
+        except MemoryError:
+            raise
         except Exception as e:
-            logger.error(f"Грешка при четене на текстов файл {file_path}: {e}")
+            logger.error("Грешка при извличане от XML %s: %s", file_path, e)
+            return None
+
+    @staticmethod
+    def extract_from_rtf(file_path: Path) -> Optional[str]:
+        """Извлича текст от RTF файл (поточен токенизатор, без картинки и служебни групи)."""
+        try:
+            return clean_text(read_rtf_text(file_path))
+        except MemoryError:
+            raise
+        except Exception as e:
+            logger.error("Грешка при извличане от RTF %s: %s", file_path, e)
             return None
 
     @staticmethod
     def extract_from_odt(file_path: Path) -> Optional[str]:
-        """Извлича текст от ODT файл."""
+        """Извлича текст от ODT/ODS файл.
+
+        Чете content.xml поточно (odf_reader) — без pandoc процес.
+        pypandoc остава само като резерва, ако вграденият четец не успее.
+        """
+        try:
+            return clean_text(read_odf_text(file_path))
+        except MemoryError:
+            raise
+        except Exception as e:
+            logger.warning("Вграденият ODF четец не успя за %s: %s", file_path, e)
+
         if not PYPANDOC_AVAILABLE:
-            logger.warning(f"pypandoc не е наличен, ODT не може да се обработи: {file_path}")
+            logger.error("pypandoc не е наличен, ODT не може да се обработи: %s", file_path)
             return None
         try:
             text = pypandoc.convert_file(str(file_path), 'plain')
             return clean_text(text)
+        except MemoryError:
+            raise
+        except Exception as e:
+            logger.error("Грешка при извличане от ODT %s: %s", file_path, e)
+            return None
+
+    @staticmethod
+    def extract_from_subtitles(file_path: Path) -> Optional[str]:
+        """Извлича VTT/SRT транскрипт като Markdown (реплики по говорещ)."""
+        try:
+            _, text = TeamsTranscriptParser.parse_subtitles(file_path)
+            return text
+        except MemoryError:
+            raise
         except Exception as e:
-            logger.error(f"Грешка при извличане от ODT {file_path}: {e}")
+            logger.error("Грешка при извличане от транскрипт %s: %s", file_path, e)
             return None
 
     def extract(self, file_path: Path) -> Optional[str]:
@@ -293,7 +481,7 @@ class OfficeTextExtractor:
         try:
             doc_type = DocumentType(file_path.suffix.lower())
         except ValueError:
-            logger.warning(f"Неподдържан тип файл: {file_path.suffix}")
+            logger.warning("Неподдържан тип файл: %s", file_path.suffix)
             return None
 
         extractors = {
@@ -301,11 +489,20 @@ class OfficeTextExtractor:
             DocumentType.DOC: self.extract_from_doc,
             DocumentType.XLSX: self.extract_from_xlsx,
             DocumentType.XLS: self.extract_from_xls,
-            DocumentType.RTF: self.extract_from_txt,
+            DocumentType.RTF: self.extract_from_rtf,
             DocumentType.TXT: self.extract_from_txt,
-            DocumentType.XML: self.extract_from_txt,
+            DocumentType.XML: self.extract_from_xml,
             DocumentType.ODT: self.extract_from_odt,
+            DocumentType.ODS: self.extract_from_odt,
+            DocumentType.VTT: self.extract_from_subtitles,
+            DocumentType.SRT: self.extract_from_subtitles,
         }
+        if self.low_memory:
+            extractors.update({
+                DocumentType.DOCX: self.extract_from_docx_streaming,
+                DocumentType.XLSX: lambda path: self.extract_from_xlsx(path, read_only=True),
+                DocumentType.XLS: lambda path: self.extract_from_xls(path, on_demand=True),
+            })
 
         extractor = extractors.get(doc_type)
         if extractor:
@@ -345,7 +542,7 @@ class EmlDocumentExtractor:
                         data,
                         part.get_content_type()
                     ))
-                    logger.info(f"Намерен офис документ в EML: {filename} ({len(data)} bytes)")
+                    logger.info("Намерен офис документ в EML: %s (%s bytes)", filename, len(data))
 
         return attachments
 
@@ -384,6 +581,12 @@ class TeamsTranscriptParser:
     # Формат: "Speaker Name   M:SS" или "Speaker Name   HH:MM:SS"
     SPEAKER_LINE_PATTERN = re.compile(r'^(.+?)\s{2,}(\d+:\d{2}(?::\d{2})?)\s*$')
 
+    # Първите параграфи: заглавие, дата, продължителност, кой е стартирал
+    HEADER_FIELDS = ('title', 'date', 'duration', 'started_by')
+
+    # Колко параграфа са нужни на is_teams_transcript
+    DETECTION_WINDOW = 15
+
     @staticmethod
     def is_teams_transcript(paragraphs: List[Dict]) -> bool:
         """Проверява дали документът е Teams транскрипт."""
@@ -406,7 +609,7 @@ class TeamsTranscriptParser:
         # Проверяваме дали параграфите съдържат speaker patterns
         # В Teams формата: параграф започва с \nSpeakerName   M:SS\nText
         speaker_count = 0
-        for p in paragraphs[4:min(15, len(paragraphs))]:
+        for p in paragraphs[4:min(TeamsTranscriptParser.DETECTION_WINDOW, len(paragraphs))]:
             lines = p['text'].strip().split('\n')
             for line in lines:
                 line = line.strip()
@@ -417,91 +620,255 @@ class TeamsTranscriptParser:
         return indicators >= 2 or speaker_count >= 3
 
     @staticmethod
-    def parse(paragraphs: List[Dict]) -> Dict:
-        """Парсва Teams транскрипт в структуриран формат.
+    def parse_time(stamp: str) -> int:
+        """Конвертира "M:SS" / "H:MM:SS" в секунди."""
+        seconds = 0
+        for part in stamp.split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+
+    @staticmethod
+    def _parse_message(raw_text: str) -> Tuple[Optional[str], str, List[str]]:
+        """Разделя параграф на (speaker, time, редове текст)."""
+        speaker = None
+        time_stamp = ''
+        text_lines = []
+
+        for line in raw_text.split('\n'):
+            line_stripped = line.strip()
+            if not line_stripped:
+                continue
+
+            if not speaker:
+                # Опитваме да match-нем speaker+time; редовете преди него
+                # (продължение от header или специален ред) се пропускат
+                match = TeamsTranscriptParser.SPEAKER_LINE_PATTERN.match(line_stripped)
+                if match:
+                    speaker = match.group(1).strip()
+                    time_stamp = match.group(2).strip()
+                continue
+
+            # Всичко след speaker line е текст
+            text_lines.append(line_stripped)
+
+        return speaker, time_stamp, text_lines
+
+    @staticmethod
+    def iter_parse(paragraphs: Iterable[Dict], result: Dict) -> Iterator[Dict]:
+        """Поточно парсване: попълва header полетата и участниците в result
+        и yield-ва съобщенията едно по едно, докато параграфите пристигат.
 
         В Teams DOCX формата всеки параграф (от 4-ти нататък) съдържа:
         - Ред 1: "SpeakerName   M:SS"
         - Редове 2+: Текстът на съобщението
         """
-        result = {
+        result.setdefault('participants', set())
+
+        for position, p in enumerate(paragraphs):
+            if position < len(TeamsTranscriptParser.HEADER_FIELDS):
+                result[TeamsTranscriptParser.HEADER_FIELDS[position]] = p['text'].strip()
+                continue
+
+            speaker, time_stamp, text_lines = TeamsTranscriptParser._parse_message(p['text'])
+            if not speaker:
+                continue
+
+            # Speaker без текст (напр. "arrêt de la transcription") —
+            # не е съобщение, но записваме участника
+            result['participants'].add(speaker)
+            if text_lines:
+                yield {
+                    'speaker': speaker,
+                    'time': time_stamp,
+                    'seconds': TeamsTranscriptParser.parse_time(time_stamp) if time_stamp else 0,
+                    'text': '\n'.join(text_lines)
+                }
+
+    @staticmethod
+    def _new_result() -> Dict:
+        return {
             'title': '',
             'date': '',
             'duration': '',
             'started_by': '',
             'participants': set(),
-            'messages': [],
         }
 
-        if not paragraphs:
-            return result
-
-        # Parse header
-        result['title'] = paragraphs[0]['text'].strip() if paragraphs else ''
-
-        if len(paragraphs) > 1:
-            result['date'] = paragraphs[1]['text'].strip()
-
-        if len(paragraphs) > 2:
-            result['duration'] = paragraphs[2]['text'].strip()
+    @staticmethod
+    def parse_to_markdown(paragraphs: Iterable[Dict]) -> Tuple[Dict, str]:
+        """Парсва транскрипта и строи четимия Markdown в същото минаване."""
+        result = TeamsTranscriptParser._new_result()
+        return TeamsTranscriptParser.build_markdown(
+            TeamsTranscriptParser.iter_parse(paragraphs, result), result
+        )
 
-        if len(paragraphs) > 3:
-            result['started_by'] = paragraphs[3]['text'].strip()
+    @staticmethod
+    def parse_subtitles(file_path: Path) -> Tuple[Dict, str]:
+        """Парсва VTT/SRT транскрипт в същата структура като DOCX транскрипт.
 
-        # Parse messages — всеки параграф е отделно съобщение
-        for p in paragraphs[4:]:
-            raw_text = p['text']
-            lines = raw_text.split('\n')
+        Последователните cue-та на един говорещ се сливат в едно съобщение.
+        """
+        result = TeamsTranscriptParser._new_result()
+        result['title'] = file_path.stem
+        turns = iter_speaker_turns(iter_cues(file_path))
+        return TeamsTranscriptParser.build_markdown(turns, result)
 
-            # Намери speaker line
-            speaker = None
-            time_stamp = None
-            text_lines = []
+    @staticmethod
+    def format_message(msg: Dict) -> str:
+        return f"**{msg['speaker']}** [{msg['time']}]:\n{msg['text']}\n\n"
 
-            for line in lines:
-                line_stripped = line.strip()
-                if not line_stripped:
-                    continue
+    @staticmethod
+    def build_markdown(messages: Iterable[Dict], result: Dict) -> Tuple[Dict, str]:
+        """Пише Markdown-а реплика по реплика и индексира отместванията им.
 
-                if not speaker:
-                    # Опитваме да match-нем speaker+time
-                    match = TeamsTranscriptParser.SPEAKER_LINE_PATTERN.match(line_stripped)
-                    if match:
-                        speaker = match.group(1).strip()
-                        time_stamp = match.group(2).strip()
-                        continue
+        Репликите не се пазят: в result остават заглавните полета, участниците
+        и индексът (говорещ/минута -> отмествания в текста), а select() чете
+        репликите обратно от текста.
+        """
+        index = TranscriptIndex()
+        body = io.StringIO()
+        last = None
 
-                    # Ако не е speaker line, може да е продължение от header
-                    # или специален ред — пропускаме
-                    continue
+        for msg in messages:
+            result['participants'].add(msg['speaker'])
+            index.add(msg, body.tell())
+            body.write(TeamsTranscriptParser.format_message(msg))
+            last = msg
+        index.close(body.tell())
 
-                # Всичко след speaker line е текст
-                if line_stripped:
-                    text_lines.append(line_stripped)
+        # В субтитрите няма ред "продължителност" — взимаме края на последния cue
+        if not result['duration'] and last is not None and 'end_seconds' in last:
+            result['duration'] = format_duration(last['end_seconds'])
 
-            if speaker and text_lines:
-                result['messages'].append({
-                    'speaker': speaker,
-                    'time': time_stamp or '',
-                    'text': '\n'.join(text_lines)
-                })
-                result['participants'].add(speaker)
-            elif speaker:
-                # Speaker без текст (напр. "arrêt de la transcription")
-                # Не добавяме като съобщение, но записваме участника
-                result['participants'].add(speaker)
-
-        # Convert set to sorted list
         result['participants'] = sorted(result['participants'])
-
         result['summary_stats'] = {
-            'total_messages': len(result['messages']),
+            'total_messages': index.count,
             'participants_count': len(result['participants']),
             'participants': result['participants'],
             'duration': result['duration'],
         }
 
-        return result
+        header = '\n'.join([
+            f"# {result['title']}",
+            f"Дата: {result['date']}",
+            f"Продължителност: {result['duration']}",
+            f"Участници: {', '.join(result['participants'])}",
+            f"{result.get('started_by', '')}",
+            "",
+            "---",
+            "",
+            "",
+        ])
+        index.shift(len(header))
+        result['index'] = index.to_dict()
+        # Последният празен ред след репликите отпада
+        return result, (header + body.getvalue())[:-1]
+
+    MESSAGE_HEAD_PATTERN = re.compile(r'^\*\*(.*)\*\* \[([^\]]*)\]:$')
+
+    @staticmethod
+    def read_message(text: str, start: int, end: int) -> Dict:
+        """Репликата между отместванията start и end на Markdown-а."""
+        head, _, body = text[start:end].partition('\n')
+        match = TeamsTranscriptParser.MESSAGE_HEAD_PATTERN.match(head)
+        speaker, time_stamp = match.groups() if match else ('', '')
+        return {
+            'speaker': speaker,
+            'time': time_stamp,
+            'seconds': TeamsTranscriptParser.parse_time(time_stamp) if time_stamp else 0,
+            'text': body.strip('\n'),
+        }
+
+    @staticmethod
+    def select(teams_data: Dict, text: str, speaker: Optional[str] = None,
+               from_minute: Optional[int] = None, to_minute: Optional[int] = None) -> List[Dict]:
+        """Връща репликите за говорещ и/или интервал [from_minute, to_minute),
+        като ползва индекса — четат се от текста (body_text), без повторно парсване.
+
+        По-старите записи пазят самите реплики в teams_data['messages'].
+        """
+        messages = teams_data.get('messages')
+        index = teams_data.get('index') or {}
+        if messages is None and 'offsets' not in index:
+            return []
+        count = len(messages) if messages is not None else len(index['offsets']) - 1
+
+        positions = None
+        if from_minute is not None or to_minute is not None:
+            bucket = index['bucket_seconds']
+            low = (from_minute or 0) * 60 // bucket
+            high = to_minute * 60 // bucket if to_minute is not None else None
+            ranges = [r for b, r in index['by_bucket'].items()
+                      if int(b) >= low and (high is None or int(b) < high)]
+            if not ranges:
+                return []
+            first = min(r[0] for r in ranges)
+            last = max(r[1] for r in ranges)
+            positions = range(first, last + 1)
+
+        if speaker is not None:
+            by_speaker = index['by_speaker'].get(speaker, [])
+            if positions is not None:
+                by_speaker = [i for i in by_speaker if positions.start <= i < positions.stop]
+            positions = by_speaker
+
+        if positions is None:
+            positions = range(count)
+        if messages is not None:
+            return [messages[i] for i in positions]
+        offsets = index['offsets']
+        return [TeamsTranscriptParser.read_message(text, offsets[i], offsets[i + 1])
+                for i in positions]
+
+
+class TranscriptIndex:
+    """Компактен индекс на транскрипт: говорещ -> позиции, времеви кош -> [първа, последна].
+
+    Съобщенията са подредени по време, затова един кош (по подразбиране
+    минута) се описва с диапазон позиции, а не със списък. offsets[i] е
+    началото на i-тата реплика в Markdown-а (последното — краят на репликите).
+    """
+
+    BUCKET_SECONDS = 60
+
+    def __init__(self, bucket_seconds: int = BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.by_speaker: Dict[str, List[int]] = {}
+        self.by_bucket: Dict[int, List[int]] = {}
+        self.offsets: List[int] = []
+
+    @property
+    def count(self) -> int:
+        return max(0, len(self.offsets) - 1)
+
+    def add(self, msg: Dict, offset: int) -> None:
+        position = len(self.offsets)
+        self.offsets.append(offset)
+        self.by_speaker.setdefault(msg['speaker'], []).append(position)
+        bucket = msg.get('seconds', 0) // self.bucket_seconds
+        span = self.by_bucket.get(bucket)
+        if span is None:
+            self.by_bucket[bucket] = [position, position]
+        else:
+            span[0] = min(span[0], position)
+            span[1] = max(span[1], position)
+
+    def close(self, end: int) -> None:
+        """Краят на последната реплика."""
+        self.offsets.append(end)
+
+    def shift(self, delta: int) -> None:
+        """Отместванията стават спрямо целия текст (заглавката е отпред)."""
+        self.offsets = [offset + delta for offset in self.offsets]
+
+    def to_dict(self) -> Dict:
+        return {
+            'bucket_seconds': self.bucket_seconds,
+            'by_speaker': self.by_speaker,
+            # JSON ключовете са низове
+            'by_bucket': {str(b): span for b, span in sorted(self.by_bucket.items())},
+            'offsets': self.offsets,
+        }
 
 
 # ================== MAIN PROCESSOR ==================
@@ -511,8 +878,10 @@ class OfficeDocumentProcessor:
 
     SUPPORTED_EXTENSIONS = {ext.value for ext in DocumentType} | {'.eml'}
 
-    def __init__(self):
-        self.extractor = OfficeTextExtractor()
+    def __init__(self, low_memory: bool = False, output: Optional[OutputSettings] = None):
+        self.low_memory = low_memory
+        self.extractor = OfficeTextExtractor(low_memory=low_memory)
+        self.output = output or OutputSettings.from_config(load_config())
         self.processed_count = 0
 
     def is_supported(self, file_path: Path) -> bool:
@@ -521,74 +890,71 @@ class OfficeDocumentProcessor:
 
     def process_file(self, file_path: Path) -> Optional[Dict]:
         """Обработва един файл и връща резултат."""
-        logger.info(f"Обработка на файл: {file_path}")
+        logger.info("Обработка на файл: %s", file_path)
 
         ext = file_path.suffix.lower()
 
         if ext == '.eml':
             return self._process_eml(file_path)
         elif ext in {e.value for e in DocumentType}:
-            return self._process_office_doc(file_path)
+            with stage('backend', ext.lstrip('.'), file_path.stat().st_size):
+                return self._process_office_doc(file_path)
         else:
-            logger.warning(f"Неподдържан формат: {ext}")
+            logger.warning("Неподдържан формат: %s", ext)
             return None
 
     def _process_eml(self, eml_path: Path) -> Optional[Dict]:
-        """Обработва EML файл — извлича прикачени офис документи."""
-        logger.info(f"Обработка на EML с офис документи: {eml_path}")
+        """Обработва EML файл — извлича прикачени офис документи.
 
-        # Get EML metadata
-        eml_meta = EmlDocumentExtractor.get_eml_metadata(eml_path)
+        Прикачените се обработват във временна папка; байтовете им остават
+        в резултата ('attachments'), а записът е работа на save_results.
+        """
+        logger.info("Обработка на EML с офис документи: %s", eml_path)
 
-        # Extract office attachments
-        attachments = EmlDocumentExtractor.extract_attachments_from_eml(eml_path)
+        with stage('parse', 'eml', eml_path.stat().st_size):
+            # Get EML metadata
+            eml_meta = EmlDocumentExtractor.get_eml_metadata(eml_path)
+
+            # Extract office attachments
+            attachments = EmlDocumentExtractor.extract_attachments_from_eml(eml_path)
 
         if not attachments:
-            logger.info(f"Няма офис документи в EML: {eml_path}")
+            logger.info("Няма офис документи в EML: %s", eml_path)
             return None
 
         results = []
-        for filename, data, content_type in attachments:
-            # Save attachment to processed/
-            att_path = PROCESSED_DIR / filename
-            if att_path.exists():
-                stem = att_path.stem
-                ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-                att_path = PROCESSED_DIR / f"{stem}_{ts}{att_path.suffix}"
-
-            att_path.write_bytes(data)
-            logger.info(f"Записан прикачен файл: {att_path} ({len(data)} bytes)")
-
-            # Process the extracted file
-            result = self._process_office_doc(att_path, eml_metadata=eml_meta)
-            if result:
-                result['source_eml'] = eml_path.name
-                results.append(result)
+        with tempfile.TemporaryDirectory(prefix='office_extractor_') as tmp_dir:
+            for filename, data, content_type in attachments:
+                att_path = Path(tmp_dir) / Path(filename).name
+                att_path.write_bytes(data)
+
+                # Process the extracted file
+                with stage('backend', att_path.suffix.lower().lstrip('.'), len(data)):
+                    result = self._process_office_doc(att_path, eml_metadata=eml_meta)
+                if result:
+                    result['source_eml'] = eml_path.name
+                    result['attachments'] = [{
+                        'filename': att_path.name,
+                        'content_type': content_type,
+                        'size': len(data),
+                        'data': data,
+                    }]
+                    results.append(result)
 
-        if results:
-            # Move EML to processed
-            dest = PROCESSED_DIR / eml_path.name
-            if dest.exists():
-                stem = eml_path.stem
-                ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-                dest = PROCESSED_DIR / f"{stem}_{ts}{eml_path.suffix}"
-            eml_path.rename(dest)
-            logger.info(f"Преместен EML: {eml_path} -> {dest}")
-
-            self.processed_count += 1
-            # Return first/main result
-            return results[0] if len(results) == 1 else {
-                'source_file': eml_path.name,
-                'format': 'eml_multi',
-                'documents': results,
-                'eml_metadata': eml_meta
-            }
+        if not results:
+            return None
 
-        return None
+        # Return first/main result
+        return results[0] if len(results) == 1 else {
+            'source_file': eml_path.name,
+            'format': 'eml_multi',
+            'documents': results,
+            'eml_metadata': eml_meta
+        }
 
     def _process_office_doc(self, file_path: Path, eml_metadata: Dict = None) -> Optional[Dict]:
         """Обработва офис документ."""
-        logger.info(f"Обработка на офис документ: {file_path}")
+        logger.info("Обработка на офис документ: %s", file_path)
 
         result = {
             'source_file': file_path.name,
@@ -605,112 +971,377 @@ class OfficeDocumentProcessor:
 
         # Try structured extraction first for DOCX (Teams transcripts)
         if file_path.suffix.lower() == '.docx':
-            paragraphs = OfficeTextExtractor.extract_from_docx_structured(file_path)
-
-            if paragraphs and TeamsTranscriptParser.is_teams_transcript(paragraphs):
-                logger.info(f"Разпознат Teams транскрипт: {file_path}")
-                result['is_teams_transcript'] = True
-                teams_data = TeamsTranscriptParser.parse(paragraphs)
-                result['teams_data'] = teams_data
-
-                # Build readable text from transcript
-                lines = []
-                lines.append(f"# {teams_data['title']}")
-                lines.append(f"Дата: {teams_data['date']}")
-                lines.append(f"Продължителност: {teams_data['duration']}")
-                lines.append(f"Участници: {', '.join(teams_data['participants'])}")
-                lines.append(f"{teams_data.get('started_by', '')}")
-                lines.append("")
-                lines.append("---")
-                lines.append("")
-
-                for msg in teams_data['messages']:
-                    lines.append(f"**{msg['speaker']}** [{msg['time']}]:")
-                    lines.append(msg['text'])
-                    lines.append("")
-
-                result['extracted_text'] = '\n'.join(lines)
-            else:
+            try:
+                paragraphs = OfficeTextExtractor.iter_docx_paragraphs(file_path)
+                # Разпознаването иска само първите параграфи — останалите
+                # се парсват поточно след това
+                head = list(itertools.islice(paragraphs, TeamsTranscriptParser.DETECTION_WINDOW))
+                if head and TeamsTranscriptParser.is_teams_transcript(head):
+                    logger.info("Разпознат Teams транскрипт: %s", file_path)
+                    result['is_teams_transcript'] = True
+                    teams_data, text = TeamsTranscriptParser.parse_to_markdown(
+                        itertools.chain(head, paragraphs)
+                    )
+                    result['teams_data'] = teams_data
+                    result['extracted_text'] = text
+            except MemoryError:
+                raise
+            except Exception as e:
+                logger.error("Грешка при структурирано извличане от DOCX %s: %s", file_path, e)
+
+            if not result['is_teams_transcript']:
                 # Normal DOCX
                 result['extracted_text'] = self.extractor.extract(file_path) or ''
+        elif file_path.suffix.lower() in ('.vtt', '.srt'):
+            try:
+                teams_data, text = TeamsTranscriptParser.parse_subtitles(file_path)
+                result['is_teams_transcript'] = True
+                result['teams_data'] = teams_data
+                result['extracted_text'] = text
+            except MemoryError:
+                raise
+            except Exception as e:
+                logger.error("Грешка при извличане от транскрипт %s: %s", file_path, e)
         else:
             # Other formats
             result['extracted_text'] = self.extractor.extract(file_path) or ''
 
         if not result['extracted_text']:
-            logger.warning(f"Не е извлечен текст от: {file_path}")
-            return result
-
-        # Save extracted data
-        self._save_results(file_path, result)
+            logger.warning("Не е извлечен текст от: %s", file_path)
 
         return result
 
-    def _save_results(self, file_path: Path, result: Dict) -> None:
-        """Запазва резултатите."""
-        stem = file_path.stem
-
-        # Save JSON metadata
-        json_path = PROCESSED_DIR / f"{stem}_extracted.json"
-        json_data = {k: v for k, v in result.items() if k != 'extracted_text'}
+    @staticmethod
+    def to_record(result: Dict) -> ExtractionRecord:
+        """Общият запис на изходите (records.py, като process_inbox) — текстът не се копира."""
+        now = now_stamp()
+        text = result.get('extracted_text', '')
+        record = ExtractionRecord({
+            'format': result.get('format', ''),
+            'date': now,
+            'date_parsed': now,
+            'subject': Path(result.get('source_file', '')).stem,
+            'body_text': text,
+            'body_clean': text,
+            'attachments': result.get('attachments', []),
+            'is_teams_transcript': result.get('is_teams_transcript', False),
+            'source_file': result.get('source_file', ''),
+            'file_size_kb': result.get('file_size_kb', 0),
+            'processing_timestamp': result.get('processing_timestamp', ''),
+        })
+
+        # Ако е Teams транскрипт — обогатяваме
+        if result.get('teams_data'):
+            td = result['teams_data']
+            record['subject'] = td.get('title') or record['subject']
+            record['date'] = td.get('date', '')
+            participants = td.get('participants', [])
+            record['from'] = ', '.join(participants) if participants else ''
+            record['teams_data'] = td
 
-        # Serialize teams_data participants set
-        if json_data.get('teams_data') and json_data['teams_data'].get('participants'):
-            json_data['teams_data']['participants'] = list(json_data['teams_data']['participants'])
+        # Ако е от EML — добавяме метаданни
+        if result.get('eml_metadata'):
+            meta = result['eml_metadata']
+            record['from'] = meta.get('from', record['from'])
+            record['to'] = meta.get('to', '')
+            record['cc'] = meta.get('cc', '')
+            record['subject'] = meta.get('subject', record['subject'])
+            record['source_eml'] = result.get('source_eml', '')
+
+        return record
+
+    def save_results(self, file_path: Path, result: Dict,
+                     journal: Optional[ProcessingJournal] = None,
+                     search: Optional[SearchIndex] = None) -> None:
+        """Записва резултата през общия изходен етап (output_writer).
+
+        Всички документи на файла са в една папка с артефакти; при EML всеки
+        документ е под името на прикачения файл, а самият EML се премества
+        при тях. Измерената памет на задачата ('memory', от process_batch)
+        влиза в _extracted.json на всеки документ. С journal файлът минава
+        през 'started' (с папката), 'written' и 'done'; със search документите влизат в индекса за
+        търсене (записват се пакетно при search.flush()).
+        """
+        key = journal.key(file_path) if journal is not None else None
+        artifact_dir = prepare_artifact_dir(file_path, PROCESSED_DIR, journal, key)
+        outputs = []
+        documents = result.get('documents') or [result]
+        for doc in documents:
+            if doc.get('extracted_text'):
+                record = self.to_record(doc)
+                if result.get('memory'):
+                    record['memory'] = result['memory']
+                outputs += output_list(write_outputs(record, Path(doc['source_file']), PROCESSED_DIR,
+                                                     artifact_dir=artifact_dir, output=self.output))
+                if search is not None:
+                    with stage('index', file_path.suffix.lower().lstrip('.')):
+                        search.add(record, ArtifactIndex(PROCESSED_DIR).relative(artifact_dir))
+
+        if journal is not None:
+            journal.record(file_path, STAGE_WRITTEN, key=key, outputs=outputs,
+                           artifact_dir=str(artifact_dir))
+        self._finish(file_path, journal, key, artifact_dir)
+        self.processed_count += 1
+
+    def _save_or_quarantine(self, file_path: Path, result: Dict, journal: ProcessingJournal,
+                            search: Optional[SearchIndex] = None) -> bool:
+        """save_results() за един файл от пакета; при грешка файлът е в карантина, а пакетът продължава."""
+        try:
+            self.save_results(file_path, result, journal, search)
+            return True
+        except Exception as e:
+            logger.error("Грешка при запис на изходите на %s: %s", file_path.name, e)
+            key = journal.key(file_path) if file_path.exists() else None
+            try:
+                dest = quarantine_write_error(file_path, QUARANTINE_DIR, e)
+            except OSError as move_error:
+                logger.error("%s не е преместен в карантина: %s", file_path.name, move_error)
+                journal.record(file_path, STAGE_FAILED, error=str(e))
+                return False
+            if dest is not None:
+                journal.record(file_path, STAGE_QUARANTINED, key=key, quarantined=str(dest))
+            return False
 
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=2, default=str)
-        logger.info(f"Записани метаданни: {json_path}")
+    @staticmethod
+    def _finish(file_path: Path, journal: Optional[ProcessingJournal], key: Optional[str],
+                artifact_dir: Optional[Path] = None) -> None:
+        """Последният етап: EML се архивира, офис файлът остава в inbox/ като 'done'."""
+        if file_path.suffix.lower() == '.eml':
+            finish_original(file_path, PROCESSED_DIR, journal, artifact_dir)
+        elif journal is not None:
+            journal.record(file_path, STAGE_DONE, key=key)
+
+    def process_batch(self, files: Iterable[Path], workers: Optional[int] = None,
+                      format_limits: Optional[Dict[str, int]] = None,
+                      summary: Optional[BatchSummary] = None,
+                      memory_limit_mb: Optional[int] = None,
+                      profile_dir: Optional[Path] = None) -> Iterator['BatchItem']:
+        """Обработва файловете паралелно в пул от процеси.
+
+        Резултатите се връщат (yield) в реда на завършване. Всеки формат има
+        лимит на едновременните задачи (format_limits, напр. {'xlsx': 2}) —
+        останалите файлове от него изчакват, докато другите формати работят.
+
+        Всеки файл има краен срок според формата си (python.batch.timeouts);
+        при изтичането му работникът се убива и заменя, а BatchItem-ът е със
+        status 'timeout' (или 'crashed' при срив) и диагностика.
+
+        При лимит на паметта (memory_limit_mb или python.batch.memoryLimitMb)
+        файл с MemoryError се пуска още веднъж в low-memory режим; ако и
+        тогава не стигне паметта, BatchItem-ът е със status 'memory'.
+        Пиковата памет на задачата е в BatchItem.memory и в result['memory'].
+
+        Args:
+            files: Файлове за обработка (в реда на подаване)
+            workers: Брой процеси (по подразбиране от config.json или CPU)
+            format_limits: Формат -> максимум едновременни задачи
+            summary: BatchSummary за статистика по формати (по избор)
+            memory_limit_mb: Лимит на адресното пространство на процес (0 = без)
+            profile_dir: Папка за профилите по файл (profiling.profiled) — с --profile
+        """
+        settings = BatchSettings.from_config(load_config())
+        workers = workers or settings.workers
+        limits = dict(settings.format_limits)
+        limits.update(format_limits or {})
+        # Лимит 0 би блокирал формата завинаги
+        limits = {fmt: max(1, limit) for fmt, limit in limits.items()}
+
+        # Формат -> опашка от (пореден номер, път); поредният номер пази
+        # реда на подаване между форматите
+        queues: Dict[str, deque] = {}
+        for position, file_path in enumerate(files):
+            fmt = file_path.suffix.lower().lstrip('.')
+            queues.setdefault(fmt, deque()).append((position, file_path))
+
+        supervision = SupervisionSettings.from_config(load_config())
+        if memory_limit_mb is not None:
+            supervision.memory_limit_mb = memory_limit_mb
+        running: Dict[str, int] = {}
+        # Файлове, които вече се изпълняват в low-memory режим
+        low_memory = set()
+
+        def task_args(file_path: Path, *args) -> Tuple:
+            if profile_dir is None:
+                return (_batch_worker, file_path) + args
+            return (profiled, profile_dir, file_path.name, _batch_worker, file_path) + args
+
+        with SupervisedPool(workers, supervision.max_tasks_per_worker,
+                            initializer=_batch_worker_init,
+                            memory_limit_mb=supervision.memory_limit_mb,
+                            trace_malloc=supervision.trace_malloc,
+                            metrics=METRICS.enabled) as pool:
+            while queues or pool.pending:
+                # Запълваме свободните процеси: най-старият файл, чийто формат има капацитет
+                while pool.in_flight < workers:
+                    ready = [fmt for fmt in queues
+                             if running.get(fmt, 0) < limits.get(fmt, workers)]
+                    if not ready:
+                        break
+                    fmt = min(ready, key=lambda f: queues[f][0][0])
+                    _, file_path = queues[fmt].popleft()
+                    if not queues[fmt]:
+                        del queues[fmt]
+                    running[fmt] = running.get(fmt, 0) + 1
+                    pool.submit(*task_args(file_path),
+                                timeout=supervision.timeout_for(fmt), tag=file_path)
+
+                task = pool.next_result()
+                file_path = task.tag
+                fmt = file_path.suffix.lower().lstrip('.')
+                METRICS.merge(task.stages)
+                if task.status == 'memory' and file_path not in low_memory:
+                    # Същият слот на формата — повторно, с поточни четци
+                    logger.warning("%s надхвърли лимита на паметта — повторно в low-memory режим", file_path)
+                    low_memory.add(file_path)
+                    pool.submit(*task_args(file_path, True),
+                                timeout=supervision.timeout_for(fmt), tag=file_path)
+                    continue
 
-        # Save body text
-        body_path = PROCESSED_DIR / f"{stem}_body.txt"
+                running[fmt] -= 1
+                memory = dict(task.memory or {}, low_memory=file_path in low_memory)
+                if task.ok:
+                    item = task.value
+                    item.memory = memory
+                    if item.result is not None:
+                        item.result['memory'] = memory
+                else:
+                    # Увиснал/сринал се работник вече е заменен — опашката продължава
+                    logger.error("Неуспешна обработка на %s: %s %s", file_path, task.status, task.error or '')
+                    item = BatchItem(file_path, fmt, _file_size(file_path), None, task.seconds,
+                                     task.error, task.status, task.to_diagnostic(), memory)
+                if summary:
+                    summary.add(item.format, item.size_bytes, item.seconds,
+                                item.result is not None, item.memory)
+                yield item
+
+            if pool.recycled or pool.killed:
+                logger.info("Работници: %s рециклирани, %s прекратени", pool.recycled, pool.killed)
+
+    def process_inbox(self, workers: Optional[int] = None,
+                      memory_limit_mb: Optional[int] = None,
+                      profile_dir: Optional[Path] = None) -> List[Dict]:
+        """Обработва всички поддържани файлове в inbox/ (паралелно)."""
+        results = []
 
-        header_lines = []
-        if result.get('eml_metadata'):
-            meta = result['eml_metadata']
-            header_lines.append(f"От: {meta.get('from', '')}")
-            header_lines.append(f"До: {meta.get('to', '')}")
-            if meta.get('cc'):
-                header_lines.append(f"CC: {meta['cc']}")
-            header_lines.append(f"Дата: {meta.get('date', '')}")
-            header_lines.append(f"Тема: {meta.get('subject', '')}")
+        files = [f for f in sorted(INBOX_DIR.iterdir()) if f.is_file() and self.is_supported(f)]
+        if not files:
+            logger.info("inbox/ е празна.")
+            return results
 
-        header_lines.append(f"Файл: {result.get('source_file', '')}")
-        header_lines.append(f"Формат: {result.get('format', '')}")
+        with ProcessingJournal() as journal, SearchIndex() as search:
+            remove_stale_temp_files(PROCESSED_DIR)
+            pending = []
+            skipped = resumed = 0
+            for file_path in files:
+                key = journal.key(file_path)
+                stage = journal.stage(file_path, key)
+                if stage == STAGE_DONE:
+                    skipped += 1
+                elif stage == STAGE_WRITTEN:
+                    # Изходите са записани преди срива — остава само последният етап
+                    artifact_dir = journal.entry(file_path, key).get('artifact_dir')
+                    self._finish(file_path, journal, key, Path(artifact_dir) if artifact_dir else None)
+                    resumed += 1
+                else:
+                    pending.append(file_path)
+            if skipped or resumed:
+                logger.info("Журнал: %s вече обработени файла пропуснати, "
+                            "%s довършени без повторно извличане", skipped, resumed)
+
+            summary = BatchSummary()
+            for item in self.process_batch(pending, workers=workers, summary=summary,
+                                           memory_limit_mb=memory_limit_mb, profile_dir=profile_dir):
+                if item.result:
+                    # Записът е в главния процес — един писач за processed/
+                    if self._save_or_quarantine(item.file_path, item.result, journal, search):
+                        results.append(item.result)
+                elif item.status in ('timeout', 'crashed', 'memory'):
+                    key = journal.key(item.file_path)
+                    dest = quarantine_file(item.file_path, QUARANTINE_DIR, item.diagnostic)
+                    journal.record(item.file_path, STAGE_QUARANTINED, key=key, quarantined=str(dest))
+                else:
+                    journal.record(item.file_path, STAGE_FAILED, error=item.error)
+
+        logger.info("Обработени %s файла", len(results))
+        for line in summary.report_lines() + METRICS.report_lines():
+            logger.info(line)
+        return results
 
-        if result.get('is_teams_transcript') and result.get('teams_data'):
-            td = result['teams_data']
-            header_lines.append(f"Тип: Teams транскрипт")
-            header_lines.append(f"Участници: {', '.join(td.get('participants', []))}")
-            header_lines.append(f"Продължителност: {td.get('duration', '')}")
-            header_lines.append(f"Съобщения: {td['summary_stats']['total_messages']}")
 
-        header_lines.append(f"Размер: {result.get('file_size_kb', 0):.1f} KB")
+# ================== BATCH PROCESSING ==================
+
+@dataclass
+class BatchSettings:
+    """Настройки за паралелната обработка (секция python.batch на config.json)."""
+    workers: int
+    format_limits: Dict[str, int]
+
+    # XLSX/XLS се зареждат изцяло в паметта — по-малко едновременно
+    DEFAULT_FORMAT_LIMITS = {'xlsx': 2, 'xls': 2}
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'BatchSettings':
+        batch = config.get('python', {}).get('batch', {})
+        limits = dict(cls.DEFAULT_FORMAT_LIMITS)
+        limits.update({k.lower().lstrip('.'): int(v)
+                       for k, v in batch.get('formatConcurrency', {}).items()})
+        return cls(
+            workers=int(batch.get('workers') or os.cpu_count() or 1),
+            format_limits=limits,
+        )
+
+
+@dataclass
+class BatchItem:
+    """Резултат от една задача в пакетната обработка."""
+    file_path: Path
+    format: str
+    size_bytes: int
+    result: Optional[Dict]
+    seconds: float
+    error: Optional[str] = None
+    # 'ok', 'error', 'memory', 'timeout' или 'crashed' (вж. worker_pool.TaskResult)
+    status: str = 'ok'
+    diagnostic: Optional[Dict] = None
+    # Пикова памет на задачата (worker_pool.TaskResult.memory + 'low_memory')
+    memory: Optional[Dict] = None
+
+
+def _file_size(file_path: Path) -> int:
+    try:
+        return file_path.stat().st_size
+    except OSError:
+        return 0
+
+
+def _run_batch_item(processor: OfficeDocumentProcessor, file_path: Path) -> BatchItem:
+    fmt = file_path.suffix.lower().lstrip('.')
+    size = _file_size(file_path)
+    start = time.perf_counter()
+    try:
+        result = processor.process_file(file_path)
+        return BatchItem(file_path, fmt, size, result, time.perf_counter() - start)
+    except MemoryError:
+        # Пулът връща 'memory' и файлът се повтаря в low-memory режим
+        raise
+    except Exception as e:
+        logger.error("Грешка при обработка на %s: %s", file_path, e)
+        return BatchItem(file_path, fmt, size, None, time.perf_counter() - start, str(e), 'error')
 
-        with open(body_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(header_lines))
-            f.write(f"\n\n{'='*60}\n\n")
-            f.write(result.get('extracted_text', ''))
 
-        logger.info(f"Записано тяло: {body_path}")
+# Един процесор на работен процес (по режим) — не се създава наново за всеки файл
+_worker_processors: Dict[bool, OfficeDocumentProcessor] = {}
 
-    def process_inbox(self) -> List[Dict]:
-        """Обработва всички поддържани файлове в inbox/."""
-        results = []
 
-        files = sorted(INBOX_DIR.iterdir())
-        if not files:
-            logger.info("inbox/ е празна.")
-            return results
+def _batch_worker_init() -> None:
+    _worker_processors[False] = OfficeDocumentProcessor()
 
-        for file_path in files:
-            if file_path.is_file() and self.is_supported(file_path):
-                result = self.process_file(file_path)
-                if result:
-                    results.append(result)
 
-        logger.info(f"Обработени {len(results)} файла")
-        return results
+def _batch_worker(file_path: Path, low_memory: bool = False) -> BatchItem:
+    processor = _worker_processors.get(low_memory)
+    if processor is None:
+        processor = _worker_processors[low_memory] = OfficeDocumentProcessor(low_memory=low_memory)
+    return _run_batch_item(processor, file_path)
 
 
 # ================== CLI ==================
@@ -740,14 +1371,81 @@ def print_result(result: Dict):
     print(f"{'='*60}\n")
 
 
+def load_extracted(source: str) -> Optional[Dict]:
+    """Извлечените метаданни: по път до _extracted.json или по име на входния файл."""
+    json_path = Path(source)
+    if not json_path.exists():
+        entry = ArtifactIndex(PROCESSED_DIR).lookup(source)
+        if not entry:
+            return None
+        if entry.get('manifest'):
+            return Manifest(PROCESSED_DIR).read(entry['manifest'])
+        json_path = Path(entry['path']) / f"{Path(source).stem}_extracted.json"
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def print_transcript_selection(source: str, speaker: Optional[str], minutes: Optional[str]):
+    """Показва реплики от вече извлечен транскрипт (по индекса, без повторно парсване)."""
+    extracted = load_extracted(source)
+    if extracted is None:
+        print(f"Няма извлечени данни за: {source}")
+        sys.exit(1)
+    teams_data = extracted.get('teams_data') or {}
+
+    from_minute = to_minute = None
+    if minutes:
+        low, _, high = minutes.partition('-')
+        from_minute = int(low) if low else None
+        to_minute = int(high) if high else None
+
+    messages = TeamsTranscriptParser.select(teams_data, extracted.get('body_text', ''),
+                                            speaker, from_minute, to_minute)
+    for msg in messages:
+        print(f"[{msg['time']}] {msg['speaker']}: {msg['text']}")
+    print(f"\nНамерени: {len(messages)} реплики")
+
+
 def main():
     sys.stdout.reconfigure(encoding='utf-8')
 
     parser = argparse.ArgumentParser(description='ClientRequests Office Document Extractor')
     parser.add_argument('--file', type=str, help='Обработи конкретен файл')
+    parser.add_argument('--workers', type=int,
+                        help='Брой паралелни процеси за inbox/')
+    parser.add_argument('--memory-limit-mb', type=int,
+                        help='Лимит на адресното пространство на процес (MB, 0 = без)')
+    parser.add_argument('--low-memory', action='store_true',
+                        help='Поточни четци (DOCX/XLSX/XLS) — за много големи файлове')
+    parser.add_argument('--transcript', type=str,
+                        help='_extracted.json или име на Teams транскрипт — търсене по индекса')
+    parser.add_argument('--speaker', type=str, help='Само репликите на участник (с --transcript)')
+    parser.add_argument('--minutes', type=str, help='Интервал в минути, напр. 40-45 (с --transcript)')
+    parser.add_argument('--output-mode', choices=OUTPUT_MODES,
+                        help='files — JSON + тяло на файл; manifest — един ред в processed/manifest/')
+    parser.add_argument('--compress', choices=CODECS, help='Компресия на тялото в manifest режим')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Времена по етап и формат (Prometheus textfile + JSON; python.metrics)')
+    parser.add_argument('--profile', action='store_true',
+                        help='cProfile + стекове (collapsed) за всеки файл в processed/profiles/')
     args = parser.parse_args()
-
-    processor = OfficeDocumentProcessor()
+    setup_logging('office_extractor')
+
+    if args.transcript:
+        print_transcript_selection(args.transcript, args.speaker, args.minutes)
+        return
+
+    output = OutputSettings.from_config(load_config())
+    if args.output_mode:
+        output.mode = args.output_mode
+    if args.compress:
+        output.compression = args.compress
+    metrics = MetricsSettings.from_config(load_config())
+    if args.metrics:
+        metrics.enabled = True
+    METRICS.enable(metrics.enabled)
+    profile_dir = new_profile_dir(PROCESSED_DIR / 'profiles') if args.profile else None
+    processor = OfficeDocumentProcessor(low_memory=args.low_memory, output=output)
 
     if args.file:
         file_path = Path(args.file)
@@ -757,20 +1455,32 @@ def main():
             print(f"Файлът не съществува: {args.file}")
             sys.exit(1)
 
-        result = processor.process_file(file_path)
+        if profile_dir is not None:
+            result = profiled(profile_dir, file_path.name, processor.process_file, file_path)
+        else:
+            result = processor.process_file(file_path)
         if result:
+            with SearchIndex() as search:
+                processor.save_results(file_path, result, search=search)
+            METRICS.export(metrics)
             print_result(result)
         else:
             print("Грешка или няма извлечен текст.")
             sys.exit(1)
     else:
-        results = processor.process_inbox()
+        results = processor.process_inbox(workers=args.workers, memory_limit_mb=args.memory_limit_mb,
+                                          profile_dir=profile_dir)
+        METRICS.export(metrics)
         if results:
             for result in results:
                 print_result(result)
             print(f"Общо обработени: {len(results)} файла")
         else:
-            print("Няма поддържани файлове в inbox/")
+            print("Няма нови поддържани файлове в inbox/")
+
+    if profile_dir is not None:
+        for line in merge_profiles(profile_dir):
+            logger.info(line)
 
 
 if __name__ == '__main__':
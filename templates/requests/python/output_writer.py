@@ -0,0 +1,380 @@
+"""
+ClientRequests Output Writer
+============================
+Единен изходен етап за process_inbox.py и office_extractor.py.
+
+Екстракторите само връщат данни — записът на диск минава оттук. Всеки
+артефакт се записва точно веднъж и атомарно (временен файл в същата
+папка + fsync + os.replace, с правата по umask), така че четящ процес
+никога не вижда наполовина записан файл. Схемата е една и съща, независимо кой модул е извлякъл
+данните. Всеки входен файл има собствена папка (processed_index.py):
+
+    processed/extracted/<ГГГГ-ММ>/<hh>/<stem>-<id>/
+        <stem>_extracted.json   - метаданни (без байтовете на прикачените)
+        <stem>_body.txt         - заглавка + изчистено тяло
+        <stem>_att_<име>        - прикачени файлове
+        <оригинал>              - оригиналът (при move_original)
+
+и ред в processed/index.jsonl, така че артефактите на файл се намират с
+ArtifactIndex.lookup(), без обхождане на папките.
+
+В компактния режим (OutputSettings.mode == 'manifest', manifest.py)
+_extracted.json и _body.txt не се създават: записът (текстовите полета по
+избор с gzip/lzma) е един ред в processed/manifest/manifest-NNNNN.jsonl,
+а мястото на реда е в index.jsonl. Заглавката на _body.txt се възстановява
+с record_body() от самия запис.
+
+Файлове, чието извличане е увиснало или сринало работника, отиват в
+quarantine/ заедно с <име>.diagnostic.json (quarantine_file); също и
+файлове, чиито изходи не се записват (quarantine_write_error).
+
+С journal (journal.ProcessingJournal) етапите 'written' и 'done' се
+записват в журнала — след срив обработката продължава от там. Папката
+с артефактите се записва в 'started' преди първия изход
+(prepare_artifact_dir), така че повторният опит пише в нея, а не в нова.
+
+Времето и байтовете на всеки запис (write_attachment, write_json,
+write_body, write_manifest, move) се мерят по формат на входния файл
+(metrics.py), когато метриките са включени.
+
+JSON-ите се пишат поточно (records.write_json) — направо от записа
+(records.ExtractionRecord) във временния файл, без речник с метаданните
+и без целия документ като низ в паметта.
+
+Използване:
+    from output_writer import write_outputs
+    paths = write_outputs(record, Path("inbox/X.eml"), PROCESSED_DIR, move_original=True)
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Callable, Dict, List, Mapping, Optional
+
+from manifest import Manifest, OutputSettings, pack_record, ref_from_str, ref_to_str
+from metrics import stage
+from processed_index import ArtifactIndex, allocate_artifact_dir, recent_shards
+from records import metadata_items, write_json, write_json_items
+
+logger = logging.getLogger(__name__)
+
+
+BODY_SEPARATOR = '=' * 60
+
+
+# ================== ATOMIC WRITES ==================
+
+def _current_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# mkstemp създава файла с 0600 — изходите получават правата на обикновен open()
+FILE_MODE = 0o666 & ~_current_umask()
+
+
+def _fsync_dir(directory: Path) -> None:
+    """fsync на папката — за да оцелее и самото преименуване (само POSIX)."""
+    if os.name != 'posix':
+        return
+    try:
+        fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_stream(path: Path, write: Callable[[IO], None], binary: bool = False) -> int:
+    """write(f) пише във временен файл в същата папка, после fsync и os.replace; връща размера.
+
+    Файлът е на диска преди преименуването — журналът отбелязва 'written'
+    чак след това.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        with (os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', encoding='utf-8', newline='')) as f:
+            write(f)
+            f.flush()
+            if hasattr(os, 'fchmod'):
+                os.fchmod(f.fileno(), FILE_MODE)
+            os.fsync(f.fileno())
+            size = os.fstat(f.fileno()).st_size
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(path.parent)
+    return size
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> int:
+    """Записва байтове атомарно: временен файл в същата папка + os.replace; връща размера."""
+    return atomic_write_stream(path, lambda f: f.write(data), binary=True)
+
+
+def atomic_write_text(path: Path, text: str) -> int:
+    return atomic_write_stream(path, lambda f: f.write(text))
+
+
+def atomic_write_json(path: Path, data) -> int:
+    """JSON с indent=2, записан поточно (records.write_json)."""
+    return atomic_write_stream(path, lambda f: write_json(f, data))
+
+
+def remove_stale_temp_files(directory: Path, min_age: float = 0) -> int:
+    """Изтрива останалите от прекъснат запис временни файлове (.<име>.*.tmp).
+
+    Проверяват се directory и папките с артефакти от последните два месеца
+    (по-старите няма как да имат недовършен запис). min_age (секунди) пази
+    текущите записи на други процеси.
+    """
+    removed = 0
+    if not directory.exists():
+        return removed
+    now = time.time()
+    candidates = list(directory.glob('.*.tmp'))
+    for shard in recent_shards(directory):
+        candidates += shard.glob('*/*/.*.tmp')
+    for tmp in candidates:
+        try:
+            if min_age and now - tmp.stat().st_mtime < min_age:
+                continue
+            tmp.unlink()
+            removed += 1
+        except OSError:
+            pass
+    if removed:
+        logger.info("Изтрити %s недописани временни файла в %s", removed, directory)
+    return removed
+
+
+def unique_path(directory: Path, name: str) -> Path:
+    """Път в directory; ако името е заето — добавя времеви печат към stem-а."""
+    path = directory / name
+    if path.exists():
+        ts = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = directory / f"{path.stem}_{ts}{path.suffix}"
+    return path
+
+
+# ================== SCHEMA ==================
+
+def record_metadata(record: Mapping) -> Dict:
+    """JSON частта на записа — прикачените са само имена и брой, без байтовете."""
+    return dict(metadata_items(record))
+
+
+def record_body(record: Mapping) -> str:
+    """Четимият _body.txt: заглавка (подател, тема, Teams данни) + изчистено тяло."""
+    lines = [
+        f"От: {record.get('from', '')}",
+        f"До: {record.get('to', '')}",
+    ]
+    if record.get('cc'):
+        lines.append(f"CC: {record['cc']}")
+    lines.append(f"Дата: {record.get('date_parsed', record.get('date', ''))}")
+    lines.append(f"Тема: {record.get('subject', '')}")
+    lines.append(f"Прикачени: {len(record.get('attachments', []))} файла")
+
+    td = record.get('teams_data')
+    if record.get('is_teams_transcript') and td:
+        lines.append("Тип: Teams транскрипт")
+        lines.append(f"Участници: {', '.join(td.get('participants', []))}")
+        lines.append(f"Продължителност: {td.get('duration', '')}")
+        lines.append(f"Съобщения: {td.get('summary_stats', {}).get('total_messages', 0)}")
+
+    return '\n'.join(lines) + f"\n\n{BODY_SEPARATOR}\n\n" + record.get('body_clean', '')
+
+
+# ================== OUTPUT STAGE ==================
+
+def archive_original(file_path: Path, output_dir: Path) -> Path:
+    """Премества оригинала в output_dir (без презаписване на съществуващ файл)."""
+    if file_path.parent.resolve() == output_dir.resolve():
+        logger.info("Файлът вече е в %s/: %s", output_dir.name, file_path)
+        return file_path
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    dest = unique_path(output_dir, file_path.name)
+    os.replace(file_path, dest)
+    logger.info("Преместен оригинал: %s -> %s", file_path, dest)
+    return dest
+
+
+def output_list(paths: Dict[str, object]) -> List[str]:
+    """Пътищата от write_outputs като плосък списък (за журнала).
+
+    Първият елемент е записът: _extracted.json или мястото на реда в manifest-а.
+    """
+    if 'manifest' in paths:
+        outputs = [ref_to_str(paths['manifest'])]
+    else:
+        outputs = [str(paths['json']), str(paths['body'])]
+    return outputs + [str(p) for p in paths.get('attachments', [])]
+
+
+def load_written_record(output: str, output_dir: Path) -> Dict:
+    """Чете обратно записа по първия изход от output_list (при възобновяване)."""
+    ref = ref_from_str(output)
+    if ref is not None:
+        return Manifest(output_dir).read(ref)
+    with open(output, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def prepare_artifact_dir(source_path: Path, output_dir: Path, journal=None,
+                         key: Optional[str] = None) -> Path:
+    """Папката за изходите на source_path — с journal записана в 'started' преди първия изход.
+
+    Ако предишен опит е спрял между 'started' и 'written', се връща неговата
+    папка: изходите в нея се презаписват, вместо да остане недописана папка.
+    """
+    entry = journal.entry(source_path, key) if journal is not None else None
+    previous = entry.get('artifact_dir') if entry and entry['stage'] == 'started' else None
+    if previous and Path(previous).is_dir():
+        artifact_dir = Path(previous)
+        logger.info("Журнал: %s — изходите отново в %s", source_path.name, artifact_dir)
+    else:
+        artifact_dir = allocate_artifact_dir(output_dir, source_path.name)
+    if journal is not None:
+        journal.record(source_path, 'started', key=key, artifact_dir=str(artifact_dir))
+    return artifact_dir
+
+
+def finish_original(source_path: Path, output_dir: Path, journal=None,
+                    artifact_dir: Optional[Path] = None) -> Path:
+    """Архивира оригинала при артефактите му и (с journal) отбелязва 'done'.
+
+    artifact_dir е папката от write_outputs; без нея се създава нова.
+    """
+    key = journal.key(source_path) if journal is not None else None
+    artifact_dir = artifact_dir or allocate_artifact_dir(output_dir, source_path.name)
+    with stage('move', source_path.suffix.lower().lstrip('.')):
+        dest = archive_original(source_path, artifact_dir)
+    ArtifactIndex(output_dir).add(source_path.name, artifact_dir, original=dest.name)
+    if journal is not None:
+        journal.record(source_path, 'done', key=key, original=str(dest))
+    return dest
+
+
+def write_outputs(record: Mapping, source_path: Path, output_dir: Path,
+                  move_original: bool = False, journal=None,
+                  artifact_dir: Optional[Path] = None,
+                  output: Optional[OutputSettings] = None) -> Dict[str, object]:
+    """Записва всички артефакти на един извлечен запис — всеки точно веднъж.
+
+    Args:
+        record: Данните от екстрактора (records.ExtractionRecord или речник)
+        source_path: Оригиналният файл — от него е stem-ът на изходите
+        output_dir: Папката за изходите (processed/)
+        move_original: Премества оригинала при артефактите след успешен запис
+        journal: ProcessingJournal — записва 'written' (и 'done' при move_original)
+        artifact_dir: Готова папка (prepare_artifact_dir или обща за всички
+            документи на един EML); без нея се създава нова в шардовете на output_dir
+        output: Изходен режим; без него — 'files' (JSON + тяло като файлове)
+
+    Returns:
+        Речник с пътищата: 'dir', 'json', 'body' (или 'manifest' — мястото
+        на реда), 'attachments' и (при move_original) 'original'
+    """
+    output = output or OutputSettings()
+    artifact_dir = artifact_dir or allocate_artifact_dir(output_dir, source_path.name)
+    stem = source_path.stem
+    fmt = source_path.suffix.lower().lstrip('.')
+    paths: Dict[str, object] = {'dir': artifact_dir}
+
+    attachment_paths: List[Path] = []
+    for att in record.get('attachments', []):
+        att_path = artifact_dir / f"{stem}_att_{att['filename']}"
+        with stage('write_attachment', fmt) as timing:
+            timing.bytes = atomic_write_bytes(att_path, att['data'])
+        attachment_paths.append(att_path)
+        logger.info("Записан прикачен файл: %s", att_path)
+    paths['attachments'] = attachment_paths
+
+    index = ArtifactIndex(output_dir)
+    if output.mode == 'manifest':
+        with stage('write_manifest', fmt):
+            line = pack_record(record_metadata(record), output.compression)
+            line['artifact_dir'] = index.relative(artifact_dir)
+            paths['manifest'] = Manifest(output_dir, output.segment_mb).append(line)
+        logger.info("Записан ред в manifest: %s", ref_to_str(paths['manifest']))
+        index.add(source_path.name, artifact_dir, files=[p.name for p in attachment_paths],
+                  manifest=paths['manifest'])
+    else:
+        json_path = artifact_dir / f"{stem}_extracted.json"
+        with stage('write_json', fmt) as timing:
+            timing.bytes = atomic_write_stream(json_path, lambda f: write_json_items(f, metadata_items(record)))
+        paths['json'] = json_path
+        logger.info("Записани извлечени данни: %s", json_path)
+
+        body_path = artifact_dir / f"{stem}_body.txt"
+        with stage('write_body', fmt) as timing:
+            timing.bytes = atomic_write_text(body_path, record_body(record))
+        paths['body'] = body_path
+        logger.info("Записано тяло: %s", body_path)
+
+        index.add(source_path.name, artifact_dir, files=[Path(p).name for p in output_list(paths)])
+
+    if journal is not None:
+        journal.record(source_path, 'written', outputs=output_list(paths),
+                       artifact_dir=str(artifact_dir))
+
+    # Оригиналът се мести последен — ако записът се провали, остава в inbox/
+    if move_original and source_path.exists():
+        paths['original'] = finish_original(source_path, output_dir, journal, artifact_dir)
+
+    return paths
+
+
+def quarantine_file(file_path: Path, quarantine_dir: Path, diagnostic: Dict) -> Path:
+    """Премества проблемен файл в карантина и записва диагностика до него.
+
+    Диагностиката е <име>.diagnostic.json: причина, време, работник,
+    плюс размера и оригиналния път на файла.
+    """
+    quarantine_dir.mkdir(parents=True, exist_ok=True)
+    record = {
+        'file': file_path.name,
+        'original_path': str(file_path),
+        'size_bytes': file_path.stat().st_size if file_path.exists() else None,
+        'quarantined_at': datetime.now().isoformat(),
+    }
+    record.update(diagnostic)
+
+    dest = unique_path(quarantine_dir, file_path.name)
+    if file_path.exists():
+        os.replace(file_path, dest)
+    atomic_write_json(dest.with_name(f"{dest.name}.diagnostic.json"), record)
+    logger.warning("Файлът е в карантина: %s -> %s (%s)", file_path, dest, record.get('status', ''))
+    return dest
+
+
+def quarantine_write_error(file_path: Path, quarantine_dir: Path, error: BaseException) -> Optional[Path]:
+    """Файл, чиито изходи не се записват (status 'write_error') — в карантина с диагностика.
+
+    Грешката при запис се повтаря при всяко пускане със същите данни, затова
+    файлът не остава в inbox/. None — оригиналът вече е архивиран (грешката
+    е след последния етап).
+    """
+    if not file_path.exists():
+        return None
+    return quarantine_file(file_path, quarantine_dir, {
+        'status': 'write_error',
+        'error': f"{type(error).__name__}: {error}",
+        'traceback': ''.join(traceback.format_exception(type(error), error, error.__traceback__)),
+    })
@@ -10,6 +10,10 @@ PDF Extractor Tool — извлича текст и/или изображени
     python pdf_extractor.py input.pdf --output-dir ./out  # задава изходна папка
     python pdf_extractor.py input.pdf --force-images      # принудително PNG per page
     python pdf_extractor.py input.pdf --mode both         # текст + изображения
+    python pdf_extractor.py input.pdf --low-memory        # страница по страница, по-нисък DPI
+    python pdf_extractor.py input.pdf --memory-limit-mb 1024  # при MemoryError → --low-memory
+    python pdf_extractor.py input.pdf --metrics       # + времена по етап (metrics.py, python.metrics)
+    python pdf_extractor.py input.pdf --profile       # + cProfile и стекове в <изход>/profiles/
 
 Режими (--mode):
     text   — само текст (default). Ако текстът е лош → fallback към images
@@ -22,15 +26,21 @@ PDF Extractor Tool — извлича текст и/или изображени
 """
 
 import io
-import json
 import logging
 import re
 import sys
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, List
 
+from logging_setup import LoggingSettings, setup_logging
+from metrics import METRICS, MetricsSettings, stage
+from profiling import merge_profiles, new_profile_dir, profiled
+from records import write_json_items
+from requests_config import load_config
+from worker_pool import apply_memory_limit, peak_rss_mb
+
 try:
     import fitz  # PyMuPDF
 except ImportError:
@@ -49,20 +59,19 @@ try:
 except ImportError:
     PDF2IMAGE_AVAILABLE = False
 
-# ================== LOGGING ==================
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
 logger = logging.getLogger(__name__)
 
+# Резолюция на изображенията; в low-memory режим страница 200 DPI A4 (~1650x2340 RGB,
+# ~11 MB) става ~2.8 MB
+RENDER_DPI = 200
+LOW_MEMORY_DPI = 100
+
 
 # ================== DATA CLASSES ==================
 
-@dataclass
+@dataclass(slots=True)
 class PageResult:
-    """Резултат от обработката на една страница."""
+    """Резултат от обработката на една страница (slots — без __dict__ на страница)."""
     page_number: int
     total_pages: int
     has_text: bool
@@ -73,7 +82,7 @@ class PageResult:
     extraction_method: str = ""
 
 
-@dataclass
+@dataclass(slots=True)
 class ExtractionResult:
     """Общ резултат от обработката на PDF."""
     source_file: str
@@ -136,7 +145,7 @@ def convert_to_optimized_grayscale_png(image: Image.Image, target_size_kb: int =
                 return Image.open(buffer)
             quality -= 5
     except Exception as e:
-        logger.error(f"Грешка при конвертиране на изображение: {e}")
+        logger.error("Грешка при конвертиране на изображение: %s", e)
         return image
 
 
@@ -149,7 +158,7 @@ def extract_text_from_pdf(file_path: Path) -> tuple[Optional[str], list[dict]]:
     Returns:
         (full_text, pages_info) — пълен текст и информация per page
     """
-    logger.info(f"Извличане на текст от: {file_path}")
+    logger.info("Извличане на текст от: %s", file_path)
     try:
         with fitz.open(file_path) as doc:
             pages_info = []
@@ -171,7 +180,7 @@ def extract_text_from_pdf(file_path: Path) -> tuple[Optional[str], list[dict]]:
                     'text': cleaned
                 })
                 all_text.append(page_text)
-                logger.debug(f"  Страница {page_num + 1}: {len(cleaned)} символа, ratio={ratio:.2f}")
+                logger.debug("  Страница %s: %s символа, ratio=%.2f", page_num + 1, len(cleaned), ratio)
 
             full_text = " ".join(all_text)
 
@@ -179,16 +188,16 @@ def extract_text_from_pdf(file_path: Path) -> tuple[Optional[str], list[dict]]:
             for encoding in ['utf-8', 'cp1251', 'iso-8859-1', 'windows-1252']:
                 try:
                     decoded = full_text.encode(encoding).decode('utf-8')
-                    logger.info(f"Декодиране с {encoding} успешно")
+                    logger.info("Декодиране с %s успешно", encoding)
                     return clean_text(decoded), pages_info
                 except (UnicodeDecodeError, UnicodeEncodeError):
                     continue
 
-            logger.warning(f"Не може да се декодира правилно, връщам суров текст")
+            logger.warning("Не може да се декодира правилно, връщам суров текст")
             return clean_text(full_text), pages_info
 
     except Exception as e:
-        logger.error(f"Грешка при извличане на текст: {e}")
+        logger.error("Грешка при извличане на текст: %s", e)
         return None, []
 
 
@@ -209,21 +218,25 @@ def text_is_usable(text: str, min_chars: int = 200) -> bool:
 
 # ================== IMAGE EXTRACTION ==================
 
-def extract_images_from_pdf(file_path: Path, output_dir: Path, grayscale: bool = True) -> list[Path]:
+def extract_images_from_pdf(file_path: Path, output_dir: Path, grayscale: bool = True,
+                            dpi: int = RENDER_DPI, low_memory: bool = False) -> list[Path]:
     """
     Конвертира PDF в PNG изображения (по 1 на страница).
     Използва pdf2image (Poppler) ако е наличен, иначе fitz fallback.
 
+    low_memory: без pdf2image (държи всички страници в паметта) — fitz
+    рендерира и записва страница по страница.
+
     Returns:
         Списък с пътища до създадените PNG файлове
     """
     output_dir.mkdir(parents=True, exist_ok=True)
     image_paths = []
 
-    if PDF2IMAGE_AVAILABLE:
-        logger.info(f"Конвертиране с pdf2image: {file_path}")
+    if PDF2IMAGE_AVAILABLE and not low_memory:
+        logger.info("Конвертиране с pdf2image: %s", file_path)
         try:
-            images = convert_from_path(file_path)
+            images = convert_from_path(file_path, dpi=dpi)
             for i, image in enumerate(images, 1):
                 if grayscale:
                     image = convert_to_optimized_grayscale_png(image)
@@ -231,21 +244,23 @@ def extract_images_from_pdf(file_path: Path, output_dir: Path, grayscale: bool =
                 save_path = output_dir / filename
                 image.save(save_path, "PNG")
                 image_paths.append(save_path)
-                logger.info(f"  Страница {i} → {save_path}")
+                logger.info("  Страница %s → %s", i, save_path)
             return image_paths
+        except MemoryError:
+            raise
         except Exception as e:
-            logger.warning(f"pdf2image неуспешно: {e}, опитвам fitz fallback")
+            logger.warning("pdf2image неуспешно: %s, опитвам fitz fallback", e)
 
     # Fallback: PyMuPDF rendering
-    logger.info(f"Конвертиране с PyMuPDF: {file_path}")
+    logger.info("Конвертиране с PyMuPDF (%s DPI): %s", dpi, file_path)
     try:
         with fitz.open(file_path) as doc:
             for page_num, page in enumerate(doc):
-                # Render at 200 DPI
-                mat = fitz.Matrix(200/72, 200/72)
+                mat = fitz.Matrix(dpi / 72, dpi / 72)
                 pix = page.get_pixmap(matrix=mat)
 
                 img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                pix = None
                 if grayscale:
                     img = convert_to_optimized_grayscale_png(img)
 
@@ -253,9 +268,11 @@ def extract_images_from_pdf(file_path: Path, output_dir: Path, grayscale: bool =
                 save_path = output_dir / filename
                 img.save(save_path, "PNG")
                 image_paths.append(save_path)
-                logger.info(f"  Страница {page_num + 1} → {save_path}")
+                logger.info("  Страница %s → %s", page_num + 1, save_path)
+    except MemoryError:
+        raise
     except Exception as e:
-        logger.error(f"Грешка при конвертиране в изображения: {e}")
+        logger.error("Грешка при конвертиране в изображения: %s", e)
 
     return image_paths
 
@@ -270,7 +287,8 @@ def extract_pdf(
     min_text_chars: int = 200,
     grayscale: bool = True,
     save_text: bool = True,
-    save_metadata: bool = True
+    save_metadata: bool = True,
+    low_memory: bool = False
 ) -> ExtractionResult:
     """
     Главна функция — извлича текст и/или изображения от PDF.
@@ -284,6 +302,7 @@ def extract_pdf(
         grayscale: Конвертирай изображенията в grayscale
         save_text: Запиши текста във файл
         save_metadata: Запиши metadata JSON
+        low_memory: Изображения страница по страница при LOW_MEMORY_DPI
 
     Returns:
         ExtractionResult с пълна информация
@@ -310,7 +329,7 @@ def extract_pdf(
 
     # Get page count
     try:
-        with fitz.open(pdf_path) as doc:
+        with stage('open', 'pdf', pdf_path.stat().st_size), fitz.open(pdf_path) as doc:
             total_pages = len(doc)
     except Exception as e:
         return ExtractionResult(
@@ -318,7 +337,7 @@ def extract_pdf(
             success=False, error=f"Не може да се отвори PDF: {e}"
         )
 
-    logger.info(f"PDF: {pdf_path.name} | Страници: {total_pages} | Режим: {mode}")
+    logger.info("PDF: %s | Страници: %s | Режим: %s", pdf_path.name, total_pages, mode)
 
     result = ExtractionResult(
         source_file=str(pdf_path),
@@ -332,7 +351,8 @@ def extract_pdf(
     text_usable = False
 
     if need_text or mode == "text":
-        full_text, pages_info = extract_text_from_pdf(pdf_path)
+        with stage('backend', 'pdf', pdf_path.stat().st_size):
+            full_text, pages_info = extract_text_from_pdf(pdf_path)
 
         if full_text and text_is_usable(full_text, min_text_chars):
             text_usable = True
@@ -354,26 +374,31 @@ def extract_pdf(
             # Save text file
             if save_text:
                 text_file = output_dir / f"{pdf_path.stem}_text.txt"
-                with open(text_file, 'w', encoding='utf-8') as f:
-                    f.write(full_text)
+                with stage('write_body', 'pdf', len(full_text)):
+                    with open(text_file, 'w', encoding='utf-8') as f:
+                        f.write(full_text)
+
+                    # Per-page text files
+                    for pi in pages_info:
+                        if pi['text'] and len(pi['text']) > 10:
+                            page_file = output_dir / f"{pdf_path.stem}_page_{pi['page_number']}_text.txt"
+                            with open(page_file, 'w', encoding='utf-8') as f:
+                                f.write(pi['text'])
                 result.text_file = str(text_file)
-                logger.info(f"Текст записан: {text_file} ({len(full_text)} символа)")
-
-                # Per-page text files
-                for pi in pages_info:
-                    if pi['text'] and len(pi['text']) > 10:
-                        page_file = output_dir / f"{pdf_path.stem}_page_{pi['page_number']}_text.txt"
-                        with open(page_file, 'w', encoding='utf-8') as f:
-                            f.write(pi['text'])
+                logger.info("Текст записан: %s (%s символа)", text_file, len(full_text))
         else:
-            logger.warning(f"Текстът не е годен (chars={len(full_text) if full_text else 0}), fallback към images")
+            logger.warning("Текстът не е годен (chars=%s), fallback към images",
+                           len(full_text) if full_text else 0)
             if mode == "text":
                 need_images = True  # auto-fallback
 
     # --- IMAGE EXTRACTION ---
     if need_images or (mode == "text" and not text_usable):
         images_subdir = output_dir / "images"
-        image_paths = extract_images_from_pdf(pdf_path, images_subdir, grayscale=grayscale)
+        with stage('render', 'pdf', pdf_path.stat().st_size):
+            image_paths = extract_images_from_pdf(pdf_path, images_subdir, grayscale=grayscale,
+                                                  dpi=LOW_MEMORY_DPI if low_memory else RENDER_DPI,
+                                                  low_memory=low_memory)
         result.images_dir = str(images_subdir)
 
         # Update/create page results for images
@@ -394,7 +419,7 @@ def extract_pdf(
                 ))
 
         if not text_usable:
-            logger.info(f"Текст не е извлечен — {len(image_paths)} изображения създадени за OCR/AI")
+            logger.info("Текст не е извлечен — %s изображения създадени за OCR/AI", len(image_paths))
 
     # Sort pages
     result.pages.sort(key=lambda p: p.page_number)
@@ -402,24 +427,26 @@ def extract_pdf(
     # --- METADATA ---
     if save_metadata:
         meta_file = output_dir / f"{pdf_path.stem}_metadata.json"
-        meta = {
-            "source_file": str(pdf_path),
-            "file_size_kb": round(pdf_path.stat().st_size / 1024, 1),
-            "total_pages": total_pages,
-            "mode": mode,
-            "text_extracted": text_usable,
-            "text_length": result.full_text_length,
-            "images_created": len([p for p in result.pages if p.image_path]),
-            "timestamp": result.timestamp,
-            "pages": [asdict(p) for p in result.pages]
-        }
-        with open(meta_file, 'w', encoding='utf-8') as f:
-            json.dump(meta, f, ensure_ascii=False, indent=2)
-        logger.info(f"Metadata записан: {meta_file}")
-
-    logger.info(f"Готово! Текст: {'ДА' if text_usable else 'НЕ'} | "
-                f"Изображения: {len([p for p in result.pages if p.image_path])} | "
-                f"Изход: {output_dir}")
+        meta = (
+            ("source_file", str(pdf_path)),
+            ("file_size_kb", round(pdf_path.stat().st_size / 1024, 1)),
+            ("total_pages", total_pages),
+            ("mode", mode),
+            ("text_extracted", text_usable),
+            ("text_length", result.full_text_length),
+            ("images_created", len([p for p in result.pages if p.image_path])),
+            ("timestamp", result.timestamp),
+            ("low_memory", low_memory),
+            ("peak_rss_mb", round(peak_rss_mb() or 0, 1)),
+            # Страниците се пишат поле по поле (без asdict копие на текста им)
+            ("pages", result.pages),
+        )
+        with stage('write_json', 'pdf'), open(meta_file, 'w', encoding='utf-8') as f:
+            write_json_items(f, meta)
+        logger.info("Metadata записан: %s", meta_file)
+
+    logger.info("Готово! Текст: %s | Изображения: %s | Изход: %s", 'ДА' if text_usable else 'НЕ',
+                len([p for p in result.pages if p.image_path]), output_dir)
 
     return result
 
@@ -444,10 +471,10 @@ def extract_pdf_from_eml(eml_path: str | Path, output_dir: str | Path | None = N
     with open(eml_path, 'r', encoding='utf-8') as f:
         msg = email.message_from_string(f.read())
 
-    logger.info(f"EML: {eml_path.name}")
-    logger.info(f"  From: {msg.get('From', 'N/A')}")
-    logger.info(f"  Date: {msg.get('Date', 'N/A')}")
-    logger.info(f"  Subject: {msg.get('Subject', 'N/A')}")
+    logger.info("EML: %s", eml_path.name)
+    logger.info("  From: %s", msg.get('From', 'N/A'))
+    logger.info("  Date: %s", msg.get('Date', 'N/A'))
+    logger.info("  Subject: %s", msg.get('Subject', 'N/A'))
 
     pdf_files = []
 
@@ -464,7 +491,7 @@ def extract_pdf_from_eml(eml_path: str | Path, output_dir: str | Path | None = N
                 body_file = output_dir / f"{eml_path.stem}_body.txt"
                 with open(body_file, 'w', encoding='utf-8') as bf:
                     bf.write(text)
-                logger.info(f"  Body записан: {body_file} ({len(text)} символа)")
+                logger.info("  Body записан: %s (%s символа)", body_file, len(text))
 
         if fn and fn.lower().endswith('.pdf'):
             data = part.get_payload(decode=True)
@@ -473,7 +500,7 @@ def extract_pdf_from_eml(eml_path: str | Path, output_dir: str | Path | None = N
                 with open(pdf_path, 'wb') as pf:
                     pf.write(data)
                 pdf_files.append(pdf_path)
-                logger.info(f"  PDF извлечен: {pdf_path} ({len(data)} bytes)")
+                logger.info("  PDF извлечен: %s (%s bytes)", pdf_path, len(data))
 
     if not pdf_files:
         logger.warning("Няма PDF прикачени файлове в този EML")
@@ -498,7 +525,8 @@ def process_eml(
         output_dir = eml_path.parent / f"{eml_path.stem}_extracted"
     output_dir = Path(output_dir)
 
-    pdf_files = extract_pdf_from_eml(eml_path, output_dir)
+    with stage('parse', 'eml', eml_path.stat().st_size):
+        pdf_files = extract_pdf_from_eml(eml_path, output_dir)
 
     results = []
     for pdf_path in pdf_files:
@@ -509,6 +537,20 @@ def process_eml(
     return results
 
 
+# ================== MEMORY LIMIT ==================
+
+def run_with_low_memory_retry(func, *args, low_memory: bool = False, **kwargs):
+    """Извиква extract_pdf/process_eml; при MemoryError — още веднъж с low_memory=True."""
+    try:
+        return func(*args, low_memory=low_memory, **kwargs)
+    except MemoryError:
+        if low_memory:
+            raise
+        logger.warning("Лимитът на паметта е надхвърлен — повторно в low-memory режим "
+                       "(%s DPI, страница по страница)", LOW_MEMORY_DPI)
+        return func(*args, low_memory=True, **kwargs)
+
+
 # ================== CLI ==================
 
 def main():
@@ -539,13 +581,23 @@ def main():
                        help='Не записвай metadata JSON')
     parser.add_argument('--min-chars', type=int, default=200,
                        help='Минимум символи за годен текст (default: 200)')
+    parser.add_argument('--low-memory', action='store_true',
+                       help=f'Изображения страница по страница при {LOW_MEMORY_DPI} DPI')
+    parser.add_argument('--memory-limit-mb', type=int, default=0,
+                       help='Лимит на адресното пространство (MB); при MemoryError → --low-memory')
+    parser.add_argument('--metrics', action='store_true',
+                       help='Времена по етап (Prometheus textfile + JSON; пътищата от python.metrics)')
+    parser.add_argument('--profile', action='store_true',
+                       help='cProfile + стекове (collapsed) в <изходна папка>/profiles/')
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='Подробен изход')
 
     args = parser.parse_args()
 
+    log_settings = LoggingSettings.from_config(load_config(), 'pdf_extractor')
     if args.verbose:
-        logging.getLogger().setLevel(logging.DEBUG)
+        log_settings.console_level = 'DEBUG'
+    setup_logging(settings=log_settings)
 
     input_path = Path(args.input)
 
@@ -554,17 +606,34 @@ def main():
         sys.exit(1)
 
     output_dir = Path(args.output_dir) if args.output_dir else None
+    apply_memory_limit(args.memory_limit_mb)
+    metrics = MetricsSettings.from_config(load_config())
+    if args.metrics:
+        metrics.enabled = True
+    METRICS.enable(metrics.enabled)
+    profile_dir = None
+    if args.profile:
+        profile_root = output_dir or input_path.parent / f"{input_path.stem}_extracted"
+        profile_dir = new_profile_dir(profile_root / 'profiles')
+
+    def run(func, **kwargs):
+        # С --profile извличането (и повторният опит в low-memory режим) е под profiling.profiled
+        if profile_dir is None:
+            return run_with_low_memory_retry(func, input_path, **kwargs)
+        return profiled(profile_dir, input_path.name,
+                        lambda: run_with_low_memory_retry(func, input_path, **kwargs))
 
     # EML or PDF?
     if input_path.suffix.lower() == '.eml':
-        results = process_eml(
-            input_path,
+        results = run(
+            process_eml,
             output_dir=output_dir,
             mode=args.mode,
             force_images=args.force_images,
             grayscale=not args.no_grayscale,
             save_metadata=not args.no_metadata,
-            min_text_chars=args.min_chars
+            min_text_chars=args.min_chars,
+            low_memory=args.low_memory
         )
 
         print(f"\n{'='*60}")
@@ -577,14 +646,15 @@ def main():
         print(f"{'='*60}")
 
     elif input_path.suffix.lower() == '.pdf':
-        result = extract_pdf(
-            input_path,
+        result = run(
+            extract_pdf,
             output_dir=output_dir,
             mode=args.mode,
             force_images=args.force_images,
             grayscale=not args.no_grayscale,
             save_metadata=not args.no_metadata,
-            min_text_chars=args.min_chars
+            min_text_chars=args.min_chars,
+            low_memory=args.low_memory
         )
 
         print(f"\n{'='*60}")
@@ -603,6 +673,13 @@ def main():
         print("Поддържани: .pdf, .eml")
         sys.exit(1)
 
+    for line in METRICS.report_lines():
+        logger.info(line)
+    METRICS.export(metrics)
+    if profile_dir is not None:
+        for line in merge_profiles(profile_dir):
+            logger.info(line)
+
 
 if __name__ == "__main__":
     main()
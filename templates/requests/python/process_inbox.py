@@ -8,7 +8,8 @@ ClientRequests Inbox Processor
 - .msg (Outlook имейл формат)
 - .txt (plain text)
 - .md (Markdown)
-- .docx, .doc, .xlsx, .xls, .rtf, .xml, .odt (офис документи — чрез office_extractor)
+- .docx, .doc, .xlsx, .xls, .rtf, .xml, .odt, .ods (офис документи — чрез office_extractor)
+- .vtt, .srt (транскрипти от Teams/Zoom — чрез office_extractor)
 
 За всеки файл извлича:
 - Подател (From)
@@ -20,12 +21,23 @@ ClientRequests Inbox Processor
 - Прикачени файлове (запазва ги в processed/)
 - Teams транскрипти (от DOCX) — структурирано извличане
 
+Изходите на всеки файл са в processed/extracted/<месец>/<hh>/<stem>-<id>/
+(output_writer.py, processed_index.py). Извличането минава в надзиравани
+работни процеси с краен срок и лимит на паметта, а етапите — в журнал
+за продължаване след срив (journal.py).
+
 Генерира структуриран .md файл готов за попълване на шаблона от агент.
 
 Използване:
     python process_inbox.py                 # Обработва всички файлове в inbox/
     python process_inbox.py --watch         # Следи inbox/ за нови файлове
     python process_inbox.py --file "X.eml"  # Обработва конкретен файл
+    python process_inbox.py --memory-limit-mb 1024  # Лимит на паметта на работника
+    python process_inbox.py --claim --node-id vm1   # Един от няколко възела върху обща inbox/
+    python process_inbox.py --search "фактура 4711" # Търсене в обработените заявки
+    python process_inbox.py --triage        # Класиран списък на inbox/ само по заглавките
+    python process_inbox.py --metrics       # + времена по етап (processed/metrics.prom, .json)
+    python process_inbox.py --profile       # + cProfile и стекове по файл (processed/profiles/)
 """
 
 import logging
@@ -34,32 +46,39 @@ import sys
 import time
 import re
 import email
-import json
 import argparse
+import tempfile
 from email import policy
 from email.parser import BytesParser
-from datetime import datetime
+from email.utils import parseaddr
 from pathlib import Path
-from typing import Optional, Dict, List, Union
-
-# Configure logging
-LOG_FILE = Path(__file__).parent / 'process_inbox.log'
-logging.basicConfig(
-    level=logging.DEBUG,
-    filename=str(LOG_FILE),
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
-console = logging.StreamHandler()
-console.setLevel(logging.INFO)
-console.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logging.getLogger('').addHandler(console)
+from typing import Callable, Optional, Dict, List, Tuple, Union
+
+from body_reducer import BodyReducer, ReductionSettings, is_reply
+from claims import DEFAULT_LEASE_SECONDS, InboxClaims
+from email_threads import ThreadIndex, threading_headers
+from journal import ProcessingJournal, STAGE_FAILED, STAGE_QUARANTINED, STAGE_WRITTEN
+from logging_setup import setup_logging
+from manifest import CODECS, OUTPUT_MODES, OutputSettings
+from metrics import METRICS, MetricsSettings, stage
+from output_writer import (finish_original, load_written_record, prepare_artifact_dir, quarantine_file,
+                           quarantine_write_error, remove_stale_temp_files, write_outputs)
+from processed_index import ArtifactIndex
+from profiling import merge_profiles, new_profile_dir, profiled
+from records import ExtractionRecord, now_stamp
+from requests_config import load_config
+from run_summary import BatchSummary
+from scheduler import ScheduledFile, SchedulingSettings, WorkScheduler
+from search_index import MAX_ATTACHMENT_CHARS, SearchIndex, print_search
+from text_decoding import decode_bytes, read_text
+from triage import print_triage
+from worker_pool import SupervisedPool, SupervisionSettings, TaskResult
 
 # Paths
 BASE_DIR = Path(__file__).parent
 INBOX_DIR = BASE_DIR / "inbox"
 PROCESSED_DIR = BASE_DIR / "processed"
+QUARANTINE_DIR = BASE_DIR / "quarantine"
 REGISTRY_FILE = BASE_DIR / "REGISTRY.md"
 TEMPLATE_FILE = BASE_DIR / "TEMPLATE.md"
 
@@ -72,27 +91,27 @@ class EmailExtractor:
     """Извлича данни от .eml файлове."""
 
     @staticmethod
-    def extract(file_path: Path) -> Dict:
-        """Извлича метаданни и тяло от .eml файл."""
-        logging.info(f"Извличане на данни от EML: {file_path}")
+    def extract(file_path: Path) -> ExtractionRecord:
+        """Извлича метаданни и тяло от .eml файл (body_clean и date_parsed — мързеливо)."""
+        logging.info("Извличане на данни от EML: %s", file_path)
 
-        with open(file_path, 'rb') as f:
+        with open(file_path, 'rb') as f, stage('parse', 'eml') as timing:
             msg = BytesParser(policy=policy.default).parse(f)
+            timing.bytes = f.tell()
 
-        result = {
+        result = ExtractionRecord({
             'format': 'eml',
             'from': msg.get('From', ''),
             'to': msg.get('To', ''),
             'cc': msg.get('CC', ''),
             'date': msg.get('Date', ''),
             'subject': msg.get('Subject', ''),
-            'body_text': '',
-            'body_html': '',
-            'attachments': []
-        }
+        })
+        # Message-ID, In-Reply-To, References, Thread-Index — за разговорите
+        result.update(threading_headers(msg.get))
 
-        # Parse date
-        result['date_parsed'] = EmailExtractor._parse_date(result['date'])
+        # Подателят е ключ за кеша на кодировките (text_decoding)
+        sender = parseaddr(str(result['from']))[1].lower() or None
 
         # Extract body
         if msg.is_multipart():
@@ -108,22 +127,14 @@ class EmailExtractor:
                     continue
 
                 if content_type == 'text/plain':
-                    payload = part.get_payload(decode=True)
-                    if payload:
-                        charset = part.get_content_charset() or 'utf-8'
-                        try:
-                            result['body_text'] = payload.decode(charset, errors='replace')
-                        except (LookupError, UnicodeDecodeError):
-                            result['body_text'] = payload.decode('utf-8', errors='replace')
+                    text = EmailExtractor._decode_payload(part, sender)
+                    if text:
+                        result['body_text'] = text
 
                 elif content_type == 'text/html':
-                    payload = part.get_payload(decode=True)
-                    if payload:
-                        charset = part.get_content_charset() or 'utf-8'
-                        try:
-                            result['body_html'] = payload.decode(charset, errors='replace')
-                        except (LookupError, UnicodeDecodeError):
-                            result['body_html'] = payload.decode('utf-8', errors='replace')
+                    text = EmailExtractor._decode_payload(part, sender)
+                    if text:
+                        result['body_html'] = text
 
                 elif 'attachment' not in content_disposition and part.get_filename():
                     # Inline attachment
@@ -131,26 +142,31 @@ class EmailExtractor:
                     if att_info:
                         result['attachments'].append(att_info)
         else:
-            payload = msg.get_payload(decode=True)
-            if payload:
-                charset = msg.get_content_charset() or 'utf-8'
-                try:
-                    text = payload.decode(charset, errors='replace')
-                except (LookupError, UnicodeDecodeError):
-                    text = payload.decode('utf-8', errors='replace')
-
+            text = EmailExtractor._decode_payload(msg, sender)
+            if text:
                 if msg.get_content_type() == 'text/html':
                     result['body_html'] = text
                 else:
                     result['body_text'] = text
 
-        # Clean body
-        result['body_clean'] = EmailExtractor._clean_body(
-            result['body_text'] or EmailExtractor._html_to_text(result['body_html'])
-        )
-
         return result
 
+    @staticmethod
+    def _decode_payload(part, sender: Optional[str]) -> str:
+        """Декодира текстова част: обявения charset, иначе автоматично откриване."""
+        payload = part.get_payload(decode=True)
+        if not payload:
+            return ''
+
+        with stage('decode', 'eml', len(payload)):
+            charset = part.get_content_charset()
+            if charset:
+                try:
+                    return payload.decode(charset)
+                except (LookupError, UnicodeDecodeError):
+                    logging.debug("Обявеният charset %s не пасва, автоматично откриване", charset)
+            return decode_bytes(payload, source=sender)
+
     @staticmethod
     def _extract_attachment(part) -> Optional[Dict]:
         """Извлича информация за прикачен файл."""
@@ -169,61 +185,14 @@ class EmailExtractor:
             'data': data
         }
 
-    @staticmethod
-    def _parse_date(date_str: str) -> str:
-        """Парсва дата от имейл хедър."""
-        if not date_str:
-            return datetime.now().strftime('%Y-%m-%d %H:%M')
-
-        try:
-            from email.utils import parsedate_to_datetime
-            dt = parsedate_to_datetime(date_str)
-            return dt.strftime('%Y-%m-%d %H:%M')
-        except Exception:
-            return date_str
-
-    @staticmethod
-    def _clean_body(body: str) -> str:
-        """Почиства тялото на имейла."""
-        if not body:
-            return ''
-
-        # Remove URLs
-        body = re.sub(r'http\S+', '', body)
-        # Remove HTML tags
-        body = re.sub(r'<[^>]+>', '', body)
-        # Remove multiple empty lines
-        body = re.sub(r'\n\s*\n\s*\n', '\n\n', body)
-        # Strip lines
-        body = '\n'.join(line.strip() for line in body.splitlines())
-        # Strip overall
-        body = body.strip()
-
-        return body
-
-    @staticmethod
-    def _html_to_text(html: str) -> str:
-        """Конвертира HTML към plain text."""
-        if not html:
-            return ''
-        # Remove tags
-        text = re.sub(r'<br\s*/?>', '\n', html, flags=re.IGNORECASE)
-        text = re.sub(r'<p[^>]*>', '\n', text, flags=re.IGNORECASE)
-        text = re.sub(r'</p>', '', text, flags=re.IGNORECASE)
-        text = re.sub(r'<[^>]+>', '', text)
-        # Decode HTML entities
-        import html as html_module
-        text = html_module.unescape(text)
-        return text.strip()
-
 
 class MsgExtractor:
     """Извлича данни от .msg файлове (Outlook формат)."""
 
     @staticmethod
-    def extract(file_path: Path) -> Dict:
+    def extract(file_path: Path) -> ExtractionRecord:
         """Извлича метаданни и тяло от .msg файл."""
-        logging.info(f"Извличане на данни от MSG: {file_path}")
+        logging.info("Извличане на данни от MSG: %s", file_path)
 
         try:
             import extract_msg
@@ -231,33 +200,18 @@ class MsgExtractor:
             logging.error("extract_msg не е инсталиран. Инсталирай с: pip install extract-msg")
             return MsgExtractor._fallback_result(file_path)
 
-        result = {
-            'format': 'msg',
-            'from': '',
-            'to': '',
-            'cc': '',
-            'date': '',
-            'subject': '',
-            'body_text': '',
-            'body_html': '',
-            'body_clean': '',
-            'attachments': []
-        }
+        result = ExtractionRecord({'format': 'msg'})
 
         try:
-            with extract_msg.Message(str(file_path)) as msg:
+            with stage('parse', 'msg', file_path.stat().st_size), extract_msg.Message(str(file_path)) as msg:
                 result['from'] = str(msg.sender or '')
                 result['to'] = str(msg.to or '')
                 result['cc'] = str(msg.cc or '')
                 result['date'] = str(msg.date or '')
                 result['subject'] = str(msg.subject or '')
                 result['body_text'] = str(msg.body or '')
-
-                # Parse date
-                result['date_parsed'] = EmailExtractor._parse_date(result['date'])
-
-                # Clean body
-                result['body_clean'] = EmailExtractor._clean_body(result['body_text'])
+                if getattr(msg, 'header', None) is not None:
+                    result.update(threading_headers(msg.header.get))
 
                 # Extract attachments
                 for i, attachment in enumerate(msg.attachments):
@@ -288,51 +242,45 @@ class MsgExtractor:
                         })
 
         except Exception as e:
-            logging.error(f"Грешка при обработка на MSG файл {file_path}: {e}")
+            logging.error("Грешка при обработка на MSG файл %s: %s", file_path, e)
 
         return result
 
     @staticmethod
-    def _fallback_result(file_path: Path) -> Dict:
-        return {
+    def _fallback_result(file_path: Path) -> ExtractionRecord:
+        text = f'[MSG файл не може да се прочете: {file_path.name}]'
+        return ExtractionRecord({
             'format': 'msg',
-            'from': '',
-            'to': '',
-            'cc': '',
-            'date': '',
-            'date_parsed': datetime.now().strftime('%Y-%m-%d %H:%M'),
+            'date_parsed': now_stamp(),
             'subject': file_path.stem,
-            'body_text': f'[MSG файл не може да се прочете: {file_path.name}]',
-            'body_html': '',
-            'body_clean': f'[MSG файл не може да се прочете: {file_path.name}]',
-            'attachments': []
-        }
+            'body_text': text,
+            'body_clean': text,
+        })
 
 
 class TextExtractor:
     """Извлича данни от .txt и .md файлове."""
 
     @staticmethod
-    def extract(file_path: Path) -> Dict:
+    def extract(file_path: Path) -> ExtractionRecord:
         """Извлича съдържание от текстов файл."""
-        logging.info(f"Извличане на данни от текстов файл: {file_path}")
+        logging.info("Извличане на данни от текстов файл: %s", file_path)
 
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-            content = f.read()
+        with stage('decode', file_path.suffix.lower().lstrip('.')) as timing:
+            content = read_text(file_path)
+            timing.bytes = file_path.stat().st_size
 
-        return {
+        now = now_stamp()
+        return ExtractionRecord({
             'format': 'text',
             'from': TextExtractor._guess_from(content),
-            'to': '',
-            'cc': '',
-            'date': datetime.now().strftime('%Y-%m-%d %H:%M'),
-            'date_parsed': datetime.now().strftime('%Y-%m-%d %H:%M'),
+            'date': now,
+            'date_parsed': now,
             'subject': file_path.stem,
             'body_text': content,
-            'body_html': '',
+            # strip() връща същия низ, ако няма какво да маха — без копие на тялото
             'body_clean': content.strip(),
-            'attachments': []
-        }
+        })
 
     @staticmethod
     def _guess_from(content: str) -> str:
@@ -353,7 +301,19 @@ class OfficeExtractorBridge:
     """Мост към office_extractor.py за офис документи."""
 
     # Офис формати, които се обработват от office_extractor
-    OFFICE_EXTENSIONS = {'.docx', '.doc', '.xlsx', '.xls', '.rtf', '.xml', '.odt'}
+    OFFICE_EXTENSIONS = {'.docx', '.doc', '.xlsx', '.xls', '.rtf', '.xml', '.odt', '.ods', '.vtt', '.srt'}
+
+    # Един OfficeDocumentProcessor за целия процес (по режим, не по един за всеки файл)
+    _processors: Dict[bool, object] = {}
+
+    @staticmethod
+    def _get_processor(low_memory: bool = False):
+        processor = OfficeExtractorBridge._processors.get(low_memory)
+        if processor is None:
+            from office_extractor import OfficeDocumentProcessor
+            processor = OfficeDocumentProcessor(low_memory=low_memory)
+            OfficeExtractorBridge._processors[low_memory] = processor
+        return processor
 
     @staticmethod
     def is_office_format(file_path: Path) -> bool:
@@ -361,75 +321,101 @@ class OfficeExtractorBridge:
         return file_path.suffix.lower() in OfficeExtractorBridge.OFFICE_EXTENSIONS
 
     @staticmethod
-    def extract(file_path: Path) -> Dict:
-        """Извлича данни от офис документ чрез office_extractor."""
-        logging.info(f"Извличане от офис документ: {file_path}")
+    def extract(file_path: Path, low_memory: bool = False) -> ExtractionRecord:
+        """Извлича данни от офис документ чрез office_extractor.
+
+        MemoryError не се поглъща — InboxProcessor повтаря файла с low_memory.
+        """
+        logging.info("Извличане от офис документ: %s", file_path)
 
         try:
             from office_extractor import OfficeDocumentProcessor
-            processor = OfficeDocumentProcessor()
-            result = processor.process_file(file_path)
+            # process_file само извлича — записът е в InboxProcessor.process_file
+            result = OfficeExtractorBridge._get_processor(low_memory).process_file(file_path)
 
             if not result:
                 return OfficeExtractorBridge._fallback_result(file_path)
 
-            # Конвертираме към стандартния формат на process_inbox
-            extracted = {
-                'format': result.get('format', file_path.suffix.lower().lstrip('.')),
-                'from': '',
-                'to': '',
-                'cc': '',
-                'date': datetime.now().strftime('%Y-%m-%d %H:%M'),
-                'date_parsed': datetime.now().strftime('%Y-%m-%d %H:%M'),
-                'subject': file_path.stem,
-                'body_text': result.get('extracted_text', ''),
-                'body_html': '',
-                'body_clean': result.get('extracted_text', ''),
-                'attachments': [],
-                'is_teams_transcript': result.get('is_teams_transcript', False),
-            }
-
-            # Ако е Teams транскрипт — обогатяваме
-            if result.get('teams_data'):
-                td = result['teams_data']
-                extracted['subject'] = td.get('title', file_path.stem)
-                extracted['date'] = td.get('date', '')
-                participants = td.get('participants', [])
-                extracted['from'] = ', '.join(participants) if participants else ''
-                extracted['teams_data'] = td
-
-            # Ако е от EML — добавяме метаданни
-            if result.get('eml_metadata'):
-                meta = result['eml_metadata']
-                extracted['from'] = meta.get('from', extracted['from'])
-                extracted['to'] = meta.get('to', '')
-                extracted['cc'] = meta.get('cc', '')
-                extracted['subject'] = meta.get('subject', extracted['subject'])
-
-            return extracted
+            # Общият запис (records.py) — полетата се вземат, не се копират
+            return OfficeDocumentProcessor.to_record(result)
 
         except ImportError:
             logging.warning("office_extractor.py не е достъпен. Опит с текстов извличане...")
             return OfficeExtractorBridge._fallback_result(file_path)
+        except MemoryError:
+            raise
         except Exception as e:
-            logging.error(f"Грешка при офис извличане от {file_path}: {e}")
+            logging.error("Грешка при офис извличане от %s: %s", file_path, e)
             return OfficeExtractorBridge._fallback_result(file_path)
 
     @staticmethod
-    def _fallback_result(file_path: Path) -> Dict:
-        return {
+    def extract_low_memory(file_path: Path) -> ExtractionRecord:
+        """Като extract, но с поточните четци на office_extractor (low-memory режим)."""
+        return OfficeExtractorBridge.extract(file_path, low_memory=True)
+
+    @staticmethod
+    def _fallback_result(file_path: Path) -> ExtractionRecord:
+        now = now_stamp()
+        text = f'[Офис документ не може да се обработи: {file_path.name}]'
+        return ExtractionRecord({
             'format': file_path.suffix.lower().lstrip('.'),
-            'from': '',
-            'to': '',
-            'cc': '',
-            'date': datetime.now().strftime('%Y-%m-%d %H:%M'),
-            'date_parsed': datetime.now().strftime('%Y-%m-%d %H:%M'),
+            'date': now,
+            'date_parsed': now,
             'subject': file_path.stem,
-            'body_text': f'[Офис документ не може да се обработи: {file_path.name}]',
-            'body_html': '',
-            'body_clean': f'[Офис документ не може да се обработи: {file_path.name}]',
-            'attachments': []
-        }
+            'body_text': text,
+            'body_clean': text,
+        })
+
+
+class AttachmentTextExtractor:
+    """Текстът на прикачените файлове — за индекса за търсене."""
+
+    TEXT_EXTENSIONS = {'.txt', '.md', '.csv', '.log', '.json', '.html', '.htm'}
+
+    @staticmethod
+    def extract(attachments: List[Dict]) -> Dict[str, str]:
+        """Име на прикачения файл -> текст (само текстови и офис формати)."""
+        texts = {}
+        for att in attachments:
+            name = att['filename']
+            ext = Path(name).suffix.lower()
+            if (ext not in AttachmentTextExtractor.TEXT_EXTENSIONS
+                    and ext not in OfficeExtractorBridge.OFFICE_EXTENSIONS):
+                continue
+            try:
+                with stage('attachment_text', ext.lstrip('.'), len(att['data'])):
+                    if ext in AttachmentTextExtractor.TEXT_EXTENSIONS:
+                        text = decode_bytes(att['data'])
+                    else:
+                        text = AttachmentTextExtractor._office_text(name, att['data'])
+            except MemoryError:
+                raise
+            except Exception as e:
+                logging.warning("Текстът на прикачения %s не може да се извлече: %s", name, e)
+                continue
+            if text and text.strip():
+                texts[name] = text[:MAX_ATTACHMENT_CHARS]
+        return texts
+
+    @staticmethod
+    def _office_text(name: str, data: bytes) -> str:
+        with tempfile.TemporaryDirectory(prefix='attachment_') as tmp:
+            path = Path(tmp) / Path(name).name
+            path.write_bytes(data)
+            result = OfficeExtractorBridge._get_processor().process_file(path)
+        return (result or {}).get('extracted_text', '')
+
+
+def extract_with_attachment_text(extractor: Callable, file_path: Path) -> ExtractionRecord:
+    """Извличане + текстът на прикачените — в работния процес, под крайния срок.
+
+    Мързеливите полета (body_clean, date_parsed) също се изчисляват тук —
+    паралелно в работниците, а не в главния процес.
+    """
+    record = extractor(file_path)
+    if record and record.get('attachments'):
+        record['attachment_text'] = AttachmentTextExtractor.extract(record['attachments'])
+    return record.resolve() if record else record
 
 
 class InboxProcessor:
@@ -448,97 +434,323 @@ class InboxProcessor:
         '.rtf': OfficeExtractorBridge.extract,
         '.xml': OfficeExtractorBridge.extract,
         '.odt': OfficeExtractorBridge.extract,
+        '.ods': OfficeExtractorBridge.extract,
+        # Транскрипти (Teams/Zoom)
+        '.vtt': OfficeExtractorBridge.extract,
+        '.srt': OfficeExtractorBridge.extract,
     }
 
-    def __init__(self):
+    # Формати с Message-ID / In-Reply-To / References (email_threads.py)
+    THREADED_FORMATS = ('eml', 'msg')
+
+    # Повторен опит при MemoryError (лимит на паметта) — само офис форматите имат поточен режим
+    LOW_MEMORY_EXTRACTORS = {ext: OfficeExtractorBridge.extract_low_memory
+                             for ext in OfficeExtractorBridge.OFFICE_EXTENSIONS}
+
+    def __init__(self, memory_limit_mb: Optional[int] = None,
+                 claims: Optional[InboxClaims] = None,
+                 output: Optional[OutputSettings] = None,
+                 metrics: Optional[bool] = None,
+                 profile: bool = False):
         self.processed_count = 0
+        self.output = output or OutputSettings.from_config(load_config())
+        self.supervision = SupervisionSettings.from_config(load_config())
+        if memory_limit_mb is not None:
+            self.supervision.memory_limit_mb = memory_limit_mb
+        self.summary = BatchSummary()
+        self.claims = claims
+        # С claims журналът е на възела — не се споделя между процесите
+        self.journal = (ProcessingJournal(claims.node_dir / '.journal.jsonl') if claims
+                        else ProcessingJournal())
+        self.search = SearchIndex()
+        self.threads = ThreadIndex(PROCESSED_DIR)
+        self.reducer = BodyReducer(ReductionSettings.from_config(load_config()))
+        self.scheduling = SchedulingSettings.from_config(load_config())
+        self.metrics = MetricsSettings.from_config(load_config())
+        if metrics is not None:
+            self.metrics.enabled = metrics
+        METRICS.enable(self.metrics.enabled)
+        # С --profile — папката с профилите на този пуск
+        self.profile_dir = new_profile_dir(PROCESSED_DIR / 'profiles') if profile else None
+        self._pool: Optional[SupervisedPool] = None
+
+    def _get_pool(self) -> SupervisedPool:
+        """Надзираваните работници — по един на слот на опашката (създават се при нужда,
+        рециклират се след N задачи)."""
+        if self._pool is None:
+            self._pool = SupervisedPool(self.scheduling.workers, self.supervision.max_tasks_per_worker,
+                                        memory_limit_mb=self.supervision.memory_limit_mb,
+                                        trace_malloc=self.supervision.trace_malloc,
+                                        metrics=self.metrics.enabled)
+        return self._pool
+
+    def close(self) -> None:
+        """Спира работния процес, записва индекса за търсене и метриките и затваря журнала."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        self.search.close()
+        self.journal.close()
+        METRICS.export(self.metrics)
+        if self.profile_dir is not None:
+            for line in merge_profiles(self.profile_dir):
+                logging.info(line)
+
+    def flush(self) -> None:
+        """Края на интервал на --watch: пакетът за индекса за търсене и метриките до момента."""
+        with stage('index_flush', 'all'):
+            self.search.flush()
+        METRICS.export(self.metrics)
+
+    def _add_to_thread(self, data: Dict, artifact_dir: Path) -> None:
+        """Добавя писмото (само новото съдържание) във файла на разговора му."""
+        if data.get('format') not in self.THREADED_FORMATS:
+            return
+        try:
+            with stage('thread', data.get('format')):
+                self.threads.add(data, self._location(artifact_dir))
+        except OSError as e:
+            logging.error("Разговорът на %s не е обновен: %s", data.get('source_file'), e)
+
+    def _reduce_body(self, data: Dict) -> None:
+        """Тялото на писмото без цитирана история, подпис и повтарящ се текст (body_reducer.py)."""
+        if data.get('format') not in self.THREADED_FORMATS or not data.get('body_clean'):
+            return
+        with stage('reduce', data['format'], len(data['body_clean'])):
+            data['body_clean'], data['reduction'] = self.reducer.reduce(data['body_clean'], reply=is_reply(data))
+
+    @staticmethod
+    def _location(artifact_dir: Path) -> str:
+        """Папката с артефакти спрямо processed/ (location в индекса за търсене)."""
+        return ArtifactIndex(PROCESSED_DIR).relative(artifact_dir)
 
     def process_all(self) -> List[Dict]:
         """Обработва всички файлове в inbox/."""
         results = []
 
         files = sorted(INBOX_DIR.iterdir())
+        if self.claims:
+            recovered = self.claims.recover_stale()
+            if recovered:
+                files = sorted(INBOX_DIR.iterdir())
+            # Първо собствените файлове от предишен пуск със същия node_id
+            files = self.claims.claimed() + files
         if not files:
             logging.info("inbox/ е празна. Няма файлове за обработка.")
             return results
 
+        # Възобновяване след срив: недописаните временни файлове не са изходи
+        # (при няколко възела — само достатъчно старите)
+        remove_stale_temp_files(PROCESSED_DIR, self.claims.lease_seconds if self.claims else 0)
+        unfinished = sum(1 for _ in self.journal.unfinished())
+        if unfinished:
+            logging.info("Журнал: %s файла с прекъсната обработка — продължаване", unfinished)
+
+        # Ред по приоритет и цена (scheduler.py) — спешното и малкото минават напред
+        scheduler = WorkScheduler(self.scheduling)
         for file_path in files:
-            if file_path.is_file():
-                result = self.process_file(file_path)
-                if result:
-                    results.append(result)
+            if not file_path.is_file():
+                continue
+            if file_path.suffix.lower() not in self.EXTRACTORS:
+                logging.warning("Неподдържан формат: %s (%s)", file_path.suffix.lower(), file_path.name)
+                continue
+            scheduler.add(file_path)
+        results = self._run_scheduled(scheduler)
+
+        with stage('index_flush', 'all'):
+            self.search.flush()
+        logging.info("Обработени %s файла от inbox/", len(results))
+        for line in (self.summary.report_lines() + scheduler.report_lines() + self.reducer.report_lines()
+                     + METRICS.report_lines()):
+            logging.info(line)
+        return results
 
-        logging.info(f"Обработени {len(results)} файла от inbox/")
+    def _run_scheduled(self, scheduler: WorkScheduler) -> List[Dict]:
+        """Пуска файловете от опашката в свободните слотове; записът е в главния процес."""
+        results = []
+        pool = self._get_pool()
+        # id на задачата -> файлът от опашката
+        running: Dict[int, ScheduledFile] = {}
+        while scheduler or running:
+            while pool.in_flight < pool.size:
+                running_large = sum(1 for item in running.values() if item.large)
+                item = scheduler.pop(len(running) - running_large, running_large)
+                if item is None:
+                    break
+                task_id = self._submit(item, results)
+                if task_id is not None:
+                    running[task_id] = item
+            if not running:
+                continue
+
+            task = pool.next_result()
+            item = running.pop(task.task_id)
+            result = self._complete(item.path, task, item.queue_info())
+            self._release(item.path)
+            if result:
+                results.append(result)
         return results
 
+    def _submit(self, item: ScheduledFile, results: List[Dict]) -> Optional[int]:
+        """Взима файла (claims) и подава извличането; id на задачата или None.
+
+        Файл, чиито изходи са записани преди срив, се довършва веднага (results).
+        """
+        file_path = self._claim(item.path)
+        if file_path is None:
+            return None
+        item.path = file_path
+        logging.info("Опашка: [%s] %s чака %.2f s", item.priority, file_path.name, item.wait)
+
+        entry = self.journal.entry(file_path)
+        if entry and entry['stage'] == STAGE_WRITTEN:
+            result = self._resume_written(file_path, entry)
+            self._release(file_path)
+            if result:
+                results.append(result)
+            return None
+        self.journal.start(file_path)
+        ext = file_path.suffix.lower()
+        return self._get_pool().submit(*self._task(self.EXTRACTORS[ext], file_path),
+                                       tag=file_path.name, timeout=self.supervision.timeout_for(ext))
+
+    def _task(self, extractor: Callable, file_path: Path) -> Tuple:
+        """Функцията и аргументите за работника — с --profile под profiling.profiled."""
+        if self.profile_dir is None:
+            return extract_with_attachment_text, extractor, file_path
+        return profiled, self.profile_dir, file_path.name, extract_with_attachment_text, extractor, file_path
+
+    def _claim(self, file_path: Path) -> Optional[Path]:
+        """С claims — файлът, взет от този възел (None: друг възел го е взел)."""
+        if not self.claims or file_path.parent == self.claims.node_dir:
+            return file_path
+        return self.claims.claim(file_path)
+
+    def _release(self, file_path: Path) -> None:
+        if self.claims and file_path.exists():
+            # Не е архивиран, нито в карантина (грешка) — връща се в inbox/
+            self.claims.release(file_path)
+
+    def process_path(self, file_path: Path) -> Optional[Dict]:
+        """Обработва файл от inbox/; с claims — само ако този възел успее да го вземе."""
+        claimed = self._claim(file_path)
+        if claimed is None:
+            return None
+        result = self.process_file(claimed)
+        self._release(claimed)
+        return result
+
     def process_file(self, file_path: Path) -> Optional[Dict]:
         """Обработва един файл от inbox/."""
         ext = file_path.suffix.lower()
 
         extractor = self.EXTRACTORS.get(ext)
         if not extractor:
-            logging.warning(f"Неподдържан формат: {ext} ({file_path.name})")
+            logging.warning("Неподдържан формат: %s (%s)", ext, file_path.name)
+            return None
+
+        entry = self.journal.entry(file_path)
+        if entry and entry['stage'] == STAGE_WRITTEN:
+            return self._resume_written(file_path, entry)
+        self.journal.start(file_path)
+
+        # Извличането е в отделен процес с краен срок — увиснал парсер
+        # (fitz, openpyxl, pandoc) не спира опашката
+        task = self._get_pool().run(*self._task(extractor, file_path),
+                                    tag=file_path.name, timeout=self.supervision.timeout_for(ext))
+        return self._complete(file_path, task)
+
+    def _complete(self, file_path: Path, task: TaskResult, queue: Optional[Dict] = None) -> Optional[Dict]:
+        """Резултатът от работника: повторен опит в low-memory режим, карантина или запис на изходите."""
+        ext = file_path.suffix.lower()
+        low_memory = False
+        METRICS.merge(task.stages)
+        if task.status == 'memory' and ext in self.LOW_MEMORY_EXTRACTORS:
+            logging.warning("%s надхвърли лимита на паметта — повторно в low-memory режим", file_path.name)
+            low_memory = True
+            task = self._get_pool().run(*self._task(self.LOW_MEMORY_EXTRACTORS[ext], file_path),
+                                        tag=file_path.name, timeout=self.supervision.timeout_for(ext))
+            METRICS.merge(task.stages)
+
+        memory = dict(task.memory or {}, low_memory=low_memory)
+        size = file_path.stat().st_size if file_path.exists() else 0
+        self.summary.add(ext.lstrip('.'), size, task.seconds, task.ok, memory)
+        # Цялото извличане в работника (с предаването на резултата) — по формат
+        METRICS.observe('extract', ext.lstrip('.'), task.seconds, size)
+
+        if task.status in ('timeout', 'crashed', 'memory'):
+            logging.error("Извличането на %s е прекратено: %s", file_path.name, task.error)
+            key = self.journal.key(file_path)
+            dest = quarantine_file(file_path, QUARANTINE_DIR, task.to_diagnostic())
+            self.journal.record(file_path, STAGE_QUARANTINED, key=key, quarantined=str(dest))
+            return None
+        if not task.ok:
+            logging.error("Грешка при обработка на %s: %s", file_path, task.error)
+            self.journal.record(file_path, STAGE_FAILED, error=task.error)
             return None
 
         try:
-            data = extractor(file_path)
+            data = task.value
             data['source_file'] = file_path.name
             data['source_path'] = str(file_path)
-
-            # Save extracted data as JSON
-            json_path = PROCESSED_DIR / f"{file_path.stem}_extracted.json"
-            json_data = {k: v for k, v in data.items() if k != 'attachments'}
-            json_data['attachment_count'] = len(data.get('attachments', []))
-            json_data['attachment_names'] = [a['filename'] for a in data.get('attachments', [])]
-
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(json_data, f, ensure_ascii=False, indent=2)
-            logging.info(f"Записани извлечени данни: {json_path}")
-
-            # Save attachments
-            for att in data.get('attachments', []):
-                att_path = PROCESSED_DIR / f"{file_path.stem}_att_{att['filename']}"
-                with open(att_path, 'wb') as f:
-                    f.write(att['data'])
-                logging.info(f"Записан прикачен файл: {att_path}")
-
-            # Save clean body as .txt for easy reading
-            body_path = PROCESSED_DIR / f"{file_path.stem}_body.txt"
-            with open(body_path, 'w', encoding='utf-8') as f:
-                f.write(f"От: {data.get('from', '')}\n")
-                f.write(f"До: {data.get('to', '')}\n")
-                if data.get('cc'):
-                    f.write(f"CC: {data['cc']}\n")
-                f.write(f"Дата: {data.get('date_parsed', data.get('date', ''))}\n")
-                f.write(f"Тема: {data.get('subject', '')}\n")
-                f.write(f"Прикачени: {len(data.get('attachments', []))} файла\n")
-                f.write(f"\n{'='*60}\n\n")
-                f.write(data.get('body_clean', ''))
-            logging.info(f"Записано тяло: {body_path}")
-
-            # Move original to processed (ако не е вече там)
-            if file_path.parent != PROCESSED_DIR:
-                dest = PROCESSED_DIR / file_path.name
-                if dest.exists():
-                    # Add timestamp to avoid overwrite
-                    stem = file_path.stem
-                    ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    dest = PROCESSED_DIR / f"{stem}_{ts}{file_path.suffix}"
-
-                file_path.rename(dest)
-                logging.info(f"Преместен оригинал: {file_path} -> {dest}")
-            else:
-                logging.info(f"Файлът вече е в processed/: {file_path}")
+            data['memory'] = memory
+            if queue:
+                data['queue'] = queue
+            if data.get('format') in self.THREADED_FORMATS:
+                data['thread_id'] = self.threads.resolve(data)
+            self._reduce_body(data)
+
+            # Един изходен етап: JSON, тяло, прикачени, преместване на оригинала;
+            # журналът отбелязва 'written' и 'done'
+            artifact_dir = prepare_artifact_dir(file_path, PROCESSED_DIR, self.journal)
+            paths = write_outputs(data, file_path, PROCESSED_DIR, move_original=True, journal=self.journal,
+                                  artifact_dir=artifact_dir, output=self.output)
+            # Индексът за търсене се записва пакетно (flush в края на inbox/)
+            with stage('index', ext.lstrip('.')):
+                self.search.add(data, self._location(paths['dir']))
+            self._add_to_thread(data, paths['dir'])
 
             self.processed_count += 1
             return data
 
         except Exception as e:
-            logging.error(f"Грешка при обработка на {file_path}: {e}")
+            logging.error("Грешка при запис на изходите на %s: %s", file_path, e)
             import traceback
             logging.error(traceback.format_exc())
+            self._quarantine_write_error(file_path, e)
             return None
 
+    def _quarantine_write_error(self, file_path: Path, error: Exception) -> None:
+        """Неуспешен запис — файлът отива в карантина, за да не се извлича наново при всяко пускане."""
+        key = self.journal.key(file_path) if file_path.exists() else None
+        try:
+            dest = quarantine_write_error(file_path, QUARANTINE_DIR, error)
+        except OSError as e:
+            logging.error("%s не е преместен в карантина: %s", file_path.name, e)
+            self.journal.record(file_path, STAGE_FAILED, error=str(error))
+            return
+        if dest is not None:
+            self.journal.record(file_path, STAGE_QUARANTINED, key=key, quarantined=str(dest))
+
+    def _resume_written(self, file_path: Path, entry: Dict) -> Optional[Dict]:
+        """Изходите са записани преди срива — остава само архивирането на оригинала."""
+        logging.info("Журнал: изходите на %s вече са записани — само архивиране", file_path.name)
+        try:
+            data = load_written_record(entry['outputs'][0], PROCESSED_DIR)
+            # Журнали отпреди 'artifact_dir': папката на _extracted.json
+            artifact_dir = Path(entry.get('artifact_dir') or Path(entry['outputs'][0]).parent)
+        except (OSError, KeyError, IndexError, ValueError) as e:
+            # Изходите липсват (изтрити ръчно) — обработваме наново
+            logging.warning("Журнал: изходите на %s не се четат (%s) — повторна обработка", file_path.name, e)
+            self.journal.record(file_path, STAGE_FAILED, error=str(e))
+            return self.process_file(file_path)
+
+        finish_original(file_path, PROCESSED_DIR, self.journal, artifact_dir=artifact_dir)
+        self.search.add(data, self._location(artifact_dir))
+        self._add_to_thread(data, artifact_dir)
+        self.processed_count += 1
+        return data
+
     def watch(self):
         """Следи inbox/ за нови файлове (Watchdog)."""
         try:
@@ -560,15 +772,16 @@ class InboxProcessor:
                     # Wait for file to be fully written
                     time.sleep(2)
                     if file_path.exists():
-                        logging.info(f"Нов файл открит: {file_path.name}")
-                        self.processor.process_file(file_path)
+                        logging.info("Нов файл открит: %s", file_path.name)
+                        self.processor.process_path(file_path)
+                        self.processor.flush()
 
         handler = InboxHandler(self)
         observer = Observer()
         observer.schedule(handler, str(INBOX_DIR), recursive=False)
         observer.start()
 
-        logging.info(f"Следене на inbox/ за нови файлове... (Ctrl+C за спиране)")
+        logging.info("Следене на inbox/ за нови файлове... (Ctrl+C за спиране)")
 
         try:
             while True:
@@ -590,7 +803,8 @@ class InboxProcessor:
                         seen_files.add(file_path.name)
                         time.sleep(2)  # Wait for file to be fully written
                         if file_path.exists():
-                            self.process_file(file_path)
+                            self.process_path(file_path)
+                self.flush()
                 time.sleep(10)
         except KeyboardInterrupt:
             logging.info("Спиране на наблюдението...")
@@ -621,10 +835,61 @@ def main():
     parser = argparse.ArgumentParser(description='ClientRequests Inbox Processor')
     parser.add_argument('--watch', action='store_true', help='Следи inbox/ за нови файлове')
     parser.add_argument('--file', type=str, help='Обработи конкретен файл')
+    parser.add_argument('--memory-limit-mb', type=int,
+                        help='Лимит на адресното пространство на работника (MB, 0 = без)')
+    parser.add_argument('--claim', action='store_true',
+                        help='Взимай файловете атомарно — за няколко възела върху обща inbox/')
+    parser.add_argument('--node-id', type=str,
+                        help='Име на възела (с --claim; по подразбиране <host>-<pid>)')
+    parser.add_argument('--output-mode', choices=OUTPUT_MODES,
+                        help='files — JSON + тяло на файл; manifest — един ред в processed/manifest/')
+    parser.add_argument('--compress', choices=CODECS,
+                        help='Компресия на тялото в manifest режим')
+    parser.add_argument('--search', type=str,
+                        help='Търси в обработените заявки (индекс processed/search.sqlite3)')
+    parser.add_argument('--limit', type=int, default=20, help='Брой резултати (с --search)')
+    parser.add_argument('--triage', action='store_true',
+                        help='Класиран списък на inbox/ само по заглавките (без извличане)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Времена по етап и формат (Prometheus textfile + JSON; python.metrics)')
+    parser.add_argument('--profile', action='store_true',
+                        help='cProfile + стекове (collapsed) за всеки файл в processed/profiles/')
     args = parser.parse_args()
+    setup_logging('process_inbox')
 
-    processor = InboxProcessor()
-
+    if args.search:
+        if not print_search(args.search, args.limit):
+            sys.exit(1)
+        return
+    if args.triage:
+        print_triage(INBOX_DIR)
+        return
+
+    output = OutputSettings.from_config(load_config())
+    if args.output_mode:
+        output.mode = args.output_mode
+    if args.compress:
+        output.compression = args.compress
+
+    claims = None
+    if args.claim:
+        lease = float(load_config().get('python', {}).get('claims', {})
+                      .get('leaseSeconds', DEFAULT_LEASE_SECONDS))
+        claims = InboxClaims(INBOX_DIR, args.node_id, lease).start()
+        logging.info("Възел %s (lease %g s)", claims.node_id, lease)
+
+    processor = InboxProcessor(memory_limit_mb=args.memory_limit_mb, claims=claims, output=output,
+                               metrics=True if args.metrics else None, profile=args.profile)
+    try:
+        run_cli(processor, args)
+    finally:
+        processor.close()
+        if claims:
+            claims.stop()
+
+
+def run_cli(processor: InboxProcessor, args) -> None:
+    """Изпълнява избрания режим (--file, --watch или цялата inbox/)."""
     if args.file:
         file_path = Path(args.file)
         if not file_path.exists():
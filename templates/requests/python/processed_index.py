@@ -0,0 +1,339 @@
+"""
+ClientRequests Processed Index
+==============================
+Шардирана подредба на processed/ и компактен индекс източник -> артефакти.
+
+Всеки обработен входен файл получава собствена папка:
+
+    processed/extracted/<ГГГГ-ММ>/<hh>/<stem>-<id>/
+        <stem>_extracted.json
+        <stem>_body.txt
+        <stem>_att_<име>
+        <оригинал>
+    processed/index.jsonl
+
+- <id> е 8 hex символа; папката се създава с mkdir(exist_ok=False), така
+  че уникалността е атомарна и между няколко възела — без времеви печати
+- <hh> са първите два символа на <id>: до 256 подпапки на месец, така че
+  нито една папка не расте неограничено
+- в manifest режим (manifest.py) редът в index.jsonl има и 'manifest' —
+  мястото на записа в processed/manifest/*.jsonl
+- index.jsonl е append-only, по един ред на етап ({'source', 'dir',
+  'files'} след записа, {'source', 'dir', 'original'} след архивирането;
+  'dir' е относителна спрямо processed/, файловете — само имена);
+  редовете за една папка се сливат при четене
+- ArtifactIndex.lookup() е O(1) — речник в паметта; при следващо търсене
+  се дочитат само новите редове (от запомнения offset)
+
+Заявките CR-*.md остават направо в processed/.
+
+Използване:
+    python processed_index.py --migrate --dry-run   # какво ще се премести
+    python processed_index.py --migrate             # плоска processed/ -> шардове
+    python processed_index.py --lookup "X.eml"      # артефактите на файл
+    python processed_index.py --rebuild             # индексът наново от папките
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import secrets
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+BASE_DIR = Path(__file__).parent
+PROCESSED_DIR = BASE_DIR / "processed"
+
+EXTRACTED_DIRNAME = 'extracted'
+INDEX_FILENAME = 'index.jsonl'
+MAX_STEM_CHARS = 80
+
+# Суфиксите на изходите на output_writer (за миграцията)
+JSON_SUFFIX = '_extracted.json'
+BODY_SUFFIX = '_body.txt'
+ATTACHMENT_MARKER = '_att_'
+
+UNSAFE_CHARS_RE = re.compile(r'[\x00-\x1f<>:"/\\|?*]+')
+
+
+# ================== LAYOUT ==================
+
+def allocate_artifact_dir(output_dir: Path, source_name: str,
+                          when: Optional[datetime] = None) -> Path:
+    """Създава нова уникална папка за артефактите на source_name."""
+    stem = UNSAFE_CHARS_RE.sub('_', Path(source_name).stem)[:MAX_STEM_CHARS].strip(' .') or 'file'
+    month_dir = Path(output_dir) / EXTRACTED_DIRNAME / (when or datetime.now()).strftime('%Y-%m')
+    while True:
+        token = secrets.token_hex(4)
+        path = month_dir / token[:2] / f"{stem}-{token}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            path.mkdir()
+            return path
+        except FileExistsError:
+            continue
+
+
+def recent_shards(output_dir: Path) -> List[Path]:
+    """Шардовете на текущия и предишния месец (където може да има недовършени записи)."""
+    now = datetime.now()
+    months = {now.strftime('%Y-%m'), (now.replace(day=1) - timedelta(days=1)).strftime('%Y-%m')}
+    root = Path(output_dir) / EXTRACTED_DIRNAME
+    return [root / month for month in sorted(months) if (root / month).exists()]
+
+
+def iter_artifact_dirs(output_dir: Path) -> Iterator[Path]:
+    """Всички папки с артефакти (extracted/<месец>/<hh>/<папка>)."""
+    root = Path(output_dir) / EXTRACTED_DIRNAME
+    if not root.exists():
+        return
+    for month in sorted(root.iterdir()):
+        if not month.is_dir():
+            continue
+        for shard in sorted(month.iterdir()):
+            if shard.is_dir():
+                yield from sorted(p for p in shard.iterdir() if p.is_dir())
+
+
+# ================== INDEX ==================
+
+class ArtifactIndex:
+    """Индекс processed/index.jsonl: име на входния файл -> папка и артефакти."""
+
+    def __init__(self, output_dir: Path = PROCESSED_DIR):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / INDEX_FILENAME
+        # Относителна папка -> слят запис; име на източник -> последната му папка
+        self._by_dir: Dict[str, Dict] = {}
+        self._by_source: Dict[str, str] = {}
+        self._offset = 0
+
+    def _merge(self, line: Dict) -> None:
+        entry = self._by_dir.setdefault(line['dir'], {'dir': line['dir'], 'sources': [], 'files': []})
+        if line.get('source') and line['source'] not in entry['sources']:
+            entry['sources'].append(line['source'])
+        entry['files'].extend(f for f in line.get('files', []) if f not in entry['files'])
+        for field, value in line.items():
+            if field not in ('dir', 'source', 'files'):
+                entry[field] = value
+        if line.get('source'):
+            self._by_source[line['source']] = line['dir']
+
+    def refresh(self) -> None:
+        """Дочита редовете, добавени след последното четене (и от други процеси)."""
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return
+        if size < self._offset:
+            # Индексът е пренаписан (--rebuild) — четем отначало
+            self._by_dir.clear()
+            self._by_source.clear()
+            self._offset = 0
+        if size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    # Ред, който друг процес още дописва
+                    break
+                self._offset += len(raw)
+                try:
+                    self._merge(json.loads(raw))
+                except (json.JSONDecodeError, KeyError):
+                    logger.warning("Повреден ред в %s — пропуснат", self.path.name)
+
+    def add(self, source_name: str, artifact_dir: Path, **fields) -> None:
+        """Добавя ред в индекса — един write() с O_APPEND, безопасно между процеси."""
+        line = {'source': source_name, 'dir': self.relative(artifact_dir)}
+        line.update(fields)
+        line['at'] = datetime.now().isoformat(timespec='seconds')
+        data = (json.dumps(line, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def relative(self, artifact_dir: Path) -> str:
+        return Path(artifact_dir).resolve().relative_to(self.output_dir.resolve()).as_posix()
+
+    def lookup(self, source_name: str) -> Optional[Dict]:
+        """Последният запис за входния файл: 'dir', 'files', 'original' ... или None."""
+        self.refresh()
+        rel = self._by_source.get(source_name)
+        return dict(self._by_dir[rel], path=str(self.output_dir / rel)) if rel else None
+
+    def entries(self) -> Iterator[Dict]:
+        self.refresh()
+        return iter(list(self._by_dir.values()))
+
+    def records(self) -> Iterator[Tuple[Dict, Dict]]:
+        """(запис в индекса, извлечен запис) за всички документи — от JSON или manifest-а."""
+        from manifest import Manifest
+
+        manifest = Manifest(self.output_dir)
+        for entry in self.entries():
+            if entry.get('manifest'):
+                try:
+                    yield entry, manifest.read(entry['manifest'])
+                except (OSError, ValueError) as e:
+                    logger.warning("Ред в manifest-а не се чете (%s): %s", entry['dir'], e)
+                continue
+            for name in entry.get('files', []):
+                if not name.endswith(JSON_SUFFIX):
+                    continue
+                try:
+                    with open(self.output_dir / entry['dir'] / name, 'r', encoding='utf-8') as f:
+                        yield entry, json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning("%s не се чете (%s): %s", name, entry['dir'], e)
+
+    def rebuild(self) -> int:
+        """Пренаписва индекса от папките в extracted/ и от manifest-а (manifest.py)."""
+        from manifest import Manifest
+
+        lines = []
+        manifest_dirs = set()
+        for row in Manifest(self.output_dir):
+            if row.get('artifact_dir'):
+                manifest_dirs.add(row['artifact_dir'])
+                lines.append({'source': row.get('source_file'), 'dir': row['artifact_dir'],
+                              'manifest': row['_ref']})
+
+        for artifact_dir in iter_artifact_dirs(self.output_dir):
+            files = sorted(p.name for p in artifact_dir.iterdir() if p.is_file())
+            line = {'dir': self.relative(artifact_dir), 'files': files}
+            sources = []
+            for name in files:
+                if name.endswith(JSON_SUFFIX):
+                    try:
+                        with open(artifact_dir / name, 'r', encoding='utf-8') as f:
+                            source = json.load(f).get('source_file')
+                    except (OSError, ValueError):
+                        source = None
+                    sources.append(source or name[:-len(JSON_SUFFIX)])
+            for name in files:
+                if not (name.endswith(JSON_SUFFIX) or name.endswith(BODY_SUFFIX)
+                        or ATTACHMENT_MARKER in name or name in sources):
+                    line['original'] = name
+            if not sources and line['dir'] not in manifest_dirs:
+                sources = [artifact_dir.name]
+            for source in sources or [None]:
+                lines.append(dict(line, source=source))
+
+        # output_writer внася този модул — затова тук, а не в началото
+        from output_writer import atomic_write_stream
+        atomic_write_stream(self.path, lambda f: f.writelines(
+            json.dumps(line, ensure_ascii=False) + '\n' for line in lines))
+        self._by_dir.clear()
+        self._by_source.clear()
+        self._offset = 0
+        return len(lines)
+
+
+# ================== MIGRATION ==================
+
+def _flat_groups(output_dir: Path) -> Iterator[Dict]:
+    """Групите артефакти в плоската processed/: по една на <stem>_extracted.json."""
+    names = {p.name for p in output_dir.iterdir() if p.is_file()}
+    for json_name in sorted(n for n in names if n.endswith(JSON_SUFFIX)):
+        stem = json_name[:-len(JSON_SUFFIX)]
+        json_path = output_dir / json_name
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            metadata = {}
+
+        files = [json_name]
+        if f"{stem}{BODY_SUFFIX}" in names:
+            files.append(f"{stem}{BODY_SUFFIX}")
+        files += sorted(n for n in names if n.startswith(f"{stem}{ATTACHMENT_MARKER}"))
+
+        # Оригиналът: по source_file, иначе единственият файл със същия stem
+        source = metadata.get('source_file') or ''
+        original = source if source in names and source not in files else None
+        if original is None:
+            candidates = [n for n in names if Path(n).stem == stem and n not in files
+                          and not n.endswith('.md')]
+            original = candidates[0] if len(candidates) == 1 else None
+
+        try:
+            when = datetime.fromisoformat(metadata.get('processing_timestamp', ''))
+        except (TypeError, ValueError):
+            when = datetime.fromtimestamp(json_path.stat().st_mtime)
+
+        yield {'stem': stem, 'source': source or original or f"{stem}", 'files': files,
+               'original': original, 'when': when}
+
+
+def migrate_flat(output_dir: Path = PROCESSED_DIR, dry_run: bool = False) -> int:
+    """Премества артефактите от плоската processed/ в шардове и ги индексира.
+
+    Връща броя мигрирани групи. CR-*.md и непознатите файлове не се пипат.
+    """
+    output_dir = Path(output_dir)
+    index = ArtifactIndex(output_dir)
+    migrated = 0
+    for group in _flat_groups(output_dir):
+        names = group['files'] + ([group['original']] if group['original'] else [])
+        if dry_run:
+            print(f"{group['source']}: {', '.join(names)}")
+            migrated += 1
+            continue
+
+        artifact_dir = allocate_artifact_dir(output_dir, group['source'] or group['stem'], group['when'])
+        for name in names:
+            os.replace(output_dir / name, artifact_dir / name)
+        fields = {'files': group['files'], 'migrated': True}
+        if group['original']:
+            fields['original'] = group['original']
+        index.add(group['source'], artifact_dir, **fields)
+        migrated += 1
+        logger.info("Мигрирано: %s -> %s", group['stem'], artifact_dir)
+    return migrated
+
+
+# ================== CLI ==================
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='ClientRequests Processed Index')
+    parser.add_argument('--dir', type=str, default=str(PROCESSED_DIR), help='processed/ папка')
+    parser.add_argument('--migrate', action='store_true',
+                        help='Премести артефактите от плоската processed/ в шардове')
+    parser.add_argument('--dry-run', action='store_true', help='Само покажи какво ще се мигрира')
+    parser.add_argument('--lookup', type=str, help='Име на входен файл — покажи артефактите му')
+    parser.add_argument('--rebuild', action='store_true', help='Построй index.jsonl наново от папките')
+    args = parser.parse_args()
+
+    output_dir = Path(args.dir)
+    if args.migrate:
+        count = migrate_flat(output_dir, dry_run=args.dry_run)
+        print(f"{'Ще бъдат мигрирани' if args.dry_run else 'Мигрирани'}: {count} входни файла")
+    elif args.rebuild:
+        print(f"Индексирани: {ArtifactIndex(output_dir).rebuild()} записа")
+    elif args.lookup:
+        entry = ArtifactIndex(output_dir).lookup(args.lookup)
+        if not entry:
+            print(f"Няма запис за: {args.lookup}")
+            sys.exit(1)
+        print(json.dumps(entry, ensure_ascii=False, indent=2))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+ClientRequests Profiling
+========================
+--profile на process_inbox.py, office_extractor.py и pdf_extractor.py:
+извличането на всеки файл минава под cProfile и под нишка, която взема
+проби от стека (StackSampler) — без промени в кода на скриптовете.
+
+За всеки файл (в работния процес, под крайния срок) се записват:
+    <папка>/<име на файла>.pstats      - cProfile (python -m pstats, snakeviz)
+    <папка>/<име на файла>.collapsed   - стекове "f1;f2;f3 брой" за
+                                         flamegraph.pl / speedscope / inferno
+и в края на пакета — сумарните _batch.pstats и _batch.collapsed, а най-
+скъпите функции (собствено време) отиват в лога.
+
+cProfile дава точни брой извиквания и време по функция, но само двойки
+извикващ -> извикан; пробите дават пълните стекове (с ~5 ms стъпка), т.е.
+по кой път се стига до бавната функция на екстрактора. Файл, убит при
+изтичане на срока, няма профил — за него увеличете timeouts.<формат>.
+
+Използване:
+    from profiling import profiled, merge_profiles, new_profile_dir
+    profile_dir = new_profile_dir(PROCESSED_DIR / 'profiles')
+    value = profiled(profile_dir, file_path.name, extractor, file_path)
+    for line in merge_profiles(profile_dir):
+        logger.info(line)
+
+    python profiling.py processed/profiles/<пуск>/X.eml.pstats   # най-скъпите функции
+"""
+
+import argparse
+import cProfile
+import logging
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Стъпка на пробите от стека (секунди)
+SAMPLE_INTERVAL = 0.005
+BATCH_NAME = '_batch'
+TOP_FUNCTIONS = 15
+
+
+# ================== SAMPLING ==================
+
+def _frame_label(code) -> str:
+    # ';' разделя нивата в collapsed формата
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})".replace(';', ',')
+
+
+class StackSampler:
+    """Нишка, която през interval взема стека на друга нишка и брои стековете.
+
+    С root стекът започва от тази рамка (напр. profiled) — без рамките над
+    нея (CLI, worker_pool, а след fork — и стекът на главния процес).
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = SAMPLE_INTERVAL,
+                 root=None):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.root = root
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                if frame is self.root:
+                    break
+                frame = frame.f_back
+            if labels:
+                self.stacks[';'.join(reversed(labels))] += 1
+
+    def start(self) -> 'StackSampler':
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'StackSampler':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def write_collapsed(path: Path, stacks: Dict[str, int]) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+
+
+def read_collapsed(path: Path) -> Counter:
+    stacks: Counter = Counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack and count.isdigit():
+                stacks[stack] += int(count)
+    return stacks
+
+
+# ================== PROFILING ==================
+
+def new_profile_dir(root: Path) -> Path:
+    """Папка за профилите на един пуск: <root>/<ГГГГММДД-ччммсс>/."""
+    profile_dir = root / datetime.now().strftime('%Y%m%d-%H%M%S')
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    return profile_dir
+
+
+def _unique_stem(profile_dir: Path, name: str) -> Path:
+    # Повторен опит (low-memory) на същия файл не презаписва първия профил
+    stem = profile_dir / name
+    attempt = 1
+    while stem.with_name(f"{stem.name}.pstats").exists():
+        attempt += 1
+        stem = profile_dir / f"{name}.{attempt}"
+    return stem
+
+
+def profiled(profile_dir: Path, name: str, func: Callable, *args):
+    """Изпълнява func(*args) под cProfile и StackSampler; профилите са <name>.pstats/.collapsed.
+
+    Профилът се записва и когато func хвърли изключение (то се предава нататък).
+    """
+    profiler = cProfile.Profile()
+    sampler = StackSampler(root=sys._getframe()).start()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        return func(*args)
+    finally:
+        profiler.disable()
+        sampler.stop()
+        seconds = time.perf_counter() - start
+        try:
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            stem = _unique_stem(profile_dir, name)
+            profiler.dump_stats(str(stem.with_name(f"{stem.name}.pstats")))
+            write_collapsed(stem.with_name(f"{stem.name}.collapsed"), sampler.stacks)
+            logger.debug("Профил на %s: %.2f s, %s проби -> %s", name, seconds, sum(sampler.stacks.values()), stem)
+        except OSError as e:
+            logger.error("Профилът на %s не е записан: %s", name, e)
+
+
+# ================== REPORT ==================
+
+def top_functions(stats: pstats.Stats, limit: int = TOP_FUNCTIONS) -> List[str]:
+    """Най-скъпите функции по собствено време: брой, собствено и кумулативно време."""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+    lines = []
+    for (filename, line, func), (_, calls, own, cumulative, _) in rows[:limit]:
+        where = f"{Path(filename).name}:{line}" if line else filename
+        lines.append(f"  {own:>8.3f} s {cumulative:>8.3f} s {calls:>9}  {func} ({where})")
+    return lines
+
+
+def merge_profiles(profile_dir: Path, limit: int = TOP_FUNCTIONS) -> List[str]:
+    """Сумира профилите на файловете в _batch.pstats/_batch.collapsed; връща редове за лога."""
+    files = sorted(p for p in profile_dir.glob('*.pstats') if p.stem != BATCH_NAME)
+    if not files:
+        return []
+    stats = pstats.Stats(str(files[0]))
+    for path in files[1:]:
+        stats.add(str(path))
+    stats.dump_stats(str(profile_dir / f"{BATCH_NAME}.pstats"))
+
+    stacks: Counter = Counter()
+    for path in profile_dir.glob('*.collapsed'):
+        if path.stem != BATCH_NAME:
+            stacks.update(read_collapsed(path))
+    write_collapsed(profile_dir / f"{BATCH_NAME}.collapsed", stacks)
+
+    return ([f"Профили: {len(files)} файла в {profile_dir} — най-скъпи функции "
+             f"(собствено, кумулативно, извиквания):"] + top_functions(stats, limit))
+
+
+# ================== CLI ==================
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description='ClientRequests Profiling')
+    parser.add_argument('pstats', help='.pstats файл (на файл или _batch.pstats)')
+    parser.add_argument('--limit', type=int, default=TOP_FUNCTIONS, help='Брой функции')
+    args = parser.parse_args()
+
+    try:
+        stats = pstats.Stats(args.pstats)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Профилът не се чете: {args.pstats}: {e}")
+        sys.exit(1)
+    print(f"{args.pstats}: {stats.total_calls} извиквания, {stats.total_tt:.3f} s")
+    print(f"  {'собств.':>10} {'кумул.':>10} {'извикв.':>9}  функция")
+    for line in top_functions(stats, args.limit):
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
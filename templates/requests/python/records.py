@@ -0,0 +1,299 @@
+"""
+ClientRequests Records
+======================
+Общият запис на един извлечен файл за process_inbox.py, office_extractor.py
+и output_writer.py — вместо речник с ~15 низови ключа на всеки файл (и
+копие в OfficeExtractorBridge, и още едно за JSON-а).
+
+ExtractionRecord е MutableMapping със __slots__: честите полета са слотове
+(без __dict__ на обект), редките — в речника extra, който се създава чак
+при първото такова поле. Достъпът остава като при речник (record['from'],
+record.get('body_clean')), така че search_index, email_threads и
+body_reducer четат еднакво записите от екстракторите и прочетените
+обратно от диска (обикновени речници).
+
+Мързеливи полета:
+- body_clean — от body_text (или HTML-а без тагове) при първия достъп
+- date_parsed — от заглавката date при първия достъп
+
+resolve() ги изчислява предварително — в работния процес, за да не товари
+главния. Изчислените се пренасят с pickle, неизчислените — не.
+
+write_json() пише JSON поточно, поле по поле, направо във файла: без
+речника с метаданните и без целия документ като низ в паметта. Записите
+и dataclass-ите (PageResult на pdf_extractor) се обхождат по полета, без
+asdict(). Резултатът е като при json.dumps(indent=2).
+
+Използване:
+    from records import ExtractionRecord, metadata_items, write_json_items
+    record = ExtractionRecord({'format': 'eml', 'from': sender, 'body_text': text})
+    record['thread_id'] = thread_id
+    with open(path, 'w', encoding='utf-8') as f:
+        write_json_items(f, metadata_items(record))
+"""
+
+import json
+import re
+from collections.abc import Mapping, MutableMapping
+from dataclasses import fields, is_dataclass
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from html import unescape
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO, Tuple
+
+from metrics import stage
+
+
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+JSON_INDENT = 2
+
+
+# ================== TEXT HELPERS ==================
+
+def now_stamp() -> str:
+    return datetime.now().strftime(DATE_FORMAT)
+
+
+def parse_date(date_str: str) -> str:
+    """Дата от имейл заглавка като 'ГГГГ-ММ-ДД чч:мм' (непарсваема — както е; празна — сега)."""
+    if not date_str:
+        return now_stamp()
+    try:
+        return parsedate_to_datetime(str(date_str)).strftime(DATE_FORMAT)
+    except (TypeError, ValueError, IndexError):
+        return str(date_str)
+
+
+def clean_body(body: str) -> str:
+    """Почиства тялото на имейла: без URL-и, тагове и повече от един празен ред."""
+    if not body:
+        return ''
+    body = re.sub(r'http\S+', '', body)
+    body = re.sub(r'<[^>]+>', '', body)
+    body = re.sub(r'\n\s*\n\s*\n', '\n\n', body)
+    body = '\n'.join(line.strip() for line in body.splitlines())
+    return body.strip()
+
+
+def html_to_text(html: str) -> str:
+    """HTML -> plain text (редове от <br>/<p>, без тагове, с декодирани entities)."""
+    if not html:
+        return ''
+    text = re.sub(r'<br\s*/?>', '\n', html, flags=re.IGNORECASE)
+    text = re.sub(r'<p[^>]*>', '\n', text, flags=re.IGNORECASE)
+    text = re.sub(r'</p>', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'<[^>]+>', '', text)
+    return unescape(text).strip()
+
+
+# ================== RECORD ==================
+
+_MISSING = object()
+
+# Ключ -> атрибут; винаги присъстват (в този ред в JSON-а)
+CORE_FIELDS = {
+    'format': 'format',
+    'from': 'sender',
+    'to': 'to',
+    'cc': 'cc',
+    'date': 'date',
+    'date_parsed': 'date_parsed',
+    'subject': 'subject',
+    'body_text': 'body_text',
+    'body_html': 'body_html',
+    'body_clean': 'body_clean',
+    'attachments': 'attachments',
+    'source_file': 'source_file',
+}
+# Слотове, които присъстват само ако са зададени
+OPTIONAL_FIELDS = (
+    'message_id', 'in_reply_to', 'references', 'thread_index',
+    'is_teams_transcript', 'teams_data', 'source_eml', 'file_size_kb', 'processing_timestamp',
+    'attachment_text', 'source_path', 'memory', 'queue', 'thread_id', 'reduction',
+)
+_ATTRIBUTES = dict(CORE_FIELDS, **{key: key for key in OPTIONAL_FIELDS})
+LAZY_FIELDS = ('date_parsed', 'body_clean')
+_SLOTS = (tuple(a for a in CORE_FIELDS.values() if a not in LAZY_FIELDS) + OPTIONAL_FIELDS
+          + ('_date_parsed', '_body_clean', 'extra'))
+
+
+class ExtractionRecord(MutableMapping):
+    """Един извлечен файл — общата схема на изходите (виж output_writer.py)."""
+
+    __slots__ = _SLOTS
+
+    def __init__(self, values: Optional[Mapping] = None, **kwargs):
+        self.format = ''
+        self.sender = ''
+        self.to = ''
+        self.cc = ''
+        self.date = ''
+        self.subject = ''
+        self.body_text = ''
+        self.body_html = ''
+        self.attachments = []
+        self.source_file = ''
+        # None — още не е изчислено (мързеливо поле)
+        self._date_parsed: Optional[str] = None
+        self._body_clean: Optional[str] = None
+        self.extra: Optional[Dict[str, Any]] = None
+        if values:
+            self.update(values)
+        if kwargs:
+            self.update(kwargs)
+
+    # ---------- мързеливи полета ----------
+
+    @property
+    def body_clean(self) -> str:
+        if self._body_clean is None:
+            source = self.body_text or self.body_html
+            with stage('html', self.format, len(source)):
+                self._body_clean = clean_body(self.body_text or html_to_text(self.body_html))
+        return self._body_clean
+
+    @body_clean.setter
+    def body_clean(self, value: str) -> None:
+        self._body_clean = value
+
+    @property
+    def date_parsed(self) -> str:
+        if self._date_parsed is None:
+            self._date_parsed = parse_date(self.date)
+        return self._date_parsed
+
+    @date_parsed.setter
+    def date_parsed(self, value: str) -> None:
+        self._date_parsed = value
+
+    def resolve(self) -> 'ExtractionRecord':
+        """Изчислява мързеливите полета сега (в работника — преди pickle към главния процес)."""
+        self.body_clean
+        self.date_parsed
+        return self
+
+    # ---------- MutableMapping ----------
+
+    def __getitem__(self, key: str) -> Any:
+        attribute = _ATTRIBUTES.get(key)
+        if attribute is None:
+            if self.extra is None or key not in self.extra:
+                raise KeyError(key)
+            return self.extra[key]
+        value = getattr(self, attribute, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        attribute = _ATTRIBUTES.get(key)
+        if attribute is not None:
+            setattr(self, attribute, value)
+        elif self.extra is None:
+            self.extra = {key: value}
+        else:
+            self.extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in CORE_FIELDS:
+            raise TypeError(f"Полето '{key}' е задължително за запис")
+        if key in _ATTRIBUTES:
+            if getattr(self, key, _MISSING) is _MISSING:
+                raise KeyError(key)
+            delattr(self, key)
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from CORE_FIELDS
+        for key in OPTIONAL_FIELDS:
+            if getattr(self, key, _MISSING) is not _MISSING:
+                yield key
+        if self.extra:
+            yield from list(self.extra)
+
+    def __len__(self) -> int:
+        return (len(CORE_FIELDS) + sum(1 for key in OPTIONAL_FIELDS if hasattr(self, key))
+                + len(self.extra or ()))
+
+    def __contains__(self, key: object) -> bool:
+        if key in CORE_FIELDS:
+            return True
+        if key in _ATTRIBUTES:
+            return hasattr(self, key)
+        return self.extra is not None and key in self.extra
+
+    def __repr__(self) -> str:
+        return f"ExtractionRecord(format={self.format!r}, source_file={self.source_file!r}, subject={self.subject!r})"
+
+
+def metadata_items(record: Mapping) -> Iterator[Tuple[str, Any]]:
+    """Полетата за JSON/manifest: прикачените са само брой и имена, без байтовете."""
+    for key, value in record.items():
+        if key != 'attachments':
+            yield key, value
+    attachments = record.get('attachments') or []
+    yield 'attachment_count', len(attachments)
+    yield 'attachment_names', [a['filename'] for a in attachments]
+
+
+# ================== STREAMING JSON ==================
+
+def _object_items(value) -> Optional[Iterable[Tuple[Any, Any]]]:
+    """Полетата на обект, който се пише поле по поле; None — стойност за json.dumps."""
+    if isinstance(value, Mapping):
+        return value.items()
+    if is_dataclass(value) and not isinstance(value, type):
+        return ((f.name, getattr(value, f.name)) for f in fields(value))
+    return None
+
+
+def _is_streamed(value) -> bool:
+    return isinstance(value, ExtractionRecord) or (is_dataclass(value) and not isinstance(value, type))
+
+
+def _key(key) -> str:
+    # Като json.dumps: низ, число, bool или None
+    if isinstance(key, str):
+        return key
+    return json.dumps(key) if isinstance(key, (bool, int, float)) or key is None else str(key)
+
+
+def _write_value(f: TextIO, value, level: int) -> None:
+    items = _object_items(value)
+    # Вложените обикновени речници и списъци — цели; записи, dataclass-и
+    # и списъци от тях — поточно
+    if items is not None and (level == 0 or _is_streamed(value)):
+        write_json_items(f, items, level)
+    elif isinstance(value, (list, tuple)) and value and any(_is_streamed(v) for v in value):
+        pad = '\n' + ' ' * (JSON_INDENT * (level + 1))
+        f.write('[')
+        for i, element in enumerate(value):
+            f.write((',' if i else '') + pad)
+            _write_value(f, element, level + 1)
+        f.write('\n' + ' ' * (JSON_INDENT * level) + ']')
+    else:
+        text = json.dumps(value, ensure_ascii=False, indent=JSON_INDENT, default=str)
+        if level and '\n' in text:
+            # JSON низовете нямат буквални нови редове — безопасно е
+            text = text.replace('\n', '\n' + ' ' * (JSON_INDENT * level))
+        f.write(text)
+
+
+def write_json_items(f: TextIO, items: Iterable[Tuple[Any, Any]], level: int = 0) -> None:
+    """Пише JSON обект от двойки (ключ, стойност) — една по една."""
+    pad = '\n' + ' ' * (JSON_INDENT * (level + 1))
+    first = True
+    f.write('{')
+    for key, value in items:
+        f.write(('' if first else ',') + pad + json.dumps(_key(key), ensure_ascii=False) + ': ')
+        _write_value(f, value, level + 1)
+        first = False
+    f.write('}' if first else '\n' + ' ' * (JSON_INDENT * level) + '}')
+
+
+def write_json(f: TextIO, value) -> None:
+    """Пише value (запис, речник, dataclass или обикновена стойност) като JSON с indent=2."""
+    _write_value(f, value, 0)
@@ -0,0 +1,36 @@
+"""
+ClientRequests Config
+=====================
+Зарежда config.json на .requests/ (една папка над python/) за Python
+инструментите. Липсващ или невалиден файл дава празна конфигурация —
+всеки инструмент има свои стойности по подразбиране.
+
+Използване:
+    from requests_config import load_config
+    config = load_config()
+    formats = config.get('python', {}).get('supportedFormats', [])
+"""
+
+import json
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+CONFIG_FILE = Path(__file__).parent.parent / 'config.json'
+
+
+@lru_cache(maxsize=None)
+def load_config(config_file: Path = CONFIG_FILE) -> Dict:
+    """Чете config.json (кешира се за процеса)."""
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.debug("Няма config.json: %s", config_file)
+    except (OSError, ValueError) as e:
+        logger.warning("Невалиден config.json %s: %s", config_file, e)
+    return {}
@@ -0,0 +1,328 @@
+"""
+ClientRequests RTF Reader
+=========================
+Поточен RTF токенизатор — извлича чист текст от .rtf файлове.
+
+Чете файла на парчета (не го зарежда целия) и:
+- пропуска destination групите (pict, objdata, stylesheet, colortbl, info,
+  \\* групи и т.н.) без да ги буферира — важно при RTF с вградени картинки
+- декодира \\'xx според \\ansicpg и кодовата таблица на текущия шрифт
+  (\\fcharset от fonttbl — напр. 204 = cp1251 за кирилица)
+- декодира \\uN (Unicode, двойките UTF-16 сурогати — един символ) и
+  пропуска заместващите символи според \\ucN
+- връща текста инкрементално (генератор)
+
+Използване:
+    from rtf_reader import read_rtf_text, iter_rtf_text
+    text = read_rtf_text(Path("X.rtf"))
+
+    python rtf_reader.py X.rtf           # Отпечатва извлечения текст
+"""
+
+import codecs
+import logging
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+CHUNK_SIZE = 256 * 1024
+
+# Минимален остатък в буфера, под който чакаме още данни (за да не
+# разрежем контролна дума между две парчета)
+TOKEN_MARGIN = 64
+
+# Групи, които не съдържат текст за извличане
+SKIP_DESTINATIONS = {
+    b'pict', b'objdata', b'objclass', b'stylesheet', b'colortbl', b'info',
+    b'listtable', b'listoverridetable', b'revtbl', b'rsidtbl', b'generator',
+    b'xmlnstbl', b'themedata', b'colorschememapping', b'datastore',
+    b'latentstyles', b'filetbl', b'pgdsctbl', b'shpinst', b'nonshppict',
+    b'fldinst', b'pntxta', b'pntxtb', b'mmathPr', b'wgrffmtfilter',
+}
+
+# Контролни думи -> текст
+CONTROL_TEXT = {
+    b'par': '\n', b'line': '\n', b'sect': '\n', b'page': '\n', b'row': '\n',
+    b'tab': '\t', b'cell': '\t',
+    b'emdash': '\u2014', b'endash': '\u2013', b'bullet': '\u2022',
+    b'lquote': '\u2018', b'rquote': '\u2019',
+    b'ldblquote': '\u201c', b'rdblquote': '\u201d',
+    b'emspace': ' ', b'enspace': ' ', b'qmspace': ' ',
+}
+
+# Контролни символи (\~, \- ...) -> текст
+CONTROL_SYMBOLS = {
+    b'~': ' ', b'_': '-', b'-': '', b'\\': '\\', b'{': '{', b'}': '}',
+    b'\n': '\n', b'\r': '\n', b'\t': '\t',
+}
+
+# \fcharsetN -> кодова таблица
+CHARSET_CODEPAGES = {
+    77: 'mac_roman', 128: 'cp932', 129: 'cp949', 134: 'cp936', 136: 'cp950',
+    161: 'cp1253', 162: 'cp1254', 163: 'cp1258', 177: 'cp1255', 178: 'cp1256',
+    186: 'cp1257', 204: 'cp1251', 222: 'cp874', 238: 'cp1250',
+}
+
+# \ansicpgN, за които cpN не е име на Python кодек
+ANSI_CODEPAGES = {
+    10000: 'mac_roman', 10006: 'mac_greek', 10007: 'mac_cyrillic', 10029: 'mac_latin2',
+    10079: 'mac_iceland', 10081: 'mac_turkish', 20127: 'ascii', 20866: 'koi8_r',
+    21866: 'koi8_u', 28591: 'latin_1', 28592: 'iso8859_2', 28595: 'iso8859_5',
+    28597: 'iso8859_7', 28599: 'iso8859_9', 28605: 'iso8859_15', 65001: 'utf-8',
+}
+DEFAULT_CODEPAGE = 'cp1252'
+REPLACEMENT_CHAR = '\ufffd'
+
+TOKEN_RE = re.compile(
+    rb"\\([a-zA-Z]{1,32})(-?\d{1,10})? ?"   # 1,2: контролна дума + параметър
+    rb"|\\'([0-9a-fA-F]{2})"                # 3: \'xx байт
+    rb"|\\(.)"                              # 4: контролен символ
+    rb"|([{}])"                             # 5: група
+    rb"|[\r\n]+"                            # нови редове се игнорират
+    rb"|([^\\{}\r\n]+)",                    # 6: обикновен текст
+    re.DOTALL
+)
+SKIP_RE = re.compile(rb"[\\{}]")
+BIN_RE = re.compile(rb"\\bin(\d{1,10}) ?")
+
+
+def _ansi_codepage(number: int) -> str:
+    """\\ansicpgN -> име на кодек; непознатата таблица става cp1252."""
+    name = ANSI_CODEPAGES.get(number, f'cp{number}')
+    try:
+        codecs.lookup(name)
+    except LookupError:
+        logger.debug("RTF: непозната кодова таблица \\ansicpg%d, ползва се %s", number, DEFAULT_CODEPAGE)
+        return DEFAULT_CODEPAGE
+    return name
+
+
+class _RtfState:
+    """Състояние на токенизатора между парчетата от файла."""
+
+    def __init__(self):
+        self.ansi_codepage = DEFAULT_CODEPAGE
+        self.fonts: Dict[int, str] = {}
+        self.default_font = None
+        # Стек от групи: [skip, uc, font_codepage, in_fonttbl]
+        self.stack: List[list] = []
+        self.group = [False, 1, None, False]
+        self.skip_chars = 0        # оставащи заместващи символи след \uN
+        self.bin_remaining = 0     # оставащи байтове от \binN
+        self.pending = bytearray()  # \'xx байтове, чакащи декодиране
+        self.high_surrogate = None  # \uN от първата половина на UTF-16 двойка
+        self.font_number = None    # текущ \fN вътре във fonttbl
+        self.out: List[str] = []
+
+    @property
+    def codepage(self) -> str:
+        return self.group[2] or self.ansi_codepage
+
+    def flush(self):
+        self.flush_bytes()
+        if self.high_surrogate is not None:
+            # Първа половина без втора
+            self.out.append(REPLACEMENT_CHAR)
+            self.high_surrogate = None
+
+    def flush_bytes(self):
+        if self.pending:
+            self.out.append(bytes(self.pending).decode(self.codepage, errors='replace'))
+            self.pending.clear()
+
+    def unicode_char(self, code: int) -> None:
+        """\\uN е UTF-16 единица: двойката сурогати (емоджи и др.) става един символ."""
+        if code < 0:
+            code += 65536
+        self.flush_bytes()
+        if 0xDC00 <= code <= 0xDFFF and self.high_surrogate is not None:
+            self.out.append(chr(0x10000 + ((self.high_surrogate - 0xD800) << 10) + (code - 0xDC00)))
+            self.high_surrogate = None
+            return
+        self.flush()
+        if 0xD800 <= code <= 0xDBFF:
+            self.high_surrogate = code
+        elif 0xDC00 <= code <= 0xDFFF or not 0 <= code <= 0x10FFFF:
+            self.out.append(REPLACEMENT_CHAR)
+        else:
+            self.out.append(chr(code))
+
+
+def _control_word(state: _RtfState, word: bytes, param) -> None:
+    group = state.group
+
+    if group[3]:
+        # Вътре във fonttbl: събираме само \fN и \fcharsetN
+        if word == b'f' and param is not None:
+            state.font_number = int(param)
+        elif word == b'fcharset' and param is not None and state.font_number is not None:
+            codepage = CHARSET_CODEPAGES.get(int(param))
+            if codepage:
+                state.fonts[state.font_number] = codepage
+        return
+
+    if word in SKIP_DESTINATIONS:
+        group[0] = True
+        return
+
+    if word == b'fonttbl':
+        group[3] = True
+        return
+
+    if word == b'u' and param is not None:
+        state.unicode_char(int(param))
+        state.skip_chars = group[1]
+        return
+
+    if word == b'uc' and param is not None:
+        group[1] = int(param)
+    elif word == b'ansicpg' and param is not None:
+        state.ansi_codepage = _ansi_codepage(int(param))
+    elif word == b'deff' and param is not None:
+        state.default_font = int(param)
+    elif word == b'f' and param is not None:
+        state.flush()
+        group[2] = state.fonts.get(int(param))
+    elif word == b'plain':
+        state.flush()
+        group[2] = state.fonts.get(state.default_font)
+    elif word in CONTROL_TEXT:
+        state.flush()
+        state.out.append(CONTROL_TEXT[word])
+
+
+def _skip_group(state: _RtfState, buf: bytes, pos: int, end: int) -> int:
+    """Бързо прескача съдържанието на пропусната група (само броим скоби)."""
+    while pos < end:
+        match = SKIP_RE.search(buf, pos, end)
+        if not match:
+            return end
+        pos = match.start()
+        ch = buf[pos]
+        if ch == 0x5C:  # '\'
+            bin_match = BIN_RE.match(buf, pos)
+            if bin_match:
+                state.bin_remaining = int(bin_match.group(1))
+                return bin_match.end()
+            pos += 2
+        elif ch == 0x7B:  # '{'
+            state.stack.append(state.group)
+            state.group = list(state.group)
+            pos += 1
+        else:  # '}'
+            state.group = state.stack.pop() if state.stack else state.group
+            pos += 1
+            if not state.group[0]:
+                return pos
+    return pos
+
+
+def _tokenize(state: _RtfState, buf: bytes, eof: bool) -> int:
+    """Обработва буфера; връща позицията, до която е консумиран."""
+    pos = 0
+    length = len(buf)
+    end = length if eof else length - TOKEN_MARGIN
+
+    while pos < end:
+        if state.bin_remaining:
+            take = min(state.bin_remaining, length - pos)
+            state.bin_remaining -= take
+            pos += take
+            continue
+
+        if state.group[0]:
+            pos = _skip_group(state, buf, pos, end)
+            continue
+
+        match = TOKEN_RE.match(buf, pos)
+        if not match:
+            pos += 1
+            continue
+        pos = match.end()
+        word, param, hex_byte, symbol, brace, text = match.groups()
+
+        if state.skip_chars and (hex_byte or text):
+            if hex_byte:
+                state.skip_chars -= 1
+                continue
+            drop = min(state.skip_chars, len(text))
+            state.skip_chars -= drop
+            text = text[drop:]
+            if not text:
+                continue
+
+        if word:
+            if word == b'bin' and param:
+                state.bin_remaining = int(param)
+            else:
+                _control_word(state, word, param)
+        elif hex_byte:
+            if not state.group[3]:
+                state.pending.append(int(hex_byte, 16))
+        elif text:
+            if state.group[3]:
+                continue
+            state.flush()
+            state.out.append(text.decode(state.codepage, errors='replace'))
+        elif brace == b'{':
+            state.flush()
+            state.stack.append(state.group)
+            state.group = list(state.group)
+            state.skip_chars = 0
+        elif brace == b'}':
+            state.flush()
+            state.group = state.stack.pop() if state.stack else state.group
+            state.skip_chars = 0
+        elif symbol:
+            if symbol == b'*':
+                state.group[0] = True
+            elif symbol in CONTROL_SYMBOLS and not state.group[3]:
+                state.flush()
+                state.out.append(CONTROL_SYMBOLS[symbol])
+
+    return pos
+
+
+def iter_rtf_text(file_path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Генератор на текстови фрагменти от RTF файл (чете на парчета)."""
+    state = _RtfState()
+    buf = b''
+
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf + chunk if buf else chunk
+            consumed = _tokenize(state, buf, eof)
+            buf = buf[consumed:]
+
+            if eof:
+                state.flush()
+            if state.out:
+                yield ''.join(state.out)
+                state.out.clear()
+            if eof:
+                break
+
+
+def read_rtf_text(file_path: Path) -> str:
+    """Извлича чистия текст от RTF файл."""
+    return ''.join(iter_rtf_text(Path(file_path)))
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    if len(sys.argv) < 2:
+        print("Използване: python rtf_reader.py <файл.rtf>")
+        sys.exit(1)
+    for fragment in iter_rtf_text(Path(sys.argv[1])):
+        sys.stdout.write(fragment)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
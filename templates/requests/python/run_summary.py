@@ -0,0 +1,111 @@
+"""
+ClientRequests Run Summary
+==========================
+Статистика за един пуск на обработката — по формати.
+
+За всеки формат: брой файлове, обем, грешки, време, пропускателна
+способност и перцентили на пиковата памет (peak RSS и tracemalloc пик,
+измерени от worker_pool за всяка задача).
+
+Използване:
+    from run_summary import BatchSummary
+    summary = BatchSummary()
+    summary.add('xlsx', size_bytes, seconds, ok=True, memory=task.memory)
+    for line in summary.report_lines():
+        logger.info(line)
+"""
+
+import time
+from typing import Dict, List, Optional
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Percentile (nearest-rank) от вече сортиран списък."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class BatchSummary:
+    """Статистика по формати: брой, обем, време, пропускателна способност и памет."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # Формат -> {'docs', 'bytes', 'failed', 'busy', 'first', 'last', 'rss', 'traced'}
+        self.formats: Dict[str, Dict] = {}
+
+    def add(self, fmt: str, size_bytes: int, seconds: float, ok: bool = True,
+            memory: Optional[Dict] = None) -> None:
+        now = time.perf_counter()
+        stats = self.formats.setdefault(fmt, {
+            'docs': 0, 'bytes': 0, 'failed': 0, 'busy': 0.0, 'first': now - seconds, 'last': now,
+            'rss': [], 'traced': [],
+        })
+        stats['docs'] += 1
+        stats['bytes'] += size_bytes
+        stats['busy'] += seconds
+        stats['first'] = min(stats['first'], now - seconds)
+        stats['last'] = now
+        if not ok:
+            stats['failed'] += 1
+        if memory:
+            if memory.get('peak_rss_mb') is not None:
+                stats['rss'].append(memory['peak_rss_mb'])
+            if memory.get('tracemalloc_peak_mb') is not None:
+                stats['traced'].append(memory['tracemalloc_peak_mb'])
+
+    @staticmethod
+    def _memory_percentiles(values: List[float]) -> Optional[Dict]:
+        if not values:
+            return None
+        values = sorted(values)
+        return {
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'max': values[-1],
+        }
+
+    def to_dict(self) -> Dict:
+        """Формат -> docs, MB, failed, wall/busy секунди, docs/s, MB/s, памет.
+
+        docs/s и MB/s са спрямо прозореца, в който форматът е бил активен
+        (от първата до последната задача), т.е. с паралелизма. 'rss_mb' и
+        'tracemalloc_mb' са p50/p95/max на пиковете по файл (None без данни).
+        """
+        report = {}
+        for fmt, stats in sorted(self.formats.items()):
+            wall = max(stats['last'] - stats['first'], 1e-9)
+            mb = stats['bytes'] / (1024 * 1024)
+            report[fmt] = {
+                'docs': stats['docs'],
+                'failed': stats['failed'],
+                'mb': round(mb, 3),
+                'wall_s': round(wall, 3),
+                'busy_s': round(stats['busy'], 3),
+                'docs_per_s': round(stats['docs'] / wall, 2),
+                'mb_per_s': round(mb / wall, 2),
+                'rss_mb': self._memory_percentiles(stats['rss']),
+                'tracemalloc_mb': self._memory_percentiles(stats['traced']),
+            }
+        return report
+
+    def report_lines(self) -> List[str]:
+        total_docs = sum(s['docs'] for s in self.formats.values())
+        total_mb = sum(s['bytes'] for s in self.formats.values()) / (1024 * 1024)
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        lines = [f"Пакет: {total_docs} файла, {total_mb:.1f} MB за {elapsed:.2f} s "
+                 f"({total_docs / elapsed:.1f} док/s, {total_mb / elapsed:.2f} MB/s)"]
+        for fmt, stats in self.to_dict().items():
+            lines.append(f"  {fmt:<5} {stats['docs']:>5} док, {stats['mb']:>8.1f} MB, "
+                         f"{stats['docs_per_s']:>7.1f} док/s, {stats['mb_per_s']:>7.2f} MB/s"
+                         + (f", грешки: {stats['failed']}" if stats['failed'] else ''))
+            rss = stats['rss_mb']
+            if rss:
+                line = (f"        памет RSS p50 {rss['p50']:.0f} MB, p95 {rss['p95']:.0f} MB, "
+                        f"max {rss['max']:.0f} MB")
+                traced = stats['tracemalloc_mb']
+                if traced:
+                    line += f"; tracemalloc p95 {traced['p95']:.1f} MB, max {traced['max']:.1f} MB"
+                lines.append(line)
+        return lines
@@ -0,0 +1,268 @@
+"""
+ClientRequests Scheduler
+========================
+Ред на обработката на inbox/ по приоритет и очаквана цена — вместо по
+азбучен ред, при който спешно писмо от един ред чака зад 2 GB архив.
+
+Приоритет (нивата на priorities от config.json — Критичен, Висок, Среден,
+Нисък) — най-високият от:
+- triage.py: важност от заглавките и спешна дума в темата
+- python.scheduling.senders: подател или домейн -> приоритет
+- python.scheduling.keywords: дума в темата (или името на файла) -> приоритет
+
+Цена: размер в MB x множител на формата (formatCost) + 1 — грубо
+пропорционална на времето за извличане (xlsx/pdf са по-скъпи от eml).
+
+Файловете от largeFileMb нагоре са в отделна опашка с largeSlots
+собствени слота: големите задачи не заемат слотовете на малките (slots),
+а малките и спешните минават напред в своята опашка. Свободен слот на
+едната опашка поема от другата само ако своята е празна.
+
+За всеки файл се мери чакането в опашката (от планирането до подаването
+на работника); сумите по приоритет са в отчета след обработката.
+
+Настройки (секция python.scheduling на config.json):
+    "scheduling": {
+        "senders": {"Критичен": ["ceo@client.bg"], "Висок": ["@vip-client.bg"]},
+        "keywords": {"Критичен": ["авария", "outage"], "Висок": ["спешно", "urgent"]},
+        "formatCost": {"xlsx": 4, "pdf": 3},
+        "slots": 1, "largeSlots": 1, "largeFileMb": 50
+    }
+
+Използване:
+    from scheduler import SchedulingSettings, WorkScheduler
+    scheduler = WorkScheduler(SchedulingSettings.from_config(load_config()))
+    for path in files:
+        scheduler.add(path)
+    item = scheduler.pop(running_small=0, running_large=0)
+
+    python scheduler.py              # редът, в който inbox/ ще се обработи
+"""
+
+import argparse
+import heapq
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from requests_config import load_config
+from run_summary import percentile
+from triage import INBOX_DIR, priority_names, triage_file
+
+logger = logging.getLogger(__name__)
+
+
+# Множител на цената по формат (за MB); останалите — 1
+DEFAULT_FORMAT_COST = {
+    'txt': 0.5, 'md': 0.5, 'eml': 1.0, 'msg': 1.0, 'vtt': 1.0, 'srt': 1.0,
+    'rtf': 1.5, 'docx': 2.0, 'doc': 2.0, 'odt': 2.0, 'xml': 2.0,
+    'pdf': 3.0, 'xlsx': 4.0, 'xls': 4.0, 'ods': 4.0,
+}
+
+
+@dataclass
+class SchedulingSettings:
+    """Правила за приоритет и слотове (секция python.scheduling на config.json)."""
+    # Приоритет -> податели ('ivan@client.bg') или домейни ('@client.bg')
+    senders: Dict[str, List[str]] = field(default_factory=dict)
+    # Приоритет -> думи в темата / името на файла
+    keywords: Dict[str, List[str]] = field(default_factory=dict)
+    format_cost: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_FORMAT_COST))
+    slots: int = 1
+    large_slots: int = 1
+    large_file_mb: float = 50.0
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'SchedulingSettings':
+        scheduling = config.get('python', {}).get('scheduling', {})
+        format_cost = dict(DEFAULT_FORMAT_COST)
+        format_cost.update({k.lower().lstrip('.'): float(v)
+                            for k, v in scheduling.get('formatCost', {}).items()})
+        return cls(
+            senders={name: [str(s).lower() for s in values]
+                     for name, values in scheduling.get('senders', {}).items()},
+            keywords={name: [str(k).lower() for k in values]
+                      for name, values in scheduling.get('keywords', {}).items()},
+            format_cost=format_cost,
+            slots=max(1, int(scheduling.get('slots', cls.slots))),
+            large_slots=max(0, int(scheduling.get('largeSlots', cls.large_slots))),
+            large_file_mb=float(scheduling.get('largeFileMb', cls.large_file_mb)),
+        )
+
+    @property
+    def workers(self) -> int:
+        """Общо слотове (работни процеси) — малки + големи."""
+        return self.slots + self.large_slots
+
+
+@dataclass
+class ScheduledFile:
+    """Файл в опашката: приоритет, цена и времената за чакането."""
+    path: Path
+    format: str
+    size: int
+    level: int
+    priority: str
+    cost: float
+    large: bool
+    subject: str = ''
+    sender: str = ''
+    enqueued: float = 0.0
+    started: Optional[float] = None
+
+    @property
+    def wait(self) -> float:
+        """Секунди в опашката (до подаването на работника)."""
+        return (self.started if self.started is not None else time.monotonic()) - self.enqueued
+
+    def queue_info(self) -> Dict:
+        """За записа (record['queue'])."""
+        return {
+            'priority': self.priority,
+            'cost': round(self.cost, 2),
+            'lane': 'large' if self.large else 'small',
+            'wait_s': round(self.wait, 3),
+        }
+
+
+class WorkScheduler:
+    """Две опашки (малки / големи файлове), всяка подредена по (приоритет, цена)."""
+
+    def __init__(self, settings: Optional[SchedulingSettings] = None):
+        self.settings = settings or SchedulingSettings()
+        self.names = priority_names()
+        self._levels = {name: level for level, name in enumerate(self.names)}
+        self._small: List = []
+        self._large: List = []
+        self._seq = 0
+        self.started: List[ScheduledFile] = []
+        for rules in (self.settings.senders, self.settings.keywords):
+            for name in rules:
+                if name not in self._levels:
+                    logger.warning("python.scheduling: непознат приоритет '%s' (priorities: %s)", name, self.names)
+
+    def __len__(self) -> int:
+        return len(self._small) + len(self._large)
+
+    # ---------- планиране ----------
+
+    def _rule_level(self, rules: Dict[str, List[str]], matches) -> Optional[int]:
+        levels = [self._levels[name] for name, values in rules.items()
+                  if name in self._levels and any(matches(value) for value in values)]
+        return min(levels) if levels else None
+
+    def classify(self, file_path: Path) -> Optional[ScheduledFile]:
+        """Приоритет и цена на файла — от заглавките (triage.py) и правилата.
+
+        None — файлът вече го няма (поет от друг възел).
+        """
+        info = triage_file(file_path)
+        if info is None:
+            return None
+        level = info['priority_level']
+        sender = info['from'].lower()
+        text = f"{info['subject']} {file_path.name}".lower()
+        for rule_level in (
+            self._rule_level(self.settings.senders, lambda value: value and value in sender),
+            self._rule_level(self.settings.keywords, lambda value: value and value in text),
+        ):
+            if rule_level is not None:
+                level = min(level, rule_level)
+        level = min(level, len(self.names) - 1)
+
+        size_mb = info['size'] / (1024 * 1024)
+        cost = 1.0 + size_mb * self.settings.format_cost.get(info['format'], 1.0)
+        return ScheduledFile(
+            path=file_path, format=info['format'], size=info['size'], level=level,
+            priority=self.names[level], cost=cost,
+            large=self.settings.large_slots > 0 and size_mb >= self.settings.large_file_mb,
+            subject=info['subject'], sender=info['from'], enqueued=time.monotonic(),
+        )
+
+    def add(self, file_path: Path) -> Optional[ScheduledFile]:
+        item = self.classify(file_path)
+        if item is None:
+            return None
+        self._seq += 1
+        heapq.heappush(self._large if item.large else self._small, (item.level, item.cost, self._seq, item))
+        return item
+
+    # ---------- подаване ----------
+
+    def pop(self, running_small: int, running_large: int) -> Optional[ScheduledFile]:
+        """Следващият файл за свободен слот (None — нищо не може да тръгне сега).
+
+        Големите имат свои largeSlots слота, малките — slots; слот на едната
+        опашка поема от другата само когато своята е празна.
+        """
+        if self._large and running_large < self.settings.large_slots:
+            queue = self._large
+        elif self._small and running_small < self.settings.slots:
+            queue = self._small
+        elif self._small and not self._large:
+            queue = self._small
+        elif self._large and not self._small:
+            queue = self._large
+        else:
+            return None
+        item = heapq.heappop(queue)[3]
+        item.started = time.monotonic()
+        self.started.append(item)
+        return item
+
+    def ordered(self) -> List[ScheduledFile]:
+        """Всички чакащи по реда на подаване при един слот на опашка (за показване)."""
+        items = []
+        small, large = list(self._small), list(self._large)
+        heapq.heapify(small)
+        heapq.heapify(large)
+        while small or large:
+            # Един малък, после един голям — както при slots=1, largeSlots=1
+            for queue in (small, large):
+                if queue:
+                    items.append(heapq.heappop(queue)[3])
+        return items
+
+    # ---------- отчет ----------
+
+    def report_lines(self) -> List[str]:
+        if not self.started:
+            return []
+        waits = sorted(item.wait for item in self.started)
+        large = sum(1 for item in self.started if item.large)
+        lines = [f"Опашка: {len(waits)} файла ({large} големи), чакане p50 {percentile(waits, 50):.2f} s, "
+                 f"p95 {percentile(waits, 95):.2f} s, max {waits[-1]:.2f} s"]
+        for level, name in enumerate(self.names):
+            level_waits = sorted(item.wait for item in self.started if item.level == level)
+            if level_waits:
+                lines.append(f"  {name:<10} {len(level_waits):>5} файла, чакане p50 "
+                             f"{percentile(level_waits, 50):.2f} s, max {level_waits[-1]:.2f} s")
+        return lines
+
+
+# ================== CLI ==================
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='ClientRequests Scheduler')
+    parser.add_argument('--dir', type=str, default=str(INBOX_DIR), help='inbox/ папка')
+    args = parser.parse_args()
+
+    scheduler = WorkScheduler(SchedulingSettings.from_config(load_config()))
+    inbox_dir = Path(args.dir)
+    if inbox_dir.exists():
+        for file_path in sorted(inbox_dir.iterdir()):
+            if file_path.is_file() and not file_path.name.startswith('.'):
+                scheduler.add(file_path)
+    for position, item in enumerate(scheduler.ordered(), 1):
+        lane = 'голям' if item.large else 'малък'
+        print(f"{position:>4}. [{item.priority}] {lane} цена {item.cost:>7.1f}  {item.path.name}  {item.subject}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+ClientRequests Search Index
+===========================
+Локален пълнотекстов индекс (SQLite FTS5) върху извлечените заявки —
+вместо grep през всеки _body.txt в processed/.
+
+    processed/search.sqlite3
+
+Всеки документ е един ред в таблицата docs_fts:
+    subject, sender, recipients       - заглавките
+    body                              - изчистеното тяло преди body_reducer.py
+                                        (подписът и цитатите също се търсят)
+    attachments                       - имената и текстът на прикачените
+    source, date, location            - само за показване (UNINDEXED)
+
+location е папката с артефакти спрямо processed/ (processed_index.py).
+Токенизаторът е unicode61 с remove_diacritics — кирилица и латиница без
+значение от главни/малки букви. Класирането е bm25 с по-голяма тежест на
+темата, а откъсът е от най-подходящата колона (snippet).
+
+process_inbox.py добавя всяко извличане веднага след записа му; в пакетен
+режим редовете се натрупват и се записват с executemany в една транзакция
+(batch_size реда наведнъж). --reindex строи индекса наново от
+processed/index.jsonl (напр. след срив преди записа или за стар архив).
+
+Използване:
+    python search_index.py --search "фактура 4711"
+    python search_index.py --search 'invoice AND 47*' --raw --limit 5
+    python search_index.py --reindex
+"""
+
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from records import clean_body, html_to_text
+
+logger = logging.getLogger(__name__)
+
+
+BASE_DIR = Path(__file__).parent
+PROCESSED_DIR = BASE_DIR / "processed"
+SEARCH_DB = PROCESSED_DIR / "search.sqlite3"
+
+BATCH_SIZE = 200
+# Текстът на прикачените се съкращава — индексът не е архив
+MAX_ATTACHMENT_CHARS = 200_000
+
+# Тежести за bm25 по колоните subject, sender, recipients, body, attachments
+RANK_WEIGHTS = (5.0, 2.0, 1.0, 1.0, 0.5)
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    source UNINDEXED, date UNINDEXED, location UNINDEXED,
+    subject, sender, recipients, body, attachments,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+INSERT_SQL = ("INSERT INTO docs_fts (source, date, location, subject, sender, recipients, body, attachments) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+def document_row(record: Dict, location: str) -> Tuple:
+    """Редът за индекса от запис със схемата на output_writer."""
+    recipients = ', '.join(v for v in (record.get('to', ''), record.get('cc', '')) if v)
+    attachment_text = record.get('attachment_text') or {}
+    names = record.get('attachment_names') or [a['filename'] for a in record.get('attachments', [])]
+    attachments = '\n'.join(list(names) + [text[:MAX_ATTACHMENT_CHARS] for text in attachment_text.values()])
+    return (
+        record.get('source_file', ''),
+        record.get('date_parsed') or record.get('date', ''),
+        location,
+        record.get('subject', ''),
+        record.get('from', ''),
+        recipients,
+        search_body(record),
+        attachments,
+    )
+
+
+def search_body(record: Dict) -> str:
+    """Тялото за индекса: при съкратен запис (record['reduction']) — пълното изчистено тяло."""
+    if record.get('reduction'):
+        return clean_body(record.get('body_text') or html_to_text(record.get('body_html', '')))
+    return record.get('body_clean') or record.get('body_text', '')
+
+
+def fts_query(text: str) -> str:
+    """Свободен текст -> FTS5 заявка: всяка дума в кавички (AND), 'дума*' остава префикс."""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+class SearchIndex:
+    """FTS5 индекс с буфер за пакетно добавяне."""
+
+    def __init__(self, path: Path = SEARCH_DB, batch_size: int = BATCH_SIZE):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self._pending: List[Tuple] = []
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # timeout — няколко възела (--claim) може да пишат едновременно
+        self.conn = sqlite3.connect(str(self.path), timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(SCHEMA)
+
+    # ---------- запис ----------
+
+    def add(self, record: Dict, location: str) -> None:
+        """Добавя документ; записва се при flush() или на всеки batch_size."""
+        self._pending.append(document_row(record, location))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """Записва натрупаните редове с executemany в една транзакция."""
+        if not self._pending:
+            return 0
+        rows, self._pending = self._pending, []
+        try:
+            with self.conn:
+                self.conn.executemany(INSERT_SQL, rows)
+        except sqlite3.Error as e:
+            logger.error("Грешка при запис в индекса за търсене (%s документа): %s", len(rows), e)
+            return 0
+        logger.debug("Индекс за търсене: +%s документа", len(rows))
+        return len(rows)
+
+    def reindex(self, output_dir: Path = PROCESSED_DIR) -> int:
+        """Изтрива индекса и го строи наново от processed/index.jsonl."""
+        from processed_index import ArtifactIndex
+
+        with self.conn:
+            self.conn.execute('DELETE FROM docs_fts')
+        count = 0
+        for entry, record in ArtifactIndex(output_dir).records():
+            self.add(record, entry['dir'])
+            count += 1
+        self.flush()
+        with self.conn:
+            self.conn.execute("INSERT INTO docs_fts (docs_fts) VALUES ('optimize')")
+        return count
+
+    # ---------- търсене ----------
+
+    def search(self, query: str, limit: int = 20, raw: bool = False) -> List[Dict]:
+        """Класирани резултати: source, date, location, subject, snippet, rank."""
+        match = query if raw else fts_query(query)
+        if not match:
+            return []
+        weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+        sql = (f"SELECT source, date, location, subject, "
+               f"snippet(docs_fts, -1, '[', ']', '…', 12), bm25(docs_fts, 0, 0, 0, {weights}) AS rank "
+               f"FROM docs_fts WHERE docs_fts MATCH ? ORDER BY rank LIMIT ?")
+        try:
+            rows = self.conn.execute(sql, (match, limit)).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.error("Невалидна заявка за търсене '%s': %s", query, e)
+            return []
+        return [{'source': r[0], 'date': r[1], 'location': r[2], 'subject': r[3],
+                 'snippet': ' '.join(r[4].split()), 'rank': round(r[5], 3)} for r in rows]
+
+    def count(self) -> int:
+        return self.conn.execute('SELECT count(*) FROM docs_fts').fetchone()[0]
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self) -> 'SearchIndex':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def print_search(query: str, limit: int = 20, raw: bool = False,
+                 db_path: Path = SEARCH_DB) -> int:
+    """Търси и отпечатва резултатите (за CLI на search_index и process_inbox)."""
+    if not db_path.exists():
+        print(f"Няма индекс за търсене: {db_path} (python search_index.py --reindex)")
+        return 0
+    with SearchIndex(db_path) as index:
+        start = time.perf_counter()
+        hits = index.search(query, limit=limit, raw=raw)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        total = index.count()
+    for hit in hits:
+        print(f"{hit['source']}  {hit['date']}  {hit['subject']}")
+        print(f"    {hit['snippet']}")
+        print(f"    processed/{hit['location']}")
+    print(f"\nНамерени: {len(hits)} от {total} документа за {elapsed_ms:.1f} ms")
+    return len(hits)
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='ClientRequests Search Index')
+    parser.add_argument('--search', type=str, help='Търси в извлечените заявки')
+    parser.add_argument('--limit', type=int, default=20, help='Максимален брой резултати')
+    parser.add_argument('--raw', action='store_true',
+                        help='Заявката е FTS5 синтаксис (AND/OR/NOT, "фраза", префикс*)')
+    parser.add_argument('--reindex', action='store_true',
+                        help='Построй индекса наново от processed/index.jsonl')
+    parser.add_argument('--dir', type=str, default=str(PROCESSED_DIR), help='processed/ папка')
+    args = parser.parse_args()
+
+    output_dir = Path(args.dir)
+    db_path = output_dir / SEARCH_DB.name
+    if args.reindex:
+        start = time.perf_counter()
+        with SearchIndex(db_path) as index:
+            count = index.reindex(output_dir)
+        print(f"Индексирани: {count} документа за {time.perf_counter() - start:.1f} s")
+    elif args.search:
+        if not print_search(args.search, args.limit, args.raw, db_path):
+            sys.exit(1)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
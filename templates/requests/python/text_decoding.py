@@ -0,0 +1,202 @@
+"""
+ClientRequests Text Decoding
+============================
+Общ слой за декодиране на текстови файлове и имейл части.
+
+- Файлът се чете веднъж (големите — през mmap, без копие в паметта)
+- Кодировката се определя от ограничена извадка: BOM -> UTF-8 -> кеш ->
+  кирилица (cp1251) -> chardet (ако е инсталиран) -> cp1252
+- Резултатът се кешира по източник (напр. подател), така че следващите
+  съобщения от същия източник не минават през chardet отново
+
+Използване:
+    from text_decoding import read_text, decode_bytes
+    text = read_text(Path("X.txt"))
+    body = decode_bytes(payload, source="client@example.com")
+"""
+
+import codecs
+import logging
+import mmap
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+try:
+    import chardet
+    CHARDET_AVAILABLE = True
+except ImportError:
+    CHARDET_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+SAMPLE_SIZE = 64 * 1024
+MMAP_THRESHOLD = 4 * 1024 * 1024
+CACHE_SIZE = 1024
+
+# Минимална увереност на chardet, под която не му вярваме
+CHARDET_MIN_CONFIDENCE = 0.5
+
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+_ASCII_BYTES = bytes(range(0x80))
+_BELOW_C0_BYTES = bytes(range(0xC0))
+_ASCII_LETTERS = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+# Източник -> кодировка (LRU)
+_encoding_cache: 'OrderedDict[str, str]' = OrderedDict()
+
+
+def _detect_bom(data) -> Optional[str]:
+    head = bytes(data[:4])
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+
+def _is_valid(sample: bytes, encoding: str) -> bool:
+    """Проверява извадката строго; непълен последен символ не е грешка."""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+
+def _looks_cyrillic_cp1251(sample: bytes) -> bool:
+    """Евристика: текст на кирилица в cp1251 има много байтове 0xC0-0xFF.
+
+    Западноевропейски текст (cp1252) също ползва този диапазон за
+    ударени букви, но те са малка част от буквите му.
+    """
+    if not sample:
+        return False
+    high = len(sample.translate(None, _ASCII_BYTES))
+    # Сравняваме с латинските букви, а не с целия размер — иначе цифрите
+    # и пунктуацията (времена в субтитри, CSV) "разреждат" извадката
+    latin = len(sample) - len(sample.translate(None, _ASCII_LETTERS))
+    if high < (high + latin) * 0.4:
+        return False
+    letters = len(sample.translate(None, _BELOW_C0_BYTES))
+    return letters >= high * 0.9
+
+
+def _cache_get(source: Optional[str]) -> Optional[str]:
+    if source is None:
+        return None
+    encoding = _encoding_cache.get(source)
+    if encoding:
+        _encoding_cache.move_to_end(source)
+    return encoding
+
+
+def _cache_put(source: Optional[str], encoding: str) -> None:
+    if source is None:
+        return
+    _encoding_cache[source] = encoding
+    _encoding_cache.move_to_end(source)
+    while len(_encoding_cache) > CACHE_SIZE:
+        _encoding_cache.popitem(last=False)
+
+
+def detect_encoding(data, source: Optional[str] = None) -> Tuple[str, str]:
+    """Определя кодировката от първите SAMPLE_SIZE байта.
+
+    Returns:
+        (кодировка, метод) — метод е 'bom', 'utf-8', 'cache', 'cp1251',
+        'chardet' или 'default'
+    """
+    bom = _detect_bom(data)
+    if bom:
+        return bom, 'bom'
+
+    sample = bytes(data[:SAMPLE_SIZE])
+
+    # UTF-8 се проверява винаги първо — валиден UTF-8 почти никога не е
+    # случайност, а еднобайтовите кодировки "пасват" на всичко
+    if _is_valid(sample, 'utf-8'):
+        return 'utf-8', 'utf-8'
+
+    cached = _cache_get(source)
+    if cached and _is_valid(sample, cached):
+        return cached, 'cache'
+
+    if _looks_cyrillic_cp1251(sample):
+        return 'cp1251', 'cp1251'
+
+    if CHARDET_AVAILABLE:
+        guess = chardet.detect(sample)
+        encoding = guess.get('encoding')
+        if encoding and guess.get('confidence', 0) >= CHARDET_MIN_CONFIDENCE:
+            try:
+                return codecs.lookup(encoding).name, 'chardet'
+            except LookupError:
+                pass
+
+    return 'cp1252', 'default'
+
+
+def decode_bytes(data, source: Optional[str] = None) -> str:
+    """Декодира байтове (bytes, memoryview или mmap) с автоматично открита кодировка.
+
+    Args:
+        data: Съдържанието
+        source: Ключ за кеша (напр. подател) — None изключва кеша
+    """
+    if not data:
+        return ''
+
+    encoding, method = detect_encoding(data, source)
+    # Кешира се само кодировка, с която целият текст се декодира чисто
+    cache = method != 'bom'
+    try:
+        text = str(data, encoding)
+    except UnicodeDecodeError as e:
+        if method in ('utf-8', 'bom'):
+            # Валиден UTF-8 (или BOM) с повреден байт по-нататък — заместваме само
+            # него; прекодирането на целия файл с еднобайтова таблица би го развалило
+            logger.debug("Невалиден %s при байт %s — заместване", encoding, e.start)
+            text = str(data, encoding, 'replace')
+            cache = False
+        else:
+            # Извадката е била валидна, но по-нататък в данните не е —
+            # определяме отново по мястото на грешката
+            retry, _ = detect_encoding(data[max(0, e.start - 1024):e.start + SAMPLE_SIZE])
+            logger.debug("Кодировка %s невалидна при байт %s, опит с %s", encoding, e.start, retry)
+            try:
+                text = str(data, retry)
+                encoding = retry
+            except UnicodeDecodeError:
+                text = str(data, encoding, 'replace')
+                cache = False
+    except LookupError:
+        encoding = 'utf-8'
+        text = str(data, encoding, 'replace')
+        cache = False
+
+    if cache:
+        _cache_put(source, encoding)
+    logger.debug("Декодирано като %s (%s), %s байта", encoding, method, len(data))
+    return text
+
+
+def read_text(file_path: Path, source: Optional[str] = None) -> str:
+    """Чете текстов файл еднократно и го декодира (mmap за големи файлове)."""
+    file_path = Path(file_path)
+    size = file_path.stat().st_size
+    if size == 0:
+        return ''
+
+    with open(file_path, 'rb') as f:
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return decode_bytes(mm, source)
+        return decode_bytes(f.read(), source)
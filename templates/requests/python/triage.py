@@ -0,0 +1,485 @@
+"""
+ClientRequests Triage
+=====================
+Бърз преглед на inbox/ само по заглавките — без декодиране на телата и
+прикачените файлове. За маршрутизиране и приоритет преди пълното
+извличане: кой клиент, каква тема, колко голямо, колко прикачени.
+
+- .eml: заглавките до първия празен ред (BytesHeaderParser), после MIME
+  структурата — границите на частите се намират с търсене в mmap на
+  файла, а за всяка част се чете само заглавката ѝ. Размерът на
+  прикачените е оценка от кодирания размер (base64 -> 3/4).
+- .msg: OLE директорията и малките потоци със свойства (__substg1.0_*,
+  __properties_version1.0) през doc_reader.CompoundFile върху mmap;
+  размерът на прикачените е размерът на потока им в директорията.
+- останалите формати: име, размер и дата на файла.
+
+Приоритетът е от списъка priorities на config.json (Критичен, Висок,
+Среден, Нисък): важност от заглавките (X-Priority / Importance / Priority,
+при .msg — PR_IMPORTANCE) и спешна дума в темата ("спешно", "urgent",
+"urgence"…). Класирането е по приоритет, после най-старото първо.
+
+Използване:
+    python triage.py                     # класиран списък на inbox/
+    python triage.py --json              # същото като JSON
+    python triage.py --dir path/to/inbox
+    python process_inbox.py --triage
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import re
+import struct
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from email.header import decode_header
+from email.parser import BytesHeaderParser
+from email.utils import parseaddr, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from doc_reader import STGTY_STORAGE, STGTY_STREAM, CompoundFile
+from requests_config import load_config
+from text_decoding import decode_bytes
+
+logger = logging.getLogger(__name__)
+
+
+BASE_DIR = Path(__file__).parent
+INBOX_DIR = BASE_DIR / "inbox"
+
+DEFAULT_PRIORITIES = ["Критичен", "Висок", "Среден", "Нисък"]
+# Нива: 0 — спешно и с висока важност, 1 — едното от двете, 2 — нормално, 3 — ниска важност
+LEVEL_CRITICAL, LEVEL_HIGH, LEVEL_NORMAL, LEVEL_LOW = range(4)
+
+URGENT_RE = re.compile(r'\b(спешн\w*|срочн\w*|авария|критичн\w*|urgent|asap|critical|urgence|urgente|critique)\b',
+                       re.IGNORECASE)
+
+DOMAIN_RE = re.compile(r'@([\w-]+(?:\.[\w-]+)+)')
+
+# MIME части: максимална дълбочина на влагане
+MAX_MIME_DEPTH = 8
+
+
+# ================== PRIORITY ==================
+
+def importance_from_headers(headers) -> int:
+    """+1 висока, -1 ниска, 0 нормална — от X-Priority, Importance и Priority."""
+    x_priority = str(headers.get('X-Priority', '') or '').strip()
+    importance = str(headers.get('Importance', '') or '').strip().lower()
+    priority = str(headers.get('Priority', '') or '').strip().lower()
+    if x_priority[:1] in ('1', '2') or importance == 'high' or priority == 'urgent':
+        return 1
+    if x_priority[:1] in ('4', '5') or importance == 'low' or priority == 'non-urgent':
+        return -1
+    return 0
+
+
+def priority_level(subject: str, importance: int) -> int:
+    urgent = bool(URGENT_RE.search(subject or ''))
+    if urgent and importance > 0:
+        return LEVEL_CRITICAL
+    if urgent or importance > 0:
+        return LEVEL_HIGH
+    if importance < 0:
+        return LEVEL_LOW
+    return LEVEL_NORMAL
+
+
+def priority_names() -> List[str]:
+    names = load_config().get('priorities') or DEFAULT_PRIORITIES
+    return names if len(names) >= len(DEFAULT_PRIORITIES) else DEFAULT_PRIORITIES
+
+
+def _parse_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed is None:
+        return None
+    return parsed.astimezone() if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc).astimezone()
+
+
+def _client(sender: str) -> str:
+    """Клиентът — домейнът на подателя."""
+    match = DOMAIN_RE.search(parseaddr(sender)[1] or sender)
+    return match.group(1).lower() if match else ''
+
+
+# ================== EML ==================
+
+# compat32: заглавките остават низове — policy.default парсва всяка в обект (~5 пъти по-бавно);
+# RFC 2047 се декодира само за показваните полета
+HEADER_PARSER = BytesHeaderParser()
+
+
+def _header_end(buf, start: int, end: int) -> Tuple[int, int]:
+    """(край на заглавките, начало на тялото) — първият празен ред след start."""
+    for newline in (b'\r\n', b'\n'):
+        if buf[start:start + len(newline)] == newline:
+            # Част без заглавки
+            return start, start + len(newline)
+    candidates = []
+    for separator in (b'\r\n\r\n', b'\n\n'):
+        position = buf.find(separator, start, end)
+        if position >= 0:
+            candidates.append((position, position + len(separator)))
+    if not candidates:
+        return end, end
+    return min(candidates)
+
+
+def _header(headers, name: str) -> str:
+    """Заглавката като текст (=?utf-8?b?...?= декодирано)."""
+    return _decoded(headers.get(name, ''))
+
+
+def _decoded(value) -> str:
+    """Заглавка -> текст: RFC 2047 и 8-битови байтове (unknown-8bit) през text_decoding."""
+    if not value:
+        return ''
+    try:
+        chunks = decode_header(value)
+    except (ValueError, TypeError):
+        return str(value)
+    text = []
+    for chunk, charset in chunks:
+        if isinstance(chunk, str):
+            text.append(chunk)
+            continue
+        try:
+            text.append(chunk.decode(charset) if charset and charset != 'unknown-8bit' else decode_bytes(chunk))
+        except (LookupError, UnicodeDecodeError):
+            text.append(decode_bytes(chunk))
+    return ' '.join(''.join(text).split())
+
+
+def _mime_parts(buf, start: int, end: int, headers, parts: List[Dict], depth: int = 0) -> None:
+    """Листата на MIME дървото в [start, end) — без декодиране на съдържанието."""
+    content_type = headers.get_content_type()
+    boundary = headers.get_boundary() if content_type.startswith('multipart/') else None
+    if boundary and depth < MAX_MIME_DEPTH:
+        # "--boundary" в началото на ред; find() върху mmap е memchr/memcmp — без regex по base64
+        marker = b'--' + boundary.encode('utf-8', 'replace')
+        position = start
+        previous = None
+        while True:
+            found = buf.find(marker, position, end)
+            if found < 0:
+                break
+            position = found + len(marker)
+            if found != start and buf[found - 1:found] != b'\n':
+                continue
+            closing = buf[position:position + 2] == b'--'
+            if previous is not None:
+                # CRLF преди разделителя е част от него
+                part_end = found
+                for newline in (b'\n', b'\r'):
+                    if part_end > previous and buf[part_end - 1:part_end] == newline:
+                        part_end -= 1
+                header_end, body_start = _header_end(buf, previous, part_end)
+                part_headers = HEADER_PARSER.parsebytes(buf[previous:header_end] + b'\n\n')
+                _mime_parts(buf, body_start, part_end, part_headers, parts, depth + 1)
+            if closing:
+                break
+            line_end = buf.find(b'\n', position, end)
+            previous = end if line_end < 0 else line_end + 1
+        return
+
+    encoded = max(0, end - start)
+    encoding = _header(headers, 'Content-Transfer-Encoding').strip().lower()
+    parts.append({
+        'content_type': content_type,
+        'filename': _decoded(headers.get_filename()),
+        'disposition': _header(headers, 'Content-Disposition').split(';')[0].strip().lower(),
+        # base64: 4 знака -> 3 байта (без преносите на редовете — оценка)
+        'size': encoded * 3 // 4 if encoding == 'base64' else encoded,
+    })
+
+
+def _empty_info() -> Dict:
+    return {'from': '', 'to': '', 'cc': '', 'subject': '', 'date': '', 'importance': 0,
+            'attachments': [], 'body_bytes': 0}
+
+
+def triage_eml(file_path: Path) -> Dict:
+    with open(file_path, 'rb') as f:
+        size = f.seek(0, 2)
+        if not size:
+            return _empty_info()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            header_end, body_start = _header_end(buf, 0, size)
+            headers = HEADER_PARSER.parsebytes(buf[:header_end] + b'\n\n')
+            parts: List[Dict] = []
+            _mime_parts(buf, body_start, size, headers, parts)
+
+    attachments = []
+    body_bytes = 0
+    for part in parts:
+        if part['filename'] or part['disposition'] == 'attachment':
+            attachments.append({'filename': part['filename'], 'content_type': part['content_type'],
+                                'size': part['size']})
+        elif part['content_type'].startswith('text/'):
+            body_bytes += part['size']
+    return {
+        'from': _header(headers, 'From'),
+        'to': _header(headers, 'To'),
+        'cc': _header(headers, 'CC'),
+        'subject': _header(headers, 'Subject'),
+        'date': _header(headers, 'Date'),
+        'importance': importance_from_headers(headers),
+        'attachments': attachments,
+        'body_bytes': body_bytes,
+    }
+
+
+# ================== MSG ==================
+
+# MAPI свойства (id) — низовете са в __substg1.0_<id><тип>, 001F = UTF-16LE, 001E = 8-битов (кодовата
+# таблица на клиента — cp1251/cp1252, затова през text_decoding)
+PR_SUBJECT = 0x0037
+PR_SENDER_NAME = 0x0C1A
+PR_SENDER_EMAIL_ADDRESS = 0x0C1F
+PR_SENDER_SMTP_ADDRESS = 0x5D01
+PR_DISPLAY_TO = 0x0E04
+PR_DISPLAY_CC = 0x0E03
+PR_TRANSPORT_MESSAGE_HEADERS = 0x007D
+PR_ATTACH_LONG_FILENAME = 0x3707
+PR_ATTACH_FILENAME = 0x3704
+PR_ATTACH_MIME_TAG = 0x370E
+PR_ATTACH_DATA = 0x3701
+# Свойства с фиксиран размер в __properties_version1.0
+PR_IMPORTANCE = 0x0017
+PR_CLIENT_SUBMIT_TIME = 0x0039
+PR_MESSAGE_DELIVERY_TIME = 0x0E06
+PT_LONG = 0x0003
+PT_SYSTIME = 0x0040
+
+PROPERTIES_STREAM = '__properties_version1.0'
+# Заглавката на потока със свойства: 32 байта в корена, 8 в прикачените
+ROOT_PROPERTIES_HEADER = 32
+ATTACH_STORAGE_PREFIX = '__attach_version1.0_#'
+FILETIME_EPOCH = datetime(1601, 1, 1, tzinfo=timezone.utc)
+
+
+def _msg_string(cf: CompoundFile, paths: Dict, prefix: str, prop: int) -> str:
+    entry = paths.get(f"{prefix}__substg1.0_{prop:04X}001F")
+    if entry:
+        return cf.read_entry(entry).decode('utf-16-le', errors='replace').rstrip('\x00')
+    entry = paths.get(f"{prefix}__substg1.0_{prop:04X}001E")
+    if entry:
+        return decode_bytes(cf.read_entry(entry)).rstrip('\x00')
+    return ''
+
+
+def _msg_fixed_properties(cf: CompoundFile, paths: Dict, prefix: str, header: int) -> Dict[int, Tuple[int, bytes]]:
+    """id -> (тип, 8 байта стойност) от потока __properties_version1.0."""
+    entry = paths.get(prefix + PROPERTIES_STREAM)
+    if not entry:
+        return {}
+    data = cf.read_entry(entry)
+    properties = {}
+    for offset in range(header, len(data) - 15, 16):
+        tag = struct.unpack_from('<I', data, offset)[0]
+        properties[tag >> 16] = (tag & 0xFFFF, bytes(data[offset + 8:offset + 16]))
+    return properties
+
+
+def _filetime(value: bytes) -> Optional[datetime]:
+    ticks = struct.unpack('<Q', value)[0]
+    if not ticks:
+        return None
+    return (FILETIME_EPOCH + timedelta(microseconds=ticks // 10)).astimezone()
+
+
+def triage_msg(file_path: Path) -> Dict:
+    with open(file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            cf = CompoundFile(buf)
+            try:
+                result = _triage_compound(cf)
+            finally:
+                # mmap не се затваря, докато има изгледи към него
+                cf.data.release()
+    return result
+
+
+def _triage_compound(cf: CompoundFile) -> Dict:
+    paths = cf.paths()
+    headers = None
+    transport = _msg_string(cf, paths, '', PR_TRANSPORT_MESSAGE_HEADERS)
+    if transport:
+        headers = HEADER_PARSER.parsebytes(transport.encode('utf-8', errors='replace') + b'\n\n')
+
+    properties = _msg_fixed_properties(cf, paths, '', ROOT_PROPERTIES_HEADER)
+    importance = importance_from_headers(headers) if headers is not None else 0
+    if PR_IMPORTANCE in properties and properties[PR_IMPORTANCE][0] == PT_LONG:
+        # 0 — ниска, 1 — нормална, 2 — висока
+        importance = struct.unpack('<i', properties[PR_IMPORTANCE][1][:4])[0] - 1
+
+    date = _header(headers, 'Date') if headers is not None else ''
+    if not date:
+        for prop in (PR_CLIENT_SUBMIT_TIME, PR_MESSAGE_DELIVERY_TIME):
+            if prop in properties and properties[prop][0] == PT_SYSTIME:
+                parsed = _filetime(properties[prop][1])
+                if parsed:
+                    date = parsed.strftime('%a, %d %b %Y %H:%M:%S %z')
+                    break
+
+    sender_name = _msg_string(cf, paths, '', PR_SENDER_NAME)
+    sender_address = _msg_string(cf, paths, '', PR_SENDER_SMTP_ADDRESS)
+    if '@' not in sender_address:
+        sender_address = _msg_string(cf, paths, '', PR_SENDER_EMAIL_ADDRESS)
+    sender = f"{sender_name} <{sender_address}>" if '@' in sender_address else sender_name
+    if headers is not None and _header(headers, 'From'):
+        sender = _header(headers, 'From')
+
+    attachments = []
+    for path, (entry_type, _, _) in sorted(paths.items()):
+        if entry_type != STGTY_STORAGE or '/' in path or not path.startswith(ATTACH_STORAGE_PREFIX):
+            continue
+        prefix = path + '/'
+        data = paths.get(f"{prefix}__substg1.0_{PR_ATTACH_DATA:04X}0102")
+        attachments.append({
+            'filename': (_msg_string(cf, paths, prefix, PR_ATTACH_LONG_FILENAME)
+                         or _msg_string(cf, paths, prefix, PR_ATTACH_FILENAME)),
+            'content_type': _msg_string(cf, paths, prefix, PR_ATTACH_MIME_TAG),
+            'size': data[2] if data and data[0] == STGTY_STREAM else 0,
+        })
+
+    body = paths.get(f"__substg1.0_{0x1000:04X}001F") or paths.get(f"__substg1.0_{0x1000:04X}001E")
+    return {
+        'from': sender,
+        'to': _msg_string(cf, paths, '', PR_DISPLAY_TO),
+        'cc': _msg_string(cf, paths, '', PR_DISPLAY_CC),
+        'subject': _msg_string(cf, paths, '', PR_SUBJECT),
+        'date': date,
+        'importance': importance,
+        'attachments': attachments,
+        'body_bytes': body[2] if body else 0,
+    }
+
+
+# ================== INBOX ==================
+
+TRIAGE_READERS = {
+    '.eml': triage_eml,
+    '.msg': triage_msg,
+}
+
+
+def triage_file(file_path: Path) -> Optional[Dict]:
+    """Заглавките, приоритетът и размерите на един файл (без пълно извличане).
+
+    None — файлът вече го няма (поет от друг възел с --claim или преместен).
+    """
+    start = time.perf_counter()
+    try:
+        stat = file_path.stat()
+    except OSError as e:
+        logger.info("%s не е достъпен (%s) — пропуснат", file_path.name, e)
+        return None
+    ext = file_path.suffix.lower()
+    reader = TRIAGE_READERS.get(ext)
+    info = _empty_info()
+    error = ''
+    if reader:
+        try:
+            info = reader(file_path)
+        except FileNotFoundError:
+            logger.info("%s изчезна по време на четенето — пропуснат", file_path.name)
+            return None
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            error = str(e)
+            logger.warning("Заглавките на %s не се четат: %s", file_path.name, e)
+
+    subject = info['subject'] or file_path.stem
+    parsed = _parse_date(info['date']) if info['date'] else None
+    if parsed is None:
+        parsed = datetime.fromtimestamp(stat.st_mtime).astimezone()
+    level = priority_level(subject, info['importance'])
+    return {
+        'source_file': file_path.name,
+        'format': ext.lstrip('.'),
+        'size': stat.st_size,
+        'from': info['from'],
+        'client': _client(info['from']),
+        'to': info['to'],
+        'cc': info['cc'],
+        'subject': subject,
+        'date_parsed': parsed.strftime('%Y-%m-%d %H:%M'),
+        'received': parsed.timestamp(),
+        'importance': info['importance'],
+        'priority_level': level,
+        'priority': priority_names()[level],
+        'attachments': info['attachments'],
+        'attachment_count': len(info['attachments']),
+        'attachment_bytes': sum(a['size'] for a in info['attachments']),
+        'body_bytes': info['body_bytes'],
+        'error': error,
+        'ms': round((time.perf_counter() - start) * 1000, 3),
+    }
+
+
+def triage_inbox(inbox_dir: Path = INBOX_DIR) -> List[Dict]:
+    """Всички файлове в inbox/ — класирани по приоритет, после най-старите първо."""
+    results = []
+    if not inbox_dir.exists():
+        return results
+    for file_path in inbox_dir.iterdir():
+        if file_path.is_file() and not file_path.name.startswith('.'):
+            info = triage_file(file_path)
+            if info is not None:
+                results.append(info)
+    results.sort(key=lambda item: (item['priority_level'], item['received'], item['size']))
+    return results
+
+
+def _human_size(size: int) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024 or unit == 'MB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} MB"
+
+
+def print_triage(inbox_dir: Path = INBOX_DIR, as_json: bool = False) -> int:
+    """Отпечатва класирания списък (за CLI на triage и process_inbox)."""
+    start = time.perf_counter()
+    results = triage_inbox(inbox_dir)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if as_json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return len(results)
+    if not results:
+        print(f"{inbox_dir} е празна.")
+        return 0
+    for rank, item in enumerate(results, 1):
+        attachments = (f", {item['attachment_count']} прикачени ({_human_size(item['attachment_bytes'])})"
+                       if item['attachment_count'] else '')
+        print(f"{rank:>4}. [{item['priority']}] {item['date_parsed']}  {item['client'] or '-'}  {item['subject']}")
+        print(f"        {item['source_file']} — {_human_size(item['size'])}{attachments}"
+              + (f"  ГРЕШКА: {item['error']}" if item['error'] else ''))
+    print(f"\nФайлове: {len(results)} за {elapsed_ms:.1f} ms "
+          f"({elapsed_ms / len(results):.2f} ms/файл)")
+    return len(results)
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='ClientRequests Triage')
+    parser.add_argument('--dir', type=str, default=str(INBOX_DIR), help='inbox/ папка')
+    parser.add_argument('--json', action='store_true', help='Резултатът като JSON')
+    args = parser.parse_args()
+
+    print_triage(Path(args.dir), args.json)
+
+
+if __name__ == '__main__':
+    main()
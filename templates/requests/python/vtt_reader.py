@@ -0,0 +1,203 @@
+"""
+ClientRequests VTT/SRT Reader
+=============================
+Поточен четец за транскрипти в WebVTT (.vtt) и SubRip (.srt) формат.
+
+Teams/Zoom/Meet експортират транскриптите като .vtt — всяка реплика е
+отделен cue с точно време:
+
+    00:01:02.500 --> 00:01:05.000
+    <v Ivan Petrov>Добър ден, колеги.</v>
+
+Четецът минава файла ред по ред (линейно време, постоянна памет) и:
+- разпознава говорещия от <v Име> тагове или "Име: текст" (SRT)
+- маха останалите тагове (<c>, <b>, <00:00:01.000> и т.н.)
+- пропуска NOTE/STYLE/REGION блоковете и номерата/идентификаторите на cue
+- слива последователните cue-та на един и същ говорещ в едно съобщение
+
+Съобщенията са във формата на TeamsTranscriptParser ('speaker', 'time',
+'seconds', 'text'), така че teams_data е същата като при DOCX транскрипт.
+
+Използване:
+    from vtt_reader import iter_cues, iter_speaker_turns
+    for msg in iter_speaker_turns(iter_cues(Path("X.vtt"))):
+        ...
+
+    python vtt_reader.py X.vtt           # Отпечатва сливаните реплики
+"""
+
+import logging
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+from text_decoding import SAMPLE_SIZE, detect_encoding
+
+logger = logging.getLogger(__name__)
+
+
+# "00:01:02.500 --> 00:01:05.000 align:start" (VTT) или "00:01:02,500 --> ..." (SRT);
+# часовете в VTT не са задължителни
+TIMING_RE = re.compile(
+    r'^\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})'
+)
+VOICE_RE = re.compile(r'<v(?:\.[^\s>]*)?\s+([^>]+)>')
+TAG_RE = re.compile(r'<[^>]*>')
+# "Ivan Petrov: текст" — само ако "името" е кратко и без изречение в него
+SPEAKER_PREFIX_RE = re.compile(r'^([^\s:][^:.!?]{0,60}?):\s+(.+)$')
+
+HEADER_BLOCKS = ('NOTE', 'STYLE', 'REGION')
+
+ENTITIES = {'&amp;': '&', '&lt;': '<', '&gt;': '>', '&nbsp;': ' ', '&lrm;': '', '&rlm;': ''}
+ENTITY_RE = re.compile('|'.join(ENTITIES))
+
+
+def parse_timestamp(stamp: str) -> float:
+    """Конвертира "HH:MM:SS.mmm" / "MM:SS,mmm" в секунди."""
+    seconds = 0.0
+    for part in stamp.replace(',', '.').split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def format_time(seconds: float) -> str:
+    """Секунди -> "M:SS" / "H:MM:SS" (както в Teams DOCX транскриптите)."""
+    total = int(seconds)
+    hours, rest = divmod(total, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
+def format_duration(seconds: float) -> str:
+    """Секунди -> "55min 28sec" (както в Teams DOCX транскриптите)."""
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes}min {secs}sec"
+
+
+def _clean_line(line: str) -> str:
+    line = TAG_RE.sub('', line)
+    if '&' in line:
+        line = ENTITY_RE.sub(lambda m: ENTITIES[m.group(0)], line)
+    return line.strip()
+
+
+def _make_cue(start: float, end: float, lines: list) -> Optional[Dict]:
+    """Сглобява cue от суровите редове; None ако няма текст."""
+    speaker = None
+    text_lines = []
+    for raw in lines:
+        voice = VOICE_RE.search(raw)
+        if voice and speaker is None:
+            speaker = voice.group(1).strip()
+        line = _clean_line(raw)
+        if line:
+            text_lines.append(line)
+
+    if not text_lines:
+        return None
+
+    if speaker is None:
+        match = SPEAKER_PREFIX_RE.match(text_lines[0])
+        if match:
+            speaker = match.group(1).strip()
+            text_lines[0] = match.group(2)
+
+    return {'start': start, 'end': end, 'speaker': speaker, 'text': ' '.join(text_lines)}
+
+
+def _open_text(file_path: Path):
+    """Отваря файла в текстов режим с кодировка, открита от първите байтове."""
+    with open(file_path, 'rb') as f:
+        sample = f.read(SAMPLE_SIZE)
+    encoding, _ = detect_encoding(sample)
+    return open(file_path, 'r', encoding=encoding, errors='replace', newline=None)
+
+
+def iter_cues(file_path: Path) -> Iterator[Dict]:
+    """Генератор на cue-тата на VTT/SRT файл ('start', 'end', 'speaker', 'text')."""
+    start = end = None
+    lines: list = []
+    skipping = False
+
+    with _open_text(Path(file_path)) as f:
+        for line in f:
+            line = line.rstrip('\n')
+
+            if not line.strip():
+                # Празен ред затваря текущия блок
+                if start is not None:
+                    cue = _make_cue(start, end, lines)
+                    if cue:
+                        yield cue
+                start = end = None
+                lines = []
+                skipping = False
+                continue
+
+            if skipping:
+                continue
+
+            if start is None:
+                timing = TIMING_RE.match(line)
+                if timing:
+                    start = parse_timestamp(timing.group(1))
+                    end = parse_timestamp(timing.group(2))
+                elif line.split(' ', 1)[0] in HEADER_BLOCKS:
+                    skipping = True
+                # Иначе: "WEBVTT" заглавие, номер (SRT) или идентификатор на cue
+                continue
+
+            lines.append(line)
+
+    if start is not None:
+        cue = _make_cue(start, end, lines)
+        if cue:
+            yield cue
+
+
+def iter_speaker_turns(cues: Iterable[Dict], unknown_speaker: str = 'Неизвестен') -> Iterator[Dict]:
+    """Слива последователните cue-та на един говорещ в едно съобщение.
+
+    Yield-ва речници във формата на TeamsTranscriptParser: 'speaker',
+    'time', 'seconds', 'end_seconds', 'text'.
+    """
+    current = None
+    parts: list = []
+
+    for cue in cues:
+        speaker = cue['speaker'] or (current['speaker'] if current else unknown_speaker)
+        if current is not None and speaker == current['speaker']:
+            parts.append(cue['text'])
+            current['end_seconds'] = cue['end']
+            continue
+
+        if current is not None:
+            current['text'] = ' '.join(parts)
+            yield current
+
+        current = {
+            'speaker': speaker,
+            'time': format_time(cue['start']),
+            'seconds': int(cue['start']),
+            'end_seconds': cue['end'],
+            'text': '',
+        }
+        parts = [cue['text']]
+
+    if current is not None:
+        current['text'] = ' '.join(parts)
+        yield current
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    if len(sys.argv) < 2:
+        print("Използване: python vtt_reader.py <файл.vtt|файл.srt>")
+        sys.exit(1)
+    for msg in iter_speaker_turns(iter_cues(Path(sys.argv[1]))):
+        print(f"[{msg['time']}] {msg['speaker']}: {msg['text']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,453 @@
+"""
+ClientRequests Worker Pool
+==========================
+Надзиравани работни процеси за извличането — с краен срок за всяка задача.
+
+За разлика от ProcessPoolExecutor, всеки работник е отделен процес със
+собствена Pipe връзка, така че един "увиснал" работник може да бъде убит
+и заменен, без да спира останалите:
+
+- timeout: задача, която не е завършила до срока си, се прекратява
+  (terminate/kill), работникът се заменя с нов и резултатът е 'timeout'
+- срив (segfault, os._exit, OOM killer) дава резултат 'crashed'
+- след max_tasks_per_worker задачи работникът се рециклира — ограничава
+  течовете на памет в C библиотеките (openpyxl/lxml, fitz)
+- memory_limit_mb ограничава адресното пространство на работника
+  (resource.setrlimit, RLIMIT_AS); MemoryError дава резултат 'memory' и
+  работникът се заменя, за да може файлът да се опита в low-memory режим
+- за всяка задача се мери пиковият RSS (и tracemalloc пикът при trace_malloc)
+  — TaskResult.memory
+- с metrics=True етапите, измерени в работника (metrics.py), се връщат с
+  резултата — TaskResult.stages, за METRICS.merge() в главния процес
+- логовете на работника минават през собствена опашка към файла на
+  главния процес (logging_setup.configure_worker)
+
+Функциите и аргументите трябва да могат да се pickle-нат (функции на ниво
+модул или staticmethod-и на класове на ниво модул).
+
+Използване:
+    from worker_pool import SupervisedPool
+    with SupervisedPool(workers=4, max_tasks_per_worker=50, memory_limit_mb=2048) as pool:
+        pool.submit(func, path, timeout=60, tag=path)
+        while pool.pending:
+            result = pool.next_result()
+"""
+
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import tracemalloc
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from multiprocessing.connection import wait as wait_connections
+from typing import Any, Callable, Dict, List, Optional
+
+from logging_setup import LoggingSettings, active_settings, configure_worker, stop_logging
+from metrics import METRICS
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    # Windows — няма rlimit; лимитът на паметта се пропуска
+    RESOURCE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+# Колко чакаме работник да излезе сам, преди да го убием
+JOIN_TIMEOUT = 2.0
+# Колко често свободен работник проверява дали главният процес е жив
+PARENT_CHECK_INTERVAL = 1.0
+
+DEFAULT_TIMEOUTS = {'default': 120, 'xlsx': 300, 'xls': 300, 'pdf': 300}
+DEFAULT_MAX_TASKS = 50
+
+PROC_STATUS = Path('/proc/self/status')
+PROC_CLEAR_REFS = Path('/proc/self/clear_refs')
+
+
+@dataclass
+class SupervisionSettings:
+    """Крайни срокове по формат и рециклиране (секция python.batch на config.json)."""
+    timeouts: Dict[str, float]
+    max_tasks_per_worker: int
+    # 0 = без лимит на адресното пространство
+    memory_limit_mb: int = 0
+    trace_malloc: bool = False
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'SupervisionSettings':
+        batch = config.get('python', {}).get('batch', {})
+        timeouts = dict(DEFAULT_TIMEOUTS)
+        timeouts.update({k.lower().lstrip('.'): float(v)
+                         for k, v in batch.get('timeouts', {}).items()})
+        return cls(
+            timeouts=timeouts,
+            max_tasks_per_worker=int(batch.get('maxTasksPerWorker', DEFAULT_MAX_TASKS)),
+            memory_limit_mb=int(batch.get('memoryLimitMb') or 0),
+            trace_malloc=bool(batch.get('traceMalloc', False)),
+        )
+
+    def timeout_for(self, fmt: str) -> Optional[float]:
+        """Срокът за формат в секунди; 0 или по-малко = без срок."""
+        timeout = self.timeouts.get(fmt.lower().lstrip('.'), self.timeouts.get('default', 0))
+        return timeout if timeout and timeout > 0 else None
+
+
+@dataclass
+class TaskResult:
+    """Резултат от задача: status е 'ok', 'error', 'memory', 'timeout' или 'crashed'."""
+    task_id: int
+    tag: Any
+    status: str
+    value: Any = None
+    error: Optional[str] = None
+    seconds: float = 0.0
+    pid: Optional[int] = None
+    exitcode: Optional[int] = None
+    timeout: Optional[float] = None
+    # {'peak_rss_mb', 'rss_scope', 'tracemalloc_peak_mb'} — вж. _measure_memory
+    memory: Optional[Dict] = None
+    # Етапите от работника (metrics.StageMetrics.drain) — само с metrics=True
+    stages: Optional[Dict] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 'ok'
+
+    def to_diagnostic(self) -> Dict:
+        """Диагностичен запис (за карантината) — без самия резултат."""
+        return {
+            'status': self.status,
+            'error': self.error,
+            'seconds': round(self.seconds, 3),
+            'timeout': self.timeout,
+            'worker_pid': self.pid,
+            'exitcode': self.exitcode,
+            'memory': self.memory,
+        }
+
+
+# ================== MEMORY ==================
+
+def apply_memory_limit(limit_mb: int) -> bool:
+    """Ограничава адресното пространство на текущия процес (RLIMIT_AS).
+
+    Над лимита заделянето на памет дава MemoryError вместо swap. Лимитът е
+    за виртуалната памет, не за RSS — оставете място за самия интерпретатор
+    и библиотеките (~100-200 MB). Връща False, ако платформата не го поддържа.
+    """
+    if not limit_mb or limit_mb <= 0:
+        return False
+    if not RESOURCE_AVAILABLE:
+        logger.warning("resource не е наличен — лимитът на паметта се пропуска")
+        return False
+    limit = int(limit_mb) * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+        return True
+    except (ValueError, OSError) as e:
+        logger.warning("Лимитът на паметта не може да се зададе: %s", e)
+        return False
+
+
+def reset_peak_rss() -> bool:
+    """Нулира пиковия RSS (VmHWM) на процеса — само Linux.
+
+    Без нулиране пикът е за целия живот на процеса, не за една задача.
+    """
+    try:
+        PROC_CLEAR_REFS.write_text('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Пиковият RSS на процеса в MB (VmHWM или ru_maxrss); None ако е неизвестен."""
+    try:
+        with open(PROC_STATUS, 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if RESOURCE_AVAILABLE:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS връща байтове, Linux — KB
+        return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+    return None
+
+
+def _measure_memory(per_task: bool, trace_malloc: bool) -> Dict:
+    peak = peak_rss_mb()
+    return {
+        'peak_rss_mb': round(peak, 1) if peak is not None else None,
+        # 'task' — пикът е само за тази задача; 'process' — за живота на работника
+        'rss_scope': 'task' if per_task else 'process',
+        'tracemalloc_peak_mb': (round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+                                if trace_malloc else None),
+    }
+
+
+def _worker_main(conn, initializer: Optional[Callable], memory_limit_mb: int = 0,
+                 trace_malloc: bool = False, metrics: bool = False,
+                 log_settings: Optional[LoggingSettings] = None) -> None:
+    """Цикъл на работника: получава (id, func, args), връща (id, status, value, error, s, memory, stages)."""
+    configure_worker(log_settings)
+    try:
+        _worker_loop(conn, initializer, memory_limit_mb, trace_malloc, metrics)
+    finally:
+        stop_logging()
+
+
+def _worker_loop(conn, initializer: Optional[Callable], memory_limit_mb: int,
+                 trace_malloc: bool, metrics: bool) -> None:
+    apply_memory_limit(memory_limit_mb)
+    if trace_malloc:
+        tracemalloc.start()
+    # При fork регистърът идва с натрупаното в главния процес — започваме отначало
+    METRICS.reset()
+    METRICS.enable(metrics)
+    if initializer:
+        initializer()
+    # При fork работникът наследява и родителския край на Pipe-а, така че
+    # EOF не идва, ако главният процес умре — следим смяната на родителя
+    parent_pid = os.getppid()
+    while True:
+        try:
+            if not conn.poll(PARENT_CHECK_INTERVAL):
+                if os.getppid() != parent_pid:
+                    break
+                continue
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        task_id, func, args = message
+        per_task = reset_peak_rss()
+        if trace_malloc:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            value = func(*args)
+            status, error = 'ok', None
+        except MemoryError:
+            value = None
+            status, error = 'memory', traceback.format_exc()
+        except BaseException:
+            value = None
+            status, error = 'error', traceback.format_exc()
+        seconds = time.perf_counter() - start
+        memory = _measure_memory(per_task, trace_malloc)
+        stages = METRICS.drain()
+
+        try:
+            conn.send((task_id, status, value, error, seconds, memory, stages))
+        except Exception:
+            # Резултатът не може да се pickle-не — връщаме грешката вместо него
+            conn.send((task_id, 'error', None, traceback.format_exc(), seconds, memory, stages))
+
+
+class _Worker:
+    __slots__ = ('process', 'conn', 'task', 'tasks_done')
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        # (task_id, tag, started, deadline, timeout) на текущата задача
+        self.task = None
+        self.tasks_done = 0
+
+
+class SupervisedPool:
+    """Пул от надзиравани процеси с краен срок за всяка задача."""
+
+    def __init__(self, workers: int = 1, max_tasks_per_worker: int = DEFAULT_MAX_TASKS,
+                 initializer: Optional[Callable] = None, memory_limit_mb: int = 0,
+                 trace_malloc: bool = False, metrics: bool = False):
+        self.size = max(1, workers)
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.initializer = initializer
+        self.memory_limit_mb = memory_limit_mb
+        self.trace_malloc = trace_malloc
+        self.metrics = metrics
+        self._context = multiprocessing.get_context()
+        self._workers: List[_Worker] = []
+        self._queue: deque = deque()
+        self._ready: deque = deque()
+        self._next_id = 0
+        self.recycled = 0
+        self.killed = 0
+
+    # ---------- жизнен цикъл на работниците ----------
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.initializer, self.memory_limit_mb, self.trace_malloc, self.metrics,
+                  active_settings()),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        self._workers.append(worker)
+        return worker
+
+    def _stop(self, worker: _Worker, kill: bool) -> None:
+        self._workers.remove(worker)
+        if not kill:
+            try:
+                worker.conn.send(None)
+            except (OSError, EOFError):
+                pass
+            worker.process.join(JOIN_TIMEOUT)
+        if worker.process.is_alive():
+            worker.process.terminate()
+            worker.process.join(JOIN_TIMEOUT)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+        worker.conn.close()
+
+    def _dispatch(self) -> None:
+        while self._queue:
+            idle = next((w for w in self._workers if w.task is None), None)
+            if idle is None:
+                if len(self._workers) >= self.size:
+                    return
+                idle = self._spawn()
+            task_id, tag, func, args, timeout = self._queue.popleft()
+            started = time.monotonic()
+            deadline = started + timeout if timeout else None
+            try:
+                idle.conn.send((task_id, func, args))
+            except Exception:
+                # Задачата не може да се pickle-не — работникът остава свободен
+                self._ready.append(TaskResult(task_id, tag, 'error', None,
+                                              traceback.format_exc(), 0.0, idle.process.pid,
+                                              None, timeout))
+                continue
+            idle.task = (task_id, tag, started, deadline, timeout)
+
+    # ---------- публичен API ----------
+
+    @property
+    def pending(self) -> int:
+        """Задачи, които още не са върнати (в опашка, в работа или готови)."""
+        busy = sum(1 for w in self._workers if w.task is not None)
+        return len(self._queue) + busy + len(self._ready)
+
+    @property
+    def in_flight(self) -> int:
+        """Задачи в опашката или в работа (без вече готовите)."""
+        return self.pending - len(self._ready)
+
+    def submit(self, func: Callable, *args, timeout: Optional[float] = None, tag: Any = None) -> int:
+        """Поставя задача в опашката; връща id на задачата."""
+        self._next_id += 1
+        self._queue.append((self._next_id, tag, func, args, timeout))
+        self._dispatch()
+        return self._next_id
+
+    def next_result(self) -> Optional[TaskResult]:
+        """Чака следващия завършил (или прекратен) резултат; None ако няма задачи."""
+        while not self._ready:
+            self._dispatch()
+            busy = [w for w in self._workers if w.task is not None]
+            if not busy:
+                return None
+
+            now = time.monotonic()
+            deadlines = [w.task[3] for w in busy if w.task[3] is not None]
+            wait_for = max(0.0, min(deadlines) - now) if deadlines else None
+
+            ready_conns = wait_connections([w.conn for w in busy], wait_for)
+            for worker in busy:
+                if worker.conn in ready_conns:
+                    self._collect(worker)
+
+            now = time.monotonic()
+            for worker in list(self._workers):
+                if worker.task and worker.task[3] is not None and now >= worker.task[3]:
+                    self._expire(worker, now)
+
+        return self._ready.popleft()
+
+    def run(self, func: Callable, *args, timeout: Optional[float] = None, tag: Any = None) -> TaskResult:
+        """Изпълнява една задача синхронно в надзиравания работник."""
+        task_id = self.submit(func, *args, timeout=timeout, tag=tag)
+        held = []
+        while True:
+            result = self.next_result()
+            if result is None or result.task_id == task_id:
+                self._ready.extendleft(reversed(held))
+                return result
+            held.append(result)
+
+    def close(self) -> None:
+        for worker in list(self._workers):
+            self._stop(worker, kill=worker.task is not None)
+        self._queue.clear()
+
+    def __enter__(self) -> 'SupervisedPool':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---------- резултати ----------
+
+    def _collect(self, worker: _Worker) -> None:
+        task_id, tag, started, _, timeout = worker.task
+        pid = worker.process.pid
+        try:
+            _, status, value, error, seconds, memory, stages = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.process.join(JOIN_TIMEOUT)
+            exitcode = worker.process.exitcode
+            logger.error("Работник %s се срина (exit code %s)", pid, exitcode)
+            worker.task = None
+            self._stop(worker, kill=True)
+            self._ready.append(TaskResult(task_id, tag, 'crashed', None,
+                                          f'worker exited with code {exitcode}',
+                                          time.monotonic() - started, pid, exitcode, timeout))
+            return
+
+        worker.task = None
+        worker.tasks_done += 1
+        self._ready.append(TaskResult(task_id, tag, status, value, error, seconds, pid, None,
+                                      timeout, memory, stages))
+
+        if status == 'memory':
+            # След MemoryError купчината може да е фрагментирана — нов работник
+            logger.warning("Задача %s надхвърли лимита на паметта — работник %s се заменя", tag, pid)
+            self._stop(worker, kill=False)
+            self.recycled += 1
+        elif self.max_tasks_per_worker and worker.tasks_done >= self.max_tasks_per_worker:
+            logger.debug("Рециклиране на работник %s след %s задачи", pid, worker.tasks_done)
+            self._stop(worker, kill=False)
+            self.recycled += 1
+
+    def _expire(self, worker: _Worker, now: float) -> None:
+        task_id, tag, started, _, timeout = worker.task
+        pid = worker.process.pid
+        logger.error("Задача %s надхвърли срока от %g s — работник %s се прекратява", tag, timeout, pid)
+        worker.task = None
+        self._stop(worker, kill=True)
+        self.killed += 1
+        self._ready.append(TaskResult(task_id, tag, 'timeout', None,
+                                      f'timed out after {timeout:g} s',
+                                      now - started, pid, worker.process.exitcode, timeout))
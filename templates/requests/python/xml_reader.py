@@ -0,0 +1,258 @@
+"""
+ClientRequests XML Reader
+=========================
+Поточно структурно извличане на текст от XML (EDI експорти и др.).
+
+Вместо целия файл като текст (тагове, атрибути, празни редове) връща
+само текстовите възли с пътя им:
+
+    Invoice/Header/Number: 4711
+    Invoice/Lines/Line/Description: Доставка на стока
+
+Работи с постоянна памет независимо от размера на файла — всеки елемент
+се изчиства и премахва от родителя веднага след обработката му.
+
+Настройки (XmlOptions):
+- allow: списък с шаблони (fnmatch) за име или път на елемент; празен
+  списък = всички. Разрешен елемент включва и всичките си наследници.
+- max_chars: общ лимит на изхода (след него парсването спира)
+- max_node_chars: лимит на един текстов възел (напр. base64 блокове)
+- include_attributes: извежда и атрибутите като path/@attr: value
+
+При невалиден XML (raw_fallback=True) извлеченото дотук се запазва, а
+останалото от реда на грешката нататък се чете поточно като текст без
+таговете — пак до max_chars.
+
+Използване:
+    from xml_reader import read_xml_text, XmlOptions
+    text = read_xml_text(Path("X.xml"), XmlOptions(allow=['Invoice/*']))
+
+    python xml_reader.py X.xml --allow "Header/*" --allow Amount
+"""
+
+import argparse
+import logging
+import re
+import sys
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterator, List
+
+from text_decoding import SAMPLE_SIZE, detect_encoding
+
+logger = logging.getLogger(__name__)
+
+
+TRUNCATED_MARKER = '[... съкратено ...]'
+RAW_MARKER = '[... невалиден XML, следва текстът без таговете ...]'
+RAW_CHUNK_SIZE = 64 * 1024
+TAG_RE = re.compile(r'<[^>]*>')
+
+
+@dataclass
+class XmlOptions:
+    """Настройки за извличане от XML."""
+    allow: List[str] = field(default_factory=list)
+    max_chars: int = 1_000_000
+    max_node_chars: int = 2000
+    include_attributes: bool = False
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'XmlOptions':
+        """Създава настройки от секцията python.xml на config.json."""
+        xml_config = config.get('python', {}).get('xml', {})
+        return cls(
+            allow=list(xml_config.get('allowElements', [])),
+            max_chars=int(xml_config.get('maxChars', cls.max_chars)),
+            max_node_chars=int(xml_config.get('maxNodeChars', cls.max_node_chars)),
+            include_attributes=bool(xml_config.get('includeAttributes', False)),
+        )
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1] if tag[:1] == '{' else tag
+
+
+def _is_allowed(name: str, path: str, patterns: List[str]) -> bool:
+    return any(fnmatchcase(name, p) or fnmatchcase(path, p) for p in patterns)
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = ' '.join(text.split())
+    return text if len(text) <= limit else text[:limit] + '…'
+
+
+class _Frame:
+    """Отворен елемент: път, дали е разрешен, натрупан смесен текст."""
+    __slots__ = ('elem', 'path', 'allowed', 'tails', 'last_child')
+
+    def __init__(self, elem: ET.Element, path: str, allowed: bool):
+        self.elem = elem
+        self.path = path
+        self.allowed = allowed
+        self.tails: List[str] = []
+        self.last_child = None
+
+    def release_last_child(self) -> None:
+        """Взима tail текста на предишното дете и го премахва от дървото."""
+        child = self.last_child
+        if child is not None:
+            if child.tail:
+                self.tails.append(child.tail)
+            self.elem.remove(child)
+            self.last_child = None
+
+
+def iter_xml_lines(file_path: Path, options: XmlOptions = None) -> Iterator[str]:
+    """Генератор на редове "път: текст" от XML файл."""
+    options = options or XmlOptions()
+    stack: List[_Frame] = []
+    emitted = 0
+
+    for event, elem in ET.iterparse(str(file_path), events=('start', 'end')):
+        if event == 'start':
+            name = _local_name(elem.tag)
+            parent = stack[-1] if stack else None
+            if parent:
+                parent.release_last_child()
+            path = f"{parent.path}/{name}" if parent else name
+            allowed = (not options.allow
+                       or (parent is not None and parent.allowed)
+                       or _is_allowed(name, path, options.allow))
+            stack.append(_Frame(elem, path, allowed))
+
+            if allowed and options.include_attributes:
+                for key, value in elem.attrib.items():
+                    line = f"{path}/@{_local_name(key)}: {_shorten(value, options.max_node_chars)}"
+                    emitted += len(line) + 1
+                    yield line
+            continue
+
+        # event == 'end'
+        frame = stack.pop()
+        frame.release_last_child()
+
+        if frame.allowed:
+            text = (elem.text or '') + ''.join(frame.tails)
+            if text.strip():
+                line = f"{frame.path}: {_shorten(text, options.max_node_chars)}"
+                emitted += len(line) + 1
+                yield line
+
+        # clear() нулира и tail, а парсерът може вече да го е попълнил
+        # (събитията идват на порции) — запазваме го за родителя
+        tail = elem.tail
+        elem.clear()
+        elem.tail = tail
+        if stack:
+            stack[-1].last_child = elem
+
+        if emitted >= options.max_chars:
+            logger.info("XML %s: достигнат лимит от %s символа", file_path, options.max_chars)
+            yield TRUNCATED_MARKER
+            return
+
+
+def _skip_lines(chunk: str, count: int) -> str:
+    """Остатъкът от chunk след count нови реда ('' ако са по-малко)."""
+    index = -1
+    for _ in range(count):
+        index = chunk.find('\n', index + 1)
+        if index < 0:
+            return ''
+    return chunk[index + 1:]
+
+
+def iter_raw_lines(file_path: Path, start_line: int = 1, max_chars: int = XmlOptions.max_chars,
+                   max_node_chars: int = XmlOptions.max_node_chars) -> Iterator[str]:
+    """Текстът между таговете от ред start_line нататък — на парчета, без XML парсер."""
+    with open(file_path, 'rb') as f:
+        encoding, _ = detect_encoding(f.read(SAMPLE_SIZE))
+
+    line = 1
+    carry = ''
+    emitted = 0
+    with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+        while True:
+            chunk = f.read(RAW_CHUNK_SIZE)
+            if not chunk:
+                break
+            if line < start_line:
+                newlines = chunk.count('\n')
+                if line + newlines < start_line:
+                    line += newlines
+                    continue
+                chunk = _skip_lines(chunk, start_line - line)
+                line = start_line
+
+            text = carry + chunk
+            # Недовършен таг в края на парчето — до следващото
+            open_tag = text.rfind('<')
+            if open_tag > text.rfind('>') and len(text) - open_tag < RAW_CHUNK_SIZE:
+                text, carry = text[:open_tag], text[open_tag:]
+            else:
+                carry = ''
+
+            for piece in TAG_RE.sub('\n', text).splitlines():
+                piece = piece.strip()
+                if not piece:
+                    continue
+                piece = _shorten(piece, max_node_chars)
+                emitted += len(piece) + 1
+                yield piece
+                if emitted >= max_chars:
+                    yield TRUNCATED_MARKER
+                    return
+
+
+def read_xml_text(file_path: Path, options: XmlOptions = None, raw_fallback: bool = False) -> str:
+    """Извлича текстовите възли на XML файл като "път: текст" редове.
+
+    Args:
+        raw_fallback: При невалиден XML — извлеченото дотук и после
+            текстът без таговете от реда на грешката (iter_raw_lines)
+
+    Raises:
+        ET.ParseError: при невалиден XML (без raw_fallback)
+    """
+    file_path = Path(file_path)
+    options = options or XmlOptions()
+    lines: List[str] = []
+    emitted = 0
+    try:
+        for line in iter_xml_lines(file_path, options):
+            lines.append(line)
+            emitted += len(line) + 1
+    except ET.ParseError as e:
+        if not raw_fallback:
+            raise
+        logger.warning("Невалиден XML %s: %s — останалото се чете като текст", file_path, e)
+        lines.append(RAW_MARKER)
+        lines.extend(iter_raw_lines(file_path, e.position[0], max(0, options.max_chars - emitted),
+                                    options.max_node_chars))
+    return '\n'.join(lines)
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+
+    parser = argparse.ArgumentParser(description='ClientRequests XML Reader')
+    parser.add_argument('file', help='XML файл')
+    parser.add_argument('--allow', action='append', default=[],
+                        help='Шаблон за име/път на елемент (може няколко пъти)')
+    parser.add_argument('--max-chars', type=int, default=XmlOptions.max_chars)
+    parser.add_argument('--max-node-chars', type=int, default=XmlOptions.max_node_chars)
+    parser.add_argument('--attributes', action='store_true', help='Включи и атрибутите')
+    args = parser.parse_args()
+
+    options = XmlOptions(allow=args.allow, max_chars=args.max_chars,
+                         max_node_chars=args.max_node_chars,
+                         include_attributes=args.attributes)
+    for line in iter_xml_lines(Path(args.file), options):
+        print(line)
+
+
+if __name__ == '__main__':
+    main()